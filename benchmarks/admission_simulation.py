@@ -0,0 +1,251 @@
+"""Simulates the proxy's admission control against first-come-first-served.
+
+A discrete-event simulation of one pod with `--workers` workers, driven by a
+fake clock so every run with the same `--seed` gives the same numbers. At
+time 0 two batch tenants dump their backlog (`etl` with weight 3, `bulk` with
+weight 1) while an interactive tenant sends `--rate` requests per second.
+
+- `fifo` sends everything upstream at once, as the proxy does without
+  `ADMISSION_MAX_CONCURRENCY`, so RunPod serves requests in arrival order.
+- `fair` runs `FairQueue` with a limit of `--workers` per pod.
+- `overload` is `fair` with `--max-queue` waiting requests at most, the rest
+  are rejected with a `Retry-After`.
+
+Then a real `Admission` and `AsyncAdmission` hold the only slot of a pod
+while a request with a short deadline waits behind it.
+
+Exits with status 1 when the scheduler breaks one of its guarantees.
+
+    python benchmarks/admission_simulation.py --workers 4 --backlog 300 --rate 0.5
+"""
+
+import argparse
+import asyncio
+import heapq
+import math
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from runpod_ollama.admission import Admission, AsyncAdmission, FairQueue, Ticket  # noqa: E402
+from runpod_ollama.exceptions import DeadlineExceeded, QueueFull  # noqa: E402
+from runpod_ollama.retries import Deadline  # noqa: E402
+
+POD_ID = "pod"
+WEIGHTS = {"etl": 3.0, "bulk": 1.0}
+
+# (arrival, tenant, priority, execution seconds)
+Request = Tuple[float, str, str, float]
+
+
+def _workload(backlog: int, rate: float, duration: float, seed: int) -> List[Request]:
+    rng = random.Random(seed)
+
+    def execution_time() -> float:
+        return rng.lognormvariate(math.log(1.0) - 0.045, 0.3)
+
+    requests: List[Request] = []
+    for tenant in WEIGHTS:
+        requests += [(0.0, tenant, "batch", execution_time()) for _ in range(backlog)]
+    now = rng.expovariate(rate)
+    while now < duration:
+        requests.append((now, "chat", "interactive", execution_time()))
+        now += rng.expovariate(rate)
+    return sorted(requests, key=lambda r: r[0])
+
+
+class Result:
+    def __init__(self):
+        self.waits: Dict[str, List[float]] = {}
+        self.completed: List[Tuple[float, str]] = []
+        self.rejected = 0
+        self.retry_after: List[float] = []
+        self.peak_running = 0
+
+    def wait(self, tenant: str, seconds: float):
+        self.waits.setdefault(tenant, []).append(seconds)
+
+    def share(self, until: float) -> Dict[str, int]:
+        """Requests completed per tenant before `until`."""
+        return dict(Counter(tenant for at, tenant in self.completed if at <= until))
+
+
+def _fifo(requests: List[Request], workers: int) -> Result:
+    result = Result()
+    events: List[Tuple[float, int, Optional[Request]]] = []
+    for i, request in enumerate(requests):
+        heapq.heappush(events, (request[0], i, request))
+    waiting: Deque[Request] = deque()
+    running = 0
+    seq = len(requests)
+
+    def start(now: float, request: Request):
+        nonlocal running, seq
+        running += 1
+        result.peak_running = max(result.peak_running, running)
+        result.wait(request[1], now - request[0])
+        seq += 1
+        heapq.heappush(events, (now + request[3], seq, None))
+        result.completed.append((now + request[3], request[1]))
+
+    while events:
+        now, _, request = heapq.heappop(events)
+        if request is not None:
+            waiting.append(request)
+        else:
+            running -= 1
+        while waiting and running < workers:
+            start(now, waiting.popleft())
+    return result
+
+
+def _fair(requests: List[Request], workers: int, max_queue: int) -> Result:
+    result = Result()
+    now = 0.0
+    queue = FairQueue(
+        max_concurrency=workers, max_queue=max_queue, weights=WEIGHTS, clock=lambda: now
+    )
+    events: List[Tuple[float, int, Optional[Request], Optional[Ticket]]] = []
+    for i, request in enumerate(requests):
+        heapq.heappush(events, (request[0], i, request, None))
+    seq = len(requests)
+
+    def start(ticket: Ticket):
+        nonlocal seq
+        seq += 1
+        execution = ticket.waiter
+        result.wait(ticket.tenant, ticket.wait_seconds)
+        heapq.heappush(events, (now + execution, seq, None, ticket))
+        result.completed.append((now + execution, ticket.tenant))
+
+    while events:
+        now, _, request, ticket = heapq.heappop(events)
+        if request is not None:
+            _, tenant, priority, execution = request
+            try:
+                # The waiter of a simulated request is how long it runs.
+                ticket = queue.arrive(POD_ID, tenant, priority, waiter=execution)
+            except QueueFull as e:
+                result.rejected += 1
+                result.retry_after.append(e.retry_after)
+                continue
+            if ticket.granted_at is not None:
+                start(ticket)
+        else:
+            for granted in queue.release(ticket):
+                start(granted)
+        result.peak_running = max(result.peak_running, queue.pods[POD_ID].running)
+    return result
+
+
+def _deadline_failures() -> List[str]:
+    """Queues a request with a 0.2s deadline behind the only slot of a pod."""
+    failures = []
+
+    def check(engine: str, queue: FairQueue, waited: float, timed_out: bool):
+        if not timed_out or waited > 1:
+            failures.append(f"a queued {engine} request waited past its deadline")
+        pod = queue.pods[POD_ID]
+        if pod.running or pod.waiting():
+            failures.append(f"a slot was kept for a {engine} request that timed out")
+
+    queue = FairQueue(max_concurrency=1, max_queue=8)
+    admission = Admission(queue)
+    timed_out = False
+    with admission.admit(POD_ID):
+        started = time.monotonic()
+        try:
+            with admission.admit(POD_ID, deadline=Deadline(0.2)):
+                pass
+        except DeadlineExceeded:
+            timed_out = True
+        waited = time.monotonic() - started
+    check("sync", queue, waited, timed_out)
+
+    async def run_async():
+        queue = FairQueue(max_concurrency=1, max_queue=8)
+        admission = AsyncAdmission(queue)
+        timed_out = False
+        async with admission.admit(POD_ID):
+            started = time.monotonic()
+            try:
+                async with admission.admit(POD_ID, deadline=Deadline(0.2)):
+                    pass
+            except DeadlineExceeded:
+                timed_out = True
+            waited = time.monotonic() - started
+        check("async", queue, waited, timed_out)
+
+    asyncio.run(run_async())
+    return failures
+
+
+def _percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(p * len(ordered)), len(ordered) - 1)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--backlog", type=int, default=300, help="Requests per batch tenant.")
+    parser.add_argument("--rate", type=float, default=0.5, help="Interactive requests per second.")
+    parser.add_argument("--duration", type=float, default=120.0)
+    parser.add_argument("--max-queue", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    requests = _workload(args.backlog, args.rate, args.duration, args.seed)
+    # While both batch tenants still have a backlog, measured on the fair run.
+    contended = args.backlog * 2 / args.workers * 0.5
+    results = {
+        "fifo": _fifo(requests, args.workers),
+        "fair": _fair(requests, args.workers, max_queue=len(requests)),
+        "overload": _fair(requests, args.workers, max_queue=args.max_queue),
+    }
+
+    print(
+        f"{'run':<9} {'chat p50':>9} {'chat p99':>9} {'batch p50':>10} "
+        f"{'etl:bulk':>9} {'rejected':>9} {'retry-after':>12} {'peak':>5}"
+    )
+    for name, result in results.items():
+        chat = result.waits.get("chat", [])
+        batch = result.waits.get("etl", []) + result.waits.get("bulk", [])
+        share = result.share(contended)
+        ratio = share.get("etl", 0) / max(share.get("bulk", 0), 1)
+        retry_after = statistics.mean(result.retry_after) if result.retry_after else 0.0
+        print(
+            f"{name:<9} {_percentile(chat, 0.5):>8.2f}s {_percentile(chat, 0.99):>8.2f}s "
+            f"{_percentile(batch, 0.5):>9.2f}s {ratio:>9.2f} {result.rejected:>9} "
+            f"{retry_after:>11.1f}s {result.peak_running:>5}"
+        )
+
+    fifo, fair, overload = results["fifo"], results["fair"], results["overload"]
+    failures = []
+    if fair.peak_running > args.workers or overload.peak_running > args.workers:
+        failures.append("more requests ran at once than the pod's limit")
+    if _percentile(fair.waits["chat"], 0.99) >= _percentile(fifo.waits["chat"], 0.99):
+        failures.append("interactive requests did not overtake the batch backlog")
+    share = fair.share(contended)
+    if not 2.5 <= share.get("etl", 0) / max(share.get("bulk", 0), 1) <= 3.5:
+        failures.append("batch tenants were not served in proportion to their weights")
+    if len(fair.completed) != len(requests):
+        failures.append("admitted requests were lost")
+    if overload.rejected and min(overload.retry_after) <= 0:
+        failures.append("rejected requests got no Retry-After")
+    failures.extend(_deadline_failures())
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
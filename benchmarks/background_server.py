@@ -0,0 +1,61 @@
+"""Runs an aiohttp fake server on the current loop or on a background thread."""
+
+import asyncio
+import threading
+from typing import Any, Coroutine, List, Optional
+from aiohttp import web
+
+
+class BackgroundServer:
+    base_path = ""
+    """Appended to the server's address to form the base url."""
+
+    def __init__(self):
+        self._runner: Optional[web.AppRunner] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def create_app(self) -> web.Application:
+        raise NotImplementedError
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Starts serving on the running loop and returns the base url."""
+        self._runner = web.AppRunner(self.create_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port, backlog=4096)
+        await site.start()
+        bound_port = self._runner.addresses[0][1]
+        return f"http://{host}:{bound_port}{self.base_path}"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def start_in_thread(self) -> str:
+        """Starts serving from a background thread, for synchronous callers."""
+        started = threading.Event()
+        base_url: List[str] = []
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            base_url.append(self._loop.run_until_complete(self.start()))
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=serve, daemon=True)
+        self._thread.start()
+        started.wait()
+        return base_url[0]
+
+    def run_coroutine(self, coroutine: Coroutine[Any, Any, Any]) -> Any:
+        """Runs `coroutine` on the background thread's loop and waits for it."""
+        assert self._loop is not None, "start_in_thread() first"
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def stop_thread(self) -> None:
+        if self._loop is None:
+            return
+        self.run_coroutine(self.stop())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join()
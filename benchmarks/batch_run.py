@@ -0,0 +1,116 @@
+"""Measures `runpod-ollama batch run` against a fake RunPod API.
+
+Writes JSONL files of `--lines` prompts and runs them with the real CLI, in a
+subprocess so that its peak memory can be compared across file sizes. Then
+runs the largest file again, kills the CLI half way with SIGKILL and resumes
+it, and checks that every line has exactly one result and how many jobs were
+submitted twice.
+
+    python benchmarks/batch_run.py --lines 10000 --lines 50000 --concurrency 256
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_runpod import FakeRunpod  # noqa: E402
+
+CLI = "from runpod_ollama import run_cli; run_cli()"
+
+
+def _write_input(path: str, lines: int) -> None:
+    with open(path, "w") as f:
+        for i in range(lines):
+            f.write(json.dumps({"id": f"p{i}", "input": {"model": "fake", "prompt": f"prompt {i}"}}))
+            f.write("\n")
+
+
+def _run_cli(
+    api_base_url: str, input_path: str, concurrency: int, kill_after: Optional[float] = None
+) -> Tuple[float, int, int]:
+    """Returns the wall time, the exit status and the peak RSS in MiB."""
+    env = dict(os.environ)
+    env.update(
+        RUNPOD_ENDPOINT_BASE_URL=api_base_url,
+        RUNPOD_API_TOKEN="batch-test",
+        HF_TOKEN=env.get("HF_TOKEN") or "unused",
+    )
+    command = [
+        sys.executable, "-c", CLI, "batch", "run", input_path,
+        "--endpoint", "fakepod", "--concurrency", str(concurrency),
+    ]
+    started = time.monotonic()
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL)
+    if kill_after is not None:
+        time.sleep(kill_after)
+        process.send_signal(signal.SIGKILL)
+    _, status, usage = os.wait4(process.pid, 0)
+    return time.monotonic() - started, status, usage.ru_maxrss // 1024
+
+
+def _results(path: str) -> Dict[int, int]:
+    counts: Dict[int, int] = {}
+    with open(path) as f:
+        for text in f:
+            line = json.loads(text)["line"]
+            counts[line] = counts.get(line, 0) + 1
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, action="append")
+    parser.add_argument("--concurrency", type=int, default=256)
+    parser.add_argument("--job-seconds", type=float, default=0.1)
+    args = parser.parse_args()
+    sizes: List[int] = args.lines or [10000, 50000]
+
+    fake_runpod = FakeRunpod(
+        execution_time=args.job_seconds, queue_delay=0.02, workers=args.concurrency
+    )
+    api_base_url = fake_runpod.start_in_thread()
+    print(f"{args.concurrency} jobs in flight, {args.job_seconds}s per job")
+    print(f"{'run':<18} {'lines':>7} {'wall':>8} {'lines/s':>8} {'polls/job':>9} {'peak RSS':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for lines in sizes:
+            input_path = os.path.join(tmp, f"prompts-{lines}.jsonl")
+            _write_input(input_path, lines)
+            submitted, polls = fake_runpod.stats.jobs_submitted, fake_runpod.stats.status_polls
+            wall, _, rss = _run_cli(api_base_url, input_path, args.concurrency)
+            polls = fake_runpod.stats.status_polls - polls
+            jobs = fake_runpod.stats.jobs_submitted - submitted
+            print(
+                f"{'full':<18} {lines:>7} {wall:>7.1f}s {lines / wall:>8.0f} "
+                f"{polls / jobs:>9.2f} {rss:>6} MiB"
+            )
+
+        lines = sizes[-1]
+        input_path = os.path.join(tmp, f"resume-{lines}.jsonl")
+        _write_input(input_path, lines)
+        submitted = fake_runpod.stats.jobs_submitted
+        crash_wall, _, _ = _run_cli(
+            api_base_url, input_path, args.concurrency, kill_after=wall / 2
+        )
+        resume_wall, status, _ = _run_cli(api_base_url, input_path, args.concurrency)
+        jobs = fake_runpod.stats.jobs_submitted - submitted
+        counts = _results(os.path.splitext(input_path)[0] + ".results.jsonl")
+        print(
+            f"{'killed + resumed':<18} {lines:>7} {crash_wall + resume_wall:>7.1f}s "
+            f"exit={os.waitstatus_to_exitcode(status)}, {len(counts)} lines with results, "
+            f"{sum(c > 1 for c in counts.values())} duplicated, "
+            f"{jobs - lines} jobs submitted again"
+        )
+    fake_runpod.stop_thread()
+
+
+if __name__ == "__main__":
+    main()
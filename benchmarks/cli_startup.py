@@ -0,0 +1,112 @@
+"""Measures how long the `runpod-ollama` CLI takes to start.
+
+Runs `--help` of the CLI and of its commands `--runs` times each in a fresh
+interpreter and prints the median wall time, next to that of a bare
+`python -c pass`. The interpreter's own startup depends on what the
+environment's site-packages load (`.pth` hooks, ...), so the budget applies
+to what the CLI adds on top of it. `python -X importtime` then lists the
+slowest imports and checks that none of the heavy dependencies, which only
+the commands using them import, is loaded. Exits with status 1 when a
+command is over `--budget-ms` or imports one of them.
+
+    python benchmarks/cli_startup.py --runs 20 --budget-ms 150
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI = "from runpod_ollama.cli import run_cli; run_cli()"
+
+COMMANDS: List[List[str]] = [
+    ["--help"],
+    ["create-template", "--help"],
+    ["create-endpoint", "--help"],
+    ["start-proxy", "--help"],
+    ["keep-warm", "--help"],
+    ["batch", "run", "--help"],
+]
+
+# Imported by the commands that need them, never to print a help.
+HEAVY_MODULES = ["runpod", "flask", "aiohttp", "litellm", "inquirer", "requests"]
+
+
+def _run(args: List[str]) -> subprocess.CompletedProcess:
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    env.setdefault("HF_TOKEN", "startup-benchmark")
+    return subprocess.run(
+        [sys.executable, *args], cwd=ROOT, env=env, capture_output=True, text=True
+    )
+
+
+def _wall_ms(args: List[str], runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        process = _run(args)
+        timings.append((time.perf_counter() - started) * 1000)
+        if process.returncode != 0:
+            raise SystemExit(f"{' '.join(args)} failed:\n{process.stderr}")
+    return statistics.median(timings)
+
+
+def _imports(command: List[str]) -> Dict[str, int]:
+    """Cumulative microseconds of every module imported by `command`."""
+    stderr = _run(["-X", "importtime", "-c", CLI, *command]).stderr
+    imports: Dict[str, int] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if name.strip() == "site":
+            # What the interpreter imports before running anything.
+            imports.clear()
+            continue
+        imports[name.strip()] = int(cumulative)
+    return imports
+
+
+def _slowest(imports: Dict[str, int], count: int) -> List[Tuple[str, int]]:
+    return sorted(imports.items(), key=lambda item: item[1], reverse=True)[:count]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument(
+        "--budget-ms", type=float, default=150, help="Time the CLI may add to the interpreter's."
+    )
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list.")
+    args = parser.parse_args()
+
+    baseline = _wall_ms(["-c", "pass"], args.runs)
+    failures = []
+    print(f"{'command':<28} {'wall':>9} {'cli':>9}")
+    print(f"{'(python -c pass)':<28} {baseline:>7.0f}ms {'':>9}")
+    for command in COMMANDS:
+        wall = _wall_ms(["-c", CLI, *command], args.runs)
+        name = " ".join(command)
+        print(f"{name:<28} {wall:>7.0f}ms {wall - baseline:>7.0f}ms")
+        if wall - baseline > args.budget_ms:
+            failures.append(f"{name} adds {wall - baseline:.0f}ms, over {args.budget_ms:.0f}ms")
+        heavy = sorted(
+            {m.split(".")[0] for m in _imports(command)} & set(HEAVY_MODULES)
+        )
+        if heavy:
+            failures.append(f"{name} imports {', '.join(heavy)}")
+
+    print("\nslowest imports of --help (cumulative)")
+    for name, us in _slowest(_imports(["--help"]), args.top):
+        print(f"{name:<40} {us / 1000:>7.1f}ms")
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
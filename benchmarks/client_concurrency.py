@@ -0,0 +1,113 @@
+"""Compares waiting for many RunPod jobs with and without the client package.
+
+"threads" is what services did with the blocking helpers: one thread per
+in-flight request, each running `RunpodRepository.call_endpoint`. "sync" and
+"async" submit the same jobs through `RunpodClient.gather` and
+`AsyncRunpodClient.gather`, spread over `--endpoints` endpoints of a fake
+RunPod API. Reports wall time, the threads the process needed, status polls
+per job and the TCP connections the fake API saw.
+
+    python benchmarks/client_concurrency.py --jobs 1000 --endpoints 4
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_runpod import FakeRunpod  # noqa: E402
+from runpod_ollama.client import AsyncRunpodClient, RunpodClient  # noqa: E402
+from runpod_ollama.http_pool import SessionPool  # noqa: E402
+from runpod_ollama.runpod_repository import RunpodRepository  # noqa: E402
+
+Requests = List[Tuple[str, str, Any]]
+
+
+def _threads(base_url: str, requests: Requests) -> int:
+    """Returns how many jobs completed."""
+    pool = SessionPool(pool_size=len(requests))
+
+    def call(request: Tuple[str, str, Any]) -> Any:
+        endpoint_id, method, input = request
+        repository = RunpodRepository(
+            api_key="bench",
+            pod_id=endpoint_id,
+            base_url=base_url,
+            session=pool.session(endpoint_id),
+        )
+        return repository.call_endpoint(method, input)
+
+    with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+        outputs = list(executor.map(call, requests))
+    pool.close()
+    return sum(output is not None for output in outputs)
+
+
+def _sync(base_url: str, requests: Requests) -> int:
+    with RunpodClient(api_key="bench", base_url=base_url) as client:
+        return sum(result.ok for result in client.gather(requests))
+
+
+def _async(base_url: str, requests: Requests) -> int:
+    async def run() -> int:
+        async with AsyncRunpodClient(api_key="bench", base_url=base_url) as client:
+            return sum(result.ok for result in await client.gather(requests))
+
+    return asyncio.run(run())
+
+
+def _peak_threads(run: Callable[[], int]) -> Tuple[int, int]:
+    """Runs `run`, returns its result and the most threads alive meanwhile."""
+    peak = [threading.active_count()]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.01):
+            peak[0] = max(peak[0], threading.active_count())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        completed = run()
+    finally:
+        done.set()
+        sampler.join()
+    # Neither the sampler nor the fake API's thread count.
+    return completed, peak[0] - 2
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=1000)
+    parser.add_argument("--endpoints", type=int, default=4)
+    parser.add_argument("--job-seconds", type=float, default=1.0)
+    args = parser.parse_args()
+
+    requests: Requests = [
+        (f"pod{i % args.endpoints}", "generate", {"model": "fake", "prompt": f"prompt {i}"})
+        for i in range(args.jobs)
+    ]
+    print(f"{args.jobs} jobs over {args.endpoints} endpoints, {args.job_seconds}s per job")
+    print(f"{'client':<8} {'done':>6} {'wall':>7} {'threads':>8} {'polls/job':>9} {'connections':>11}")
+    for name, run in (("threads", _threads), ("sync", _sync), ("async", _async)):
+        fake_runpod = FakeRunpod(execution_time=args.job_seconds, queue_delay=0.05)
+        base_url = fake_runpod.start_in_thread()
+        started = time.monotonic()
+        completed, threads = _peak_threads(lambda: run(base_url, requests))
+        wall = time.monotonic() - started
+        stats = fake_runpod.stats
+        print(
+            f"{name:<8} {completed:>6} {wall:>6.2f}s {threads:>8} "
+            f"{stats.status_polls / args.jobs:>9.2f} {stats.connections:>11}"
+        )
+        fake_runpod.stop_thread()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Measures single-flight coalescing during a cold start.
+
+Fires `--duplicates` copies of each of `--distinct` prompts at once through
+the proxy, against a fake RunPod API whose jobs wait `--cold-start` seconds in
+the queue, with coalescing off and on, and reports the jobs and status polls
+RunPod received.
+
+    python benchmarks/coalescing.py --distinct 5 --duplicates 20
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import Dict
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_runpod import FakeRunpod  # noqa: E402
+from benchmarks.load_test_proxy import (  # noqa: E402
+    PROXY_COMMANDS,
+    _free_port,
+    _start_proxy,
+    _wait_until_listening,
+)
+
+
+async def _fire(port: int, distinct: int, duplicates: int) -> Dict[str, int]:
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as session:
+
+        async def one(i: int) -> None:
+            async with session.post(
+                f"http://127.0.0.1:{port}/fakepod/generate",
+                json={"model": "fake", "prompt": f"prompt {i % distinct}"},
+            ) as response:
+                response.raise_for_status()
+                await response.read()
+
+        await asyncio.gather(*(one(i) for i in range(distinct * duplicates)))
+        async with session.get(f"http://127.0.0.1:{port}/_proxy/coalescing") as response:
+            return await response.json()
+
+
+def run(engine: str, coalesce: str, distinct: int, duplicates: int, cold_start: float) -> None:
+    fake_runpod = FakeRunpod(execution_time=0.5, queue_delay=cold_start)
+    port = _free_port()
+    proxy = _start_proxy(
+        engine,
+        port,
+        fake_runpod.start_in_thread(),
+        extra_env={"COALESCE_REQUESTS": coalesce},
+    )
+    try:
+        asyncio.run(_wait_until_listening(port))
+        started = time.monotonic()
+        stats = asyncio.run(_fire(port, distinct, duplicates))
+        wall = time.monotonic() - started
+    finally:
+        proxy.terminate()
+        proxy.wait()
+        fake_runpod.stop_thread()
+
+    print(
+        f"{coalesce:<10} {wall:>7.2f}s {fake_runpod.stats.jobs_submitted:>6} "
+        f"{fake_runpod.stats.status_polls:>7} {stats.get('coalesced', 0):>10}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", choices=sorted(PROXY_COMMANDS), default="async")
+    parser.add_argument("--distinct", type=int, default=5)
+    parser.add_argument("--duplicates", type=int, default=20)
+    parser.add_argument("--cold-start", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"engine={args.engine}, {args.distinct} prompts x {args.duplicates} copies")
+    print(f"{'coalesce':<10} {'wall':>8} {'jobs':>6} {'polls':>7} {'coalesced':>10}")
+    for coalesce in ("off", "on"):
+        run(args.engine, coalesce, args.distinct, args.duplicates, args.cold_start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Counts the TCP connections RunPod sees per batch of proxied jobs.
+
+"before" sends every `/run` and `/status` call through bare `requests.post` /
+`requests.get`, as `RunpodRepository` used to. "after" uses the pooled
+keep-alive sessions from `runpod_ollama.http_pool`.
+
+    python benchmarks/connection_reuse.py --jobs 1000
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_runpod import FakeRunpod  # noqa: E402
+from runpod_ollama.http_pool import SessionPool  # noqa: E402
+from runpod_ollama.runpod_repository import RunpodRepository  # noqa: E402
+
+
+class PerCallSession:
+    """Opens a new connection for every call, like the module-level helpers."""
+
+    def post(self, *args, **kwargs):
+        return requests.post(*args, **kwargs)
+
+    def get(self, *args, **kwargs):
+        return requests.get(*args, **kwargs)
+
+    def request(self, *args, **kwargs):
+        return requests.request(*args, **kwargs)
+
+
+def run(mode: str, jobs: int, workers: int) -> None:
+    fake_runpod = FakeRunpod(execution_time=0.05)
+    base_url = fake_runpod.start_in_thread()
+    pool = SessionPool(pool_size=workers)
+    session = PerCallSession() if mode == "before" else pool.session("fakepod")
+    repository = RunpodRepository(
+        api_key="bench", pod_id="fakepod", base_url=base_url, session=session  # type: ignore
+    )
+
+    started = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(
+                executor.map(
+                    lambda i: repository.call_endpoint(
+                        "generate", {"prompt": str(i)}, sleep_interval=0.02
+                    ),
+                    range(jobs),
+                )
+            )
+        wall = time.monotonic() - started
+    finally:
+        pool.close()
+        fake_runpod.stop_thread()
+
+    stats = fake_runpod.stats
+    calls = stats.jobs_submitted + stats.status_polls
+    print(f"{mode}")
+    print(f"  jobs           {stats.jobs_submitted}")
+    print(f"  http calls     {calls}")
+    print(f"  connections    {stats.connections}")
+    print(f"  per 1000 jobs  {stats.connections * 1000 / jobs:.0f}")
+    print(f"  wall time      {wall:.2f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=32)
+    args = parser.parse_args()
+
+    for mode in ("before", "after"):
+        run(mode, args.jobs, args.workers)
+
+
+if __name__ == "__main__":
+    main()
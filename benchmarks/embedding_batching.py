@@ -0,0 +1,100 @@
+"""Measures embedding throughput with and without micro-batching.
+
+Chains a fake Ollama, the real worker handler from `server/runpod_wrapper.py`
+running inside a fake RunPod endpoint with a few workers, and the proxy, then
+fires `--requests` concurrent `/embed` calls once with batching off and once
+for every `--wait-ms`.
+
+    python benchmarks/embedding_batching.py --engine async --wait-ms 5 --wait-ms 20
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+from typing import List, Tuple
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_ollama import FakeOllama  # noqa: E402
+from benchmarks.fake_runpod import FakeRunpod  # noqa: E402
+from benchmarks.load_test_proxy import (  # noqa: E402
+    PROXY_COMMANDS,
+    _free_port,
+    _start_proxy,
+    _wait_until_listening,
+)
+from benchmarks.streaming_ttft import load_worker  # noqa: E402
+
+
+async def _fire(port: int, requests: int) -> Tuple[float, List[float]]:
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+
+        async def one(i: int) -> float:
+            started = time.monotonic()
+            async with session.post(
+                f"http://127.0.0.1:{port}/fakepod/embed",
+                json={"model": "fake", "input": f"document number {i}"},
+            ) as response:
+                response.raise_for_status()
+                body = await response.json()
+                assert len(body["embeddings"]) == 1, body
+            return time.monotonic() - started
+
+        started = time.monotonic()
+        latencies = await asyncio.gather(*(one(i) for i in range(requests)))
+    return time.monotonic() - started, sorted(latencies)
+
+
+def run(engine: str, wait_ms: int, requests: int, workers: int, embed_seconds: float) -> None:
+    fake_ollama = FakeOllama(prompt_eval_seconds=embed_seconds)
+    worker = load_worker("fake", fake_ollama.start_in_thread(), concurrency=1)
+    fake_runpod = FakeRunpod(handler=worker.handler, queue_delay=0.02, workers=workers)
+    port = _free_port()
+    proxy = _start_proxy(
+        engine,
+        port,
+        fake_runpod.start_in_thread(),
+        extra_env={"EMBED_BATCH_WAIT_MS": str(wait_ms)},
+    )
+    try:
+        asyncio.run(_wait_until_listening(port))
+        wall, latencies = asyncio.run(_fire(port, requests))
+    finally:
+        proxy.terminate()
+        proxy.wait()
+        fake_runpod.run_coroutine(worker.close())
+        fake_runpod.stop_thread()
+        fake_ollama.stop_thread()
+
+    name = f"batch {wait_ms}ms" if wait_ms else "no batching"
+    print(
+        f"{name:<14} {requests / wall:>8.1f} {statistics.median(latencies):>8.2f}s "
+        f"{latencies[int(0.99 * (len(latencies) - 1))]:>8.2f}s "
+        f"{fake_runpod.stats.jobs_submitted:>6} {fake_ollama.requests:>7}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", choices=sorted(PROXY_COMMANDS), default="async")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--embed-seconds", type=float, default=0.02)
+    parser.add_argument("--wait-ms", type=int, action="append")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    print(f"engine={args.engine}, {args.requests} requests, {args.workers} workers")
+    print(f"{'mode':<14} {'req/s':>8} {'p50':>9} {'p99':>9} {'jobs':>6} {'ollama':>7}")
+    for wait_ms in [0] + (args.wait_ms or [10]):
+        run(args.engine, wait_ms, args.requests, args.workers, args.embed_seconds)
+
+
+if __name__ == "__main__":
+    main()
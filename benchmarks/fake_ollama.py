@@ -0,0 +1,316 @@
+"""An in-process fake of the Ollama HTTP API.
+
+Generates `tokens` tokens per request at `tokens_per_second` after a
+`prompt_eval_seconds` pause, streamed as NDJSON when asked to, so the worker
+handler can be exercised without a model or a GPU. The first request for a
+model also waits `load_seconds`, like Ollama loading it into memory, and a
+generate request without a prompt only loads it. Pulls take `pull_seconds`.
+Every request body is kept in `received`, with its path. Embeddings are
+small whole numbers unless `random_embeddings` asks for normalised random
+float32 values, printed with the nine digits they need like Ollama does.
+
+Models take `model_sizes` bytes of a `vram` that fits them all unless it is
+set. A model that does not fit evicts the least recently used ones without
+requests running on them, waiting for some if needed, like Ollama's
+scheduler, and `model_load_seconds` overrides the load time of a
+model. A request with `keep_alive: 0` and no prompt unloads its model, and
+`/api/ps` lists the loaded ones.
+
+With `prefix_cache`, the fake keeps the conversations of its last `slots`
+requests like Ollama's KV cache: a prompt only counts, and waits
+`prompt_eval_seconds` for, the tokens that follow the longest prefix it
+shares with one of them. Tokens are four characters, and `generate` answers
+carry a `context` that stands for their prompt and answer.
+"""
+
+import asyncio
+import json
+import math
+import random
+import struct
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+from aiohttp import web
+from benchmarks.background_server import BackgroundServer
+
+
+class FakeOllama(BackgroundServer):
+    def __init__(
+        self,
+        tokens: int = 32,
+        tokens_per_second: float = 100.0,
+        prompt_eval_seconds: float = 0.05,
+        embedding_size: int = 8,
+        load_seconds: float = 0.0,
+        pull_seconds: float = 0.0,
+        prefix_cache: bool = False,
+        slots: int = 4,
+        model_sizes: Optional[Dict[str, int]] = None,
+        vram: int = 0,
+        model_load_seconds: Optional[Dict[str, float]] = None,
+        random_embeddings: bool = False,
+    ):
+        super().__init__()
+        self.tokens = tokens
+        self.tokens_per_second = tokens_per_second
+        self.prompt_eval_seconds = prompt_eval_seconds
+        self.embedding_size = embedding_size
+        self.random_embeddings = random_embeddings
+        self.load_seconds = load_seconds
+        self.pull_seconds = pull_seconds
+        self.loaded: Set[str] = set()
+        self.model_sizes = model_sizes or {}
+        self.vram = vram
+        self.model_load_seconds = model_load_seconds or {}
+        self.last_used: Dict[str, float] = {}
+        self.in_use: Dict[str, int] = {}
+        self._loading: Dict[str, asyncio.Lock] = {}
+        self.loads = 0
+        self.unloads = 0
+        self.evictions = 0
+        """Models the fake evicted by itself, for lack of VRAM."""
+        self.requests = 0
+        self.received: List[Tuple[str, Any]] = []
+        self.prefix_cache = prefix_cache
+        self.slots = slots
+        self.cached: List[str] = []
+        self.prompt_tokens = 0
+        """Prompt tokens evaluated, after the prefix cache."""
+
+    async def _load(self, model: str) -> float:
+        """Loads `model` if it is not in memory yet, returns how long that took."""
+        lock = self._loading.setdefault(model, asyncio.Lock())
+        async with lock:
+            self.last_used[model] = time.monotonic()
+            if model in self.loaded:
+                return 0.0
+            size = self.model_sizes.get(model, 0)
+            while self.vram and self.loaded and self._used() + size > self.vram:
+                idle = [loaded for loaded in self.loaded if not self.in_use.get(loaded)]
+                if not idle:
+                    await asyncio.sleep(0.005)
+                    continue
+                self.loaded.discard(min(idle, key=self.last_used.__getitem__))
+                self.evictions += 1
+            # The memory is taken while the model loads.
+            self.loaded.add(model)
+            seconds = self.model_load_seconds.get(model, self.load_seconds)
+            await asyncio.sleep(seconds)
+            self.loads += 1
+            return seconds
+
+    @asynccontextmanager
+    async def _running(self, model: str) -> AsyncIterator[float]:
+        """Loads `model` and keeps it in memory while a request waits for it or runs on it."""
+        self.in_use[model] = self.in_use.get(model, 0) + 1
+        try:
+            yield await self._load(model)
+        finally:
+            self.in_use[model] -= 1
+
+    def _used(self) -> int:
+        return sum(self.model_sizes.get(model, 0) for model in self.loaded)
+
+    def _prompt(self, body: Dict[str, Any]) -> str:
+        if not self.prefix_cache:
+            return str(body.get("prompt", body.get("messages", "")))
+        if "messages" in body:
+            return "".join(f"{m.get('role')}:{m.get('content')}\n" for m in body["messages"])
+        return _decode_context(body.get("context") or []) + body.get("prompt", "")
+
+    def _evaluate(self, prompt: str) -> Tuple[int, float]:
+        """Tokens of `prompt` to evaluate and how long that takes."""
+        tokens = len(prompt) // 4
+        if not self.prefix_cache:
+            return tokens, self.prompt_eval_seconds
+        shared = max((_common_prefix(prompt, cached) for cached in self.cached), default=0)
+        new = tokens - shared // 4
+        return new, self.prompt_eval_seconds * new / max(tokens, 1)
+
+    def _keep(self, text: str):
+        if self.prefix_cache:
+            self.cached = [text] + [cached for cached in self.cached if cached != text]
+            del self.cached[self.slots :]
+
+    def _final(
+        self,
+        body: Dict[str, Any],
+        started: float,
+        load_seconds: float = 0.0,
+        prompt_eval: Tuple[int, float] = (0, 0.0),
+    ) -> Dict[str, Any]:
+        eval_seconds = self.tokens / self.tokens_per_second
+        prompt_tokens, prompt_seconds = prompt_eval
+        return {
+            "model": body.get("model", "fake"),
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": int((time.monotonic() - started) * 1e9),
+            "load_duration": int(load_seconds * 1e9),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prompt_seconds * 1e9),
+            "eval_count": self.tokens,
+            "eval_duration": int(eval_seconds * 1e9),
+        }
+
+    def _piece(self, body: Dict[str, Any], text: str) -> Dict[str, Any]:
+        if "messages" in body:
+            return {"message": {"role": "assistant", "content": text}}
+        return {"response": text}
+
+    def _answered(self, body: Dict[str, Any], prompt: str, result: Dict[str, Any]):
+        """Keeps the conversation with its answer, and gives a generate answer its context."""
+        answer = "tok " * self.tokens
+        if "messages" in body:
+            self._keep(f"{prompt}assistant:{answer}\n")
+        else:
+            self._keep(prompt + answer)
+            if self.prefix_cache:
+                result["context"] = _encode_context(prompt + answer)
+
+    async def _generate(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        started = time.monotonic()
+        body = await request.json()
+        self.received.append((request.path, body))
+        model = body.get("model", "fake")
+        for name, value in (body.get("options") or {}).items():
+            # Ollama refuses options that are not of their declared type.
+            if isinstance(value, str):
+                return web.json_response({"error": f"invalid value for option {name}"}, status=400)
+        if body.get("keep_alive") == 0 and "prompt" not in body and "messages" not in body:
+            if model in self.loaded:
+                self.loaded.discard(model)
+                self.unloads += 1
+            return web.json_response({"model": model, "done": True, "done_reason": "unload"})
+        async with self._running(model) as load_seconds:
+            if "prompt" not in body and "messages" not in body:
+                return web.json_response({"model": model, "done": True, "done_reason": "load"})
+            return await self._answer(request, body, started, load_seconds)
+
+    async def _answer(
+        self, request: web.Request, body: Dict[str, Any], started: float, load_seconds: float
+    ) -> web.StreamResponse:
+        prompt = self._prompt(body)
+        prompt_eval = self._evaluate(prompt)
+        self.prompt_tokens += prompt_eval[0]
+        await asyncio.sleep(prompt_eval[1])
+        delay = 1 / self.tokens_per_second
+        if body.get("stream", True) is False:
+            await asyncio.sleep(delay * self.tokens)
+            result = self._final(body, started, load_seconds, prompt_eval)
+            result.update(self._piece(body, "tok " * self.tokens))
+            self._answered(body, prompt, result)
+            return web.json_response(result)
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        for _ in range(self.tokens):
+            await asyncio.sleep(delay)
+            chunk = {"model": body.get("model", "fake"), "done": False}
+            chunk.update(self._piece(body, "tok "))
+            await response.write((json.dumps(chunk) + "\n").encode())
+        final = self._final(body, started, load_seconds, prompt_eval)
+        final.update(self._piece(body, ""))
+        self._answered(body, prompt, final)
+        await response.write((json.dumps(final) + "\n").encode())
+        await response.write_eof()
+        return response
+
+    async def _embed(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        body = await request.json()
+        self.received.append((request.path, body))
+        inputs = body.get("input", "")
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        await asyncio.sleep(self.prompt_eval_seconds)
+        return web.json_response(
+            {
+                "model": body.get("model", "fake"),
+                "prompt_eval_count": sum(len(text) // 4 + 1 for text in inputs),
+                "embeddings": [self._vector(text) for text in inputs],
+            }
+        )
+
+    async def _embeddings(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        body = await request.json()
+        self.received.append((request.path, body))
+        await asyncio.sleep(self.prompt_eval_seconds)
+        text = body.get("prompt", "")
+        return web.json_response({"embedding": self._vector(text)})
+
+    def _vector(self, text: str) -> List[float]:
+        if not self.random_embeddings:
+            return [float(len(text) + i) for i in range(self.embedding_size)]
+        rng = random.Random(text)
+        values = [rng.gauss(0.0, 1.0) for _ in range(self.embedding_size)]
+        norm = math.sqrt(sum(value * value for value in values)) or 1.0
+        # Rounded to float32, nine significant digits tell every float32 apart.
+        return [
+            float(f"{struct.unpack('<f', struct.pack('<f', value / norm))[0]:.9g}")
+            for value in values
+        ]
+
+    async def _ps(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "models": [
+                    {
+                        "name": model,
+                        "model": model,
+                        "size": self.model_sizes.get(model, 0),
+                        "size_vram": self.model_sizes.get(model, 0),
+                    }
+                    for model in sorted(self.loaded)
+                ]
+            }
+        )
+
+    async def _pull(self, request: web.Request) -> web.Response:
+        await request.json()
+        await asyncio.sleep(self.pull_seconds)
+        return web.json_response({"status": "success"})
+
+    async def _root(self, request: web.Request) -> web.Response:
+        return web.Response(text="Ollama is running")
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/", self._root)
+        app.router.add_get("/api/ps", self._ps)
+        # The worker posts to `/api/<method>/`, Ollama accepts both forms.
+        for suffix in ("", "/"):
+            app.router.add_post(f"/api/generate{suffix}", self._generate)
+            app.router.add_post(f"/api/chat{suffix}", self._generate)
+            app.router.add_post(f"/api/embed{suffix}", self._embed)
+            app.router.add_post(f"/api/embeddings{suffix}", self._embeddings)
+            app.router.add_post(f"/api/pull{suffix}", self._pull)
+        return app
+
+
+def _common_prefix(a: str, b: str) -> int:
+    size = min(len(a), len(b))
+    for i in range(size):
+        if a[i] != b[i]:
+            return i
+    return size
+
+
+def _encode_context(text: str) -> List[int]:
+    """One number per token of four characters, like Ollama's token ids.
+
+    Characters take 16 bits so that tokens fit the 64-bit integers of JSON parsers.
+    """
+    return [
+        sum((ord(c) & 0xFFFF) << (16 * i) for i, c in enumerate(text[start : start + 4]))
+        for start in range(0, len(text), 4)
+    ]
+
+
+def _decode_context(context: List[int]) -> str:
+    return "".join(
+        chr((token >> (16 * i)) & 0xFFFF) for token in context for i in range(4)
+    ).rstrip("\0")
@@ -0,0 +1,530 @@
+"""An in-process fake of the RunPod serverless API.
+
+Serves `/v2/<pod_id>/run`, `/runsync`, `/status/<id>`, `/stream/<id>`,
+`/cancel/<id>` and `/health`, plus a `/graphql` listing `endpoints` and
+`templates` and saving endpoints, so the proxy, the repositories and the CLI
+can be benchmarked without a GPU or a RunPod account. Jobs either spend a configurable time in the queue
+and in execution and answer with a canned output, or run a real worker
+handler (e.g. `server/runpod_wrapper.handler` against a fake Ollama).
+`Faults` injects the failures the repositories have to survive.
+"""
+
+import asyncio
+import inspect
+import math
+import random
+import time
+import uuid
+import weakref
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from aiohttp import web
+from benchmarks.background_server import BackgroundServer
+
+Duration = Union[float, Callable[[Any], float]]
+
+# Keep in sync with `server/runpod_wrapper.py`.
+WORKER_METADATA_KEY = "runpod_ollama"
+
+
+@dataclass
+class FakeJob:
+    id: str
+    input: Any
+    submitted_at: float
+    queue_delay: float
+    execution_time: float
+    cancelled: bool = False
+    chunks: List[Any] = field(default_factory=list)
+    """Streamed outputs, each one readable once `now` passes its ready time."""
+    chunk_ready_at: List[float] = field(default_factory=list)
+    stream_cursor: int = 0
+    output: Any = None
+    finished_at: Optional[float] = None
+    final_status: str = "COMPLETED"
+    """What the job ends as, one of RunPod's terminal statuses."""
+
+    @property
+    def started_at(self) -> float:
+        return self.submitted_at + self.queue_delay
+
+    def status(self, now: float) -> str:
+        if self.cancelled:
+            return "CANCELLED"
+        if now < self.started_at:
+            return "IN_QUEUE"
+        if self.finished_at is None or now < self.finished_at:
+            return "IN_PROGRESS"
+        return self.final_status
+
+    def ready_chunks(self, now: float) -> List[Any]:
+        ready = [c for c, t in zip(self.chunks, self.chunk_ready_at) if t <= now]
+        new = ready[self.stream_cursor:]
+        self.stream_cursor = len(ready)
+        return new
+
+
+def echo_output(job_input: Any) -> Any:
+    """Mimics what the worker returns for `/api/generate`."""
+    body = job_input.get("input") or {}
+    return {
+        "model": body.get("model", "fake"),
+        "response": f"echo: {body.get('prompt', '')}",
+        "done": True,
+    }
+
+
+def echo_stream(job_input: Any) -> List[Any]:
+    """Mimics the chunks a worker yields for a streamed `/api/generate`."""
+    body = job_input.get("input") or {}
+    model = body.get("model", "fake")
+    words = f"echo: {body.get('prompt', '')}".split(" ")
+    chunks: List[Any] = [
+        {"model": model, "response": word + " ", "done": False} for word in words
+    ]
+    chunks.append({"model": model, "response": "", "done": True})
+    return chunks
+
+
+@dataclass
+class Faults:
+    """Failures injected by `FakeRunpod`, each a probability.
+
+    `errors`, `disconnects` and `stalls` are keyed by route: `run`,
+    `runsync`, `status`, `stream`, `cancel` or `health`. An error answers the
+    request with `error_status` without handling it. A disconnect handles the
+    request and closes the connection instead of answering, so a submission
+    still creates its job. A stall holds the answer back `stall_seconds`.
+    `job_failures` is the fraction of jobs that end as `failure_status`.
+    """
+
+    errors: Dict[str, float] = field(default_factory=dict)
+    error_status: int = 503
+    disconnects: Dict[str, float] = field(default_factory=dict)
+    stalls: Dict[str, float] = field(default_factory=dict)
+    stall_seconds: float = 5.0
+    job_failures: float = 0.0
+    failure_status: str = "FAILED"
+
+
+@dataclass
+class FakeWorker:
+    ready_at: float = 0.0
+    """When the worker finished starting."""
+
+    free_at: Optional[float] = None
+    """When its last job finishes, None if it never ran one."""
+
+
+@dataclass
+class FakeRunpodStats:
+    jobs_submitted: int = 0
+    jobs_by_pod: Dict[str, int] = field(default_factory=dict)
+    graphql_queries: int = 0
+    cold_starts: int = 0
+    status_polls: int = 0
+    stream_polls: int = 0
+    cancels: int = 0
+    faults: int = 0
+    """Requests that got an injected error, disconnect or stall."""
+    connections: int = 0
+    transports: "weakref.WeakSet[asyncio.BaseTransport]" = field(
+        default_factory=weakref.WeakSet
+    )
+
+
+class FakeRunpod(BackgroundServer):
+    """A RunPod serverless API that answers from memory.
+
+    `execution_time` and `queue_delay` are seconds, either fixed or computed
+    from the job input. Without a `handler`, completed jobs answer with
+    `output(input)`, and jobs asking for `"stream": true` stream
+    `stream_output(input)` spread evenly over the execution time. With a
+    `handler`, it is called with the job once the queue delay has passed,
+    like RunPod calls a worker (async handlers on the server's loop, sync
+    ones on a thread), and whatever it yields is streamed and aggregated.
+    `workers` caps how many jobs run at once, the others wait in the queue
+    like they would for a busy endpoint. `failure_rate` is the fraction of
+    submissions and health checks answered with an HTTP 500, `faults` gives
+    finer control.
+
+    Workers can also start cold: a job that finds no warm worker waits
+    `cold_start` more seconds. Without a handler, its output says it was the
+    worker's first job like the real worker's does; with one, cold starts
+    need `workers`. Workers go cold again after `idle_timeout` seconds
+    without a job.
+    """
+
+    base_path = "/v2"
+
+    def __init__(
+        self,
+        execution_time: Duration = 0.5,
+        queue_delay: Duration = 0.0,
+        output: Callable[[Any], Any] = echo_output,
+        stream_output: Callable[[Any], List[Any]] = echo_stream,
+        handler: Optional[Callable[[Any], Any]] = None,
+        workers: Optional[int] = None,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+        cold_start: float = 0.0,
+        idle_timeout: Optional[float] = None,
+        faults: Optional[Faults] = None,
+    ):
+        super().__init__()
+        self.execution_time = execution_time
+        self.queue_delay = queue_delay
+        self.output = output
+        self.stream_output = stream_output
+        self.handler = handler
+        self.workers = workers
+        self._worker_slots: Optional[asyncio.Semaphore] = None
+        self._fake_workers = [FakeWorker() for _ in range(workers or 0)]
+        self.cold_start = cold_start
+        self.idle_timeout = idle_timeout
+        self.failure_rate = failure_rate
+        self.faults = faults or Faults()
+        self.rng = random.Random(seed)
+        self.jobs: Dict[str, FakeJob] = {}
+        self.endpoints: List[Dict[str, Any]] = []
+        """What `/graphql` lists, as RunPod's GraphQL API returns them."""
+        self.templates: List[Dict[str, Any]] = []
+        self.graphql_latency = 0.0
+        self.stats = FakeRunpodStats()
+
+    def _duration(self, duration: Duration, job_input: Any) -> float:
+        return duration(job_input) if callable(duration) else duration
+
+    def _track(self, request: web.Request) -> None:
+        transport = request.transport
+        if transport is not None and transport not in self.stats.transports:
+            self.stats.transports.add(transport)
+            self.stats.connections += 1
+
+    def _job_response(self, job: FakeJob) -> Dict[str, Any]:
+        now = time.monotonic()
+        status = job.status(now)
+        out: Dict[str, Any] = {"id": job.id, "status": status}
+        if status != "IN_QUEUE":
+            out["delayTime"] = int(job.queue_delay * 1000)
+        if status == "COMPLETED":
+            out["executionTime"] = int(job.execution_time * 1000)
+            out["output"] = job.output
+        elif status == job.final_status:
+            out["error"] = "injected failure"
+        return out
+
+    def _failure(self) -> Optional[web.Response]:
+        if self.failure_rate and self.rng.random() < self.failure_rate:
+            return web.json_response({"error": "injected failure"}, status=500)
+        return None
+
+    def _warm(self, worker: FakeWorker, now: float) -> bool:
+        """Whether `worker` can take a job at `now` without a cold start."""
+        if not self.cold_start:
+            return True
+        if worker.free_at is None:
+            return False
+        return self.idle_timeout is None or now - worker.free_at <= self.idle_timeout
+
+    def _simulate(self, job: FakeJob) -> None:
+        cold = False
+        if self._fake_workers:
+            ready = job.started_at
+
+            def start(worker: FakeWorker) -> Tuple[float, bool]:
+                """When `worker` would start the job, and whether that is a cold start."""
+                if worker.free_at is not None and worker.free_at > ready:
+                    return worker.free_at, False
+                if self._warm(worker, ready):
+                    return ready, False
+                return ready + self.cold_start, True
+
+            # Warm workers win ties, like RunPod's scheduler prefers them.
+            worker = min(self._fake_workers, key=start)
+            started_at, cold = start(worker)
+            if cold:
+                worker.ready_at = started_at
+                self.stats.cold_starts += 1
+            job.queue_delay = started_at - job.submitted_at
+            worker.free_at = job.started_at + job.execution_time
+        job.finished_at = job.started_at + job.execution_time
+        body = job.input.get("input") or {}
+        if isinstance(body, dict) and body.get("stream") is True:
+            job.chunks = self.stream_output(job.input)
+            step = job.execution_time / len(job.chunks)
+            job.chunk_ready_at = [
+                job.started_at + step * (i + 1) for i in range(len(job.chunks))
+            ]
+            job.output = job.chunks
+        else:
+            job.output = self.output(job.input)
+        if cold:
+            first = job.chunks[0] if job.chunks else job.output
+            if isinstance(first, dict):
+                first[WORKER_METADATA_KEY] = {"worker": {"first_job": True}}
+
+    async def _execute(self, job: FakeJob) -> None:
+        """Runs the worker handler for `job`, like a RunPod worker would."""
+        assert self.handler is not None
+        await asyncio.sleep(job.queue_delay)
+        if self.workers is None:
+            await self._run_handler(job)
+            return
+        if self._worker_slots is None:
+            self._worker_slots = asyncio.Semaphore(self.workers)
+        async with self._worker_slots:
+            now = time.monotonic()
+            free = [w for w in self._fake_workers if w.free_at is None or w.free_at <= now]
+            # Warm workers first, then the one that ran last.
+            worker = max(free, key=lambda w: (self._warm(w, now), w.free_at or 0.0))
+            if not self._warm(worker, now):
+                self.stats.cold_starts += 1
+                await asyncio.sleep(self.cold_start)
+            worker.free_at = math.inf
+            job.queue_delay = time.monotonic() - job.submitted_at
+            try:
+                await self._run_handler(job)
+            finally:
+                worker.free_at = time.monotonic()
+
+    async def _run_handler(self, job: FakeJob) -> None:
+        assert self.handler is not None
+        loop = asyncio.get_running_loop()
+        handler = self.handler
+
+        def produce(chunk: Any) -> None:
+            job.chunks.append(chunk)
+            job.chunk_ready_at.append(time.monotonic())
+
+        def work() -> Any:
+            result = handler({"id": job.id, "input": job.input})
+            if not inspect.isgenerator(result):
+                return result
+            for chunk in result:
+                loop.call_soon_threadsafe(produce, chunk)
+            return None
+
+        started = time.monotonic()
+        if inspect.isasyncgenfunction(handler):
+            result = None
+            async for chunk in handler({"id": job.id, "input": job.input}):
+                produce(chunk)
+        elif inspect.iscoroutinefunction(handler):
+            result = await handler({"id": job.id, "input": job.input})
+        else:
+            result = await asyncio.to_thread(work)
+            # Let the chunks scheduled by the worker thread land first.
+            await asyncio.sleep(0)
+        job.output = job.chunks if result is None else result
+        job.execution_time = time.monotonic() - started
+        job.finished_at = time.monotonic()
+
+    async def _create_job(self, request: web.Request) -> FakeJob:
+        self._track(request)
+        body = await request.json()
+        job_input = body["input"]
+        job = FakeJob(
+            id=str(uuid.uuid4()),
+            input=job_input,
+            submitted_at=time.monotonic(),
+            queue_delay=self._duration(self.queue_delay, job_input),
+            execution_time=self._duration(self.execution_time, job_input),
+        )
+        if self.faults.job_failures and self.rng.random() < self.faults.job_failures:
+            job.final_status = self.faults.failure_status
+        if self.handler is None:
+            self._simulate(job)
+        else:
+            asyncio.ensure_future(self._execute(job))
+        self.jobs[job.id] = job
+        self.stats.jobs_submitted += 1
+        pod_id = request.match_info["pod_id"]
+        self.stats.jobs_by_pod[pod_id] = self.stats.jobs_by_pod.get(pod_id, 0) + 1
+        return job
+
+    async def _wait(self, job: FakeJob, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if job.status(time.monotonic()) not in ("IN_QUEUE", "IN_PROGRESS"):
+                return
+            if job.finished_at is not None:
+                await asyncio.sleep(min(deadline, job.finished_at) - time.monotonic())
+            else:
+                await asyncio.sleep(min(0.01, deadline - time.monotonic()))
+
+    async def _run(self, request: web.Request) -> web.Response:
+        failure = self._failure()
+        if failure is not None:
+            return failure
+        job = await self._create_job(request)
+        return web.json_response({"id": job.id, "status": "IN_QUEUE"})
+
+    async def _runsync(self, request: web.Request) -> web.Response:
+        failure = self._failure()
+        if failure is not None:
+            return failure
+        job = await self._create_job(request)
+        await self._wait(job, int(request.query.get("wait", 90000)) / 1000)
+        return web.json_response(self._job_response(job))
+
+    async def _status(self, request: web.Request) -> web.Response:
+        self._track(request)
+        self.stats.status_polls += 1
+        job = self.jobs.get(request.match_info["job_id"])
+        if job is None:
+            return web.json_response({"error": "job not found"}, status=404)
+        return web.json_response(self._job_response(job))
+
+    async def _stream(self, request: web.Request) -> web.Response:
+        self._track(request)
+        self.stats.stream_polls += 1
+        job = self.jobs.get(request.match_info["job_id"])
+        if job is None:
+            return web.json_response({"error": "job not found"}, status=404)
+        now = time.monotonic()
+        status = job.status(now)
+        stream = [{"output": chunk} for chunk in job.ready_chunks(now)]
+        return web.json_response({"id": job.id, "status": status, "stream": stream})
+
+    async def _cancel(self, request: web.Request) -> web.Response:
+        self._track(request)
+        job = self.jobs.get(request.match_info["job_id"])
+        if job is None:
+            return web.json_response({"error": "job not found"}, status=404)
+        job.cancelled = True
+        self.stats.cancels += 1
+        return web.json_response({"id": job.id, "status": "CANCELLED"})
+
+    async def _health(self, request: web.Request) -> web.Response:
+        self._track(request)
+        failure = self._failure()
+        if failure is not None:
+            return failure
+        now = time.monotonic()
+        statuses = [job.status(now) for job in self.jobs.values()]
+        in_progress = statuses.count("IN_PROGRESS")
+        if self._fake_workers and self.handler is None:
+            workers = {"idle": 0, "initializing": 0, "running": 0}
+            for worker in self._fake_workers:
+                if worker.ready_at > now:
+                    workers["initializing"] += 1
+                elif worker.free_at is not None and worker.free_at > now:
+                    workers["running"] += 1
+                elif self._warm(worker, now):
+                    workers["idle"] += 1
+        else:
+            running = in_progress if self.workers is None else min(in_progress, self.workers)
+            idle = 0 if self.workers is None else self.workers - running
+            workers = {"idle": idle, "running": running}
+        return web.json_response(
+            {
+                "jobs": {
+                    "completed": statuses.count("COMPLETED"),
+                    "failed": 0,
+                    "inProgress": in_progress,
+                    "inQueue": statuses.count("IN_QUEUE"),
+                    "retried": 0,
+                },
+                "workers": workers,
+            }
+        )
+
+    def _faulty(
+        self, name: str, handler: Callable[[web.Request], Any]
+    ) -> Callable[[web.Request], Any]:
+        """`handler` with the `faults` of route `name` injected."""
+        faults = self.faults
+
+        def happens(rates: Dict[str, float]) -> bool:
+            return bool(rates.get(name)) and self.rng.random() < rates[name]
+
+        async def faulty(request: web.Request) -> Any:
+            if happens(faults.errors):
+                self.stats.faults += 1
+                return web.json_response({"error": "injected error"}, status=faults.error_status)
+            if happens(faults.stalls):
+                self.stats.faults += 1
+                await asyncio.sleep(faults.stall_seconds)
+            response = await handler(request)
+            if happens(faults.disconnects):
+                self.stats.faults += 1
+                assert request.transport is not None
+                request.transport.abort()
+            return response
+
+        return faulty
+
+    def routes(self) -> Dict[str, Callable[[web.Request], Any]]:
+        routes = {
+            "POST /run": self._run,
+            "POST /runsync": self._runsync,
+            "GET /status/{job_id}": self._status,
+            "GET /stream/{job_id}": self._stream,
+            "POST /cancel/{job_id}": self._cancel,
+            "GET /health": self._health,
+        }
+        return {
+            route: self._faulty(route.split(" ")[1].split("/")[1], handler)
+            for route, handler in routes.items()
+        }
+
+    async def _graphql(self, request: web.Request) -> web.Response:
+        self.stats.graphql_queries += 1
+        await asyncio.sleep(self.graphql_latency)
+        body = await request.json()
+        if "saveEndpoint" in body["query"] and "variables" not in body:
+            # The RunPod SDK inlines its input, which the fake does not parse.
+            message = "The fake only saves endpoints whose input is a variable"
+            return web.json_response({"errors": [{"message": message}]})
+        if "saveEndpoint" in body["query"]:
+            return web.json_response({"data": {"saveEndpoint": self._save_endpoint(body)}})
+        return web.json_response(
+            {"data": {"myself": {"endpoints": self.endpoints, "podTemplates": self.templates}}}
+        )
+
+    def _save_endpoint(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Updates the endpoint with the input's id, or adds one."""
+        fields = dict(body["variables"]["input"])
+        fields.setdefault("id", f"ep-{uuid.uuid4().hex[:8]}")
+        for endpoint in self.endpoints:
+            if endpoint["id"] == fields["id"]:
+                endpoint.update(fields)
+                return endpoint
+        self.endpoints.append(fields)
+        return fields
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        for route, handler in self.routes().items():
+            method, path = route.split(" ")
+            app.router.add_route(method, "/v2/{pod_id}" + path, handler)
+        app.router.add_post("/graphql", self._graphql)
+        return app
+
+
+class FakeRunpodFleet(BackgroundServer):
+    """Several fake endpoints behind one API, each with its own behaviour.
+
+    Requests for `/v2/<pod_id>/...` are answered by `pods[pod_id]`.
+    """
+
+    base_path = "/v2"
+
+    def __init__(self, pods: Dict[str, FakeRunpod]):
+        super().__init__()
+        self.pods = pods
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        for route in next(iter(self.pods.values())).routes():
+            method, path = route.split(" ")
+
+            async def dispatch(request: web.Request, route: str = route) -> Any:
+                pod = self.pods.get(request.match_info["pod_id"])
+                if pod is None:
+                    return web.json_response({"error": "endpoint not found"}, status=404)
+                return await pod.routes()[route](request)
+
+            app.router.add_route(method, "/v2/{pod_id}" + path, dispatch)
+        return app
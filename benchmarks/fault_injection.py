@@ -0,0 +1,363 @@
+"""Checks how the repositories and the proxies survive a misbehaving RunPod.
+
+Every scenario starts a fake RunPod API injecting one kind of fault, makes
+calls through the sync and async repositories (or a proxy) and checks the
+outcome: transient errors and dropped answers are retried without
+submitting a job twice, failed jobs and deadlines end the call instead of
+polling forever, and jobs nobody waits for anymore are cancelled. Exits
+with status 1 when a check fails.
+
+    python benchmarks/fault_injection.py --calls 20
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+import aiohttp
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_runpod import FakeRunpod, FakeRunpodFleet, Faults  # noqa: E402
+from benchmarks.load_test_proxy import (  # noqa: E402
+    PROXY_COMMANDS,
+    _free_port,
+    _start_proxy,
+    _wait_until_listening,
+)
+from runpod_ollama.async_runpod_repository import AsyncRunpodRepository  # noqa: E402
+from runpod_ollama.exceptions import DeadlineExceeded, JobFailed  # noqa: E402
+from runpod_ollama.polling import FixedInterval  # noqa: E402
+from runpod_ollama.retries import RetryPolicy  # noqa: E402
+from runpod_ollama.runpod_repository import RunpodRepository  # noqa: E402
+
+POD_ID = "pod"
+INPUT = {"model": "fake", "prompt": "hello"}
+STREAM_INPUT = {"model": "fake", "prompt": "a b c d e f g h", "stream": True}
+RETRY = RetryPolicy(attempts=8, backoff=0.05, max_backoff=0.5)
+POLLING = FixedInterval(0.05)
+
+Check = Tuple[str, bool]
+# Runs `calls` calls of one engine against a fake's base url, returns checks.
+Scenario = Callable[[str, FakeRunpod, str, int], Awaitable[List[Check]]]
+
+
+def _sync_repository(base_url: str, **kwargs: Any) -> RunpodRepository:
+    return RunpodRepository(
+        "fault-injection", POD_ID, base_url=base_url, polling=POLLING, retry=RETRY, **kwargs
+    )
+
+
+async def _calls(
+    engine: str, base_url: str, calls: int, **kwargs: Any
+) -> List[Any]:
+    """`calls` concurrent `call_endpoint`s, each result or exception in a list."""
+    http_timeout = kwargs.pop("http_timeout", None)
+    if engine == "sync":
+        repository = _sync_repository(base_url, http_timeout=http_timeout)
+
+        def one() -> Any:
+            try:
+                return repository.call_endpoint("generate", INPUT, **kwargs)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(calls) as pool:
+            return list(pool.map(lambda _: one(), range(calls)))
+    async with aiohttp.ClientSession() as session:
+        repository = AsyncRunpodRepository(
+            "fault-injection",
+            POD_ID,
+            session=session,
+            base_url=base_url,
+            polling=POLLING,
+            retry=RETRY,
+            http_timeout=http_timeout,
+        )
+        return await asyncio.gather(
+            *(repository.call_endpoint("generate", INPUT, **kwargs) for _ in range(calls)),
+            return_exceptions=True,
+        )
+
+
+def _ok(results: List[Any]) -> bool:
+    return all(isinstance(r, dict) and "response" in r for r in results)
+
+
+async def transient_submit_errors(engine, fake, base_url, calls):
+    results = await _calls(engine, base_url, calls)
+    return [
+        ("every call succeeded", _ok(results)),
+        ("faults were injected", fake.stats.faults > 0),
+        ("no job was submitted twice", fake.stats.jobs_submitted == calls),
+    ]
+
+
+async def flaky_polls(engine, fake, base_url, calls):
+    results = await _calls(engine, base_url, calls)
+    return [("every call succeeded", _ok(results)), ("faults were injected", fake.stats.faults > 0)]
+
+
+async def stalled_polls(engine, fake, base_url, calls):
+    started = time.monotonic()
+    results = await _calls(engine, base_url, calls, http_timeout=0.3)
+    return [
+        ("every call succeeded", _ok(results)),
+        ("stalls were cut short", time.monotonic() - started < fake.faults.stall_seconds),
+    ]
+
+
+async def lost_submissions(engine, fake, base_url, calls):
+    results = await _calls(engine, base_url, calls)
+    lost = sum(isinstance(r, (requests.RequestException, aiohttp.ClientError)) for r in results)
+    return [
+        ("some answers were lost", lost > 0),
+        ("the others succeeded", _ok([r for r in results if not isinstance(r, Exception)])),
+        ("no job was submitted twice", fake.stats.jobs_submitted == calls),
+    ]
+
+
+async def failed_jobs(engine, fake, base_url, calls):
+    started = time.monotonic()
+    results = await _calls(engine, base_url, calls)
+    return [
+        ("every call raised JobFailed", all(isinstance(r, JobFailed) for r in results)),
+        ("without polling forever", time.monotonic() - started < 5),
+    ]
+
+
+async def deadlines(engine, fake, base_url, calls):
+    started = time.monotonic()
+    results = await _calls(engine, base_url, calls, timeout=0.5)
+    return [
+        ("every call hit its deadline", all(isinstance(r, DeadlineExceeded) for r in results)),
+        ("on time", time.monotonic() - started < 2),
+        ("every job was cancelled", fake.stats.cancels == calls),
+    ]
+
+
+async def abandoned_calls(engine, fake, base_url, calls):
+    if engine == "sync":
+        repository = _sync_repository(base_url)
+
+        def one():
+            stream = repository.stream_endpoint("generate", STREAM_INPUT)
+            next(stream)
+            stream.close()
+
+        with ThreadPoolExecutor(calls) as pool:
+            list(pool.map(lambda _: one(), range(calls)))
+    else:
+        async with aiohttp.ClientSession() as session:
+            repository = AsyncRunpodRepository(
+                "fault-injection", POD_ID, session=session, base_url=base_url, polling=POLLING
+            )
+            tasks = [
+                asyncio.ensure_future(repository.call_endpoint("generate", INPUT))
+                for _ in range(calls)
+            ]
+            await asyncio.sleep(0.3)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    return [
+        ("every job was cancelled", fake.stats.cancels == calls),
+        ("none is tracked anymore", not repository.active_jobs),
+    ]
+
+
+async def cancel_requests(engine, fake, base_url, calls):
+    started = time.monotonic()
+    if engine == "sync":
+        repository = _sync_repository(base_url)
+        with ThreadPoolExecutor(calls) as pool:
+            futures = [
+                pool.submit(repository.call_endpoint, "generate", INPUT) for _ in range(calls)
+            ]
+            while len(repository.active_jobs) < calls:
+                time.sleep(0.01)
+            repository.cancel_requests()
+            results = [f.exception() for f in futures]
+    else:
+        async with aiohttp.ClientSession() as session:
+            repository = AsyncRunpodRepository(
+                "fault-injection", POD_ID, session=session, base_url=base_url, polling=POLLING
+            )
+            tasks = [
+                asyncio.ensure_future(repository.call_endpoint("generate", INPUT))
+                for _ in range(calls)
+            ]
+            while len(repository.active_jobs) < calls:
+                await asyncio.sleep(0.01)
+            await repository.cancel_requests()
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+    return [
+        ("every concurrent job was cancelled", fake.stats.cancels == calls),
+        ("every call ended CANCELLED", all(isinstance(r, JobFailed) for r in results)),
+        ("at once", time.monotonic() - started < 5),
+    ]
+
+
+SCENARIOS: Dict[str, Tuple[Dict[str, Any], Scenario]] = {
+    "transient-submit-errors": (
+        {"faults": Faults(errors={"run": 0.3})},
+        transient_submit_errors,
+    ),
+    "flaky-polls": (
+        {"faults": Faults(errors={"status": 0.2}, error_status=500, disconnects={"status": 0.2})},
+        flaky_polls,
+    ),
+    "stalled-polls": (
+        {"faults": Faults(stalls={"status": 0.2}, stall_seconds=5)},
+        stalled_polls,
+    ),
+    "lost-submissions": ({"faults": Faults(disconnects={"run": 0.3})}, lost_submissions),
+    "failed-jobs": ({"faults": Faults(job_failures=1.0)}, failed_jobs),
+    "deadlines": ({"execution_time": 30}, deadlines),
+    "abandoned-calls": ({"execution_time": 30}, abandoned_calls),
+    "cancel-requests": ({"execution_time": 30}, cancel_requests),
+}
+
+
+async def _until(condition: Callable[[], bool], timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    return condition()
+
+
+async def _proxy_checks(engine: str, fake: FakeRunpod, port: int) -> List[Check]:
+    url = f"http://127.0.0.1:{port}/{POD_ID}/generate"
+    checks: List[Check] = []
+    async with aiohttp.ClientSession() as session:
+        # A stream the client stops reading, WSGI notices it at the next chunk.
+        async with session.post(url, json=STREAM_INPUT) as response:
+            await response.content.readline()
+        cancelled = await _until(lambda: fake.stats.cancels == 1, timeout=5)
+        checks.append(("a dropped stream cancels its job", cancelled))
+
+        started = time.monotonic()
+        async with session.post(url, json=INPUT, headers={"X-Request-Timeout": "0.5"}) as response:
+            status = response.status
+        checks.append(("X-Request-Timeout answers 504", status == 504))
+        checks.append(("on time", time.monotonic() - started < 2))
+        cancelled = await _until(lambda: fake.stats.cancels == 2, timeout=1)
+        checks.append(("and cancels the job", cancelled))
+
+        if engine == "async":
+            # WSGI cannot tell that a client of a plain request went away.
+            try:
+                await session.post(url, json=INPUT, timeout=aiohttp.ClientTimeout(total=0.5))
+            except asyncio.TimeoutError:
+                pass
+            cancelled = await _until(lambda: fake.stats.cancels == 3, timeout=1)
+            checks.append(("a client going away cancels its job", cancelled))
+    return checks
+
+
+def _run_proxy(engine: str) -> List[Check]:
+    fake = FakeRunpod(execution_time=30)
+    port = _free_port()
+    proxy = _start_proxy(
+        engine,
+        port,
+        fake.start_in_thread(),
+        {"RESPONSE_CACHE": "off"},
+    )
+    try:
+        asyncio.run(_wait_until_listening(port))
+        return asyncio.run(_proxy_checks(engine, fake, port))
+    finally:
+        proxy.terminate()
+        proxy.wait()
+        fake.stop_thread()
+
+
+async def _pool_checks(fleet: FakeRunpodFleet, port: int) -> List[Check]:
+    url = f"http://127.0.0.1:{port}/pool/generate"
+    headers = {"X-Session-Id": "conversation"}
+    checks: List[Check] = []
+    async with aiohttp.ClientSession() as session:
+        async with session.post(url, json=INPUT, headers=headers) as response:
+            checks.append(("a routed session turn answers", response.status == 200))
+        pinned = next(pod for pod in fleet.pods.values() if pod.stats.jobs_submitted)
+        for dropped in range(1, 4):
+            async with session.post(url, json=STREAM_INPUT, headers=headers) as response:
+                await response.content.readline()
+            await _until(lambda: pinned.stats.cancels == dropped, timeout=5)
+        async with session.post(url, json=INPUT, headers=headers) as response:
+            checks.append(("the next turn answers", response.status == 200))
+        checks.append(
+            (
+                "three client disconnects leave the endpoint in the pool",
+                sum(pod.stats.jobs_submitted for pod in fleet.pods.values())
+                == pinned.stats.jobs_submitted
+                == 5,
+            )
+        )
+    return checks
+
+
+def _run_pool(engine: str) -> List[Check]:
+    fleet = FakeRunpodFleet({name: FakeRunpod(execution_time=3) for name in ("a", "b")})
+    port = _free_port()
+    proxy = _start_proxy(
+        engine,
+        port,
+        fleet.start_in_thread(),
+        {
+            "RESPONSE_CACHE": "off",
+            "COALESCE_REQUESTS": "off",
+            "PROXY_SESSIONS": "on",
+            "RUNPOD_ROUTES": json.dumps({"pool": ["a", "b"]}),
+        },
+    )
+    try:
+        asyncio.run(_wait_until_listening(port))
+        return asyncio.run(_pool_checks(fleet, port))
+    finally:
+        proxy.terminate()
+        proxy.wait()
+        fleet.stop_thread()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), action="append")
+    parser.add_argument("--engine", choices=sorted(PROXY_COMMANDS), action="append")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    failed = 0
+    print(f"{'scenario':<25} {'engine':<7} {'result':<6} check")
+
+    def report(name: str, engine: str, checks: List[Check]):
+        nonlocal failed
+        for description, ok in checks:
+            failed += not ok
+            print(f"{name:<25} {engine:<7} {'ok' if ok else 'FAILED':<6} {description}")
+
+    for name in args.scenario or SCENARIOS:
+        kwargs, scenario = SCENARIOS[name]
+        for engine in ("sync", "async"):
+            fake = FakeRunpod(**{"execution_time": 0.2, "seed": 1, **kwargs})
+            base_url = fake.start_in_thread()
+            try:
+                report(name, engine, asyncio.run(scenario(engine, fake, base_url, args.calls)))
+            finally:
+                fake.stop_thread()
+    for engine in args.engine or sorted(PROXY_COMMANDS):
+        report("proxy", engine, _run_proxy(engine))
+        report("routed proxy", engine, _run_pool(engine))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Measures cold starts of bursty traffic with and without the warm pool keeper.
+
+Sends a burst of `--burst` requests every `--gap` seconds through the proxy
+to a fake RunPod endpoint whose workers take `--cold-start` seconds to start
+and stop after `--idle-timeout` idle seconds, once as is and once with the
+proxy keeping `--burst` workers warm, and reports the cold starts the
+requests ran into and their latency.
+
+    python benchmarks/keep_warm.py --burst 4 --gap 8 --bursts 6
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import Any, Dict, List
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_runpod import WORKER_METADATA_KEY, FakeRunpod  # noqa: E402
+from benchmarks.load_test_proxy import (  # noqa: E402
+    PROXY_COMMANDS,
+    _free_port,
+    _start_proxy,
+    _wait_until_listening,
+)
+
+WARM_METHOD = "_warm"
+
+
+def _execution_time(job_input: Any) -> float:
+    return 0.05 if job_input.get("method_name") == WARM_METHOD else 1.0
+
+
+async def _bursts(port: int, burst: int, gap: float, bursts: int) -> List[float]:
+    latencies: List[float] = []
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as session:
+
+        async def one(i: int) -> None:
+            started = time.monotonic()
+            async with session.post(
+                f"http://127.0.0.1:{port}/fakepod/generate",
+                json={"model": "fake", "prompt": f"request {i}"},
+            ) as response:
+                response.raise_for_status()
+                await response.read()
+            latencies.append(time.monotonic() - started)
+
+        for b in range(bursts):
+            # Give the keeper its first check before the first burst too.
+            await asyncio.sleep(gap)
+            await asyncio.gather(*(one(b * burst + i) for i in range(burst)))
+    return sorted(latencies)
+
+
+def run(
+    engine: str,
+    scenario: str,
+    env: Dict[str, str],
+    burst: int,
+    gap: float,
+    bursts: int,
+    cold_start: float,
+    idle_timeout: float,
+) -> None:
+    fake_runpod = FakeRunpod(
+        execution_time=_execution_time,
+        queue_delay=0.05,
+        workers=burst * 2,
+        cold_start=cold_start,
+        idle_timeout=idle_timeout,
+    )
+    port = _free_port()
+    proxy = _start_proxy(
+        engine,
+        port,
+        fake_runpod.start_in_thread(),
+        extra_env={"COALESCE_REQUESTS": "off", **env},
+    )
+    try:
+        asyncio.run(_wait_until_listening(port))
+        latencies = asyncio.run(_bursts(port, burst, gap, bursts))
+    finally:
+        proxy.terminate()
+        proxy.wait()
+        fake_runpod.stop_thread()
+
+    jobs = list(fake_runpod.jobs.values())
+    traffic = [job for job in jobs if job.input.get("method_name") != WARM_METHOD]
+    cold = [
+        job for job in traffic
+        if isinstance(job.output, dict) and WORKER_METADATA_KEY in job.output
+    ]
+
+    def quantile(q: float) -> float:
+        return latencies[int(q * (len(latencies) - 1))]
+
+    print(
+        f"{scenario:<10} {quantile(0.5):>6.2f}s {quantile(0.99):>6.2f}s "
+        f"{len(cold):>6}/{len(traffic):<4} {len(jobs) - len(traffic):>9}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", choices=sorted(PROXY_COMMANDS), default="async")
+    parser.add_argument("--burst", type=int, default=4)
+    parser.add_argument("--gap", type=float, default=8.0)
+    parser.add_argument("--bursts", type=int, default=6)
+    parser.add_argument("--cold-start", type=float, default=3.0)
+    parser.add_argument("--idle-timeout", type=float, default=4.0)
+    args = parser.parse_args()
+
+    keep_warm = {
+        "KEEP_WARM_ENDPOINTS": "fakepod",
+        "KEEP_WARM_MIN_WORKERS": str(args.burst),
+        "KEEP_WARM_MAX_WORKERS": str(args.burst),
+        "KEEP_WARM_INTERVAL": str(args.idle_timeout / 2),
+    }
+    print(
+        f"engine={args.engine}, {args.bursts} bursts of {args.burst} every {args.gap:.0f}s, "
+        f"{args.cold_start:.0f}s cold starts, {args.idle_timeout:.0f}s idle timeout"
+    )
+    print(f"{'scenario':<10} {'p50':>7} {'p99':>7} {'cold/requests':>13} {'warm jobs':>9}")
+    for scenario, env in (("no keeper", {}), ("keep-warm", keep_warm)):
+        run(
+            args.engine,
+            scenario,
+            env,
+            args.burst,
+            args.gap,
+            args.bursts,
+            args.cold_start,
+            args.idle_timeout,
+        )
+
+
+if __name__ == "__main__":
+    main()
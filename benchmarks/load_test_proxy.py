@@ -0,0 +1,132 @@
+"""Load test for the local proxy engines.
+
+Starts a fake RunPod API, starts the proxy as a subprocess pointed at it, then
+fires `--concurrency` simultaneous `/generate` requests and reports how long
+it took for all of them to come back.
+
+    python benchmarks/load_test_proxy.py --engine flask --engine async
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_runpod import FakeRunpod  # noqa: E402
+
+PROXY_COMMANDS = {
+    "flask": "from runpod_ollama.local_proxy import run_local_proxy; run_local_proxy(port={port})",
+    "async": "from runpod_ollama.async_proxy import run_async_proxy; run_async_proxy(port={port})",
+}
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_proxy(
+    engine: str,
+    port: int,
+    api_base_url: str,
+    extra_env: Optional[Dict[str, str]] = None,
+) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update(
+        RUNPOD_ENDPOINT_BASE_URL=api_base_url,
+        RUNPOD_API_TOKEN="load-test",
+        HF_TOKEN=env.get("HF_TOKEN") or "unused",
+        # The fakes are called by pod id, no need to list them.
+        PROXY_RESOLVE_NAMES="off",
+    )
+    env.update(extra_env or {})
+    return subprocess.Popen(
+        [sys.executable, "-c", PROXY_COMMANDS[engine].format(port=port)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def _wait_until_listening(port: int, timeout: float = 20) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.05)
+    raise TimeoutError(f"proxy did not start listening on port {port}")
+
+
+async def _fire(port: int, concurrency: int, timeout: float) -> List[float]:
+    connector = aiohttp.TCPConnector(limit=0)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+
+        async def one(i: int) -> float:
+            started = time.monotonic()
+            async with session.post(
+                f"http://127.0.0.1:{port}/fakepod/generate",
+                json={"model": "fake", "prompt": f"request {i}"},
+            ) as response:
+                response.raise_for_status()
+                await response.read()
+            return time.monotonic() - started
+
+        results = await asyncio.gather(
+            *(one(i) for i in range(concurrency)), return_exceptions=True
+        )
+    return [r for r in results if isinstance(r, float)]
+
+
+def run(engine: str, concurrency: int, job_seconds: float, timeout: float) -> None:
+    fake_runpod = FakeRunpod(execution_time=job_seconds)
+    api_base_url = fake_runpod.start_in_thread()
+    port = _free_port()
+    proxy = _start_proxy(engine, port, api_base_url)
+    try:
+        asyncio.run(_wait_until_listening(port))
+        started = time.monotonic()
+        latencies = asyncio.run(_fire(port, concurrency, timeout))
+        wall = time.monotonic() - started
+    finally:
+        proxy.terminate()
+        proxy.wait()
+        fake_runpod.stop_thread()
+
+    ok = len(latencies)
+    print(f"engine={engine}")
+    print(f"  completed      {ok}/{concurrency} in {wall:.2f}s")
+    print(f"  throughput     {ok / wall:.1f} req/s")
+    if latencies:
+        latencies.sort()
+        print(f"  latency p50    {statistics.median(latencies):.2f}s")
+        print(f"  latency p99    {latencies[int(0.99 * (ok - 1))]:.2f}s")
+    print(f"  runpod jobs    {fake_runpod.stats.jobs_submitted}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", action="append", choices=sorted(PROXY_COMMANDS))
+    parser.add_argument("--concurrency", type=int, default=1000)
+    parser.add_argument("--job-seconds", type=float, default=5.0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    for engine in args.engine or sorted(PROXY_COMMANDS):
+        run(engine, args.concurrency, args.job_seconds, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
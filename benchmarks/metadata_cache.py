@@ -0,0 +1,225 @@
+"""Checks the cache of RunPod templates and endpoints used by the CLI and the proxies.
+
+Starts a fake RunPod API whose `/graphql` lists a few endpoints, answering
+after `--graphql-latency` seconds like the real control plane, and runs the
+CLI's lookups against it: the first one lists the endpoints, the next ones
+answer from the cache file without asking RunPod until `METADATA_CACHE_TTL`
+has passed, `--refresh` always asks, and a name the cache does not know is
+looked up once more before failing. Both proxies are then sent requests by
+model name, which have to reach the endpoint's id. Prints the median time of
+a cached and of a refreshed lookup, and exits with status 1 when a check
+fails.
+
+    python benchmarks/metadata_cache.py --runs 10 --graphql-latency 0.3
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_runpod import FakeRunpod  # noqa: E402
+from benchmarks.load_test_proxy import (  # noqa: E402
+    PROXY_COMMANDS,
+    _free_port,
+    _start_proxy,
+    _wait_until_listening,
+)
+
+CLI = "from runpod_ollama.cli import run_cli; run_cli()"
+
+ENDPOINTS = [
+    {"id": "ep-llama3", "name": "llama3", "templateId": "tpl-llama3", "workersMax": 1},
+    # RunPod renames endpoints created with FlashBoot.
+    {"id": "ep-mistral", "name": "mistral -fb", "templateId": "tpl-mistral", "workersMax": 2},
+    {"id": "ep-phi3", "name": "phi3", "templateId": "tpl-phi3", "workersMax": 1},
+]
+TEMPLATES = [
+    {"id": f"tpl-{name}", "name": name, "imageName": "runpod-ollama", "containerDiskInGb": 20}
+    for name in ("llama3", "mistral", "phi3")
+]
+
+Check = Tuple[str, bool]
+
+
+class Cli:
+    """Runs the CLI against the fake with one cache file."""
+
+    def __init__(self, control_plane_url: str, cache_path: str, ttl: float = 300):
+        self.env = dict(os.environ)
+        self.env.update(
+            RUNPOD_API_BASE_URL=control_plane_url,
+            RUNPOD_API_TOKEN="metadata-test",
+            METADATA_CACHE_PATH=cache_path,
+            METADATA_CACHE_TTL=str(ttl),
+            HF_TOKEN=self.env.get("HF_TOKEN") or "unused",
+        )
+
+    def run(self, *args: str, token: Optional[str] = None) -> Tuple[int, str, float]:
+        """The exit status, the output and the wall time of one command."""
+        env = dict(self.env, RUNPOD_API_TOKEN=token) if token else self.env
+        started = time.perf_counter()
+        process = subprocess.run(
+            [sys.executable, "-c", CLI, *args], env=env, capture_output=True, text=True
+        )
+        return process.returncode, process.stdout.strip(), time.perf_counter() - started
+
+
+def _cli_checks(
+    fake: FakeRunpod, control_plane_url: str, runs: int
+) -> Tuple[List[Check], Dict[str, float]]:
+    directory = tempfile.mkdtemp()
+    cli = Cli(control_plane_url, os.path.join(directory, "metadata.json"))
+    checks: List[Check] = []
+
+    def queries_during(*args: str, **kwargs) -> Tuple[int, str, int]:
+        before = fake.stats.graphql_queries
+        status, out, _ = cli.run(*args, **kwargs)
+        return status, out, fake.stats.graphql_queries - before
+
+    status, out, queries = queries_during("resolve", "llama3")
+    checks.append(
+        ("the first lookup lists the endpoints once", (status, out, queries) == (0, "ep-llama3", 1))
+    )
+
+    before = fake.stats.graphql_queries
+    cached = [cli.run("resolve", "llama3")[2] for _ in range(runs)]
+    checks.append(("the next ones answer from the cache", fake.stats.graphql_queries == before))
+
+    refreshed = [cli.run("resolve", "llama3", "--refresh")[2] for _ in range(runs)]
+    checks.append(("--refresh always asks RunPod", fake.stats.graphql_queries == before + runs))
+
+    status, out, _ = queries_during("resolve", "mistral")
+    checks.append(("FlashBoot's suffix is ignored", (status, out) == (0, "ep-mistral")))
+    status, out, _ = queries_during("resolve", "ep-phi3")
+    checks.append(("ids resolve to themselves", (status, out) == (0, "ep-phi3")))
+
+    status, out, _ = queries_during("endpoints", "--json")
+    checks.append(("endpoints --json lists them", status == 0 and json.loads(out) == ENDPOINTS))
+    status, out, _ = queries_during("templates", "--json")
+    checks.append(("templates --json lists them", status == 0 and json.loads(out) == TEMPLATES))
+    status, out, _ = queries_during("resolve", "phi3", "--json")
+    checks.append(
+        ("resolve --json prints the endpoint", status == 0 and json.loads(out) == ENDPOINTS[2])
+    )
+
+    status, _, queries = queries_during("resolve", "gemma")
+    checks.append(("an unknown name is looked up again, then fails", (status, queries) == (1, 1)))
+
+    fake.endpoints.append({"id": "ep-gemma", "name": "gemma", "templateId": "tpl-gemma"})
+    status, out, queries = queries_during("resolve", "gemma")
+    checks.append(
+        ("a new endpoint is found without --refresh", (status, out, queries) == (0, "ep-gemma", 1))
+    )
+    fake.endpoints.pop()
+
+    status, out, queries = queries_during("resolve", "llama3", token="another-account")
+    checks.append(("another API key lists its own", (status, queries) == (0, 1)))
+
+    expiring = Cli(control_plane_url, os.path.join(directory, "expiring.json"), ttl=0.5)
+    expiring.run("resolve", "llama3")
+    before = fake.stats.graphql_queries
+    time.sleep(0.6)
+    expiring.run("resolve", "llama3")
+    checks.append(("a stale listing is fetched again", fake.stats.graphql_queries == before + 1))
+    timings = {"cached": statistics.median(cached), "refreshed": statistics.median(refreshed)}
+    return checks, timings
+
+
+async def _until_fetched(session: aiohttp.ClientSession, port: int, timeout: float = 10) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        async with session.get(f"http://127.0.0.1:{port}/_proxy/metadata") as response:
+            if (await response.json()).get("fetched"):
+                return True
+        await asyncio.sleep(0.05)
+    return False
+
+
+async def _proxy_checks(fake: FakeRunpod, port: int) -> List[Check]:
+    async with aiohttp.ClientSession() as session:
+        fetched = await _until_fetched(session, port)
+        statuses = []
+        for name in ("llama3", "mistral", "ep-phi3"):
+            async with session.post(
+                f"http://127.0.0.1:{port}/{name}/generate", json={"model": name, "prompt": "hi"}
+            ) as response:
+                statuses.append(response.status)
+    return [
+        ("the proxy lists the endpoints when it starts", fetched),
+        ("requests by model name succeed", statuses == [200, 200, 200]),
+        (
+            "and reach the endpoint ids",
+            fake.stats.jobs_by_pod == {"ep-llama3": 1, "ep-mistral": 1, "ep-phi3": 1},
+        ),
+    ]
+
+
+def _run_proxy(engine: str, graphql_latency: float) -> List[Check]:
+    fake = FakeRunpod(execution_time=0.05)
+    fake.endpoints, fake.templates = ENDPOINTS, TEMPLATES
+    fake.graphql_latency = graphql_latency
+    base_url = fake.start_in_thread()
+    port = _free_port()
+    proxy = _start_proxy(
+        engine,
+        port,
+        base_url,
+        {
+            "PROXY_RESOLVE_NAMES": "on",
+            "RUNPOD_API_BASE_URL": base_url.rsplit("/v2", 1)[0],
+            "METADATA_CACHE_PATH": os.path.join(tempfile.mkdtemp(), "metadata.json"),
+        },
+    )
+    try:
+        asyncio.run(_wait_until_listening(port))
+        return asyncio.run(_proxy_checks(fake, port))
+    finally:
+        proxy.terminate()
+        proxy.wait()
+        fake.stop_thread()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--graphql-latency", type=float, default=0.3)
+    parser.add_argument("--engine", choices=sorted(PROXY_COMMANDS), action="append")
+    args = parser.parse_args()
+
+    fake = FakeRunpod()
+    fake.endpoints, fake.templates = ENDPOINTS, TEMPLATES
+    fake.graphql_latency = args.graphql_latency
+    base_url = fake.start_in_thread()
+    try:
+        checks, timings = _cli_checks(fake, base_url.rsplit("/v2", 1)[0], args.runs)
+    finally:
+        fake.stop_thread()
+    results = [("cli", checks)]
+    for engine in args.engine or sorted(PROXY_COMMANDS):
+        results.append((engine, _run_proxy(engine, args.graphql_latency)))
+
+    print(f"{'lookup':<10} {'median':>8}")
+    for name, seconds in timings.items():
+        print(f"{name:<10} {seconds * 1000:>6.0f}ms")
+    print()
+    failed = 0
+    print(f"{'where':<6} {'result':<6} check")
+    for where, where_checks in results:
+        for description, ok in where_checks:
+            failed += not ok
+            print(f"{where:<6} {'ok' if ok else 'FAILED':<6} {description}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""Serves several small models from one worker and measures model swaps.
+
+Runs the real worker handler against a fake Ollama whose VRAM holds
+`--resident` of the `--models` models at once, each taking `--load` seconds
+to load. `--requests` generate jobs arrive at `--rate` per second in two
+phases with opposite model mixes, and run on:
+
+- "ollama lru": a multi-model worker that leaves evictions to Ollama,
+- "residency": the worker's `ModelResidency`, which knows the VRAM,
+- "residency+preload": the same, loading models the recent jobs asked for
+  before they are needed.
+
+Prints the share of jobs that found their model loaded, as Ollama's load
+times tell and as the worker reported it, the time spent loading and
+unloading models and the job latencies. Exits with status 1 when a check
+fails: every job reports its model, runs the model it named, a model outside
+the allow-list is refused, and with the residency manager Ollama never
+evicts on its own and the reported hits are the real ones.
+
+    python benchmarks/multi_model.py --models 4 --resident 2 --requests 200
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_ollama import FakeOllama  # noqa: E402
+from benchmarks.streaming_ttft import load_worker_module  # noqa: E402
+
+MODEL_BYTES = 2 * 1024**3
+
+# Keep in sync with `server/runpod_wrapper.py`.
+WORKER_METADATA_KEY = "runpod_ollama"
+
+Check = Tuple[str, bool]
+
+
+def _traffic(models: List[str], requests: int, rate: float, seed: int) -> List[Tuple[float, str]]:
+    """Arrival times and models, the first model popular first and the last one after."""
+    rng = random.Random(seed)
+    weights = [2.0**-i for i in range(len(models))]
+    at = 0.0
+    traffic = []
+    for i in range(requests):
+        at += rng.expovariate(rate)
+        mix = weights if i < requests // 2 else weights[::-1]
+        traffic.append((at, rng.choices(models, mix)[0]))
+    return traffic
+
+
+async def _run(
+    worker, traffic: List[Tuple[float, str]]
+) -> Tuple[List[float], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    latencies: List[float] = []
+    reports: List[Dict[str, Any]] = []
+    timings: List[Dict[str, Any]] = []
+
+    async def one(i: int, at: float, model: str):
+        await asyncio.sleep(max(at - (time.monotonic() - started), 0))
+        sent = time.monotonic()
+        job = {
+            "id": str(i),
+            "input": {"method_name": "generate", "input": {"model": model, "prompt": str(i)}},
+        }
+        async for output in worker.handler(job):
+            metadata = output.get(WORKER_METADATA_KEY) or {}
+            reports.append(metadata.get("model") or {})
+            timings.append(metadata.get("ollama") or {})
+        latencies.append(time.monotonic() - sent)
+
+    started = time.monotonic()
+    await asyncio.gather(*(one(i, at, model) for i, (at, model) in enumerate(traffic)))
+    return latencies, reports, timings
+
+
+def run(
+    module,
+    ollama: FakeOllama,
+    base_url: str,
+    models: List[str],
+    traffic: List[Tuple[float, str]],
+    vram_gb: float,
+    preload: bool,
+) -> Dict[str, Any]:
+    config = module.WorkerConfig(
+        model=models[0],
+        ollama_base_url=base_url,
+        concurrency=4,
+        models=models,
+        vram_gb=vram_gb,
+        preload=preload,
+    )
+    worker = module.OllamaWorker(config, model_sizes={model: MODEL_BYTES for model in models})
+    ollama.received.clear()
+    ollama.loaded.clear()
+    evictions = ollama.evictions
+
+    async def serve():
+        try:
+            return await _run(worker, traffic)
+        finally:
+            await worker.close()
+
+    latencies, reports, timings = asyncio.run(serve())
+    named = [body.get("model") for path, body in ollama.received if body.get("prompt")]
+    hits = [not t.get("load_seconds") for t in timings]
+    reported = [bool(r.get("hit")) for r in reports]
+    return {
+        "hit_rate": sum(hits) / len(hits),
+        "reported_hit_rate": sum(reported) / len(reported),
+        "reported_hits": sum(reported) == sum(hits),
+        "load_seconds": sum(t.get("load_seconds", 0) for t in timings),
+        "unload_seconds": sum(r.get("unload_seconds", 0) for r in reports),
+        "p50": statistics.median(latencies),
+        "p95": sorted(latencies)[int(0.95 * (len(latencies) - 1))],
+        "reported": all("hit" in r and "hit_rate" in r for r in reports),
+        "routed": sorted(named) == sorted(model for _, model in traffic),
+        "ollama_evictions": ollama.evictions - evictions,
+    }
+
+
+async def _refused(module, base_url: str, models: List[str]) -> bool:
+    worker = module.OllamaWorker(
+        module.WorkerConfig(model=models[0], ollama_base_url=base_url, models=models)
+    )
+    job = {"id": "x", "input": {"method_name": "generate", "input": {"model": "other"}}}
+    outputs = [output async for output in worker.handler(job)]
+    await worker.close()
+    return len(outputs) == 1 and outputs[0].get("status") == "failed"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--models", type=int, default=4)
+    parser.add_argument("--resident", type=int, default=2)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=10.0)
+    parser.add_argument("--load", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    module = load_worker_module()
+    models = [f"small-{chr(ord('a') + i)}" for i in range(args.models)]
+    ollama = FakeOllama(
+        tokens=8,
+        tokens_per_second=200,
+        prompt_eval_seconds=0.01,
+        model_sizes={model: MODEL_BYTES for model in models},
+        vram=args.resident * MODEL_BYTES,
+        load_seconds=args.load,
+    )
+    base_url = ollama.start_in_thread()
+    traffic = _traffic(models, args.requests, args.rate, args.seed)
+    vram_gb = args.resident * MODEL_BYTES / 1024**3
+    try:
+        results = {
+            "ollama lru": run(module, ollama, base_url, models, traffic, 0, False),
+            "residency": run(module, ollama, base_url, models, traffic, vram_gb, False),
+            "residency+preload": run(module, ollama, base_url, models, traffic, vram_gb, True),
+        }
+        refused = asyncio.run(_refused(module, base_url, models))
+    finally:
+        ollama.stop_thread()
+
+    print(
+        f"{args.models} models, {args.resident} fit in VRAM, {args.load}s to load one,"
+        f" {args.requests} jobs at {args.rate}/s"
+    )
+    print(
+        f"{'worker':<18} {'hit rate':>8} {'reported':>8} {'loading':>8} {'unloading':>9}"
+        f" {'p50':>7} {'p95':>7}"
+    )
+    for name, result in results.items():
+        print(
+            f"{name:<18} {result['hit_rate']:>8.0%} {result['reported_hit_rate']:>8.0%}"
+            f" {result['load_seconds']:>7.1f}s"
+            f" {result['unload_seconds']:>8.2f}s {result['p50']:>6.2f}s {result['p95']:>6.2f}s"
+        )
+
+    managed = [results["residency"], results["residency+preload"]]
+    checks: List[Check] = [
+        ("every job reports its model's residency", all(r["reported"] for r in results.values())),
+        ("every job runs the model it named", all(r["routed"] for r in results.values())),
+        ("a model outside the allow-list is refused", refused),
+        ("Ollama never evicts a model by itself", all(r["ollama_evictions"] == 0 for r in managed)),
+        ("the worker reports the real hits", all(r["reported_hits"] for r in managed)),
+    ]
+    print()
+    failed = 0
+    print(f"{'result':<6} check")
+    for description, ok in checks:
+        failed += not ok
+        print(f"{'ok' if ok else 'FAILED':<6} {description}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
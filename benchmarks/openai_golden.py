@@ -0,0 +1,197 @@
+"""Checks the proxy's OpenAI translation against golden files.
+
+Chains a fake Ollama, the real worker handler running inside a fake RunPod,
+and the proxy, sends OpenAI `v1/chat/completions`, `v1/completions` and
+`v1/embeddings` requests, streamed and not, and compares the native request
+Ollama received and the response the client got with
+`benchmarks/golden/openai/<case>.json`. Ids and timestamps are masked.
+Exits with status 1 when anything differs; `--update` rewrites the files.
+
+    python benchmarks/openai_golden.py --engine async --engine flask
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from typing import Any, Dict, List, Tuple
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_ollama import FakeOllama  # noqa: E402
+from benchmarks.fake_runpod import FakeRunpod  # noqa: E402
+from benchmarks.load_test_proxy import (  # noqa: E402
+    PROXY_COMMANDS,
+    _free_port,
+    _start_proxy,
+    _wait_until_listening,
+)
+from benchmarks.streaming_ttft import load_worker  # noqa: E402
+
+GOLDEN_DIR = os.path.join(ROOT, "benchmarks", "golden", "openai")
+
+MESSAGES = [
+    {"role": "system", "content": "You are terse."},
+    {"role": "user", "content": [{"type": "text", "text": "Why is the sky blue?"}]},
+]
+
+CASES: List[Tuple[str, str, Dict[str, Any]]] = [
+    ("chat", "v1/chat/completions", {"model": "fake", "messages": MESSAGES}),
+    (
+        "chat_options",
+        "v1/chat/completions",
+        {
+            "model": "fake",
+            "messages": MESSAGES,
+            "temperature": 0,
+            "seed": 7,
+            "max_tokens": 64,
+            "stop": "\n\n",
+            "response_format": {"type": "json_object"},
+        },
+    ),
+    (
+        "chat_stream",
+        "v1/chat/completions",
+        {
+            "model": "fake",
+            "messages": MESSAGES,
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        },
+    ),
+    ("completions", "v1/completions", {"model": "fake", "prompt": "Once upon a time"}),
+    (
+        "completions_stream",
+        "v1/completions",
+        {"model": "fake", "prompt": ["Once upon a time"], "stream": True},
+    ),
+    ("embeddings", "v1/embeddings", {"model": "fake", "input": ["sky", "blue ocean"]}),
+    (
+        "embeddings_base64",
+        "v1/embeddings",
+        {"model": "fake", "input": "sky", "encoding_format": "base64"},
+    ),
+    (
+        "unsupported_n",
+        "v1/chat/completions",
+        {"model": "fake", "messages": MESSAGES, "n": 2},
+    ),
+    (
+        "invalid_n",
+        "v1/chat/completions",
+        {"model": "fake", "messages": MESSAGES, "n": "2"},
+    ),
+    (
+        "invalid_message",
+        "v1/chat/completions",
+        {"model": "fake", "messages": [{"content": "Why is the sky blue?"}]},
+    ),
+    (
+        "invalid_content_part",
+        "v1/chat/completions",
+        {"model": "fake", "messages": [{"role": "user", "content": ["Why is the sky blue?"]}]},
+    ),
+    (
+        "invalid_image_part",
+        "v1/chat/completions",
+        {"model": "fake", "messages": [{"role": "user", "content": [{"type": "image_url"}]}]},
+    ),
+    (
+        "rejected_option",
+        "v1/chat/completions",
+        {"model": "fake", "messages": MESSAGES, "temperature": "hot"},
+    ),
+]
+
+MASKED = {"id": "<id>", "created": 0}
+
+
+def _mask(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: MASKED[k] if k in MASKED else _mask(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_mask(v) for v in value]
+    return value
+
+
+async def _request(port: int, endpoint: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    async with aiohttp.ClientSession() as session:
+        async with session.post(f"http://127.0.0.1:{port}/fakepod/{endpoint}", json=body) as response:
+            result: Dict[str, Any] = {
+                "status": response.status,
+                "content_type": response.content_type,
+            }
+            if response.content_type != "text/event-stream":
+                result["body"] = _mask(await response.json())
+                return result
+            events: List[Any] = []
+            async for raw_line in response.content:
+                line = raw_line.decode().strip()
+                if line.startswith("data:"):
+                    data = line[len("data:"):].strip()
+                    events.append(data if data == "[DONE]" else _mask(json.loads(data)))
+            result["events"] = events
+            return result
+
+
+def _run_engine(engine: str) -> Dict[str, Dict[str, Any]]:
+    fake_ollama = FakeOllama(tokens=4, tokens_per_second=1000, prompt_eval_seconds=0.0)
+    worker = load_worker("fake", fake_ollama.start_in_thread())
+    fake_runpod = FakeRunpod(handler=worker.handler)
+    port = _free_port()
+    proxy = _start_proxy(
+        engine, port, fake_runpod.start_in_thread(), {"RESPONSE_CACHE": "off"}
+    )
+    results: Dict[str, Dict[str, Any]] = {}
+    try:
+        asyncio.run(_wait_until_listening(port))
+        for name, endpoint, body in CASES:
+            fake_ollama.received.clear()
+            response = asyncio.run(_request(port, endpoint, body))
+            results[name] = {
+                "request": {"endpoint": endpoint, "body": body},
+                "ollama": [{"path": p, "body": b} for p, b in fake_ollama.received],
+                "response": response,
+            }
+    finally:
+        proxy.terminate()
+        proxy.wait()
+        fake_runpod.run_coroutine(worker.close())
+        fake_runpod.stop_thread()
+        fake_ollama.stop_thread()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", choices=sorted(PROXY_COMMANDS), action="append")
+    parser.add_argument("--update", action="store_true")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    failed = 0
+    print(f"{'case':<20} {'engine':<7} result")
+    for engine in args.engine or sorted(PROXY_COMMANDS):
+        for name, result in _run_engine(engine).items():
+            path = os.path.join(GOLDEN_DIR, f"{name}.json")
+            if args.update:
+                os.makedirs(GOLDEN_DIR, exist_ok=True)
+                with open(path, "w") as f:
+                    json.dump(result, f, indent=2, sort_keys=True)
+                    f.write("\n")
+                outcome = "updated"
+            else:
+                with open(path) as f:
+                    outcome = "ok" if json.load(f) == result else "DIFF"
+            failed += outcome == "DIFF"
+            print(f"{name:<20} {engine:<7} {outcome}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""Measures the bytes and the CPU job outputs cost between worker, proxy and client.
+
+First in process: an `embed` output of `--vectors` vectors of `--dims` float32
+values and a `generate` one with a `context` of `--context` tokens, as the
+worker hands them to RunPod with JSON numbers, slimmed or packed, the time the
+proxy takes to parse them with json and orjson and to unpack the vectors, and
+what gzip and zstd make of the response the client gets.
+
+Then end to end, with a fake Ollama, the real worker handler from
+`server/runpod_wrapper.py` inside a fake RunPod endpoint and the proxy: bytes
+the client receives and proxy CPU per `embed` request with packed vectors and
+without, and what a slim worker leaves out of `generate` answers, cached or not.
+
+    python benchmarks/payload_size.py --engine flask --vectors 64 --dims 1024
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import aiohttp
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_ollama import FakeOllama  # noqa: E402
+from benchmarks.fake_runpod import FakeRunpod  # noqa: E402
+from benchmarks.load_test_proxy import (  # noqa: E402
+    PROXY_COMMANDS,
+    _free_port,
+    _start_proxy,
+    _wait_until_listening,
+)
+from benchmarks.streaming_ttft import load_worker, load_worker_module  # noqa: E402
+from runpod_ollama import codec  # noqa: E402
+from runpod_ollama.compression import compress, zstandard  # noqa: E402
+from runpod_ollama.payloads import unpack_embeddings  # noqa: E402
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _per_call_ms(function: Callable[[], Any], repeats: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - started) / repeats * 1000
+
+
+def _float32(vectors: Any) -> numpy.ndarray:
+    return numpy.array([numpy.asarray(v, dtype=numpy.float32) for v in vectors])
+
+
+def _outputs(vectors: int, dims: int, context: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """An Ollama `embed` and `generate` answer of the given sizes."""
+    fake = FakeOllama(embedding_size=dims, random_embeddings=True)
+    embed = {
+        "model": "fake",
+        "embeddings": [fake._vector(f"document number {i}") for i in range(vectors)],
+        "total_duration": 812345678,
+        "load_duration": 1234567,
+        "prompt_eval_count": vectors * 128,
+    }
+    generate = {
+        "model": "fake",
+        "created_at": "2026-01-01T00:00:00.000000000Z",
+        "response": "tok " * 256,
+        "done": True,
+        "done_reason": "stop",
+        "context": [(i * 2654435761) % 128256 for i in range(context)],
+        "total_duration": 5123456789,
+        "load_duration": 12345678,
+        "prompt_eval_count": context - 256,
+        "prompt_eval_duration": 234567890,
+        "eval_count": 256,
+        "eval_duration": 4876543210,
+    }
+    return embed, generate
+
+
+def in_process(args: argparse.Namespace) -> List[Tuple[str, bool]]:
+    worker = load_worker_module()
+    embed, generate = _outputs(args.vectors, args.dims, args.context)
+    # What RunPod's `/status` carries, as the worker shapes it.
+    wires = {
+        "embed json": embed,
+        "embed float32": worker.pack_embeddings(dict(embed), "float32"),
+        "embed float16": worker.pack_embeddings(dict(embed), "float16"),
+        "generate": generate,
+        "generate slim": worker.slimmed(dict(generate), []),
+    }
+    print(f"{args.vectors} x {args.dims} embeddings, {args.context} context tokens")
+    print(f"{'worker output':<16} {'bytes':>10} {'json ms':>9} {'orjson ms':>10} {'unpack ms':>10}")
+    for name, output in wires.items():
+        data = json.dumps(output).encode()
+        parse = _per_call_ms(lambda: json.loads(data), args.repeats)
+        parse_orjson = _per_call_ms(lambda: orjson.loads(data), args.repeats) if orjson else None
+        unpack = None
+        if isinstance(output.get("embeddings"), dict):
+            unpack = _per_call_ms(lambda: unpack_embeddings(codec.loads(data)), args.repeats)
+            unpack -= parse_orjson if parse_orjson is not None else parse
+        print(
+            f"{name:<16} {len(data):>10} {parse:>9.3f} "
+            f"{parse_orjson if parse_orjson is not None else float('nan'):>10.3f} "
+            f"{unpack if unpack is not None else float('nan'):>10.3f}"
+        )
+
+    # What the proxy writes for the client, from the output it decoded.
+    embed_json = codec.loads(json.dumps(wires["embed json"]))
+    embed_float32 = unpack_embeddings(codec.loads(json.dumps(wires["embed float32"])))
+    embed_float16 = unpack_embeddings(codec.loads(json.dumps(wires["embed float16"])))
+    responses = {"embed": embed_json, "embed float32": embed_float32, "generate": generate}
+    encodings = ["gzip"] + (["zstd"] if zstandard is not None else [])
+    print()
+    print(
+        f"{'proxy response':<16} {'identity':>10} {'json ms':>9} {'orjson ms':>10}"
+        + "".join(f" {encoding:>10} {encoding + ' ms':>9}" for encoding in encodings)
+    )
+    for name, response in responses.items():
+        body = codec.dumps(response)
+        plain = response
+        if name == "embed float32":
+            plain = dict(response, embeddings=[v.tolist() for v in response["embeddings"]])
+        write = _per_call_ms(lambda: json.dumps(plain).encode(), args.repeats)
+        write_orjson = _per_call_ms(lambda: codec.dumps(response), args.repeats) if orjson else None
+        line = (
+            f"{name:<16} {len(body):>10} {write:>9.3f} "
+            f"{write_orjson if write_orjson is not None else float('nan'):>10.3f}"
+        )
+        for encoding in encodings:
+            compressed = compress(body, encoding)
+            seconds = _per_call_ms(lambda: compress(body, encoding), args.repeats)
+            line += f" {len(compressed):>10} {seconds:>9.3f}"
+        print(line)
+
+    sent = _float32(embed["embeddings"])
+    float16 = numpy.array(embed_float16["embeddings"])
+    data = {name: json.dumps(output).encode() for name, output in wires.items()}
+    checks = [
+        (
+            "packed float32 vectors are the ones Ollama sent",
+            numpy.array_equal(numpy.array(embed_float32["embeddings"]), sent),
+        ),
+        (
+            "float16 vectors are within 1e-3 of them",
+            bool(numpy.abs(float16 - sent).max() < 1e-3),
+        ),
+        (
+            "packed float32 outputs are less than half the size of JSON numbers",
+            len(data["embed float32"]) * 2 < len(data["embed json"]),
+        ),
+        (
+            "slim outputs are less than half the size of full ones",
+            len(data["generate slim"]) * 2 < len(data["generate"]),
+        ),
+        (
+            "unpacked vectors are views of one buffer",
+            embed_float32["embeddings"][0].base is not None,
+        ),
+    ]
+    if orjson is not None:
+        checks.append(
+            (
+                "orjson parses JSON numbers faster than json",
+                _per_call_ms(lambda: orjson.loads(data["embed json"]), args.repeats)
+                < _per_call_ms(lambda: json.loads(data["embed json"]), args.repeats),
+            )
+        )
+    return checks
+
+
+def _decompress(body: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == "gzip":
+        return gzip.decompress(body)
+    if encoding == "zstd":
+        return zstandard.ZstdDecompressor().decompress(body)
+    return body
+
+
+def _cpu_seconds(pid: int) -> Optional[float]:
+    """User and system CPU time of a running process, from /proc."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def _post(
+    session: aiohttp.ClientSession, port: int, endpoint: str, body: Any, headers: Dict[str, str]
+) -> Tuple[int, Optional[str], Any]:
+    """Bytes received, their encoding and the decoded answer of one call."""
+    async with session.post(
+        f"http://127.0.0.1:{port}/fakepod/{endpoint}", json=body, headers=headers
+    ) as response:
+        response.raise_for_status()
+        raw = await response.read()
+        encoding = response.headers.get("Content-Encoding")
+    return len(raw), encoding, json.loads(_decompress(raw, encoding))
+
+
+async def _embed_calls(
+    port: int, pid: int, requests: int, vectors: int
+) -> Tuple[int, int, Optional[str], float, Any, Any]:
+    body = {"model": "fake", "input": [f"document number {i}" for i in range(vectors)]}
+    # Every call decodes a worker output, none is answered from the cache.
+    accept = {"Accept-Encoding": "zstd, gzip", "Cache-Control": "no-store"}
+    async with aiohttp.ClientSession(auto_decompress=False) as session:
+        identity, _, plain = await _post(
+            session, port, "embed", body, dict(accept, **{"Accept-Encoding": "identity"})
+        )
+        cpu = _cpu_seconds(pid)
+        received, encoding, answer = 0, None, None
+        for _ in range(requests):
+            size, encoding, answer = await _post(session, port, "embed", body, accept)
+            received += size
+        cpu_ms = ((_cpu_seconds(pid) or 0) - (cpu or 0)) / requests * 1000
+    return identity, received // requests, encoding, cpu_ms, plain, answer
+
+
+async def _generate_calls(port: int) -> Tuple[Any, Any]:
+    # Deterministic, so the kept answer must not come from the cached slim one.
+    body = {"model": "fake", "prompt": "Why is the sky blue?", "stream": False}
+    body["options"] = {"temperature": 0}
+    async with aiohttp.ClientSession() as session:
+        _, _, slim = await _post(session, port, "generate", body, {})
+        _, _, kept = await _post(session, port, "generate", body, {"X-Keep-Fields": "context"})
+    return slim, kept
+
+
+def end_to_end(engine: str, dtype: str, args: argparse.Namespace) -> Dict[str, Any]:
+    fake_ollama = FakeOllama(
+        tokens_per_second=10000.0,
+        prompt_eval_seconds=0.0,
+        embedding_size=args.dims,
+        prefix_cache=True,
+        random_embeddings=True,
+    )
+    worker = load_worker("fake", fake_ollama.start_in_thread())
+    worker.config.slim_output = True
+    fake_runpod = FakeRunpod(handler=worker.handler, queue_delay=0.0)
+    port = _free_port()
+    proxy = _start_proxy(
+        engine,
+        port,
+        fake_runpod.start_in_thread(),
+        extra_env={"PROXY_EMBEDDING_DTYPE": dtype, "RESPONSE_CACHE": "memory"},
+    )
+    try:
+        asyncio.run(_wait_until_listening(port))
+        started = time.monotonic()
+        identity, received, encoding, cpu_ms, plain, answer = asyncio.run(
+            _embed_calls(port, proxy.pid, args.requests, args.vectors)
+        )
+        wall_ms = (time.monotonic() - started) / (args.requests + 1) * 1000
+        slim, kept = asyncio.run(_generate_calls(port))
+    finally:
+        proxy.terminate()
+        proxy.wait()
+        fake_runpod.run_coroutine(worker.close())
+        fake_runpod.stop_thread()
+        fake_ollama.stop_thread()
+
+    name = f"{engine} {dtype}"
+    print(
+        f"{name:<16} {identity:>10} {received:>10} {encoding or '-':>9} "
+        f"{cpu_ms:>12.2f} {wall_ms:>8.1f}"
+    )
+    return {"plain": plain, "answer": answer, "slim": slim, "kept": kept, "encoding": encoding}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", choices=sorted(PROXY_COMMANDS), action="append")
+    parser.add_argument("--vectors", type=int, default=64)
+    parser.add_argument("--dims", type=int, default=1024)
+    parser.add_argument("--context", type=int, default=4096)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    checks = in_process(args)
+
+    print()
+    print(f"{args.requests} embed requests of {args.vectors} vectors per proxy")
+    print(
+        f"{'proxy dtype':<16} {'identity':>10} {'received':>10} {'encoding':>9} "
+        f"{'proxy cpu ms':>12} {'wall ms':>8}"
+    )
+    for engine in args.engine or sorted(PROXY_COMMANDS):
+        runs = {dtype: end_to_end(engine, dtype, args) for dtype in ("off", "float32")}
+        packed, plain = runs["float32"], runs["off"]
+        checks += [
+            (
+                f"{engine}: packed vectors reach clients unchanged",
+                numpy.array_equal(
+                    _float32(packed["answer"]["embeddings"]),
+                    _float32(plain["answer"]["embeddings"]),
+                ),
+            ),
+            (
+                f"{engine}: compressed responses decode to the same body",
+                packed["encoding"] is not None and packed["answer"] == packed["plain"],
+            ),
+            (
+                f"{engine}: slim workers leave out context and durations",
+                "context" not in packed["slim"] and "total_duration" not in packed["slim"],
+            ),
+            (
+                f"{engine}: X-Keep-Fields keeps the context",
+                "context" in packed["kept"] and packed["kept"].get("eval_count") is not None,
+            ),
+        ]
+
+    print()
+    print(f"{'result':<6} check")
+    failed = 0
+    for check, passed in checks:
+        failed += not passed
+        print(f"{'ok' if passed else 'FAIL':<6} {check}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""Checks the endpoint planner's picks on synthetic traffic.
+
+Runs `runpod_ollama.planner` on traces whose best plan is known: steady
+traffic keeps a worker up with `workersMin`, a few bursts a day are cheaper
+on flex workers, a large model rules out the 16 and 24 GB pools, a high
+tokens/s target rules out the slow GPUs, and ten times the traffic needs
+more workers. It also checks that the picks meet their wait target, are the
+same on every run, that FlashBoot never makes a plan worse, that the
+counters of a proxy's `/metrics` give back the traffic they were recorded
+from, and that `runpod-ollama plan --apply` saves the best plan on a fake
+RunPod. Prints the best plan of every trace and how long planning took, and
+exits with status 1 when a check fails.
+
+    python benchmarks/plan_comparison.py --duration 3600
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_runpod import FakeRunpod  # noqa: E402
+from runpod_ollama import metrics  # noqa: E402
+from runpod_ollama.planner import (  # noqa: E402
+    MetricsProfile,
+    PlanResult,
+    Request,
+    candidate_gpus,
+    plan_endpoint,
+    poisson_traffic,
+    without_flashboot,
+)
+
+CLI = "from runpod_ollama.cli import run_cli; run_cli()"
+
+MODEL_SIZE_GB = 4.1
+TARGET_TPS = 30.0
+
+Check = Tuple[str, bool]
+
+
+def _steady(duration: float) -> List[Request]:
+    """One request every two seconds."""
+    return [Request(at * 2.0) for at in range(int(duration / 2))]
+
+
+def _bursty(duration: float) -> List[Request]:
+    """30 requests in a minute, once an hour."""
+    return [
+        Request(hour * 3600 + at * 2.0)
+        for hour in range(max(int(duration / 3600), 1) * 4)
+        for at in range(30)
+    ]
+
+
+def _describe(result: PlanResult) -> str:
+    plan = result.plan
+    return (
+        f"{plan.gpu_id} {plan.workers_min}-{plan.workers_max} workers, idle {plan.idle_timeout}s:"
+        f" ${result.cost_per_hour:.3f}/hour, p95 wait {result.wait_p95:.1f}s"
+    )
+
+
+def _metrics_round_trip(duration: float) -> bool:
+    """Records calls of two pods in the metrics and reads the first one's traffic back."""
+    for pod_id, calls in (("ep-planned", 360), ("ep-other", 7200)):
+        labels = {"pod_id": pod_id, "endpoint": "generate", "model": "llama3"}
+        for _ in range(calls):
+            metrics.REQUEST_SECONDS.observe(5.0, **labels)
+            metrics.OLLAMA_EVAL_SECONDS.observe(4.0, **labels)
+            metrics.OLLAMA_PROMPT_EVAL_SECONDS.observe(0.1, **labels)
+            metrics.OLLAMA_TOKENS_PER_SECOND.observe(64.0, **labels)
+        metrics.COLD_START_SECONDS.observe(40.0, **labels)
+    profile = MetricsProfile.from_metrics(metrics.REGISTRY.render(), 3600, pod_id="ep-planned")
+    return (
+        abs(profile.rate - 0.1) < 1e-9
+        and profile.output_tokens == 256
+        and profile.prompt_tokens == 128
+        and profile.cold_start_seconds == 40.0
+        and abs(len(profile.traffic(duration)) - 0.1 * duration) < 0.2 * 0.1 * duration
+    )
+
+
+def _apply_checks(traffic: List[Request]) -> List[Check]:
+    """Runs `plan --trace ... --apply` against the fake and compares the saved endpoint."""
+    fake = FakeRunpod()
+    fake.endpoints = [
+        {
+            "id": "ep-llama3",
+            "name": "llama3 -fb",
+            "templateId": "tpl-llama3",
+            "gpuIds": "AMPERE_16",
+            "workersMin": 0,
+            "workersMax": 1,
+            "idleTimeout": 60,
+        }
+    ]
+    fake.templates = [{"id": "tpl", "name": "llama3", "isServerless": True}]
+    base_url = fake.start_in_thread()
+    directory = tempfile.mkdtemp()
+    trace_path = os.path.join(directory, "trace.jsonl")
+    with open(trace_path, "w") as f:
+        for request in traffic:
+            f.write(json.dumps({"timestamp": 1_700_000_000 + request.at, "eval_count": 256}) + "\n")
+    env = dict(
+        os.environ,
+        RUNPOD_API_BASE_URL=base_url.rsplit("/v2", 1)[0],
+        RUNPOD_API_TOKEN="plan-test",
+        METADATA_CACHE_PATH=os.path.join(directory, "metadata.json"),
+        HF_TOKEN=os.environ.get("HF_TOKEN") or "unused",
+    )
+    args = ["plan", "--trace", trace_path, "--model-size", str(MODEL_SIZE_GB)]
+    args += ["--target-tps", str(TARGET_TPS)]
+    try:
+        shown = subprocess.run(
+            [sys.executable, "-c", CLI, *args, "--json"], env=env, capture_output=True, text=True
+        )
+        applied = subprocess.run(
+            [sys.executable, "-c", CLI, *args, "--apply", "llama3"],
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        # A new endpoint goes through the SDK's mutation, which the fake refuses.
+        refused = subprocess.run(
+            [sys.executable, "-c", CLI, *args, "--apply", "mistral", "--template-id", "tpl"],
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+    finally:
+        fake.stop_thread()
+    checks = [("plan --apply fails when the endpoint cannot be created", refused.returncode == 1)]
+    if shown.returncode or applied.returncode:
+        return checks + [("plan --apply saves the best plan", False)]
+    best = json.loads(shown.stdout)["plans"][0]["plan"]
+    saved = fake.endpoints[0]
+    expected = {
+        "id": "ep-llama3",
+        "name": "llama3-fb",
+        "gpuIds": best["gpu_id"],
+        "workersMin": best["workers_min"],
+        "workersMax": best["workers_max"],
+        "idleTimeout": best["idle_timeout"],
+        "templateId": "tpl-llama3",
+    }
+    return checks + [("plan --apply saves the best plan", saved == expected)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=3600)
+    parser.add_argument("--max-wait", type=float, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    def best(traffic: List[Request], **kwargs) -> PlanResult:
+        options = dict(
+            model_size_gb=MODEL_SIZE_GB,
+            target_tokens_per_second=TARGET_TPS,
+            max_wait=args.max_wait,
+        )
+        options.update(kwargs)
+        return plan_endpoint(traffic, **options)[0]
+
+    started = time.perf_counter()
+    steady = best(_steady(args.duration))
+    # Bursts are batch work that can wait for a cold start.
+    bursty = best(_bursty(args.duration), max_wait=60)
+    light_traffic = poisson_traffic(0.2, args.duration, seed=args.seed)
+    light = best(light_traffic)
+    heavy = best(poisson_traffic(2.0, args.duration, seed=args.seed))
+    again = best(poisson_traffic(0.2, args.duration, seed=args.seed))
+    elapsed = time.perf_counter() - started
+    large = [gpu.id for gpu in candidate_gpus(30, 0)]
+    fast = [gpu.id for gpu in candidate_gpus(MODEL_SIZE_GB, 100)]
+    baseline = without_flashboot(light, light_traffic, MODEL_SIZE_GB)
+
+    picks = [("steady", steady), ("bursty", bursty), ("0.2/s", light), ("2/s", heavy)]
+    checks: List[Check] = [
+        ("steady traffic keeps a worker up", steady.plan.workers_min >= 1),
+        ("hourly bursts run on flex workers", bursty.plan.workers_min == 0),
+        (
+            "a 30 GB model skips the 16 and 24 GB pools",
+            not {"AMPERE_16", "AMPERE_24", "ADA_24"} & set(large) and bool(large),
+        ),
+        ("100 tokens/s skips the slow GPUs", "AMPERE_16" not in fast and "AMPERE_24" not in fast),
+        (
+            "ten times the traffic needs more workers",
+            heavy.plan.workers_max > light.plan.workers_max
+            and heavy.plan.workers_min >= light.plan.workers_min,
+        ),
+        ("the picks meet their wait target", all(pick.meets_target for _, pick in picks)),
+        ("the same traffic gives the same pick", again.to_dict() == light.to_dict()),
+        (
+            "FlashBoot never makes a plan worse",
+            baseline.cost >= light.cost - 1e-9 and baseline.wait_p95 >= light.wait_p95,
+        ),
+        ("metrics give back the recorded traffic", _metrics_round_trip(args.duration)),
+        *_apply_checks(light_traffic),
+    ]
+
+    print(f"{'traffic':<8} best plan")
+    for name, pick in picks:
+        print(f"{name:<8} {_describe(pick)}")
+    print(f"without FlashBoot, 0.2/s: {_describe(baseline)}")
+    print(f"planned 5 traces in {elapsed:.2f}s")
+    print()
+    failed = 0
+    print(f"{'result':<6} check")
+    for description, ok in checks:
+        failed += not ok
+        print(f"{'ok' if ok else 'FAILED':<6} {description}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Compares status polling strategies on simulated RunPod jobs.
+
+No network is involved: every job gets a queue delay and an execution time
+drawn from a distribution loosely shaped like our traffic (mostly short
+generations, some long ones, the occasional cold start), and each strategy is
+replayed on a virtual clock. "Added latency" is the time between the job
+finishing on RunPod and the poller noticing it. The same is then reported
+for long generations and cold starts only, where polling too often costs
+the most requests.
+
+    python benchmarks/polling_strategies.py --jobs 10000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from runpod_ollama.polling import (  # noqa: E402
+    AdaptivePolling,
+    ExponentialBackoff,
+    FixedInterval,
+    PollingStrategy,
+)
+
+
+def sample_job(rng: random.Random) -> Tuple[float, float]:
+    """Returns (queue delay, execution time) in seconds."""
+    queue_delay = rng.uniform(0.02, 0.3)
+    if rng.random() < 0.05:
+        queue_delay += rng.uniform(10, 40)  # cold start
+    if rng.random() < 0.8:
+        execution_time = rng.lognormvariate(-1.0, 0.5)  # ~0.4s short prompts
+    else:
+        execution_time = rng.lognormvariate(2.3, 0.6)  # ~10s long generations
+    return queue_delay, execution_time
+
+
+def sample_long_job(rng: random.Random) -> Tuple[float, float]:
+    """A long generation, half of them behind a cold start."""
+    queue_delay = rng.uniform(0.02, 0.3)
+    if rng.random() < 0.5:
+        queue_delay += rng.uniform(10, 40)
+    return queue_delay, rng.lognormvariate(2.3, 0.6)
+
+
+def status_at(t: float, queue_delay: float, execution_time: float) -> Dict[str, Any]:
+    if t < queue_delay:
+        return {"id": "job", "status": "IN_QUEUE"}
+    if t < queue_delay + execution_time:
+        return {"id": "job", "status": "IN_PROGRESS", "delayTime": int(queue_delay * 1000)}
+    return {
+        "id": "job",
+        "status": "COMPLETED",
+        "delayTime": int(queue_delay * 1000),
+        "executionTime": int(execution_time * 1000),
+    }
+
+
+def simulate(strategy: PollingStrategy, jobs: List[Tuple[float, float]]) -> Tuple[List[float], List[int]]:
+    added, polls = [], []
+    for queue_delay, execution_time in jobs:
+        now = [0.0]
+        poller = strategy.start("generate", clock=lambda: now[0])
+        out = {"id": "job", "status": "IN_QUEUE"}
+        while out["status"] != "COMPLETED":
+            now[0] += poller.next_delay(out)
+            out = status_at(now[0], queue_delay, execution_time)
+        poller.finish(out)
+        added.append(now[0] - queue_delay - execution_time)
+        polls.append(poller.polls)
+    return added, polls
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    workloads = {
+        "mixed": [sample_job(rng) for _ in range(args.jobs)],
+        "long/cold": [sample_long_job(rng) for _ in range(args.jobs)],
+    }
+
+    random.seed(args.seed)
+    print(f"{'jobs':<10} {'strategy':<24} {'p50 added':>10} {'p99 added':>10} {'polls/job':>10}")
+    for workload, jobs in workloads.items():
+        # Fresh strategies, the adaptive one would otherwise start with learned times.
+        strategies: Dict[str, PollingStrategy] = {
+            "fixed 2s (old default)": FixedInterval(2),
+            "fixed 0.25s": FixedInterval(0.25),
+            "exponential backoff": ExponentialBackoff(),
+            "adaptive": AdaptivePolling(),
+        }
+        for name, strategy in strategies.items():
+            added, polls = simulate(strategy, jobs)
+            added.sort()
+            p50 = statistics.median(added)
+            p99 = added[int(0.99 * (len(added) - 1))]
+            print(
+                f"{workload:<10} {name:<24} {p50 * 1000:>8.0f}ms {p99 * 1000:>8.0f}ms "
+                f"{statistics.mean(polls):>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
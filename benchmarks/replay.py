@@ -0,0 +1,393 @@
+"""Replays a JSONL trace through the proxy, `RunpodRepository` and `client.py`.
+
+Chains a fake Ollama generating `--tokens-per-second`, the real worker
+handler from `server/runpod_wrapper.py` running inside a fake RunPod with
+`--workers`, `--queue-delay`, `--cold-start` and `--failure-rate`, and sends
+every request of the trace at its time through each target: the `flask` and
+`async` proxy engines over HTTP, `RunpodRepository`, and `client.py`'s
+`call_runpod_api`. Every target is driven from a process of its own.
+
+A line of the trace is `{"timestamp": ..., "method": ..., "input": {...}}`,
+or a bare `/api/generate` body; lines without a timestamp are spaced
+`1 / --rate` seconds apart. Reports throughput, time to first token (the
+first chunk of streamed requests, the whole answer of the others), latency
+percentiles, RunPod status and stream polls per job, errors, and the peak
+RSS of the process serving the requests: the proxy, or the driver that
+calls RunPod itself. `--save-baseline` stores the results, `--baseline`
+compares them with stored ones and exits with status 1 when a metric got
+worse by more than `--tolerance`.
+
+    python benchmarks/replay.py --baseline benchmarks/baselines/replay.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_ollama import FakeOllama  # noqa: E402
+from benchmarks.fake_runpod import Faults, FakeRunpod  # noqa: E402
+from benchmarks.load_test_proxy import (  # noqa: E402
+    PROXY_COMMANDS,
+    _free_port,
+    _start_proxy,
+    _wait_until_listening,
+)
+from benchmarks.streaming_ttft import load_worker  # noqa: E402
+
+DEFAULT_TRACE = os.path.join(ROOT, "benchmarks", "traces", "chat.jsonl")
+TARGETS = sorted(PROXY_COMMANDS) + ["repository", "client"]
+POD_ID = "fakepod"
+
+# (name, higher is better, absolute slack) of the metrics compared with a baseline.
+# The slack keeps a few milliseconds of noise on tiny values from failing the run.
+METRICS = [
+    ("throughput", True, 0.0),
+    ("ttft_p50", False, 0.05),
+    ("ttft_p95", False, 0.05),
+    ("latency_p50", False, 0.05),
+    ("latency_p95", False, 0.05),
+    ("latency_p99", False, 0.05),
+    ("polls_per_job", False, 0.5),
+    ("errors", False, 0.0),
+    ("memory_mb", False, 5.0),
+]
+
+# (time to first token, latency, ok) of one request, in seconds.
+Sample = Tuple[float, float, bool]
+
+
+@dataclass
+class TraceRequest:
+    at: float
+    """Seconds after the start of the replay."""
+
+    method: str
+    body: Dict[str, Any]
+
+    @property
+    def stream(self) -> bool:
+        return self.body.get("stream") is True
+
+    @property
+    def prompt(self) -> str:
+        """The prompt, or the last message of a chat."""
+        if "prompt" in self.body:
+            return str(self.body["prompt"])
+        messages = self.body.get("messages") or [{}]
+        return str(messages[-1].get("content", ""))
+
+
+def load_trace(path: str, rate: float, speedup: float = 1.0) -> List[TraceRequest]:
+    requests = []
+    with open(path) as f:
+        for number, line in enumerate(f):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "input" not in record:
+                record = {"input": record}
+            at = record.get("timestamp")
+            requests.append(
+                TraceRequest(
+                    at=float(at) if at is not None else number / rate,
+                    method=record.get("method", "generate"),
+                    body=record["input"],
+                )
+            )
+    start = min(r.at for r in requests)
+    for request in requests:
+        request.at = (request.at - start) / speedup
+    return sorted(requests, key=lambda r: r.at)
+
+
+def _percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(p * len(ordered)), len(ordered) - 1)]
+
+
+async def _drive_proxy(port: int, trace: List[TraceRequest]) -> List[Sample]:
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=300)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        start = time.monotonic()
+
+        async def one(request: TraceRequest) -> Sample:
+            await asyncio.sleep(max(start + request.at - time.monotonic(), 0))
+            scheduled = start + request.at
+            first = None
+            body = b""
+            try:
+                async with session.post(
+                    f"http://127.0.0.1:{port}/{POD_ID}/{request.method}", json=request.body
+                ) as response:
+                    async for chunk in response.content.iter_any():
+                        if first is None:
+                            first = time.monotonic() - scheduled
+                        body += chunk
+                    ok = response.status == 200 and b'"error"' not in body
+            except aiohttp.ClientError:
+                ok = False
+            latency = time.monotonic() - scheduled
+            return (first if first is not None and request.stream else latency), latency, ok
+
+        return await asyncio.gather(*(one(r) for r in trace))
+
+
+def _drive_threads(trace: List[TraceRequest], call) -> List[Sample]:
+    """Runs `call(request) -> time to first token` for every request, on time."""
+    start = time.monotonic()
+
+    def one(request: TraceRequest) -> Sample:
+        time.sleep(max(start + request.at - time.monotonic(), 0))
+        scheduled = start + request.at
+        try:
+            first = call(request) - scheduled
+            ok = True
+        except Exception:
+            first, ok = 0.0, False
+        latency = time.monotonic() - scheduled
+        return (first if ok and request.stream else latency), latency, ok
+
+    with ThreadPoolExecutor(max_workers=min(len(trace), 256)) as pool:
+        return list(pool.map(one, trace))
+
+
+def _drive_repository(base_url: str, trace: List[TraceRequest]) -> List[Sample]:
+    from runpod_ollama.runpod_repository import RunpodRepository
+
+    repository = RunpodRepository(api_key="replay", pod_id=POD_ID, base_url=base_url)
+
+    def call(request: TraceRequest) -> float:
+        if not request.stream:
+            repository.call_endpoint(request.method, request.body)
+            return time.monotonic()
+        first = None
+        for _ in repository.stream_endpoint(request.method, request.body):
+            first = first or time.monotonic()
+        return first or time.monotonic()
+
+    return _drive_threads(trace, call)
+
+
+def _drive_client(base_url: str, trace: List[TraceRequest]) -> List[Sample]:
+    import client
+
+    client.RUNPOD_API_URL = base_url
+
+    def call(request: TraceRequest) -> float:
+        # `call_runpod_api` only generates, without streaming.
+        out = client.call_runpod_api(
+            request.prompt,
+            model=request.body.get("model"),
+            api_key="replay",
+            endpoint_id=POD_ID,
+            wait_for_result=True,
+        )
+        if out.get("status") != "COMPLETED":
+            raise RuntimeError(out.get("error") or out.get("status"))
+        return time.monotonic()
+
+    return _drive_threads(trace, call)
+
+
+def _drive(args: argparse.Namespace) -> None:
+    """The driver process: replays the trace on one target, prints its samples as JSON."""
+    trace = load_trace(args.trace, args.rate, args.speedup)
+    started = time.monotonic()
+    if args.drive in PROXY_COMMANDS:
+        samples = asyncio.run(_drive_proxy(args.port, trace))
+    elif args.drive == "repository":
+        samples = _drive_repository(args.base_url, trace)
+    else:
+        samples = _drive_client(args.base_url, trace)
+    wall = time.monotonic() - started
+    # ru_maxrss is in kilobytes on Linux.
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"samples": samples, "wall": wall, "max_rss_mb": max_rss_mb}))
+
+
+def _peak_rss_mb(pid: int) -> Optional[float]:
+    """Peak RSS of a running process, from /proc."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _summary(samples: List[Sample], wall: float, fake: FakeRunpod) -> Dict[str, float]:
+    ok = [s for s in samples if s[2]]
+    polls = fake.stats.status_polls + fake.stats.stream_polls
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "throughput": len(ok) / wall if wall else 0.0,
+        "ttft_p50": _percentile([s[0] for s in ok], 0.5),
+        "ttft_p95": _percentile([s[0] for s in ok], 0.95),
+        "latency_p50": _percentile([s[1] for s in ok], 0.5),
+        "latency_p95": _percentile([s[1] for s in ok], 0.95),
+        "latency_p99": _percentile([s[1] for s in ok], 0.99),
+        "polls_per_job": polls / fake.stats.jobs_submitted if fake.stats.jobs_submitted else 0.0,
+    }
+
+
+def run_target(target: str, args: argparse.Namespace, ollama_url: str) -> Dict[str, float]:
+    worker = load_worker("fake", ollama_url, concurrency=args.workers)
+    fake = FakeRunpod(
+        handler=worker.handler,
+        workers=args.workers,
+        queue_delay=args.queue_delay,
+        cold_start=args.cold_start,
+        idle_timeout=args.idle_timeout,
+        faults=Faults(job_failures=args.failure_rate),
+        seed=args.seed,
+    )
+    base_url = fake.start_in_thread()
+    env = dict(os.environ, HF_TOKEN=os.environ.get("HF_TOKEN") or "unused")
+    command = [sys.executable, os.path.abspath(__file__), "--drive", target]
+    command += ["--trace", args.trace, "--rate", str(args.rate), "--speedup", str(args.speedup)]
+    proxy = None
+    try:
+        if target in PROXY_COMMANDS:
+            port = _free_port()
+            proxy = _start_proxy(target, port, base_url)
+            asyncio.run(_wait_until_listening(port))
+            command += ["--port", str(port)]
+        else:
+            command += ["--base-url", base_url]
+        driver = subprocess.run(command, env=env, capture_output=True, text=True)
+        if driver.returncode:
+            raise RuntimeError(f"the {target} driver failed:\n{driver.stderr}")
+        out = json.loads(driver.stdout.strip().splitlines()[-1])
+        memory = _peak_rss_mb(proxy.pid) if proxy is not None else out["max_rss_mb"]
+    finally:
+        if proxy is not None:
+            proxy.terminate()
+            proxy.wait()
+        fake.run_coroutine(worker.close())
+        fake.stop_thread()
+    summary = _summary([tuple(s) for s in out["samples"]], out["wall"], fake)
+    summary["memory_mb"] = memory if memory is not None else 0.0
+    return summary
+
+
+def regressions(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    tolerance: float,
+) -> List[str]:
+    """The metrics of `results` worse than `baseline` by more than `tolerance`."""
+    found = []
+    for target, summary in results.items():
+        before = baseline.get(target)
+        if before is None:
+            continue
+        for name, higher_is_better, slack in METRICS:
+            if name not in before:
+                continue
+            now, then = summary[name], before[name]
+            if higher_is_better:
+                worse = now < then * (1 - tolerance) - slack
+            else:
+                worse = now > then * (1 + tolerance) + slack
+            if worse:
+                found.append(f"{target} {name}: {then:.3f} -> {now:.3f}")
+    return found
+
+
+def _print_results(results: Dict[str, Dict[str, float]]) -> None:
+    print(
+        f"{'target':<11} {'ok':>9} {'req/s':>7} {'TTFT p50':>9} {'TTFT p95':>9} "
+        f"{'p50':>7} {'p95':>7} {'p99':>7} {'polls/job':>9} {'RSS':>8}"
+    )
+    for target, s in results.items():
+        done = f"{s['requests'] - s['errors']:.0f}/{s['requests']:.0f}"
+        print(
+            f"{target:<11} {done:>9} {s['throughput']:>7.1f} {s['ttft_p50']:>8.3f}s "
+            f"{s['ttft_p95']:>8.3f}s {s['latency_p50']:>6.3f}s {s['latency_p95']:>6.3f}s "
+            f"{s['latency_p99']:>6.3f}s {s['polls_per_job']:>9.1f} {s['memory_mb']:>6.0f}MB"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trace", default=DEFAULT_TRACE)
+    parser.add_argument("--target", action="append", choices=TARGETS)
+    parser.add_argument("--rate", type=float, default=4.0, help="of lines without a timestamp")
+    parser.add_argument("--speedup", type=float, default=1.0)
+    parser.add_argument("--tokens", type=int, default=32)
+    parser.add_argument("--tokens-per-second", type=float, default=100)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--queue-delay", type=float, default=0.05)
+    parser.add_argument("--cold-start", type=float, default=0.0)
+    parser.add_argument("--idle-timeout", type=float, default=None)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", help="JSON file of results to compare with")
+    parser.add_argument("--save-baseline", help="where to store the results")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    # Used by the driver processes.
+    parser.add_argument("--drive", choices=TARGETS, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.drive:
+        _drive(args)
+        return
+    logging.disable(logging.INFO)
+
+    fake_ollama = FakeOllama(tokens=args.tokens, tokens_per_second=args.tokens_per_second)
+    ollama_url = fake_ollama.start_in_thread()
+    results = {}
+    try:
+        for target in args.target or TARGETS:
+            results[target] = run_target(target, args, ollama_url)
+    finally:
+        fake_ollama.stop_thread()
+
+    trace = load_trace(args.trace, args.rate, args.speedup)
+    print(
+        f"{len(trace)} requests over {trace[-1].at:.1f}s from {os.path.relpath(args.trace)}, "
+        f"{args.tokens} tokens at {args.tokens_per_second:.0f} tokens/s"
+    )
+    _print_results(results)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"saved to {args.save_baseline}")
+    if not args.baseline:
+        return
+    with open(args.baseline) as f:
+        found = regressions(results, json.load(f), args.tolerance)
+    print()
+    if not found:
+        print(f"no regression against {args.baseline} (tolerance {args.tolerance:.0%})")
+        return
+    print(f"regressions against {args.baseline}:")
+    for line in found:
+        print(f"  {line}")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
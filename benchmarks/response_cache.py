@@ -0,0 +1,102 @@
+"""Measures the response cache on repeated deterministic prompts.
+
+Sends `--requests` `temperature: 0` generations drawn from `--distinct`
+prompts through the proxy, against a fake RunPod API, with the cache off, in
+memory and in sqlite. The sqlite run restarts the proxy halfway through to
+show that its entries survive.
+
+    python benchmarks/response_cache.py --requests 200 --distinct 20
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_runpod import FakeRunpod  # noqa: E402
+from benchmarks.load_test_proxy import (  # noqa: E402
+    PROXY_COMMANDS,
+    _free_port,
+    _start_proxy,
+    _wait_until_listening,
+)
+
+
+async def _send(port: int, prompts: List[str]) -> Tuple[List[float], Dict[str, int]]:
+    latencies, cache_headers = [], {"HIT": 0, "MISS": 0}
+    async with aiohttp.ClientSession() as session:
+        for prompt in prompts:
+            started = time.monotonic()
+            async with session.post(
+                f"http://127.0.0.1:{port}/fakepod/generate",
+                json={"model": "fake", "prompt": prompt, "options": {"temperature": 0}},
+            ) as response:
+                response.raise_for_status()
+                await response.read()
+                header = response.headers.get("X-Cache")
+                if header in cache_headers:
+                    cache_headers[header] += 1
+            latencies.append(time.monotonic() - started)
+    return latencies, cache_headers
+
+
+def run(engine: str, backend: str, prompts: List[str], job_seconds: float) -> None:
+    fake_runpod = FakeRunpod(execution_time=job_seconds)
+    api_base_url = fake_runpod.start_in_thread()
+    with tempfile.TemporaryDirectory() as directory:
+        env = {
+            "RESPONSE_CACHE": backend,
+            "RESPONSE_CACHE_PATH": os.path.join(directory, "responses.sqlite3"),
+        }
+        # Restarting the proxy clears the memory cache but not the sqlite one.
+        halves = [prompts[: len(prompts) // 2], prompts[len(prompts) // 2:]]
+        latencies: List[float] = []
+        hits = 0
+        try:
+            for half in halves:
+                port = _free_port()
+                proxy = _start_proxy(engine, port, api_base_url, extra_env=env)
+                try:
+                    asyncio.run(_wait_until_listening(port))
+                    half_latencies, headers = asyncio.run(_send(port, half))
+                    latencies += half_latencies
+                    hits += headers["HIT"]
+                finally:
+                    proxy.terminate()
+                    proxy.wait()
+        finally:
+            fake_runpod.stop_thread()
+
+    latencies.sort()
+    print(
+        f"{backend:<8} {sum(latencies):>7.1f}s {latencies[len(latencies) // 2] * 1000:>7.0f}ms "
+        f"{hits:>6} {fake_runpod.stats.jobs_submitted:>6}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", choices=sorted(PROXY_COMMANDS), default="async")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--distinct", type=int, default=20)
+    parser.add_argument("--job-seconds", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    prompts = [f"prompt {rng.randrange(args.distinct)}" for _ in range(args.requests)]
+    print(f"engine={args.engine}, {args.requests} requests, {args.distinct} distinct prompts")
+    print(f"{'cache':<8} {'total':>8} {'p50':>9} {'hits':>6} {'jobs':>6}")
+    for backend in ("off", "memory", "sqlite"):
+        run(args.engine, backend, prompts, args.job_seconds)
+
+
+if __name__ == "__main__":
+    main()
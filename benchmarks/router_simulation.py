@@ -0,0 +1,137 @@
+"""Simulates routing a model alias over endpoints of different speeds.
+
+Starts a fake RunPod API with a fast, a medium and a slow endpoint plus one
+that fails every call, then sends `--rate` requests per second (Poisson
+arrivals) through the proxy for `--duration` seconds: once straight to the
+fast endpoint, as a single-endpoint deployment would, and once to an alias
+routed over all four.
+
+    python benchmarks/router_simulation.py --rate 4.5 --duration 60
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+from typing import Dict, List, Tuple
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_runpod import FakeRunpod, FakeRunpodFleet  # noqa: E402
+from benchmarks.load_test_proxy import (  # noqa: E402
+    PROXY_COMMANDS,
+    _free_port,
+    _start_proxy,
+    _wait_until_listening,
+)
+
+# name: (workers, mean execution seconds, failure rate)
+ENDPOINTS = {
+    "fast": (2, 0.5, 0.0),
+    "medium": (2, 1.0, 0.0),
+    "slow": (1, 2.5, 0.0),
+    "broken": (2, 0.5, 1.0),
+}
+
+
+def _fleet(seed: int) -> FakeRunpodFleet:
+    rng = random.Random(seed)
+    pods = {}
+    for name, (workers, mean, failure_rate) in ENDPOINTS.items():
+
+        def execution_time(_, mean: float = mean) -> float:
+            return rng.lognormvariate(math.log(mean) - 0.125, 0.5)
+
+        pods[name] = FakeRunpod(
+            execution_time=execution_time,
+            queue_delay=0.05,
+            workers=workers,
+            failure_rate=failure_rate,
+            seed=seed,
+        )
+    return FakeRunpodFleet(pods)
+
+
+async def _open_loop(
+    port: int, pod_id: str, rate: float, duration: float, seed: int
+) -> Tuple[List[float], int]:
+    rng = random.Random(seed)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(session: aiohttp.ClientSession, i: int) -> None:
+        nonlocal errors
+        started = time.monotonic()
+        try:
+            async with session.post(
+                f"http://127.0.0.1:{port}/{pod_id}/generate",
+                json={"model": "fake", "prompt": f"request {i}"},
+            ) as response:
+                response.raise_for_status()
+                await response.read()
+        except aiohttp.ClientError:
+            errors += 1
+            return
+        latencies.append(time.monotonic() - started)
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as session:
+        tasks = []
+        deadline = time.monotonic() + duration
+        i = 0
+        while time.monotonic() < deadline:
+            tasks.append(asyncio.ensure_future(one(session, i)))
+            i += 1
+            await asyncio.sleep(rng.expovariate(rate))
+        await asyncio.gather(*tasks)
+    return sorted(latencies), errors
+
+
+def run(engine: str, scenario: str, pod_id: str, rate: float, duration: float, seed: int) -> None:
+    fleet = _fleet(seed)
+    routes = {"llama": list(ENDPOINTS)}
+    port = _free_port()
+    proxy = _start_proxy(
+        engine,
+        port,
+        fleet.start_in_thread(),
+        extra_env={"RUNPOD_ROUTES": json.dumps(routes), "COALESCE_REQUESTS": "off"},
+    )
+    try:
+        asyncio.run(_wait_until_listening(port))
+        latencies, errors = asyncio.run(_open_loop(port, pod_id, rate, duration, seed))
+    finally:
+        proxy.terminate()
+        proxy.wait()
+        fleet.stop_thread()
+
+    def quantile(q: float) -> float:
+        return latencies[int(q * (len(latencies) - 1))]
+
+    jobs: Dict[str, int] = {name: pod.stats.jobs_submitted for name, pod in fleet.pods.items()}
+    print(
+        f"{scenario:<16} {quantile(0.5):>6.2f}s {quantile(0.95):>6.2f}s {quantile(0.99):>6.2f}s "
+        f"{errors:>6}  " + " ".join(f"{name}={count}" for name, count in jobs.items())
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", choices=sorted(PROXY_COMMANDS), default="async")
+    parser.add_argument("--rate", type=float, default=4.5)
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"engine={args.engine}, {args.rate} req/s for {args.duration:.0f}s")
+    print(f"{'scenario':<16} {'p50':>7} {'p95':>7} {'p99':>7} {'errors':>6}  jobs per endpoint")
+    run(args.engine, "single endpoint", "fast", args.rate, args.duration, args.seed)
+    run(args.engine, "routed alias", "llama", args.rate, args.duration, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""Measures what keeping a conversation on one endpoint saves in prompt evaluation.
+
+Starts a fake RunPod API with two endpoints behind a `RUNPOD_ROUTES` alias,
+each running the real worker handler against its own fake Ollama that keeps
+the prompts of its last `--slots` requests in a prefix cache. `--conversations`
+conversations of `--turns` chat turns each are sent through the proxy at
+once, first without and then with an `X-Session-Id` header. The same runs
+with `generate` turns, which resend the whole transcript as their prompt
+without a session and only the new question with one, relying on the proxy
+to give back the `context` of the previous turn. Prints the
+prompt tokens the fakes evaluated, those the workers reported reused and the
+turn latencies, and exits with status 1 when sessions do not save anything.
+Last, with the response cache on, checks that a session switching models is
+not given the `context` of the other one, and that a turn answered from the
+cache still gives its `context` to the next.
+
+    python benchmarks/session_affinity.py --conversations 8 --turns 6
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_ollama import FakeOllama  # noqa: E402
+from benchmarks.fake_runpod import FakeRunpod, FakeRunpodFleet  # noqa: E402
+from benchmarks.load_test_proxy import (  # noqa: E402
+    PROXY_COMMANDS,
+    _free_port,
+    _start_proxy,
+    _wait_until_listening,
+)
+from benchmarks.streaming_ttft import load_worker  # noqa: E402
+
+ENDPOINTS = ("left", "right")
+SYSTEM_PROMPT = "You answer questions about the conversation number {0}. " * 40
+
+
+async def _conversation(
+    session: aiohttp.ClientSession,
+    port: int,
+    method: str,
+    number: int,
+    turns: int,
+    session_id: Optional[str],
+) -> List[float]:
+    headers = {"X-Session-Id": session_id} if session_id else {}
+    messages: List[Dict[str, str]] = [
+        {"role": "system", "content": SYSTEM_PROMPT.format(number)}
+    ]
+    transcript = SYSTEM_PROMPT.format(number)
+    latencies = []
+    for turn in range(turns):
+        question = f"What happened in turn {turn}?"
+        if method == "chat":
+            messages.append({"role": "user", "content": question})
+            body: Dict[str, Any] = {"model": "fake", "messages": messages, "stream": False}
+        else:
+            transcript += question
+            prompt = transcript if turn == 0 or not session_id else question
+            body = {"model": "fake", "prompt": prompt, "stream": False}
+        started = time.monotonic()
+        async with session.post(
+            f"http://127.0.0.1:{port}/llama/{method}", json=body, headers=headers
+        ) as response:
+            response.raise_for_status()
+            out = await response.json()
+        latencies.append(time.monotonic() - started)
+        if method == "chat":
+            messages.append(out["message"])
+        else:
+            transcript += out["response"]
+    return latencies
+
+
+async def _drive(
+    port: int, method: str, conversations: int, turns: int, sessions: bool
+) -> Tuple[List[float], Dict[str, Any], float]:
+    async with aiohttp.ClientSession() as session:
+        results = await asyncio.gather(
+            *(
+                _conversation(
+                    session, port, method, i, turns, str(uuid.uuid4()) if sessions else None
+                )
+                for i in range(conversations)
+            )
+        )
+        async with session.get(f"http://127.0.0.1:{port}/_proxy/sessions") as response:
+            stats = await response.json()
+        async with session.get(f"http://127.0.0.1:{port}/metrics") as response:
+            exposition = await response.text()
+    reused = sum(
+        float(line.rsplit(" ", 1)[1])
+        for line in exposition.splitlines()
+        if line.startswith("ollama_prompt_tokens_reused_total")
+    )
+    return [latency for latencies in results for latency in latencies], stats, reused
+
+
+def run(
+    engine: str, method: str, sessions: bool, conversations: int, turns: int, slots: int
+) -> Dict[str, Any]:
+    ollamas = {
+        name: FakeOllama(
+            tokens=16,
+            tokens_per_second=400,
+            prompt_eval_seconds=0.2,
+            prefix_cache=True,
+            slots=slots,
+        )
+        for name in ENDPOINTS
+    }
+    workers = {
+        name: load_worker("fake", ollama.start_in_thread()) for name, ollama in ollamas.items()
+    }
+    fleet = FakeRunpodFleet(
+        {
+            name: FakeRunpod(handler=worker.handler, queue_delay=0.02, workers=slots)
+            for name, worker in workers.items()
+        }
+    )
+    port = _free_port()
+    proxy = _start_proxy(
+        engine,
+        port,
+        fleet.start_in_thread(),
+        extra_env={
+            "RUNPOD_ROUTES": json.dumps({"llama": list(ENDPOINTS)}),
+            "COALESCE_REQUESTS": "off",
+            "PROXY_SESSIONS": "on",
+        },
+    )
+    try:
+        asyncio.run(_wait_until_listening(port))
+        latencies, stats, reused = asyncio.run(
+            _drive(port, method, conversations, turns, sessions)
+        )
+    finally:
+        proxy.terminate()
+        proxy.wait()
+        for worker in workers.values():
+            fleet.run_coroutine(worker.close())
+        fleet.stop_thread()
+        for ollama in ollamas.values():
+            ollama.stop_thread()
+    return {
+        "evaluated": sum(ollama.prompt_tokens for ollama in ollamas.values()),
+        "reused": int(reused),
+        "pinned": stats.get("pinned", 0),
+        "contexts": stats.get("contexts_given", 0),
+        "p50": statistics.median(latencies),
+        "p95": sorted(latencies)[int(0.95 * (len(latencies) - 1))],
+    }
+
+
+async def _edge_turns(port: int) -> List[Dict[str, Any]]:
+    """The proxy's session counters after every turn of the edge cases."""
+    turns = [
+        ("first", "fake", "Why is the sky blue?"),
+        ("first", "other", "And the sea?"),
+        # Answered from the cache, then continued.
+        ("second", "fake", "Why is the sky blue?"),
+        ("second", "fake", "And the sea?"),
+    ]
+    counters = []
+    async with aiohttp.ClientSession() as session:
+        for session_id, model, prompt in turns:
+            body = {"model": model, "prompt": prompt, "stream": False}
+            body["options"] = {"temperature": 0}
+            async with session.post(
+                f"http://127.0.0.1:{port}/llama/generate",
+                json=body,
+                headers={"X-Session-Id": session_id},
+            ) as response:
+                response.raise_for_status()
+                await response.read()
+            async with session.get(f"http://127.0.0.1:{port}/_proxy/sessions") as response:
+                counters.append(await response.json())
+    return counters
+
+
+def run_edge_cases(engine: str) -> List[Tuple[str, bool]]:
+    ollama = FakeOllama(
+        tokens=16, tokens_per_second=400, prompt_eval_seconds=0.0, prefix_cache=True
+    )
+    worker = load_worker("fake", ollama.start_in_thread())
+    fleet = FakeRunpodFleet({name: FakeRunpod(handler=worker.handler) for name in ENDPOINTS})
+    port = _free_port()
+    proxy = _start_proxy(
+        engine,
+        port,
+        fleet.start_in_thread(),
+        extra_env={
+            "RUNPOD_ROUTES": json.dumps({"llama": list(ENDPOINTS)}),
+            "PROXY_SESSIONS": "on",
+            "RESPONSE_CACHE": "memory",
+        },
+    )
+    try:
+        asyncio.run(_wait_until_listening(port))
+        counters = asyncio.run(_edge_turns(port))
+    finally:
+        proxy.terminate()
+        proxy.wait()
+        fleet.run_coroutine(worker.close())
+        fleet.stop_thread()
+        ollama.stop_thread()
+    given = [c["contexts_given"] for c in counters]
+    return [
+        ("a session is not given the context of another model", given[1] == given[0]),
+        ("a cached turn gives its context to the next", given[3] == given[2] + 1),
+        ("only the turns that reached a worker ran jobs", ollama.requests == 3),
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", choices=sorted(PROXY_COMMANDS), default="async")
+    parser.add_argument("--conversations", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--slots", type=int, default=4)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    print(
+        f"engine={args.engine}, {args.conversations} conversations of {args.turns} turns,"
+        f" {len(ENDPOINTS)} endpoints with {args.slots} cached prompts each"
+    )
+    print(
+        f"{'scenario':<18} {'evaluated':>9} {'reused':>7} {'pinned':>6} {'contexts':>8}"
+        f" {'p50':>7} {'p95':>7}"
+    )
+    results = {}
+    for method in ("chat", "generate"):
+        for sessions in (False, True):
+            scenario = f"{method} {'sessions' if sessions else 'no session'}"
+            result = results[scenario] = run(
+                args.engine, method, sessions, args.conversations, args.turns, args.slots
+            )
+            print(
+                f"{scenario:<18} {result['evaluated']:>9} {result['reused']:>7}"
+                f" {result['pinned']:>6} {result['contexts']:>8}"
+                f" {result['p50']:>6.2f}s {result['p95']:>6.2f}s"
+            )
+
+    later_turns = args.conversations * (args.turns - 1)
+    checks = [
+        (
+            "chat sessions evaluate fewer prompt tokens",
+            results["chat sessions"]["evaluated"] < results["chat no session"]["evaluated"],
+        ),
+        (
+            "chat sessions stay on their endpoint",
+            results["chat sessions"]["pinned"] == later_turns,
+        ),
+        (
+            "generate turns get their context back",
+            results["generate sessions"]["contexts"] == later_turns,
+        ),
+        (
+            "generate sessions evaluate fewer prompt tokens",
+            results["generate sessions"]["evaluated"]
+            < results["generate no session"]["evaluated"],
+        ),
+    ]
+    checks += run_edge_cases(args.engine)
+    print()
+    failed = 0
+    print(f"{'result':<6} check")
+    for description, ok in checks:
+        failed += not ok
+        print(f"{'ok' if ok else 'FAILED':<6} {description}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
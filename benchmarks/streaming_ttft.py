@@ -0,0 +1,112 @@
+"""Measures time to first token through the local proxy.
+
+Chains a fake Ollama, the real worker handler from `server/runpod_wrapper.py`
+running inside a fake RunPod, and the proxy, then compares how long a client
+waits for the first streamed chunk with how long it waits for a non-streamed
+answer.
+
+    python benchmarks/streaming_ttft.py --engine async
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import logging
+import os
+import statistics
+import sys
+import time
+from typing import List, Tuple
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_ollama import FakeOllama  # noqa: E402
+from benchmarks.fake_runpod import FakeRunpod  # noqa: E402
+from benchmarks.load_test_proxy import (  # noqa: E402
+    PROXY_COMMANDS,
+    _free_port,
+    _start_proxy,
+    _wait_until_listening,
+)
+
+
+def load_worker_module():
+    """Imports `server/runpod_wrapper.py`, which is not part of the package."""
+    spec = importlib.util.spec_from_file_location(
+        "runpod_wrapper", os.path.join(ROOT, "server", "runpod_wrapper.py")
+    )
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_worker(model: str, ollama_base_url: str, concurrency: int = 8):
+    """An `OllamaWorker` configured like `start.sh` would configure it."""
+    module = load_worker_module()
+    return module.OllamaWorker(
+        module.WorkerConfig(
+            model=model, ollama_base_url=ollama_base_url, concurrency=concurrency
+        )
+    )
+
+
+async def request_once(port: int, endpoint: str, body: dict) -> Tuple[float, float]:
+    """Returns (time to first byte of body, total time)."""
+    async with aiohttp.ClientSession() as session:
+        started = time.monotonic()
+        first = None
+        async with session.post(f"http://127.0.0.1:{port}/fakepod/{endpoint}", json=body) as response:
+            response.raise_for_status()
+            async for _ in response.content.iter_any():
+                if first is None:
+                    first = time.monotonic() - started
+        total = time.monotonic() - started
+    return (first if first is not None else total), total
+
+
+async def measure(port: int, repeats: int, stream: bool) -> List[Tuple[float, float]]:
+    body = {"model": "fake", "prompt": "Why is the sky blue?", "stream": stream}
+    return [await request_once(port, "generate", body) for _ in range(repeats)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", choices=sorted(PROXY_COMMANDS), default="async")
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--tokens-per-second", type=float, default=40)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    fake_ollama = FakeOllama(tokens=args.tokens, tokens_per_second=args.tokens_per_second)
+    worker = load_worker("fake", fake_ollama.start_in_thread())
+    fake_runpod = FakeRunpod(handler=worker.handler, queue_delay=0.05)
+    port = _free_port()
+    proxy = _start_proxy(args.engine, port, fake_runpod.start_in_thread())
+    try:
+        asyncio.run(_wait_until_listening(port))
+        rows = []
+        for stream in (False, True):
+            results = asyncio.run(measure(port, args.repeats, stream))
+            rows.append(("stream" if stream else "blocking", results))
+    finally:
+        proxy.terminate()
+        proxy.wait()
+        fake_runpod.run_coroutine(worker.close())
+        fake_runpod.stop_thread()
+        fake_ollama.stop_thread()
+
+    generation = args.tokens / args.tokens_per_second
+    print(f"engine={args.engine}, generation takes {generation:.2f}s on the fake Ollama")
+    print(f"{'mode':<10} {'TTFT p50':>9} {'total p50':>10}")
+    for name, results in rows:
+        ttft = statistics.median(r[0] for r in results)
+        total = statistics.median(r[1] for r in results)
+        print(f"{name:<10} {ttft:>8.2f}s {total:>9.2f}s")
+
+
+if __name__ == "__main__":
+    main()
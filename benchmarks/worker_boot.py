@@ -0,0 +1,140 @@
+"""Measures a worker's cold start until its first job is answered.
+
+Starts a fake `ollama serve` that takes `--startup` seconds to listen, pulls
+in `--pull` seconds and loads a model in `--load` seconds, then boots the
+worker the way the old `start.sh` did (wait for the "Listening" log line in
+5 second steps, always pull, load with the first job) and with
+`server/bootstrap.py`, with the model missing and already on disk.
+
+    python benchmarks/worker_boot.py --startup 1.2 --pull 4 --load 3
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "server"))
+
+import bootstrap  # noqa: E402
+from benchmarks.load_test_proxy import _free_port  # noqa: E402
+
+MODEL = "fake"
+
+FAKE_SERVE = """
+import asyncio, sys, time
+sys.path.insert(0, {root!r})
+from benchmarks.fake_ollama import FakeOllama
+
+async def main():
+    time.sleep({startup})
+    await FakeOllama(load_seconds={load}, pull_seconds={pull}).start(port={port})
+    print("Listening on 127.0.0.1:{port}", flush=True)
+    await asyncio.Event().wait()
+
+asyncio.run(main())
+"""
+
+
+def _serve_command(port: int, args: argparse.Namespace) -> List[str]:
+    script = FAKE_SERVE.format(
+        root=ROOT, startup=args.startup, load=args.load, pull=args.pull, port=port
+    )
+    return [sys.executable, "-c", script]
+
+
+def _first_job(base_url: str) -> None:
+    bootstrap._post(base_url, "generate", {"model": MODEL, "prompt": "hi", "stream": False})
+
+
+def _start_sh(args: argparse.Namespace) -> Dict[str, float]:
+    """What `start.sh` did: grep the log every 5 seconds, pull, serve."""
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.monotonic()
+    with tempfile.NamedTemporaryFile("w+") as log:
+        process = subprocess.Popen(_serve_command(port, args), stdout=log)
+        try:
+            while True:
+                log.seek(0)
+                if "Listening" in log.read():
+                    break
+                time.sleep(5)
+            phases = {"ollama_start_seconds": time.monotonic() - started}
+            pull_started = time.monotonic()
+            bootstrap._post(base_url, "pull", {"name": MODEL, "stream": False})
+            phases["pull_seconds"] = time.monotonic() - pull_started
+            phases["load_seconds"] = 0.0
+            phases["total_seconds"] = time.monotonic() - started
+            _first_job(base_url)
+            phases["first_job_seconds"] = time.monotonic() - started
+        finally:
+            process.terminate()
+            process.wait()
+    return phases
+
+
+def _write_model(models_dir: str) -> None:
+    digest = "sha256:" + "0" * 64
+    manifest = bootstrap.manifest_path(models_dir, MODEL)
+    os.makedirs(os.path.dirname(manifest))
+    with open(manifest, "w") as f:
+        json.dump({"config": {"digest": digest}, "layers": [{"digest": digest}]}, f)
+    os.makedirs(os.path.join(models_dir, "blobs"))
+    open(os.path.join(models_dir, "blobs", digest.replace(":", "-")), "w").close()
+
+
+def _bootstrap(args: argparse.Namespace, on_disk: bool) -> Dict[str, float]:
+    port = _free_port()
+    with tempfile.TemporaryDirectory() as models_dir:
+        if on_disk:
+            _write_model(models_dir)
+        config = bootstrap.WorkerConfig(
+            model=MODEL,
+            ollama_base_url=f"http://127.0.0.1:{port}",
+            models_dir=models_dir,
+        )
+        started = time.monotonic()
+        process, phases = bootstrap.boot(config, _serve_command(port, args))
+        try:
+            _first_job(config.ollama_base_url)
+            phases["first_job_seconds"] = time.monotonic() - started
+        finally:
+            process.terminate()
+            process.wait()
+    return phases
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--startup", type=float, default=1.2)
+    parser.add_argument("--pull", type=float, default=4.0)
+    parser.add_argument("--load", type=float, default=3.0)
+    args = parser.parse_args()
+
+    print(f"ollama starts in {args.startup}s, pulls in {args.pull}s, loads in {args.load}s")
+    print(
+        f"{'boot':<22} {'ollama up':>9} {'pull':>7} {'load':>7} "
+        f"{'ready':>7} {'first job':>9}"
+    )
+    for name, run in (
+        ("start.sh", lambda: _start_sh(args)),
+        ("bootstrap, pull", lambda: _bootstrap(args, on_disk=False)),
+        ("bootstrap, on disk", lambda: _bootstrap(args, on_disk=True)),
+    ):
+        phases = run()
+        print(
+            f"{name:<22} {phases['ollama_start_seconds']:>8.2f}s "
+            f"{phases['pull_seconds']:>6.2f}s {phases['load_seconds']:>6.2f}s "
+            f"{phases['total_seconds']:>6.2f}s {phases['first_job_seconds']:>8.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
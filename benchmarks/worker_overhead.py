@@ -0,0 +1,95 @@
+"""Per-job overhead of the worker handler against a stub Ollama.
+
+"before" replays the old handler: read the environment and open a fresh
+`requests.post` connection for every job, one job at a time. "after" runs
+`OllamaWorker.handler` with its pooled session, first sequentially and then
+with `--concurrency` jobs in flight, as RunPod's concurrency modifier allows.
+
+    python benchmarks/worker_overhead.py --jobs 500
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_ollama import FakeOllama  # noqa: E402
+from benchmarks.streaming_ttft import load_worker_module  # noqa: E402
+
+
+def job(i: int):
+    return {"id": str(i), "input": {"method_name": "generate", "input": {"prompt": str(i)}}}
+
+
+def legacy_handler(job, model: str):
+    base_url = os.environ.get("OLLAMA_BASE_URL", "http://0.0.0.0:11434")
+    job["input"]["input"]["stream"] = False
+    job["input"]["input"]["model"] = model
+    response = requests.post(
+        url=f"{base_url}/api/{job['input']['method_name']}/",
+        headers={"Content-Type": "application/json"},
+        json=job["input"]["input"],
+        timeout=120,
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+async def run_worker(worker, jobs: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            async for _ in worker.handler(job(i)):
+                pass
+
+    started = time.monotonic()
+    await asyncio.gather(*(one(i) for i in range(jobs)))
+    elapsed = time.monotonic() - started
+    await worker.close()
+    return elapsed
+
+
+def report(name: str, jobs: int, elapsed: float) -> None:
+    print(f"{name:<28} {elapsed / jobs * 1000:>8.2f}ms/job {jobs / elapsed:>9.1f} jobs/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--ollama-seconds", type=float, default=0.0,
+        help="time the stub spends per request, 0 isolates the handler overhead",
+    )
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    fake_ollama = FakeOllama(tokens=1, tokens_per_second=1e6, prompt_eval_seconds=args.ollama_seconds)
+    base_url = fake_ollama.start_in_thread()
+    os.environ["OLLAMA_BASE_URL"] = base_url
+    module = load_worker_module()
+    config = module.WorkerConfig(model="fake", ollama_base_url=base_url)
+    try:
+        started = time.monotonic()
+        for i in range(args.jobs):
+            legacy_handler(job(i), "fake")
+        report("before (new connection)", args.jobs, time.monotonic() - started)
+
+        elapsed = asyncio.run(run_worker(module.OllamaWorker(config), args.jobs, 1))
+        report("after (pooled)", args.jobs, elapsed)
+
+        config.concurrency = args.concurrency
+        elapsed = asyncio.run(run_worker(module.OllamaWorker(config), args.jobs, args.concurrency))
+        report(f"after (pooled, {args.concurrency} in flight)", args.jobs, elapsed)
+    finally:
+        fake_ollama.stop_thread()
+
+
+if __name__ == "__main__":
+    main()
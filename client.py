@@ -1,9 +1,12 @@
-import requests
+import atexit
 import os
 import json
-import time
 from dotenv import load_dotenv
 import pathlib
+from runpod_ollama.client import Job, PollingTimeout, RunpodClient
+from runpod_ollama.polling import AdaptivePolling
+
+RUNPOD_API_URL = "https://api.runpod.ai/v2"
 
 # Load environment variables from .env file
 def load_env():
@@ -19,9 +22,28 @@ def load_env():
 
 load_env()
 
+_clients = {}
+
+
+def _client(api_key):
+    """One `RunpodClient` per API key, so every call reuses its connections."""
+    client = _clients.get(api_key)
+    if client is None:
+        client = _clients[api_key] = RunpodClient(api_key=api_key, base_url=RUNPOD_API_URL)
+        atexit.register(client.close)
+    return client
+
+
+def _job(job_id, endpoint_id, method="generate"):
+    return Job(endpoint_id=endpoint_id, id=job_id, method=method)
+
+
 def call_runpod_api(prompt, model=None, api_key=None, endpoint_id=None, wait_for_result=False, poll_interval=1, max_retries=10):
     """
     Call the RunPod API with the given prompt.
+
+    Prefer `runpod_ollama.client.RunpodClient` in new code; this helper is a
+    thin wrapper over it.
     
     Args:
         prompt (str): The prompt to send to the model
@@ -29,8 +51,8 @@ def call_runpod_api(prompt, model=None, api_key=None, endpoint_id=None, wait_for
         api_key (str, optional): Your RunPod API key (will use RUNPOD_API_KEY or RUNPOD_API_TOKEN env var if not provided)
         endpoint_id (str, optional): Your RunPod endpoint ID (will use RUNPOD_ENDPOINT_ID env var if not provided)
         wait_for_result (bool, optional): Whether to wait for the result (default: False)
-        poll_interval (float, optional): How often to check for result in seconds (default: 1)
-        max_retries (int, optional): Maximum number of retries when checking status (default: 10)
+        poll_interval (float, optional): Longest wait between two status checks in seconds (default: 1)
+        max_retries (int, optional): Unused, kept for compatibility
     
     Returns:
         dict: The API response
@@ -45,44 +67,14 @@ def call_runpod_api(prompt, model=None, api_key=None, endpoint_id=None, wait_for
     if not endpoint_id:
         raise ValueError("Endpoint ID is required. Provide it as a parameter or set RUNPOD_ENDPOINT_ID environment variable.")
     
-    # Set up headers with authentication
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': f'Bearer {api_key}'
-    }
-    
-    # Prepare request payload
-    data = {
-        'input': {
-            'method_name': 'generate',
-            'input': {
-                'prompt': prompt
-            }
-        }
-    }
-    
-    # Add model to request if provided
+    input = {'prompt': prompt}
     if model:
-        data['input']['input']['model'] = model
+        input['model'] = model
     
-    # Make the API request
-    api_url = f'https://api.runpod.ai/v2/{endpoint_id}/run'
-    response = requests.post(api_url, headers=headers, json=data)
-    
-    # Check if the request was successful
-    if response.status_code == 200:
-        result = response.json()
-        
-        # If not waiting for result, return immediately
-        if not wait_for_result:
-            return result
-        
-        # Otherwise, poll for result
-        return wait_for_runpod_result(result['id'], api_key, endpoint_id, poll_interval, max_retries)
-    else:
-        print(f"Error: {response.status_code}")
-        print(response.text)
-        return None
+    job = _client(api_key).submit(endpoint_id, 'generate', input, mode='run')
+    if not wait_for_result:
+        return dict(job.last_status)
+    return wait_for_runpod_result(job.id, api_key, endpoint_id, poll_interval, max_retries, job=job)
 
 def check_runpod_status(job_id, api_key, endpoint_id):
     """
@@ -96,22 +88,16 @@ def check_runpod_status(job_id, api_key, endpoint_id):
     Returns:
         dict: The status response
     """
-    status_url = f'https://api.runpod.ai/v2/{endpoint_id}/status/{job_id}'
-    headers = {
-        'Authorization': f'Bearer {api_key}'
-    }
-    
-    try:
-        response = requests.get(status_url, headers=headers)
-        response.raise_for_status()  # Raise exception for 4XX/5XX responses
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Error checking status: {str(e)}")
-        return None
+    job = _job(job_id, endpoint_id)
+    _client(api_key).status(job)
+    return dict(job.last_status)
 
 def get_runpod_output(job_id, api_key, endpoint_id):
     """
     Get the output of a completed RunPod job.
+
+    RunPod's `/status` response carries the output of a completed job, so
+    this is a single status fetch.
     
     Args:
         job_id (str): The ID of the job to get output for
@@ -121,32 +107,9 @@ def get_runpod_output(job_id, api_key, endpoint_id):
     Returns:
         dict: The output response
     """
-    # In RunPod, the status endpoint can also return the result when it's complete
-    status_url = f'https://api.runpod.ai/v2/{endpoint_id}/status/{job_id}'
-    headers = {
-        'Authorization': f'Bearer {api_key}'
-    }
-    
-    try:
-        response = requests.get(status_url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Check if the result is already included in the status response
-        if 'output' in data:
-            return data
-        
-        # If not, try the output endpoint
-        output_url = f'https://api.runpod.ai/v2/{endpoint_id}/output/{job_id}'
-        response = requests.get(output_url, headers=headers)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Error getting output: {str(e)}")
-        # Return the status response as fallback
-        return {"status": "COMPLETED", "error": str(e)}
+    return check_runpod_status(job_id, api_key, endpoint_id)
 
-def wait_for_runpod_result(job_id, api_key, endpoint_id, poll_interval=1, max_retries=10):
+def wait_for_runpod_result(job_id, api_key, endpoint_id, poll_interval=1, max_retries=10, polling=None, job=None):
     """
     Wait for a RunPod job to complete and return the result.
     
@@ -154,50 +117,20 @@ def wait_for_runpod_result(job_id, api_key, endpoint_id, poll_interval=1, max_re
         job_id (str): The ID of the job to wait for
         api_key (str): Your RunPod API key
         endpoint_id (str): Your RunPod endpoint ID
-        poll_interval (float): How often to check for result in seconds
-        max_retries (int): Maximum number of retries for checking result
+        poll_interval (float): Longest wait between two status checks in seconds
+        max_retries (int): Unused, kept for compatibility
+        polling (PollingStrategy, optional): Overrides the default adaptive polling
+        job (Job, optional): The job returned by `RunpodClient.submit`, saves a status fetch
         
     Returns:
-        dict: The job result
+        dict: The final status response, with the output of a completed job
     """
-    print(f"Job submitted with ID: {job_id}")
-    print("Waiting for result...", end='', flush=True)
-    
-    retries = 0
-    
-    while retries < max_retries:
-        status_response = check_runpod_status(job_id, api_key, endpoint_id)
-        
-        if not status_response:
-            retries += 1
-            if retries >= max_retries:
-                print(f" Failed after {max_retries} retries!")
-                return {"error": "Max retries exceeded", "status": "FAILED"}
-            print("x", end='', flush=True)
-            time.sleep(poll_interval)
-            continue
-        
-        status = status_response.get('status')
-        
-        # If job is completed, get the output
-        if status == 'COMPLETED':
-            print(" Done!")
-            # Check if the output is already in the status response
-            if 'output' in status_response:
-                return status_response
-            return get_runpod_output(job_id, api_key, endpoint_id)
-        
-        # If job failed, return the status
-        elif status in ['FAILED', 'CANCELLED']:
-            print(f" {status}!")
-            return status_response
-        
-        # Otherwise, wait and try again
-        print(".", end='', flush=True)
-        time.sleep(poll_interval)
-    
-    print(" Timed out!")
-    return {"error": "Timed out waiting for result", "status": "TIMEOUT"}
+    polling = polling or AdaptivePolling(max_interval=poll_interval)
+    try:
+        result = _client(api_key).wait(job or _job(job_id, endpoint_id), polling=polling)
+    except PollingTimeout:
+        return {"error": "Timed out waiting for result", "status": "TIMEOUT"}
+    return dict(result.response)
 
 def stream_output(response):
     """
@@ -218,6 +151,10 @@ def stream_output(response):
     
     output = response['output']
     
+    # The worker yields its response, RunPod aggregates the yields into a list
+    if isinstance(output, list) and len(output) == 1:
+        output = output[0]
+    
     # Extract the model's text output
     if isinstance(output, dict) and 'response' in output:
         print("\nResponse from model:\n")
@@ -241,8 +178,8 @@ if __name__ == "__main__":
     parser.add_argument("--api-key", type=str, help="RunPod API key (defaults to RUNPOD_API_KEY env var)")
     parser.add_argument("--endpoint-id", type=str, help="RunPod endpoint ID (defaults to RUNPOD_ENDPOINT_ID env var)")
     parser.add_argument("--wait", action="store_true", help="Wait for the result and display it")
-    parser.add_argument("--poll-interval", type=float, default=1.0, help="How often to check for result in seconds")
-    parser.add_argument("--max-retries", type=int, default=60, help="Maximum number of status check retries")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Longest wait between two status checks in seconds")
+    parser.add_argument("--max-retries", type=int, default=60, help="Unused, kept for compatibility")
     
     args = parser.parse_args()
     
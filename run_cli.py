@@ -10,7 +10,7 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 try:
-    from runpod_ollama import run_cli
+    from runpod_ollama.cli import run_cli
     run_cli()
 except ImportError as e:
     print(f"Error importing runpod_ollama: {e}")
@@ -1,3 +1,16 @@
+from typing import Any
 from .config import ENVIRONMENT as ENVIRONMENT
-from runpod_ollama.local_proxy import run_local_proxy
-from runpod_ollama.cli import run_cli
+
+
+def __getattr__(name: str) -> Any:
+    # The entry points pull in Flask, the RunPod SDK and the like, so they are
+    # only imported when used; `import runpod_ollama` stays cheap.
+    if name == "run_local_proxy":
+        from runpod_ollama.local_proxy import run_local_proxy
+
+        return run_local_proxy
+    if name == "run_cli":
+        from runpod_ollama.cli import run_cli
+
+        return run_cli
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
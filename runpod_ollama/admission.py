@@ -0,0 +1,356 @@
+"""Admission control of the local proxies.
+
+Without it every incoming request is submitted to RunPod at once, so a spike
+of bulk jobs fills the endpoint's queue and interactive calls wait behind
+them. With `ADMISSION_MAX_CONCURRENCY` (or per pod `ADMISSION_POD_LIMITS`)
+set, at most that many requests per pod are sent upstream at a time and the
+rest wait in the proxy:
+
+- `X-Priority: interactive` requests (the default) are always admitted
+  before `X-Priority: batch` ones.
+- Within a priority, tenants (`X-Tenant`, else the caller's API key) are
+  served by weighted fair queuing, weights from `ADMISSION_TENANT_WEIGHTS`,
+  so one tenant's backlog cannot starve the others.
+- At most `ADMISSION_MAX_QUEUE` requests wait per pod; the next one is
+  rejected with `QueueFull`, which the proxies answer with a 429 and a
+  `Retry-After` estimated from the queue and recent request times.
+
+`FairQueue` only keeps the state and never blocks, which keeps it
+deterministic under a fake clock; `Admission` and `AsyncAdmission` make
+callers wait on threads or on an event loop.
+"""
+
+import asyncio
+import heapq
+import json
+import math
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Mapping, Optional, Tuple
+from runpod_ollama import ENVIRONMENT
+from runpod_ollama.exceptions import DeadlineExceeded, QueueFull
+from runpod_ollama.metrics import (
+    ADMISSION_QUEUE_DEPTH,
+    ADMISSION_REJECTED,
+    ADMISSION_RUNNING,
+    ADMISSION_WAIT_SECONDS,
+)
+from runpod_ollama.retries import Deadline
+
+Clock = Callable[[], float]
+
+# Served in this order, a batch request only runs when no interactive one waits.
+PRIORITIES = ("interactive", "batch")
+DEFAULT_PRIORITY = "interactive"
+DEFAULT_TENANT = "default"
+
+
+def load_numbers(value: str) -> Dict[str, float]:
+    """Parses a JSON object of numbers or the path to a JSON file, like
+    `ADMISSION_TENANT_WEIGHTS` and `ADMISSION_POD_LIMITS`."""
+    if not value.strip():
+        return {}
+    if value.lstrip().startswith("{"):
+        numbers = json.loads(value)
+    else:
+        with open(value) as f:
+            numbers = json.load(f)
+    return {key: float(number) for key, number in numbers.items()}
+
+
+@dataclass
+class Ticket:
+    """A request waiting for, or holding, one of its pod's slots."""
+
+    pod_id: str
+    tenant: str
+    priority: str
+    arrived_at: float
+    seq: int
+    finish: float = 0.0
+    """Virtual finish time of the request among its pod's requests of the same priority."""
+
+    granted_at: Optional[float] = None
+    cancelled: bool = False
+    waiter: Any = field(default=None, repr=False)
+    """Woken by the controller that created the ticket once it is granted."""
+
+    @property
+    def wait_seconds(self) -> Optional[float]:
+        if self.granted_at is None:
+            return None
+        return self.granted_at - self.arrived_at
+
+
+@dataclass
+class PodQueue:
+    limit: int
+    running: int = 0
+    queued: Dict[str, int] = field(default_factory=lambda: {p: 0 for p in PRIORITIES})
+    heaps: Dict[str, List[Tuple[float, int, Ticket]]] = field(
+        default_factory=lambda: {p: [] for p in PRIORITIES}
+    )
+    virtual_time: Dict[str, float] = field(default_factory=lambda: {p: 0.0 for p in PRIORITIES})
+    last_finish: Dict[Tuple[str, str], float] = field(default_factory=dict)
+    """Virtual finish time of every (priority, tenant)'s last request."""
+
+    service_time: Optional[float] = None
+    """Moving average of how long admitted requests hold their slot, in seconds."""
+    admitted: int = 0
+    rejected: int = 0
+
+    def waiting(self) -> int:
+        return sum(self.queued.values())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "running": self.running,
+            "queued": dict(self.queued),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "service_seconds": self.service_time,
+        }
+
+
+class FairQueue:
+    """Per-pod slots, priority classes and weighted fair queuing of tenants.
+
+    Every `arrive` must be followed by a `release` once the request is done,
+    or by a `cancel` if the caller gives up while waiting. Both return the
+    tickets that got a slot, whose callers must be woken up.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queue: int,
+        pod_limits: Optional[Mapping[str, float]] = None,
+        weights: Optional[Mapping[str, float]] = None,
+        smoothing: float = 0.2,
+        default_service_time: float = 1.0,
+        clock: Clock = time.monotonic,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.pod_limits = {pod_id: int(limit) for pod_id, limit in (pod_limits or {}).items()}
+        self.weights = dict(weights or {})
+        self.smoothing = smoothing
+        self.default_service_time = default_service_time
+        self.clock = clock
+        self.pods: Dict[str, PodQueue] = {}
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def limit(self, pod_id: str) -> int:
+        """Requests the pod may run at once, 0 for no limit."""
+        return self.pod_limits.get(pod_id, self.max_concurrency)
+
+    def weight(self, tenant: str) -> float:
+        return self.weights.get(tenant, self.weights.get(DEFAULT_TENANT, 1.0))
+
+    def arrive(
+        self,
+        pod_id: str,
+        tenant: str = DEFAULT_TENANT,
+        priority: str = DEFAULT_PRIORITY,
+        waiter: Any = None,
+    ) -> Ticket:
+        """Admits the request at once if it can, otherwise queues it.
+
+        Raises QueueFull when the pod already has `max_queue` waiting requests.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {priority!r}, expected one of {PRIORITIES}")
+        now = self.clock()
+        with self._lock:
+            pod = self.pods.get(pod_id)
+            if pod is None:
+                pod = self.pods[pod_id] = PodQueue(limit=self.limit(pod_id))
+            self._seq += 1
+            ticket = Ticket(pod_id, tenant, priority, arrived_at=now, seq=self._seq, waiter=waiter)
+            if pod.limit <= 0 or (pod.running < pod.limit and pod.waiting() == 0):
+                self._grant(pod, ticket, now)
+                return ticket
+            if pod.waiting() >= self.max_queue:
+                pod.rejected += 1
+                ADMISSION_REJECTED.inc(pod_id=pod_id, priority=priority)
+                raise QueueFull(
+                    f"{pod.waiting()} requests are already waiting for {pod_id}",
+                    retry_after=self.retry_after(pod),
+                )
+            key = (priority, tenant)
+            start = max(pod.virtual_time[priority], pod.last_finish.get(key, 0.0))
+            ticket.finish = pod.last_finish[key] = start + 1 / self.weight(tenant)
+            heapq.heappush(pod.heaps[priority], (ticket.finish, ticket.seq, ticket))
+            pod.queued[priority] += 1
+            ADMISSION_QUEUE_DEPTH.set(pod.queued[priority], pod_id=pod_id, priority=priority)
+            return ticket
+
+    def release(self, ticket: Ticket) -> List[Ticket]:
+        """Frees the slot of a granted ticket."""
+        now = self.clock()
+        with self._lock:
+            pod = self.pods[ticket.pod_id]
+            pod.running -= 1
+            ADMISSION_RUNNING.set(pod.running, pod_id=ticket.pod_id)
+            if ticket.granted_at is not None:
+                held = now - ticket.granted_at
+                if pod.service_time is None:
+                    pod.service_time = held
+                else:
+                    pod.service_time += self.smoothing * (held - pod.service_time)
+            return self._dispatch(pod, now)
+
+    def cancel(self, ticket: Ticket) -> List[Ticket]:
+        """Gives up a ticket, releasing its slot if it was granted meanwhile."""
+        with self._lock:
+            if ticket.granted_at is None:
+                ticket.cancelled = True
+                pod = self.pods[ticket.pod_id]
+                pod.queued[ticket.priority] -= 1
+                ADMISSION_QUEUE_DEPTH.set(
+                    pod.queued[ticket.priority], pod_id=ticket.pod_id, priority=ticket.priority
+                )
+                return []
+        return self.release(ticket)
+
+    def retry_after(self, pod: PodQueue) -> float:
+        """Seconds until the queue has likely drained enough to take a request."""
+        service_time = pod.service_time or self.default_service_time
+        return (pod.waiting() + 1) * service_time / max(pod.limit, 1)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {pod_id: pod.to_dict() for pod_id, pod in self.pods.items()}
+
+    def _dispatch(self, pod: PodQueue, now: float) -> List[Ticket]:
+        granted = []
+        while pod.running < pod.limit:
+            ticket = self._next(pod)
+            if ticket is None:
+                break
+            pod.virtual_time[ticket.priority] = ticket.finish
+            pod.queued[ticket.priority] -= 1
+            ADMISSION_QUEUE_DEPTH.set(
+                pod.queued[ticket.priority], pod_id=ticket.pod_id, priority=ticket.priority
+            )
+            self._grant(pod, ticket, now)
+            granted.append(ticket)
+        return granted
+
+    def _next(self, pod: PodQueue) -> Optional[Ticket]:
+        for priority in PRIORITIES:
+            heap = pod.heaps[priority]
+            while heap:
+                _, _, ticket = heapq.heappop(heap)
+                if not ticket.cancelled:
+                    return ticket
+        return None
+
+    def _grant(self, pod: PodQueue, ticket: Ticket, now: float):
+        ticket.granted_at = now
+        pod.running += 1
+        pod.admitted += 1
+        ADMISSION_RUNNING.set(pod.running, pod_id=ticket.pod_id)
+        ADMISSION_WAIT_SECONDS.observe(now - ticket.arrived_at, pod_id=ticket.pod_id, priority=ticket.priority)
+
+
+class Admission:
+    """Makes callers on threads wait for their `FairQueue` slot.
+
+    A caller whose `deadline` passes while it waits leaves the queue and
+    gets `DeadlineExceeded`.
+    """
+
+    def __init__(self, queue: FairQueue):
+        self.queue = queue
+
+    @contextmanager
+    def admit(
+        self,
+        pod_id: str,
+        tenant: str = DEFAULT_TENANT,
+        priority: str = DEFAULT_PRIORITY,
+        deadline: Optional[Deadline] = None,
+    ) -> Iterator[Ticket]:
+        deadline = deadline or Deadline()
+        ticket = self.queue.arrive(pod_id, tenant, priority, waiter=threading.Event())
+        if ticket.granted_at is None:
+            remaining = deadline.remaining()
+            if not ticket.waiter.wait(None if remaining is None else max(remaining, 0)):
+                for granted in self.queue.cancel(ticket):
+                    granted.waiter.set()
+                raise _not_admitted(pod_id, deadline)
+        try:
+            yield ticket
+        finally:
+            for granted in self.queue.release(ticket):
+                granted.waiter.set()
+
+
+class AsyncAdmission:
+    """The asyncio counterpart of `Admission`.
+
+    A caller cancelled while it waits (e.g. because its client went away)
+    leaves the queue without taking a slot, like one whose `deadline` passes.
+    """
+
+    def __init__(self, queue: FairQueue):
+        self.queue = queue
+
+    @asynccontextmanager
+    async def admit(
+        self,
+        pod_id: str,
+        tenant: str = DEFAULT_TENANT,
+        priority: str = DEFAULT_PRIORITY,
+        deadline: Optional[Deadline] = None,
+    ) -> AsyncIterator[Ticket]:
+        deadline = deadline or Deadline()
+        waiter = asyncio.get_running_loop().create_future()
+        ticket = self.queue.arrive(pod_id, tenant, priority, waiter=waiter)
+        if ticket.granted_at is None:
+            remaining = deadline.remaining()
+            try:
+                await asyncio.wait_for(waiter, None if remaining is None else max(remaining, 0))
+            except asyncio.TimeoutError:
+                self._wake(self.queue.cancel(ticket))
+                raise _not_admitted(pod_id, deadline) from None
+            except asyncio.CancelledError:
+                self._wake(self.queue.cancel(ticket))
+                raise
+        try:
+            yield ticket
+        finally:
+            self._wake(self.queue.release(ticket))
+
+    def _wake(self, tickets: List[Ticket]):
+        for ticket in tickets:
+            if not ticket.waiter.done():
+                ticket.waiter.set_result(None)
+
+
+def _not_admitted(pod_id: str, deadline: Deadline) -> DeadlineExceeded:
+    return DeadlineExceeded(f"No slot for {pod_id} within {deadline.seconds}s")
+
+
+def create_fair_queue() -> Optional[FairQueue]:
+    """The queue configured by the `ADMISSION_*` settings, or None when off."""
+    max_concurrency = int(ENVIRONMENT.ADMISSION_MAX_CONCURRENCY)
+    pod_limits = load_numbers(ENVIRONMENT.ADMISSION_POD_LIMITS)
+    if max_concurrency <= 0 and not pod_limits:
+        return None
+    return FairQueue(
+        max_concurrency=max_concurrency,
+        max_queue=int(ENVIRONMENT.ADMISSION_MAX_QUEUE),
+        pod_limits=pod_limits,
+        weights=load_numbers(ENVIRONMENT.ADMISSION_TENANT_WEIGHTS),
+    )
+
+
+def retry_after_header(error: QueueFull) -> str:
+    """The `Retry-After` value of a rejected request, in whole seconds."""
+    return str(max(math.ceil(error.retry_after), 1))
@@ -0,0 +1,513 @@
+"""An asyncio version of the local proxy.
+
+Serves the same `/<pod_id>/<endpoint>` routes as `local_proxy`, but every
+request is a coroutine on a single event loop instead of a blocked thread, so
+slow RunPod jobs do not starve the other callers. A client that disconnects
+cancels its handler, and with it the RunPod job nobody else waits for.
+"""
+
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import logging
+import aiohttp
+from aiohttp import web
+from runpod_ollama import ENVIRONMENT, codec
+from runpod_ollama.admission import AsyncAdmission, create_fair_queue, retry_after_header
+from runpod_ollama.async_runpod_repository import AsyncRunpodRepository
+from runpod_ollama.batching import (
+    BATCH_EMBED_METHOD,
+    AsyncEmbeddingBatcher,
+    embedding_endpoint,
+)
+from runpod_ollama.compression import Compressor, create_compressor
+from runpod_ollama.exceptions import DeadlineExceeded, PollingTimeout, QueueFull, RunpodError
+from runpod_ollama.http_pool import AsyncSessionPool
+from runpod_ollama.metadata import MetadataCache, create_proxy_resolver
+from runpod_ollama.metrics import METRICS_CONTENT_TYPE, REGISTRY
+from runpod_ollama.openai_compat import OpenAITranslation, openai_error
+from runpod_ollama.payloads import output_format
+from runpod_ollama.proxy_options import ProxyOptions
+from runpod_ollama.response_cache import (
+    ResponseCache,
+    cache_key,
+    create_response_cache,
+    is_cacheable,
+    is_error_response,
+)
+from runpod_ollama.retries import Deadline
+from runpod_ollama.router import Router, create_router
+from runpod_ollama.sessions import Sessions, create_sessions, session_digest
+from runpod_ollama.single_flight import AsyncSingleFlight
+from runpod_ollama.streaming import (
+    encode_chunk,
+    stream_content_type,
+    stream_end,
+    wants_stream,
+)
+from runpod_ollama.warm_pool import WarmPoolKeeper, create_keepers, keep_warm
+
+SESSION_POOL_KEY = web.AppKey("session_pool", AsyncSessionPool)
+EMBEDDING_BATCHER_KEY = web.AppKey("embedding_batcher", AsyncEmbeddingBatcher)
+RESPONSE_CACHE_KEY = web.AppKey("response_cache", Optional[ResponseCache])
+SINGLE_FLIGHT_KEY = web.AppKey("single_flight", Optional[AsyncSingleFlight])
+ROUTER_KEY = web.AppKey("router", Optional[Router])
+KEEPERS_KEY = web.AppKey("keepers", Dict[str, WarmPoolKeeper])
+ADMISSION_KEY = web.AppKey("admission", Optional[AsyncAdmission])
+METADATA_CACHE_KEY = web.AppKey("metadata_cache", Optional[MetadataCache])
+SESSIONS_KEY = web.AppKey("sessions", Optional[Sessions])
+COMPRESSOR_KEY = web.AppKey("compressor", Optional[Compressor])
+
+# Errors of calls RunPod could not complete, answered with a 502 or a 504.
+UPSTREAM_ERRORS = (RunpodError, aiohttp.ClientError, asyncio.TimeoutError)
+
+json_response = partial(web.json_response, dumps=codec.dumps_str)
+
+
+async def _session_pool(app: web.Application) -> AsyncIterator[None]:
+    app[SESSION_POOL_KEY] = AsyncSessionPool()
+    yield
+    await app[SESSION_POOL_KEY].close()
+
+
+def _repository(app: web.Application, pod_id: str) -> AsyncRunpodRepository:
+    return AsyncRunpodRepository(
+        api_key=ENVIRONMENT.RUNPOD_API_TOKEN,
+        pod_id=pod_id,
+        session=app[SESSION_POOL_KEY].session(pod_id),
+    )
+
+
+async def _refresh_health(app: web.Application, router: Router, endpoint_ids: List[str]):
+    """Fetches the health of claimed endpoints, releasing every claim however it ends."""
+    pending = set(endpoint_ids)
+
+    async def refresh(endpoint_id: str):
+        router.update_health(endpoint_id, await _repository(app, endpoint_id).health())
+        pending.discard(endpoint_id)
+
+    try:
+        # Failures, undecodable answers included, are released below.
+        await asyncio.gather(*(refresh(e) for e in endpoint_ids), return_exceptions=True)
+    finally:
+        # A cancelled request too, or the endpoints would never be fetched again.
+        for endpoint_id in pending:
+            router.health_failed(endpoint_id)
+
+
+def _resolve(app: web.Application, pod_id: str) -> str:
+    """The endpoint id of an endpoint or model name, `RUNPOD_ROUTES` aliases are kept."""
+    metadata_cache, router = app[METADATA_CACHE_KEY], app[ROUTER_KEY]
+    if metadata_cache is None or (router is not None and router.pool(pod_id) is not None):
+        return pod_id
+    return metadata_cache.resolve(pod_id)
+
+
+def _endpoint_fault(error: Exception) -> bool:
+    """Whether `error` comes from RunPod rather than from the request or its caller."""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status >= 500
+    if isinstance(error, PollingTimeout):
+        return not isinstance(error, DeadlineExceeded)
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+@asynccontextmanager
+async def _routed(
+    app: web.Application, pod_id: str, session: Optional[str] = None
+) -> AsyncIterator[AsyncRunpodRepository]:
+    """A repository for the endpoint a call to `pod_id` should be sent to.
+
+    Aliases from `RUNPOD_ROUTES` are routed to one of their endpoints, the
+    one of the previous turn of `session` when it is healthy, and the
+    outcome of the call is reported back to the router.
+    """
+    router = app[ROUTER_KEY]
+    if router is None or router.pool(pod_id) is None:
+        runpod_repository = _repository(app, pod_id)
+        yield runpod_repository
+        _record_traffic(app, pod_id, runpod_repository)
+        return
+    await _refresh_health(app, router, router.claim_stale(pod_id))
+    sessions = app[SESSIONS_KEY]
+    prefer = sessions.endpoint(session) if sessions is not None else None
+    endpoint_id = router.pick(pod_id, prefer=prefer)
+    runpod_repository = _repository(app, endpoint_id)
+    ok: Optional[bool] = None
+    try:
+        yield runpod_repository
+        ok = True
+        _record_traffic(app, endpoint_id, runpod_repository)
+    except Exception as e:
+        ok = False if _endpoint_fault(e) else None
+        raise
+    finally:
+        router.done(endpoint_id, ok, runpod_repository.execution_time())
+
+
+@asynccontextmanager
+async def _admitted(
+    app: web.Application, pod_id: str, options: ProxyOptions, deadline: Deadline
+) -> AsyncIterator[None]:
+    """Waits until the request may be sent upstream, see `admission`."""
+    admission = app[ADMISSION_KEY]
+    if admission is None:
+        yield
+        return
+    async with admission.admit(pod_id, options.tenant, options.priority, deadline):
+        yield
+
+
+def _remember(
+    app: web.Application,
+    session: Optional[str],
+    data,
+    response,
+    runpod_repository: Optional[AsyncRunpodRepository] = None,
+    endpoint_id: Optional[str] = None,
+):
+    """Records the turn of a session, where it ran and what the worker kept of it.
+
+    Turns answered from the cache or by the job of an identical request come
+    without a repository, and without a report of the worker.
+    """
+    sessions = app[SESSIONS_KEY]
+    if session is None or sessions is None:
+        return
+    report = None
+    if runpod_repository is not None:
+        endpoint_id = runpod_repository.pod_id
+        last_call = runpod_repository.last_call
+        report = last_call.session if last_call is not None else None
+    sessions.record(session, endpoint_id, data, response, report)
+
+
+def _record_traffic(
+    app: web.Application, endpoint_id: str, runpod_repository: AsyncRunpodRepository
+):
+    keeper = app[KEEPERS_KEY].get(endpoint_id)
+    execution_time = runpod_repository.execution_time()
+    if keeper is not None and execution_time is not None:
+        keeper.traffic.record(execution_time)
+
+
+async def _keep_warm(app: web.Application) -> AsyncIterator[None]:
+    keepers = list(app[KEEPERS_KEY].values())
+    task = asyncio.ensure_future(keep_warm(keepers)) if keepers else None
+    yield
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+async def _prefetch_metadata(app: web.Application) -> AsyncIterator[None]:
+    # Listing the endpoints is a blocking call, made on a thread of the cache.
+    if app[METADATA_CACHE_KEY] is not None:
+        app[METADATA_CACHE_KEY].prefetch()
+    yield
+
+
+async def _embedding_batcher(app: web.Application) -> AsyncIterator[None]:
+    async def submit(
+        pod_id: str, batch_input, mode: Optional[str], timeout: Optional[float]
+    ):
+        async with _routed(app, pod_id) as runpod_repository:
+            return await runpod_repository.call_endpoint(
+                BATCH_EMBED_METHOD,
+                batch_input,
+                mode=mode,
+                timeout=timeout,
+                output=output_format(BATCH_EMBED_METHOD, batch_input),
+            )
+
+    app[EMBEDDING_BATCHER_KEY] = AsyncEmbeddingBatcher(
+        submit=submit,
+        max_batch_size=int(ENVIRONMENT.EMBED_BATCH_MAX_SIZE),
+        max_wait=int(ENVIRONMENT.EMBED_BATCH_WAIT_MS) / 1000,
+    )
+    yield
+
+
+async def endpoint(request: web.Request) -> web.StreamResponse:
+    """Forwards a request to the Runpod Ollama service."""
+    data = await request.json(loads=codec.loads)
+    try:
+        options = ProxyOptions.from_headers(request.headers)
+    except ValueError as e:
+        raise web.HTTPBadRequest(text=str(e))
+    pod_id = _resolve(request.app, request.match_info["pod_id"])
+    endpoint = request.match_info["endpoint"]
+    try:
+        translation = OpenAITranslation.from_request(endpoint, data)
+    except ValueError as e:
+        return json_response(openai_error(str(e), "invalid_request_error"), status=400)
+    if translation is not None:
+        endpoint, data = translation.method, translation.body
+    sessions = request.app[SESSIONS_KEY]
+    session = options.session if sessions is not None else None
+    if session is not None:
+        data = sessions.prepare(session, endpoint, data)
+    if wants_stream(data):
+        try:
+            return await _stream(request, pod_id, endpoint, data, options, translation, session)
+        except QueueFull as e:
+            return _rejected(e, translation)
+
+    response_cache = request.app[RESPONSE_CACHE_KEY]
+    output = output_format(endpoint, data, options.keep, session)
+    key = None
+    if response_cache is not None and not options.no_store and is_cacheable(endpoint, data):
+        key = cache_key(pod_id, endpoint, data, output)
+        cached = None if options.no_cache else response_cache.get(key)
+        if cached is not None:
+            _remember(request.app, session, data, cached)
+            return _json_response(cached, translation, {"X-Cache": "HIT"})
+
+    # What is left of it bounds a call started again after another caller's deadline.
+    deadline = Deadline(options.timeout)
+    recorded = False
+
+    async def upstream():
+        """The response with the endpoint that answered it, if known."""
+        nonlocal recorded
+        embedding = embedding_endpoint(endpoint)
+        batcher = request.app[EMBEDDING_BATCHER_KEY]
+        async with _admitted(request.app, pod_id, options, deadline):
+            if embedding and batcher.max_wait > 0:
+                response = await batcher.call(
+                    pod_id, embedding, data, mode=options.mode, timeout=deadline.remaining()
+                )
+                return response, None
+            async with _routed(request.app, pod_id, session) as runpod_repository:
+                response = await runpod_repository.call_endpoint(
+                    endpoint,
+                    data,
+                    mode=options.mode,
+                    timeout=deadline.remaining(),
+                    session_id=session_digest(session),
+                    output=output,
+                )
+                _remember(request.app, session, data, response, runpod_repository)
+                recorded = True
+                return response, runpod_repository.pod_id
+
+    single_flight = request.app[SINGLE_FLIGHT_KEY]
+    try:
+        if single_flight is not None and not options.no_store:
+            response, endpoint_id = await single_flight.do(
+                key or cache_key(pod_id, endpoint, data, output), upstream, timeout=options.timeout
+            )
+        else:
+            response, endpoint_id = await upstream()
+    except QueueFull as e:
+        return _rejected(e, translation)
+    except UPSTREAM_ERRORS as e:
+        return _failed(e, translation)
+    if not recorded:
+        _remember(request.app, session, data, response, endpoint_id=endpoint_id)
+
+    if key is not None and not is_error_response(response):
+        response_cache.set(key, response)
+        return _json_response(response, translation, {"X-Cache": "MISS"})
+    return _json_response(response, translation)
+
+
+def _json_response(
+    response, translation: Optional[OpenAITranslation], headers: Optional[Dict[str, str]] = None
+) -> web.Response:
+    if translation is None:
+        return json_response(response, headers=headers)
+    body, status = translation.response(response)
+    return json_response(body, status=status, headers=headers)
+
+
+def _rejected(error: QueueFull, translation: Optional[OpenAITranslation]) -> web.Response:
+    body = (
+        openai_error(str(error), "rate_limit_error")
+        if translation is not None
+        else {"error": str(error)}
+    )
+    return json_response(
+        body, status=429, headers={"Retry-After": retry_after_header(error)}
+    )
+
+
+def _failed(error: Exception, translation: Optional[OpenAITranslation]) -> web.Response:
+    message = str(error) or type(error).__name__
+    body = openai_error(message) if translation is not None else {"error": message}
+    status = 504 if isinstance(error, (PollingTimeout, asyncio.TimeoutError)) else 502
+    return json_response(body, status=status)
+
+
+@web.middleware
+async def compress_response(
+    request: web.Request, handler: Callable[[web.Request], Awaitable[web.StreamResponse]]
+) -> web.StreamResponse:
+    """Compresses whole responses for clients that accept it, see compression.py."""
+    response = await handler(request)
+    compressor = request.app[COMPRESSOR_KEY]
+    # Streamed responses are already sent, only prepared ones carry their body.
+    if (
+        compressor is None
+        or not isinstance(response, web.Response)
+        or not isinstance(response.body, bytes)
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+    response.headers.add("Vary", "Accept-Encoding")
+    body, encoding = compressor.encode(response.body, request.headers.get("Accept-Encoding"))
+    if encoding is not None:
+        response.body = body
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
+async def metrics(request: web.Request) -> web.Response:
+    """Prometheus metrics of the RunPod calls made by the proxy."""
+    return web.Response(
+        body=REGISTRY.render().encode(),
+        headers={"Content-Type": METRICS_CONTENT_TYPE},
+    )
+
+
+async def cache_stats(request: web.Request) -> web.Response:
+    """Hit, miss and eviction counters of the response cache."""
+    response_cache = request.app[RESPONSE_CACHE_KEY]
+    if response_cache is None:
+        return json_response({"enabled": False})
+    return json_response({"enabled": True, **response_cache.stats.to_dict()})
+
+
+async def coalescing_stats(request: web.Request) -> web.Response:
+    """How many requests were sent upstream and how many shared their result."""
+    single_flight = request.app[SINGLE_FLIGHT_KEY]
+    if single_flight is None:
+        return json_response({"enabled": False})
+    return json_response({"enabled": True, **single_flight.stats.to_dict()})
+
+
+async def admission_stats(request: web.Request) -> web.Response:
+    """Limit, running and queued requests of every pod, with admissions and rejections."""
+    admission = request.app[ADMISSION_KEY]
+    if admission is None:
+        return json_response({"enabled": False})
+    return json_response({"enabled": True, "pods": admission.queue.stats()})
+
+
+async def metadata_stats(request: web.Request) -> web.Response:
+    """The endpoint names the proxy resolves and how old their listing is."""
+    metadata_cache = request.app[METADATA_CACHE_KEY]
+    if metadata_cache is None:
+        return json_response({"enabled": False})
+    return json_response({"enabled": True, **metadata_cache.stats()})
+
+
+async def session_stats(request: web.Request) -> web.Response:
+    """Sessions kept, turns pinned to their endpoint and prompt tokens the workers reused."""
+    sessions = request.app[SESSIONS_KEY]
+    if sessions is None:
+        return json_response({"enabled": False})
+    return json_response({"enabled": True, **sessions.to_dict()})
+
+
+async def keep_warm_stats(request: web.Request) -> web.Response:
+    """Target and warm-up jobs of every endpoint kept warm, with their cold starts."""
+    return json_response(
+        {
+            endpoint_id: {"target": keeper.target(), **keeper.stats.to_dict()}
+            for endpoint_id, keeper in request.app[KEEPERS_KEY].items()
+        }
+    )
+
+
+async def _stream(
+    request: web.Request,
+    pod_id: str,
+    endpoint: str,
+    data,
+    options: ProxyOptions,
+    translation: Optional[OpenAITranslation] = None,
+    session: Optional[str] = None,
+) -> web.StreamResponse:
+    # The wire format is the one of the endpoint the client called.
+    wire = translation.endpoint if translation is not None else endpoint
+    encode = translation.encode if translation is not None else partial(encode_chunk, endpoint)
+    response = web.StreamResponse(headers={"Content-Type": stream_content_type(wire)})
+    deadline = Deadline(options.timeout)
+    try:
+        async with _admitted(request.app, pod_id, options, deadline), _routed(
+            request.app, pod_id, session
+        ) as runpod_repository:
+            await response.prepare(request)
+            chunks = runpod_repository.stream_endpoint(
+                endpoint,
+                data,
+                timeout=deadline.remaining(),
+                session_id=session_digest(session),
+                output=output_format(endpoint, data, options.keep, session),
+            )
+            try:
+                async for chunk in chunks:
+                    if isinstance(chunk, dict) and chunk.get("done"):
+                        _remember(request.app, session, data, chunk, runpod_repository)
+                    await response.write(encode(chunk))
+            finally:
+                # Cancels the job when the client went away mid-stream.
+                await chunks.aclose()
+    except UPSTREAM_ERRORS as e:
+        if not response.prepared:
+            # Gone before the response started, e.g. while waiting for admission.
+            return _failed(e, translation)
+        await response.write(encode({"error": str(e) or type(e).__name__}))
+    await response.write(stream_end(wire))
+    await response.write_eof()
+    return response
+
+
+def create_app() -> web.Application:
+    app = web.Application(middlewares=[compress_response])
+    app.cleanup_ctx.append(_session_pool)
+    app.cleanup_ctx.append(_embedding_batcher)
+    response_cache = app[RESPONSE_CACHE_KEY] = create_response_cache()
+    router = app[ROUTER_KEY] = create_router()
+    app[KEEPERS_KEY] = create_keepers(router)
+    fair_queue = create_fair_queue()
+    app[ADMISSION_KEY] = AsyncAdmission(fair_queue) if fair_queue is not None else None
+    app.cleanup_ctx.append(_keep_warm)
+    app[METADATA_CACHE_KEY] = create_proxy_resolver()
+    app.cleanup_ctx.append(_prefetch_metadata)
+    app[SESSIONS_KEY] = create_sessions()
+    single_flight = app[SINGLE_FLIGHT_KEY] = (
+        AsyncSingleFlight() if ENVIRONMENT.COALESCE_REQUESTS == "on" else None
+    )
+    if response_cache is not None:
+        REGISTRY.register_collector(
+            "proxy_response_cache", "Response cache counter.", response_cache.stats.to_dict
+        )
+    if single_flight is not None:
+        REGISTRY.register_collector(
+            "proxy_coalescing", "Request coalescing counter.", single_flight.stats.to_dict
+        )
+    compressor = app[COMPRESSOR_KEY] = create_compressor()
+    if compressor is not None:
+        REGISTRY.register_collector(
+            "proxy_compression", "Response compression counter.", compressor.stats.to_dict
+        )
+    app.router.add_get("/metrics", metrics)
+    app.router.add_get("/_proxy/cache", cache_stats)
+    app.router.add_get("/_proxy/coalescing", coalescing_stats)
+    app.router.add_get("/_proxy/keep-warm", keep_warm_stats)
+    app.router.add_get("/_proxy/admission", admission_stats)
+    app.router.add_get("/_proxy/metadata", metadata_stats)
+    app.router.add_get("/_proxy/sessions", session_stats)
+    app.router.add_post("/{pod_id}/{endpoint:.+}", endpoint)
+    return app
+
+
+def run_async_proxy(
+    port: int = 5000,
+    debug: Optional[bool] = None,
+):
+    logging.basicConfig(level=logging.DEBUG if debug else logging.INFO)
+    web.run_app(create_app(), host="127.0.0.1", port=port, handler_cancellation=True)
@@ -0,0 +1,276 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Mapping, Optional, Any
+import aiohttp
+from runpod_ollama import codec
+from runpod_ollama.exceptions import JobFailed, PollingTimeout, RunpodError
+from runpod_ollama.metrics import CallMetrics
+from runpod_ollama.payloads import OutputFormat, unpack_embeddings
+from runpod_ollama.polling import PollingStrategy
+from runpod_ollama.retries import (
+    RESUBMIT_STATUSES,
+    RETRY_STATUSES,
+    Deadline,
+    RetryPolicy,
+    parse_retry_after,
+)
+from runpod_ollama.runpod_repository import (
+    FAILED_STATUSES,
+    PENDING_STATUSES,
+    STREAM_POLLING,
+    BaseRunpodRepository,
+    RunningJob,
+)
+
+
+class AsyncRunpodRepository(BaseRunpodRepository):
+    """An asyncio version of `RunpodRepository`.
+
+    Waiting for a job only suspends the calling coroutine, so a single event
+    loop can keep thousands of RunPod jobs in flight. The aiohttp session is
+    owned by the caller and is expected to be shared between repositories.
+    A call whose task is cancelled cancels its job.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        pod_id: str,
+        session: aiohttp.ClientSession,
+        base_url: Optional[str] = None,
+        polling: Optional[PollingStrategy] = None,
+        runsync_wait_ms: Optional[int] = None,
+        retry: Optional[RetryPolicy] = None,
+        http_timeout: Optional[float] = None,
+    ):
+        super().__init__(
+            api_key=api_key,
+            pod_id=pod_id,
+            base_url=base_url,
+            polling=polling,
+            runsync_wait_ms=runsync_wait_ms,
+            retry=retry,
+            http_timeout=http_timeout,
+        )
+        self.session = session
+
+    async def call_endpoint(
+        self,
+        endpoint: str,
+        input: Any,
+        sleep_interval: Optional[float] = None,
+        mode: Optional[str] = None,
+        timeout: Optional[float] = None,
+        session_id: Optional[str] = None,
+        output: Optional[OutputFormat] = None,
+    ) -> Mapping[str, Any]:
+        poller = self._polling(sleep_interval).start(endpoint)
+        metrics = self.last_call = CallMetrics(self.pod_id, endpoint, input)
+        deadline = Deadline(timeout)
+
+        async with self._running(metrics) as job:
+            out = await self.submit(
+                endpoint,
+                input,
+                mode=mode,
+                metrics=metrics,
+                deadline=deadline,
+                session_id=session_id,
+                output=output,
+            )
+            metrics.submitted()
+            self._track(job, out)
+
+            while out["status"] != "COMPLETED":
+                if out["status"] in FAILED_STATUSES:
+                    raise self._job_failed(out)
+                await asyncio.sleep(deadline.cap(poller.next_delay(out), job.id))
+                metrics.polled()
+                out = job.out = await self.status(job.id, metrics=metrics, deadline=deadline)
+        poller.finish(out)
+        metrics.completed(out)
+        self.last_status = out
+
+        return unpack_embeddings(metrics.worker_output(self._job_output(out)))
+
+    async def stream_endpoint(
+        self,
+        endpoint: str,
+        input: Any,
+        timeout: Optional[float] = None,
+        session_id: Optional[str] = None,
+        output: Optional[OutputFormat] = None,
+    ) -> AsyncIterator[Any]:
+        metrics = self.last_call = CallMetrics(self.pod_id, endpoint, input)
+        deadline = Deadline(timeout)
+        async with self._running(metrics) as job:
+            out = await self.submit(
+                endpoint,
+                input,
+                mode="run",
+                metrics=metrics,
+                deadline=deadline,
+                session_id=session_id,
+                output=output,
+            )
+            metrics.submitted()
+            self._track(job, out)
+
+            poller = STREAM_POLLING.start(endpoint)
+            while out["status"] in PENDING_STATUSES:
+                await asyncio.sleep(deadline.cap(poller.next_delay(out), job.id))
+                metrics.polled()
+                out = job.out = await self.stream(job.id, metrics=metrics, deadline=deadline)
+                chunks = out.get("stream") or []
+                for chunk in chunks:
+                    yield metrics.worker_output(chunk["output"])
+                if chunks:
+                    poller = STREAM_POLLING.start(endpoint)
+            if out["status"] in FAILED_STATUSES:
+                raise self._job_failed(out)
+        metrics.completed()
+
+    @asynccontextmanager
+    async def _running(self, metrics: CallMetrics) -> AsyncIterator[RunningJob]:
+        job = RunningJob()
+        try:
+            yield job
+        except JobFailed:
+            metrics.failed("worker")
+            raise
+        except BaseException as e:
+            if isinstance(e, PollingTimeout):
+                metrics.failed("timeout")
+            elif isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError)):
+                metrics.failed("http")
+            if job.pending:
+                await self._abandon(job.id)
+            raise
+        finally:
+            self._untrack(job)
+
+    async def _abandon(self, job_id: str):
+        try:
+            await self.cancel(job_id, deadline=Deadline(self.http_timeout))
+        except (aiohttp.ClientError, asyncio.TimeoutError, RunpodError):
+            pass
+
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        idempotent: bool,
+        metrics: Optional[CallMetrics] = None,
+        deadline: Optional[Deadline] = None,
+        json: Any = None,
+        check: bool = False,
+        http_timeout: Optional[float] = None,
+    ) -> Mapping[str, Any]:
+        deadline = deadline or Deadline()
+        attempt = 0
+        while True:
+            attempt += 1
+            retry_after = None
+            timeout = deadline.timeout(http_timeout or self.http_timeout)
+            try:
+                async with self.session.request(
+                    method,
+                    url,
+                    headers=self._request_headers(),
+                    data=codec.dumps(json) if json is not None else None,
+                    timeout=aiohttp.ClientTimeout(total=timeout),
+                ) as response:
+                    if response.status not in RETRY_STATUSES:
+                        if check:
+                            response.raise_for_status()
+                        return codec.loads(await response.read())
+                    if not self.retry.retries(
+                        attempt, idempotent or response.status in RESUBMIT_STATUSES
+                    ):
+                        response.raise_for_status()
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                unsent = isinstance(e, aiohttp.ClientConnectorError)
+                if not self.retry.retries(attempt, idempotent or unsent):
+                    raise
+            if metrics is not None:
+                metrics.retried()
+            await asyncio.sleep(deadline.cap(self.retry.delay(attempt, retry_after)))
+
+    async def submit(
+        self,
+        endpoint: str,
+        input: Any,
+        mode: Optional[str] = None,
+        metrics: Optional[CallMetrics] = None,
+        deadline: Optional[Deadline] = None,
+        session_id: Optional[str] = None,
+        output: Optional[OutputFormat] = None,
+    ) -> Mapping[str, Any]:
+        """Creates a job without waiting for it, returns its first status."""
+        return await self._request(
+            "POST",
+            self._submit_url(mode),
+            idempotent=False,
+            metrics=metrics,
+            deadline=deadline,
+            json=self._job_input(endpoint, input, session_id, output),
+            check=True,
+            http_timeout=self._submit_timeout(mode),
+        )
+
+    async def status(
+        self,
+        job_id: str,
+        metrics: Optional[CallMetrics] = None,
+        deadline: Optional[Deadline] = None,
+        check: bool = False,
+    ) -> Mapping[str, Any]:
+        """The job's status, `check` raises for error statuses instead of decoding them."""
+        return await self._request(
+            "GET",
+            f"{self._request_base_url()}/status/{job_id}",
+            idempotent=True,
+            metrics=metrics,
+            deadline=deadline,
+            check=check,
+        )
+
+    async def stream(
+        self,
+        job_id: str,
+        metrics: Optional[CallMetrics] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> Mapping[str, Any]:
+        """The job's status with the chunks streamed since the last call."""
+        return await self._request(
+            "GET",
+            f"{self._request_base_url()}/stream/{job_id}",
+            idempotent=False,
+            metrics=metrics,
+            deadline=deadline,
+        )
+
+    async def cancel(self, job_id: str, deadline: Optional[Deadline] = None) -> Mapping[str, Any]:
+        return await self._request(
+            "POST",
+            f"{self._request_base_url()}/cancel/{job_id}",
+            idempotent=True,
+            deadline=deadline,
+        )
+
+    async def health(self) -> Mapping[str, Any]:
+        async with self.session.get(
+            f"{self._request_base_url()}/health",
+            headers=self._request_headers(),
+            timeout=aiohttp.ClientTimeout(total=self.http_timeout),
+        ) as response:
+            response.raise_for_status()
+            return codec.loads(await response.read())
+
+    async def pull_model(self, model_name: str):
+        return await self.call_endpoint("pull", {"name": model_name})
+
+    async def cancel_requests(self) -> List[Mapping[str, Any]]:
+        """Cancels the jobs of every call in progress."""
+        return await asyncio.gather(*(self.cancel(job_id) for job_id in self._active_job_ids()))
@@ -0,0 +1,419 @@
+"""Runs every line of a JSONL file as a RunPod job.
+
+    runpod-ollama batch run prompts.jsonl --endpoint <endpoint-id> --concurrency 64
+
+Every input line is an Ollama request body, sent to `method` (`generate` by
+default), or an object with the body under `input` and optionally its own
+`method` and `id`. Results are appended to the output file as jobs finish,
+one line per input line:
+
+    {"line":12,"id":"...","status":"COMPLETED","output":{...},"delay_ms":80,"execution_ms":950}
+
+The input is read lazily and at most `concurrency` jobs are in flight, so
+memory does not grow with the file. RunPod has no status route for several
+jobs, so instead of a sleeping loop per job a single sweep polls every job
+that is due, according to the pod's polling strategy, on a shared pool.
+
+Progress is checkpointed next to the output: the first line that is not
+finished, the finished lines after it, the jobs in flight and how much of
+the output was written. A resumed run keeps the results written after the
+checkpoint, polls the jobs it had in flight and only submits the rest.
+"""
+
+import asyncio
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from typing import IO, Any, Callable, Dict, Iterator, List, Mapping, Optional, Set, Tuple
+import aiohttp
+from runpod_ollama import codec
+from runpod_ollama.async_runpod_repository import AsyncRunpodRepository
+from runpod_ollama.exceptions import PollingTimeout
+from runpod_ollama.metrics import CallMetrics
+from runpod_ollama.polling import Poller
+from runpod_ollama.retries import RETRY_STATUSES
+from runpod_ollama.runpod_repository import FAILED_STATUSES
+
+# Finished lines after the first unfinished one are tracked individually, and
+# the input is not read further ahead than this many windows of jobs.
+LOOKAHEAD_WINDOWS = 16
+
+
+def count_lines(path: str, chunk_size: int = 1 << 20) -> int:
+    """Counts the lines of `path` without holding more than a chunk in memory."""
+    lines = 0
+    last = b"\n"
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            lines += chunk.count(b"\n")
+            last = chunk[-1:]
+    return lines + (last != b"\n")
+
+
+@dataclass
+class Checkpoint:
+    next_line: int = 0
+    """Every line before it is finished."""
+
+    input_offset: int = 0
+    """Byte offset of `next_line` in the input."""
+
+    done: List[int] = field(default_factory=list)
+    """Finished lines after `next_line`."""
+
+    in_flight: Dict[str, str] = field(default_factory=dict)
+    """Job ids of the lines submitted and not finished, by line."""
+
+    output_bytes: int = 0
+    completed: int = 0
+    failed: int = 0
+
+    @classmethod
+    def load(cls, path: str) -> Optional["Checkpoint"]:
+        try:
+            with open(path) as f:
+                return cls(**json.load(f))
+        except FileNotFoundError:
+            return None
+
+    def save(self, path: str):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(asdict(self), f)
+        os.replace(tmp, path)
+
+
+@dataclass
+class BatchProgress:
+    completed: int
+    failed: int
+    in_flight: int
+    total: Optional[int]
+    elapsed: float
+    finished_this_run: int
+
+    @property
+    def finished(self) -> int:
+        return self.completed + self.failed
+
+    @property
+    def throughput(self) -> float:
+        """Lines finished per second by this run."""
+        return self.finished_this_run / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Seconds until every line is finished at the current throughput."""
+        if self.total is None or self.throughput == 0:
+            return None
+        return max(self.total - self.finished, 0) / self.throughput
+
+    def __str__(self) -> str:
+        total = f"/{self.total}" if self.total is not None else ""
+        line = (
+            f"{self.finished}{total} lines ({self.failed} failed), {self.in_flight} in flight, "
+            f"{self.throughput:.1f} lines/s"
+        )
+        if self.eta is not None:
+            line += f", ETA {time.strftime('%H:%M:%S', time.gmtime(self.eta))}"
+        return line
+
+
+@dataclass
+class BatchJob:
+    line: int
+    id: Any
+    method: str
+    body: Any
+    job_id: Optional[str] = None
+    attempts: int = 0
+    due_at: float = 0.0
+    """When to submit it, or to poll it once it has a job id."""
+
+    started_at: float = field(default_factory=time.monotonic)
+    poller: Optional[Poller] = None
+    metrics: Optional[CallMetrics] = None
+    last_status: Mapping[str, Any] = field(default_factory=dict)
+
+
+def parse_line(text: bytes, method: str) -> Tuple[Any, str, Any]:
+    """The id, method and request body of an input line."""
+    value = codec.loads(text)
+    if isinstance(value, dict) and "input" in value:
+        return value.get("id"), value.get("method", method), value["input"]
+    return None, method, value
+
+
+class BatchRunner:
+    def __init__(
+        self,
+        repository: AsyncRunpodRepository,
+        input_path: str,
+        output_path: str,
+        concurrency: int = 32,
+        method: str = "generate",
+        timeout: float = 3600.0,
+        retries: int = 3,
+        checkpoint_interval: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.repository = repository
+        self.input_path = input_path
+        self.output_path = output_path
+        self.checkpoint_path = f"{output_path}.checkpoint"
+        self.concurrency = concurrency
+        self.method = method
+        self.timeout = timeout
+        self.retries = retries
+        self.checkpoint_interval = checkpoint_interval
+        self.clock = clock
+        self.checkpoint = Checkpoint()
+        self.total: Optional[int] = None
+        self.jobs: Dict[int, BatchJob] = {}
+        self._done: Set[int] = set()
+        self._offsets: Dict[int, int] = {}
+        self._reattach: Dict[int, str] = {}
+        self._read_head = 0
+        self._output: Optional[IO[bytes]] = None
+        self._exhausted = False
+        self._finished_this_run = 0
+
+    def _resume(self, output: IO[bytes]) -> bool:
+        """Restores the checkpoint, if there is one, and positions the output after it."""
+        checkpoint = Checkpoint.load(self.checkpoint_path)
+        if checkpoint is None:
+            output.truncate(0)
+            return False
+        self.checkpoint = checkpoint
+        self._done = set(checkpoint.done)
+        self._reattach = {int(line): job_id for line, job_id in checkpoint.in_flight.items()}
+        # Results written after the checkpoint are kept, a torn last line is not.
+        output.seek(checkpoint.output_bytes)
+        position = checkpoint.output_bytes
+        for text in iter(output.readline, b""):
+            if not text.endswith(b"\n"):
+                break
+            record = codec.loads(text)
+            self._finish_line(record["line"], record["status"] == "COMPLETED")
+            position += len(text)
+        output.seek(position)
+        output.truncate()
+        return True
+
+    def _lines(self, input: IO[bytes]) -> Iterator[Tuple[int, int, bytes]]:
+        input.seek(self.checkpoint.input_offset)
+        line = self.checkpoint.next_line
+        while True:
+            offset = input.tell()
+            text = input.readline()
+            if not text:
+                return
+            yield line, offset, text
+            line += 1
+
+    def _finish_line(self, line: int, ok: bool):
+        self._reattach.pop(line, None)
+        if line in self._done or line < self.checkpoint.next_line:
+            return
+        self._done.add(line)
+        if ok:
+            self.checkpoint.completed += 1
+        else:
+            self.checkpoint.failed += 1
+        self._finished_this_run += 1
+
+    def _advance(self):
+        checkpoint = self.checkpoint
+        while checkpoint.next_line < self._read_head and checkpoint.next_line in self._done:
+            self._done.discard(checkpoint.next_line)
+            self._offsets.pop(checkpoint.next_line, None)
+            checkpoint.next_line += 1
+        checkpoint.input_offset = self._offsets.get(checkpoint.next_line, checkpoint.input_offset)
+
+    def _fill(self, lines: Iterator[Tuple[int, int, bytes]]):
+        """Reads lines until the window is full."""
+        self._advance()
+        lookahead = self.concurrency * LOOKAHEAD_WINDOWS
+        while (
+            not self._exhausted
+            and len(self.jobs) < self.concurrency
+            and self._read_head - self.checkpoint.next_line < lookahead
+        ):
+            try:
+                line, offset, text = next(lines)
+            except StopIteration:
+                self._exhausted = True
+                return
+            self._offsets[line] = offset
+            self._offsets[line + 1] = offset + len(text)
+            self._read_head = line + 1
+            if line in self._done or not text.strip():
+                if not text.strip():
+                    self._done.add(line)
+                continue
+            try:
+                id, method, body = parse_line(text, self.method)
+            except ValueError as e:
+                self._write(BatchJob(line, None, self.method, None), "FAILED", error=str(e))
+                continue
+            job = BatchJob(line, id, method, body, due_at=self.clock())
+            job.job_id = self._reattach.pop(line, None)
+            if job.job_id is not None:
+                job.poller = self.repository.polling.start(method)
+                job.metrics = CallMetrics(self.repository.pod_id, method, body)
+            self.jobs[line] = job
+
+    async def _submit(self, job: BatchJob):
+        job.attempts += 1
+        job.metrics = CallMetrics(self.repository.pod_id, job.method, job.body)
+        if job.attempts > 1:
+            job.metrics.retried()
+        try:
+            out = await self.repository.submit(job.method, job.body)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            job.metrics.failed("http")
+            if job.attempts > self.retries:
+                self._write(job, "FAILED", error=f"submit failed: {e}")
+                return
+            job.due_at = self.clock() + min(2 ** job.attempts, 30)
+            return
+        job.metrics.submitted()
+        job.job_id = out["id"]
+        job.started_at = self.clock()
+        job.poller = self.repository.polling.start(job.method)
+        await self._handle(job, out)
+
+    async def _poll(self, job: BatchJob):
+        assert job.job_id is not None and job.metrics is not None
+        job.metrics.polled()
+        try:
+            out = await self.repository.status(job.job_id, check=True)
+        except aiohttp.ClientResponseError as e:
+            if e.status in RETRY_STATUSES:
+                job.metrics.failed("http")
+                job.due_at = self.clock() + 1.0
+                return
+            out = {}
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            job.metrics.failed("http")
+            job.due_at = self.clock() + 1.0
+            return
+        except ValueError:
+            out = {}
+        if not isinstance(out, Mapping) or "status" not in out:
+            # RunPod forgot the job, e.g. one of a checkpoint that expired, and
+            # answered with an error status or a body that is not a job.
+            job.job_id = None
+            job.due_at = self.clock()
+            return
+        await self._handle(job, out)
+
+    async def _handle(self, job: BatchJob, out: Mapping[str, Any]):
+        assert job.poller is not None and job.metrics is not None
+        job.last_status = out
+        status = out["status"]
+        if status == "COMPLETED":
+            job.poller.finish(out)
+            job.metrics.completed(out)
+            output = job.metrics.worker_output(self.repository._job_output(out))
+            if isinstance(output, dict) and output.get("status") == "failed":
+                self._write(job, "FAILED", error=output.get("error"))
+            else:
+                self._write(job, status, output=output)
+            return
+        if status in FAILED_STATUSES:
+            job.metrics.failed("worker")
+            self._write(job, status, error=out.get("error"))
+            return
+        try:
+            if self.clock() - job.started_at > self.timeout:
+                raise PollingTimeout(f"Job {job.job_id} not finished within {self.timeout}s")
+            job.due_at = self.clock() + job.poller.next_delay(out)
+        except PollingTimeout as e:
+            job.metrics.failed("timeout")
+            if job.job_id is not None:
+                try:
+                    await self.repository.cancel(job.job_id)
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    pass
+            self._write(job, "TIMED_OUT", error=str(e))
+
+    def _write(self, job: BatchJob, status: str, output: Any = None, error: Any = None):
+        assert self._output is not None
+        record: Dict[str, Any] = {"line": job.line, "id": job.id, "status": status}
+        if output is not None:
+            record["output"] = output
+        if error is not None:
+            record["error"] = error
+        for key, name in (("delayTime", "delay_ms"), ("executionTime", "execution_ms")):
+            if key in job.last_status:
+                record[name] = job.last_status[key]
+        self._output.write(codec.dumps(record) + b"\n")
+        self.jobs.pop(job.line, None)
+        self._finish_line(job.line, status == "COMPLETED")
+
+    def _save_checkpoint(self):
+        assert self._output is not None
+        self._advance()
+        self._output.flush()
+        self.checkpoint.output_bytes = self._output.tell()
+        self.checkpoint.done = sorted(self._done)
+        self.checkpoint.in_flight = {
+            str(line): job.job_id for line, job in self.jobs.items() if job.job_id is not None
+        }
+        # Jobs of the old checkpoint that were not read again yet are still in flight.
+        self.checkpoint.in_flight.update({str(k): v for k, v in self._reattach.items()})
+        self.checkpoint.save(self.checkpoint_path)
+
+    def progress(self, started_at: float) -> BatchProgress:
+        return BatchProgress(
+            completed=self.checkpoint.completed,
+            failed=self.checkpoint.failed,
+            in_flight=len(self.jobs),
+            total=self.total,
+            elapsed=self.clock() - started_at,
+            finished_this_run=self._finished_this_run,
+        )
+
+    async def run(
+        self,
+        on_progress: Callable[[BatchProgress], Any] = lambda progress: None,
+        progress_interval: float = 2.0,
+        count: bool = True,
+    ) -> BatchProgress:
+        """Runs the lines not finished yet, returns the final progress."""
+        if count:
+            self.total = count_lines(self.input_path)
+        mode = "r+b" if os.path.exists(self.output_path) else "w+b"
+        with open(self.input_path, "rb") as input, open(self.output_path, mode) as output:
+            self._output = output
+            self._resume(output)
+            # A run killed before its first periodic checkpoint can still be resumed.
+            self._save_checkpoint()
+            lines = self._lines(input)
+            started_at = self.clock()
+            checkpoint_at = reported_at = started_at
+            while True:
+                self._fill(lines)
+                if not self.jobs and self._exhausted:
+                    break
+                now = self.clock()
+                due = [job for job in self.jobs.values() if job.due_at <= now]
+                await asyncio.gather(
+                    *(self._submit(j) if j.job_id is None else self._poll(j) for j in due)
+                )
+                now = self.clock()
+                if now - checkpoint_at >= self.checkpoint_interval:
+                    self._save_checkpoint()
+                    checkpoint_at = now
+                if now - reported_at >= progress_interval:
+                    on_progress(self.progress(started_at))
+                    reported_at = now
+                if self.jobs:
+                    next_due = min(job.due_at for job in self.jobs.values())
+                    await asyncio.sleep(min(max(next_due - now, 0.005), 1.0))
+            self._save_checkpoint()
+        progress = self.progress(started_at)
+        os.remove(self.checkpoint_path)
+        return progress
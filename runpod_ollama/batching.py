@@ -0,0 +1,231 @@
+"""Micro-batching of embedding requests.
+
+Concurrent `embed`/`embeddings` requests for the same pod, model and options
+are held for up to `max_wait` seconds and sent as a single RunPod job. The
+worker turns the `embed` requests of that job into one multi-input Ollama
+`/api/embed` call (the legacy `/api/embeddings` has no multi-input form, so
+those are sent side by side) and answers with one response per original
+request, in order.
+
+Requests only share a batch with others of the same `mode`, and each caller
+waits for it up to its own `timeout`. The batched job is given as long as
+its most patient caller, and no deadline when one of them waits forever.
+"""
+
+import asyncio
+import json
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Set, Tuple
+from runpod_ollama.exceptions import DeadlineExceeded
+from runpod_ollama.retries import Deadline
+
+# The worker recognizes batched jobs by this method name, keep it in sync
+# with `server/runpod_wrapper.py`.
+BATCH_EMBED_METHOD = "_batch/embed"
+
+EMBEDDING_ENDPOINTS = ("embed", "embeddings")
+
+BatchKey = Tuple[str, str]
+
+
+def embedding_endpoint(endpoint: str) -> Optional[str]:
+    """Returns "embed" or "embeddings" for embedding endpoints, else None."""
+    name = endpoint.strip("/")
+    if name.startswith("api/"):
+        name = name[len("api/"):]
+    return name if name in EMBEDDING_ENDPOINTS else None
+
+
+def batch_key(
+    pod_id: str, endpoint: str, body: Mapping[str, Any], mode: Optional[str] = None
+) -> BatchKey:
+    """Requests can share a batch when everything but their text matches."""
+    options = {k: v for k, v in body.items() if k not in ("input", "prompt")}
+    return pod_id, json.dumps([endpoint, mode, options], sort_keys=True)
+
+
+def pack_batch(items: List[Tuple[str, Mapping[str, Any]]]) -> Dict[str, Any]:
+    """The input of the batched job for (endpoint, body) pairs."""
+    return {"requests": [{"endpoint": e, "body": b} for e, b in items]}
+
+
+def unpack_batch(output: Any, size: int) -> List[Any]:
+    """Splits a batched job's output into the response of every request.
+
+    An output without per-request responses is an error from the worker,
+    which every request of the batch receives.
+    """
+    if isinstance(output, Mapping) and "responses" in output:
+        responses = list(output["responses"])
+        if len(responses) == size:
+            return responses
+    return [output] * size
+
+
+def job_timeout(deadlines: List[Deadline]) -> Optional[float]:
+    """How long the batched job is waited for, None when a caller waits forever."""
+    longest = 0.0
+    for deadline in deadlines:
+        remaining = deadline.remaining()
+        if remaining is None:
+            return None
+        longest = max(longest, remaining)
+    return longest
+
+
+@dataclass
+class _PendingBatch:
+    items: List[Tuple[str, Mapping[str, Any]]] = field(default_factory=list)
+    deadlines: List[Deadline] = field(default_factory=list)
+    responses: List[Any] = field(default_factory=list)
+    error: Optional[Exception] = None
+    full: threading.Event = field(default_factory=threading.Event)
+    done: threading.Event = field(default_factory=threading.Event)
+
+
+class EmbeddingBatcher:
+    """Coalesces embedding requests from concurrent threads.
+
+    `submit(pod_id, batch_input, mode, timeout)` runs one batched job and
+    returns its output. Each batch waits for more requests and is then
+    submitted by its own thread, so every caller can stop waiting at its
+    deadline.
+    """
+
+    def __init__(
+        self,
+        submit: Callable[[str, Mapping[str, Any], Optional[str], Optional[float]], Any],
+        max_batch_size: int,
+        max_wait: float,
+    ):
+        self.submit = submit
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending: Dict[BatchKey, _PendingBatch] = {}
+        self._lock = threading.Lock()
+
+    def call(
+        self,
+        pod_id: str,
+        endpoint: str,
+        body: Mapping[str, Any],
+        mode: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """Raises `DeadlineExceeded` when the response is not there within `timeout`."""
+        deadline = Deadline(timeout)
+        key = batch_key(pod_id, endpoint, body, mode)
+        with self._lock:
+            batch = self._pending.get(key)
+            if batch is None:
+                batch = self._pending[key] = _PendingBatch()
+                threading.Thread(
+                    target=self._flush, args=(pod_id, key, batch, mode), daemon=True
+                ).start()
+            index = len(batch.items)
+            batch.items.append((endpoint, body))
+            batch.deadlines.append(deadline)
+            if len(batch.items) >= self.max_batch_size:
+                del self._pending[key]
+                batch.full.set()
+
+        if not batch.done.wait(deadline.remaining()):
+            raise DeadlineExceeded(f"The call not finished within {timeout}s")
+        if batch.error is not None:
+            raise batch.error
+        return batch.responses[index]
+
+    def _flush(self, pod_id: str, key: BatchKey, batch: _PendingBatch, mode: Optional[str]):
+        batch.full.wait(self.max_wait)
+        with self._lock:
+            if self._pending.get(key) is batch:
+                del self._pending[key]
+        try:
+            output = self.submit(
+                pod_id, pack_batch(batch.items), mode, job_timeout(batch.deadlines)
+            )
+            batch.responses = unpack_batch(output, len(batch.items))
+        except Exception as e:
+            batch.error = e
+        finally:
+            batch.done.set()
+
+
+@dataclass
+class _AsyncPendingBatch:
+    items: List[Tuple[str, Mapping[str, Any]]] = field(default_factory=list)
+    deadlines: List[Deadline] = field(default_factory=list)
+    full: asyncio.Event = field(default_factory=asyncio.Event)
+    result: "asyncio.Future[List[Any]]" = field(
+        default_factory=lambda: asyncio.get_running_loop().create_future()
+    )
+
+
+class AsyncEmbeddingBatcher:
+    """The asyncio counterpart of `EmbeddingBatcher`.
+
+    Each batch is flushed by its own task, so a caller that goes away does
+    not take the requests it shares a batch with down with it.
+    """
+
+    def __init__(
+        self,
+        submit: Callable[
+            [str, Mapping[str, Any], Optional[str], Optional[float]], Awaitable[Any]
+        ],
+        max_batch_size: int,
+        max_wait: float,
+    ):
+        self.submit = submit
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending: Dict[BatchKey, _AsyncPendingBatch] = {}
+        self._flushes: Set["asyncio.Task[None]"] = set()
+
+    async def call(
+        self,
+        pod_id: str,
+        endpoint: str,
+        body: Mapping[str, Any],
+        mode: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """Raises `DeadlineExceeded` when the response is not there within `timeout`."""
+        deadline = Deadline(timeout)
+        key = batch_key(pod_id, endpoint, body, mode)
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = _AsyncPendingBatch()
+            flush = asyncio.ensure_future(self._flush(pod_id, key, batch, mode))
+            self._flushes.add(flush)
+            flush.add_done_callback(self._flushes.discard)
+        index = len(batch.items)
+        batch.items.append((endpoint, body))
+        batch.deadlines.append(deadline)
+        if len(batch.items) >= self.max_batch_size:
+            del self._pending[key]
+            batch.full.set()
+
+        try:
+            responses = await asyncio.wait_for(asyncio.shield(batch.result), timeout)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"The call not finished within {timeout}s") from None
+        return responses[index]
+
+    async def _flush(
+        self, pod_id: str, key: BatchKey, batch: _AsyncPendingBatch, mode: Optional[str]
+    ):
+        try:
+            await asyncio.wait_for(batch.full.wait(), self.max_wait)
+        except asyncio.TimeoutError:
+            pass
+        if self._pending.get(key) is batch:
+            del self._pending[key]
+        try:
+            output = await self.submit(
+                pod_id, pack_batch(batch.items), mode, job_timeout(batch.deadlines)
+            )
+            batch.result.set_result(unpack_batch(output, len(batch.items)))
+        except Exception as e:
+            batch.result.set_exception(e)
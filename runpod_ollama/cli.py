@@ -1,45 +1,120 @@
-from typing import Optional
+"""The `runpod-ollama` command line.
+
+Commands import what they need (the RunPod SDK, Flask, aiohttp, ...) when
+they run, so `--help` and the quick commands do not pay for the others'
+dependencies; `benchmarks/cli_startup.py` keeps an eye on it.
+"""
+
+from enum import Enum
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+import json
+import os
 from runpod_ollama import ENVIRONMENT
-from runpod_ollama.local_proxy import run_local_proxy
 from runpod_ollama.utils import is_port_free
 import typer
-from rich import print
-from rich.console import Console
-import runpod  # type: ignore
-import inquirer  # type: ignore
 
-err_console = Console(stderr=True, style="bold red")
-app = typer.Typer()
+# Plain click help: rich's help formatter alone costs more than the rest.
+app = typer.Typer(rich_markup_mode=None)
+batch_app = typer.Typer(
+    help="Runs JSONL files of requests as RunPod jobs.", rich_markup_mode=None
+)
+app.add_typer(batch_app, name="batch")
+
+
+def print(*objects: Any):
+    """rich's print, imported on first use."""
+    from rich import print as rich_print
+
+    rich_print(*objects)
+
+
+@lru_cache(maxsize=None)
+def _err_console() -> Any:
+    from rich.console import Console
 
+    return Console(stderr=True, style="bold red")
+
+
+def _runpod() -> Any:
+    """The RunPod SDK, which takes seconds to import, with the API key set."""
+    import runpod  # type: ignore
 
-try:
     runpod.api_key = ENVIRONMENT.RUNPOD_API_TOKEN
-except Exception:
-    err_console.print(
-        "Runpod API key not found. Please set the RUNPOD_API_KEY environment variable.",
-    )
-    exit(1)
+    return runpod
+
+
+def _metadata(refresh: bool = False) -> Any:
+    """The account's templates and endpoints, from the local cache while it is fresh."""
+    from runpod_ollama.metadata import create_metadata_cache
+
+    try:
+        return create_metadata_cache().get(refresh=refresh)
+    except Exception as e:
+        _err_console().print("Failed to list the templates and endpoints.")
+        _err_console().print(e)
+        raise typer.Exit(1)
+
+
+def _find(kind: str, name: str, refresh: bool = False) -> Optional[Dict[str, Any]]:
+    """The `kind` ("template" or "endpoint") named `name`, or with that id.
+
+    A name the cache does not know is looked up again on RunPod, it may
+    have been created since.
+    """
+    item = getattr(_metadata(refresh), kind)(name)
+    if item is None and not refresh:
+        item = getattr(_metadata(refresh=True), kind)(name)
+    return item
+
+
+def _existing(kind: str, name: str, refresh: bool = False) -> Optional[Dict[str, Any]]:
+    """`_find` for the create commands, None when RunPod cannot list what exists.
+
+    Creating then may make a duplicate, but a listing failing for a moment
+    must not stop creating things the way it did before names were looked up.
+    """
+    try:
+        return _find(kind, name, refresh)
+    except typer.Exit:
+        _err_console().print(f"Could not check for an existing {kind}, creating {name} anyway.")
+        return None
+
+
+def _forget_metadata():
+    from runpod_ollama.metadata import create_metadata_cache
+
+    create_metadata_cache().invalidate()
+
+
+REFRESH_HELP = "List the templates and endpoints on RunPod instead of using the local cache."
 
 
 @app.command()
-def create_template(model: str, disk_size: int):
-    """Creates a new template for the given model."""
+def create_template(model: str, disk_size: int, refresh: bool = False):
+    """Creates a new template for the given model, unless one already exists."""
 
+    existing = _existing("template", model, refresh)
+    if existing is not None:
+        print(f"Template {model} already exists:")
+        print(existing)
+        return existing
     try:
-        response = runpod.create_template(
+        response = _runpod().create_template(
             name=model,
             image_name="pooyaharatian/runpod-ollama:0.0.9",
             docker_start_cmd=model,
             is_serverless=True,
             container_disk_in_gb=disk_size,
         )
+        _forget_metadata()
         print("Created template:")
         print(response)
         return response
     except Exception as e:
-        err_console.print("Failed to create template.")
-        err_console.print(e)
-        err_console.print("Make sure the template does not already exist.")
+        _err_console().print("Failed to create template.")
+        _err_console().print(e)
+        _err_console().print("Make sure the template does not already exist.")
 
 
 def _get_pod_url(
@@ -54,30 +129,33 @@ def create_endpoint(
     template_id: str,
     workers_max: int = 1,
     idle_timeout: int = 60,
+    gpu_ids: str = "AMPERE_16",
+    workers_min: int = 0,
+    flashboot: bool = True,
 ):
-    """Creates a new endpoint for the given template."""
-    # TODO: investigate a way to find the available GPU ids
+    """Creates a new endpoint for the given template.
 
+    `gpu_ids` are RunPod's GPU pools, e.g. "AMPERE_16,ADA_24"; `plan` picks one.
+    """
     try:
-        response = runpod.create_endpoint(
+        response = _runpod().create_endpoint(
             template_id=template_id,
-            gpu_ids="NVIDIA RTX A4000",
+            gpu_ids=gpu_ids,
             name=name,
+            workers_min=workers_min,
             workers_max=workers_max,
             idle_timeout=idle_timeout,
-            flashboot=True,
+            flashboot=flashboot,
         )
+        _forget_metadata()
         pod_url = _get_pod_url(response["id"])
         print("Created endpoint:")
         print(response)
-        print(
-            "[bold red]You must manually update the gpu type from 'Edit Endpoint'.[/bold red]"
-        )
         print(f"URL: {pod_url}")
         return response
     except Exception as e:
-        err_console.print("Failed to create endpoint.")
-        err_console.print(e)
+        _err_console().print("Failed to create endpoint.")
+        _err_console().print(e)
 
 
 @app.command()
@@ -86,15 +164,27 @@ def create_model(
     disk_size: int,
     workers_max: int = 1,
     idle_timeout: int = 60,
+    gpu_ids: str = "AMPERE_16",
+    workers_min: int = 0,
+    flashboot: bool = True,
+    refresh: bool = False,
 ):
-    """Creates a template and endpoint for the given model."""
-    template = create_template(model=model, disk_size=disk_size)
+    """Creates a template and endpoint for the given model, reusing existing ones."""
+    template = create_template(model=model, disk_size=disk_size, refresh=refresh)
     assert template is not None
+    existing = _existing("endpoint", model)
+    if existing is not None and existing.get("templateId") == template["id"]:
+        print(f"Endpoint {model} already exists:")
+        print(existing)
+        return existing
     endpoint = create_endpoint(
         name=model,
         template_id=template["id"],
         workers_max=workers_max,
         idle_timeout=idle_timeout,
+        gpu_ids=gpu_ids,
+        workers_min=workers_min,
+        flashboot=flashboot,
     )
     return endpoint
 
@@ -122,35 +212,283 @@ print(response.choices[0].message["content"])
 
 
 @app.command()
-def example():
+def example(
+    endpoint: Optional[str] = typer.Argument(
+        None, help="Name or id of the endpoint, asked for when missing."
+    ),
+    refresh: bool = typer.Option(False, help=REFRESH_HELP),
+):
     """Prints an example of how to use the local proxy."""
-    endpoints = runpod.get_endpoints()
-    endpoint_prompt = inquirer.prompt(
-        [
-            inquirer.List(
-                "endpoint",
-                message="Select an endpoint:",
-                choices=[e["name"] for e in endpoints],
-            )
-        ]
-    )
-    assert endpoint_prompt is not None
-    endpoint_name: str = endpoint_prompt["endpoint"]
-    endpoint_id = endpoints[
-        [endpoint["name"] for endpoint in endpoints].index(endpoint_name)
-    ]["id"]
+    from runpod_ollama.metadata import display_name
+
+    if endpoint is None:
+        import inquirer  # type: ignore
+
+        endpoint_prompt = inquirer.prompt(
+            [
+                inquirer.List(
+                    "endpoint",
+                    message="Select an endpoint:",
+                    choices=[display_name(e) for e in _metadata(refresh).endpoints],
+                )
+            ]
+        )
+        assert endpoint_prompt is not None
+        endpoint = endpoint_prompt["endpoint"]
+    found = _find("endpoint", endpoint, refresh)
+    if found is None:
+        _err_console().print(f"No endpoint named {endpoint}.")
+        raise typer.Exit(1)
 
-    print(_get_pod_url(endpoint_id))
+    print(_get_pod_url(found["id"]))
     print(
         _code_example(
-            pod_id=endpoint_id,
-            model=endpoint_name,
+            pod_id=found["id"],
+            model=display_name(found),
         )
     )
 
 
 @app.command()
-def start_proxy(debug: Optional[bool] = None):
+def endpoints(
+    refresh: bool = typer.Option(False, help=REFRESH_HELP),
+    json_output: bool = typer.Option(False, "--json", help="Print them as JSON."),
+):
+    """Lists the endpoints of the account."""
+    metadata = _metadata(refresh)
+    if json_output:
+        typer.echo(json.dumps(metadata.endpoints, indent=2))
+        return
+    for endpoint in metadata.endpoints:
+        print(
+            f"[bold]{endpoint['name']}[/bold] {endpoint['id']}: template "
+            f"{endpoint.get('templateId')}, {endpoint.get('workersMin', 0)}-"
+            f"{endpoint.get('workersMax')} worker(s) of {endpoint.get('gpuIds')}"
+        )
+
+
+@app.command()
+def templates(
+    refresh: bool = typer.Option(False, help=REFRESH_HELP),
+    json_output: bool = typer.Option(False, "--json", help="Print them as JSON."),
+):
+    """Lists the templates of the account."""
+    metadata = _metadata(refresh)
+    if json_output:
+        typer.echo(json.dumps(metadata.templates, indent=2))
+        return
+    for template in metadata.templates:
+        print(
+            f"[bold]{template['name']}[/bold] {template['id']}: {template.get('imageName')}, "
+            f"{template.get('containerDiskInGb')} GB disk"
+        )
+
+
+@app.command()
+def resolve(
+    name: str = typer.Argument(..., help="Name of the endpoint or of its model."),
+    refresh: bool = typer.Option(False, help=REFRESH_HELP),
+    json_output: bool = typer.Option(False, "--json", help="Print the whole endpoint as JSON."),
+):
+    """Prints the id of the endpoint serving a model.
+
+    For scripts: `POD_ID=$(runpod-ollama resolve llama3)`.
+    """
+    endpoint = _find("endpoint", name, refresh)
+    if endpoint is None:
+        _err_console().print(f"No endpoint named {name}.")
+        raise typer.Exit(1)
+    typer.echo(json.dumps(endpoint, indent=2) if json_output else endpoint["id"])
+
+
+def _plan_traffic(
+    trace: Optional[str],
+    metrics: Optional[str],
+    rate: Optional[float],
+    window: float,
+    endpoint: Optional[str],
+    tokens: int,
+    prompt_tokens: int,
+    duration: float,
+    seed: int,
+) -> Any:
+    """The requests `plan` simulates and the cold start its metrics measured."""
+    from runpod_ollama.planner import ColdStart, MetricsProfile, load_trace, poisson_traffic
+
+    if sum(source is not None for source in (trace, metrics, rate)) != 1:
+        raise ValueError("Pass one of --trace, --metrics and --rate.")
+    if trace is not None:
+        with open(trace) as f:
+            return load_trace(f, output_tokens=tokens), None
+    if metrics is not None:
+        if metrics.startswith(("http://", "https://")):
+            import requests
+
+            response = requests.get(metrics, timeout=float(ENVIRONMENT.RUNPOD_HTTP_TIMEOUT))
+            response.raise_for_status()
+            text = response.text
+        else:
+            with open(metrics) as f:
+                text = f.read()
+        profile = MetricsProfile.from_metrics(text, window, pod_id=endpoint)
+        return profile.traffic(duration, seed=seed), ColdStart(
+            measured_seconds=profile.cold_start_seconds
+        )
+    assert rate is not None
+    return poisson_traffic(rate, duration, tokens, prompt_tokens, seed=seed), None
+
+
+def _plan_row(result: Any) -> str:
+    plan = result.plan
+    return (
+        f"{plan.gpu_id:<11} {plan.workers_min:>3} {plan.workers_max:>3} {plan.idle_timeout:>5}"
+        f" {result.cost_per_hour:>7.3f} {result.cost_per_million_tokens:>7.2f}"
+        f" {result.wait_p50:>7.1f}s {result.wait_p95:>7.1f}s {result.tokens_per_second:>6.0f}"
+        f" {result.cold_starts:>6} {'yes' if result.meets_target else 'no':>4}"
+    )
+
+
+@app.command()
+def plan(
+    model_size: float = typer.Option(..., help="Size of the model in GB, as `ollama list` shows."),
+    target_tps: float = typer.Option(20, help="Tokens/s every request is generated at, at least."),
+    max_wait: float = typer.Option(5, help="Seconds 95% of the requests wait at most."),
+    trace: Optional[str] = typer.Option(
+        None, help="JSONL file of past requests, with a `timestamp` and Ollama's token counts."
+    ),
+    metrics: Optional[str] = typer.Option(None, help="File or URL of a proxy's /metrics."),
+    window: float = typer.Option(3600, help="Seconds of traffic the --metrics counters cover."),
+    endpoint: Optional[str] = typer.Option(None, help="Only count this endpoint's --metrics."),
+    rate: Optional[float] = typer.Option(None, help="Requests per second, instead of a trace."),
+    tokens: int = typer.Option(256, help="Tokens generated per request, when not traced."),
+    prompt_tokens: int = typer.Option(0, help="Prompt tokens of a --rate request."),
+    duration: float = typer.Option(3600, help="Seconds of --rate or --metrics traffic."),
+    max_workers: int = typer.Option(8, help="Largest workersMax to consider."),
+    top: int = typer.Option(5, help="Plans to show."),
+    seed: int = typer.Option(0, help="Seed of the simulated arrivals."),
+    json_output: bool = typer.Option(False, "--json", help="Print the plans as JSON."),
+    apply: Optional[str] = typer.Option(
+        None, help="Create or update the endpoint with this name with the best plan."
+    ),
+    template_id: Optional[str] = typer.Option(
+        None, help="Template of an endpoint --apply creates, the one named like it by default."
+    ),
+):
+    """Picks the GPU pool and scaling settings of an endpoint for a traffic profile.
+
+    Every plan is simulated offline, the costs and waits are estimates.
+    """
+    from runpod_ollama.planner import plan_endpoint, requests_per_second, without_flashboot
+
+    try:
+        traffic, cold_start = _plan_traffic(
+            trace, metrics, rate, window, endpoint, tokens, prompt_tokens, duration, seed
+        )
+    except Exception as e:
+        _err_console().print("Failed to read the traffic.")
+        _err_console().print(e)
+        raise typer.Exit(1)
+    results = plan_endpoint(
+        traffic, model_size, target_tps, max_wait, max_workers=max_workers, cold_start=cold_start
+    )
+    if not results:
+        _err_console().print(
+            f"No GPU pool holds a {model_size} GB model and generates {target_tps} tokens/s."
+        )
+        raise typer.Exit(1)
+    best = results[0]
+    baseline = without_flashboot(best, traffic, model_size, cold_start)
+
+    if json_output:
+        typer.echo(
+            json.dumps(
+                {
+                    "requests": len(traffic),
+                    "requests_per_second": requests_per_second(traffic),
+                    "plans": [r.to_dict() for r in results[:top]],
+                    "without_flashboot": baseline.to_dict(),
+                },
+                indent=2,
+            )
+        )
+    else:
+        print(
+            f"{len(traffic)} requests, {requests_per_second(traffic):.3f}/s, "
+            f"{len(results)} plans simulated"
+        )
+        typer.echo(
+            f"{'gpu':<11} {'min':>3} {'max':>3} {'idle':>5} {'$/hour':>7} {'$/Mtok':>7}"
+            f" {'wait p50':>8} {'wait p95':>8} {'tok/s':>6} {'colds':>6} {'ok':>4}"
+        )
+        for result in results[:top]:
+            typer.echo(_plan_row(result))
+        print(
+            f"Without FlashBoot the best plan costs ${baseline.cost_per_hour:.3f}/hour "
+            f"with a p95 wait of {baseline.wait_p95:.1f}s."
+        )
+    if apply is None:
+        return
+    if not best.meets_target:
+        _err_console().print("No plan meets --max-wait, raise it or --max-workers.")
+        raise typer.Exit(1)
+    _apply_plan(apply, template_id, best.plan)
+
+
+def _apply_plan(name: str, template_id: Optional[str], plan: Any):
+    """Creates the endpoint `name` set up like `plan`, or updates it."""
+    from runpod_ollama.metadata import update_endpoint
+
+    existing = _find("endpoint", name)
+    if existing is None:
+        template = _find("template", template_id or name)
+        if template is None:
+            _err_console().print(f"No template named {template_id or name}.")
+            raise typer.Exit(1)
+        created = create_endpoint(
+            name=name,
+            template_id=template["id"],
+            workers_max=plan.workers_max,
+            idle_timeout=plan.idle_timeout,
+            gpu_ids=plan.gpu_id,
+            workers_min=plan.workers_min,
+            flashboot=plan.flashboot,
+        )
+        if created is None:
+            # create_endpoint printed why.
+            raise typer.Exit(1)
+        return
+    try:
+        response = update_endpoint(
+            ENVIRONMENT.RUNPOD_API_TOKEN,
+            existing,
+            flashboot=plan.flashboot,
+            gpuIds=plan.gpu_id,
+            workersMin=plan.workers_min,
+            workersMax=plan.workers_max,
+            idleTimeout=plan.idle_timeout,
+        )
+    except Exception as e:
+        _err_console().print("Failed to update endpoint.")
+        _err_console().print(e)
+        raise typer.Exit(1)
+    _forget_metadata()
+    print("Updated endpoint:")
+    print(response)
+
+
+class ProxyEngine(str, Enum):
+    flask = "flask"
+    async_ = "async"
+
+
+@app.command()
+def start_proxy(
+    debug: Optional[bool] = None,
+    engine: ProxyEngine = typer.Option(
+        ProxyEngine.flask,
+        help="'flask' blocks a thread per request, 'async' serves all requests on one event loop.",
+    ),
+):
     """Starts a local proxy to forward requests to the Runpod Ollama service."""
     print(
         "[bold green]Run `runpod-ollama example` to see how to use the proxy.[/bold green]"
@@ -159,7 +497,124 @@ def start_proxy(debug: Optional[bool] = None):
     while not is_port_free(local_proxy_port):
         local_proxy_port += 1
     print(f"Starting local proxy on port {local_proxy_port}")
-    run_local_proxy(port=local_proxy_port, debug=debug)
+    if engine == ProxyEngine.async_:
+        from runpod_ollama.async_proxy import run_async_proxy
+
+        run_async_proxy(port=local_proxy_port, debug=debug)
+    else:
+        from runpod_ollama.local_proxy import run_local_proxy
+
+        run_local_proxy(port=local_proxy_port, debug=debug)
+
+
+@app.command()
+def keep_warm(
+    endpoint_ids: List[str] = typer.Argument(..., help="Endpoints to keep warm."),
+    workers: int = typer.Option(1, help="Workers to keep up at all times."),
+    schedule: str = typer.Option(
+        "", help="Windows raising the minimum, e.g. '08:00-18:00=3,18:00-22:00=1'."
+    ),
+    interval: float = typer.Option(30, help="Seconds between two checks."),
+    once: bool = typer.Option(False, help="Check once and exit."),
+):
+    """Keeps workers of serverless endpoints warm with cheap warm-up jobs."""
+    import asyncio
+    import aiohttp
+    from runpod_ollama.warm_pool import (
+        WarmPoolKeeper,
+        keep_warm as run_keepers,
+        parse_schedule,
+    )
+
+    try:
+        windows = parse_schedule(schedule)
+    except ValueError as e:
+        _err_console().print(str(e))
+        raise typer.Exit(1)
+    keepers = [
+        WarmPoolKeeper(
+            api_key=ENVIRONMENT.RUNPOD_API_TOKEN,
+            endpoint_id=endpoint_id,
+            min_workers=workers,
+            schedule=windows,
+            interval=interval,
+        )
+        for endpoint_id in endpoint_ids
+    ]
+
+    async def check_once():
+        async with aiohttp.ClientSession() as session:
+            for report in await asyncio.gather(*(k.check(session) for k in keepers)):
+                print(str(report))
+
+    try:
+        if once:
+            asyncio.run(check_once())
+        else:
+            asyncio.run(run_keepers(keepers, on_report=lambda report: print(str(report))))
+    except KeyboardInterrupt:
+        pass
+    for keeper in keepers:
+        stats = keeper.stats
+        waits = stats.cold_start_seconds
+        line = (
+            f"[bold]{keeper.endpoint_id}[/bold]: {stats.warm_jobs} warm-up job(s), "
+            f"{stats.cold_starts} cold start(s)"
+        )
+        if waits:
+            line += f", {sum(waits) / len(waits):.1f}s mean / {max(waits):.1f}s max wait"
+        print(line)
+
+
+@batch_app.command("run")
+def batch_run(
+    input_path: str = typer.Argument(..., help="JSONL file, one request body per line."),
+    endpoint: str = typer.Option(..., help="The endpoint id to run the requests on."),
+    concurrency: int = typer.Option(32, help="Jobs in flight at most."),
+    output: Optional[str] = typer.Option(
+        None, help="Where to write the results, <input>.results.jsonl by default."
+    ),
+    method: str = typer.Option("generate", help="Ollama API method of lines without one."),
+    timeout: float = typer.Option(3600, help="Seconds after which a job is cancelled."),
+    overwrite: bool = typer.Option(False, help="Start over instead of resuming."),
+):
+    """Runs every line of a JSONL file and resumes where a previous run stopped."""
+    import asyncio
+    import aiohttp
+    from runpod_ollama.async_runpod_repository import AsyncRunpodRepository
+    from runpod_ollama.batch_runner import BatchRunner
+
+    output_path = output or f"{os.path.splitext(input_path)[0]}.results.jsonl"
+    checkpoint_path = f"{output_path}.checkpoint"
+    if overwrite and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    if os.path.exists(checkpoint_path):
+        print(f"Resuming from {checkpoint_path}")
+    elif os.path.exists(output_path) and not overwrite:
+        _err_console().print(f"{output_path} already exists, pass --overwrite to start over.")
+        raise typer.Exit(1)
+
+    async def run():
+        connector = aiohttp.TCPConnector(limit=max(concurrency, 1))
+        async with aiohttp.ClientSession(connector=connector) as session:
+            runner = BatchRunner(
+                AsyncRunpodRepository(
+                    api_key=ENVIRONMENT.RUNPOD_API_TOKEN, pod_id=endpoint, session=session
+                ),
+                input_path,
+                output_path,
+                concurrency=concurrency,
+                method=method,
+                timeout=timeout,
+            )
+            return await runner.run(on_progress=lambda progress: print(str(progress)))
+
+    try:
+        progress = asyncio.run(run())
+    except KeyboardInterrupt:
+        _err_console().print("Interrupted, run the same command again to resume.")
+        raise typer.Exit(130)
+    print(f"[bold green]Done:[/bold green] {progress}, results in {output_path}")
 
 
 def run_cli():
@@ -0,0 +1,14 @@
+"""Python clients for RunPod endpoints that run the Ollama worker.
+
+`AsyncRunpodClient` is for asyncio code and `RunpodClient` for everything
+else; the blocking client drives an asyncio one, so both share the pooled
+connections, the polling strategies and the metrics of the proxy.
+"""
+
+from runpod_ollama.client.async_client import AsyncRunpodClient as AsyncRunpodClient
+from runpod_ollama.client.jobs import Job as Job
+from runpod_ollama.client.jobs import JobResult as JobResult
+from runpod_ollama.client.jobs import JobStatus as JobStatus
+from runpod_ollama.client.sync_client import RunpodClient as RunpodClient
+from runpod_ollama.exceptions import JobFailed as JobFailed
+from runpod_ollama.exceptions import PollingTimeout as PollingTimeout
@@ -0,0 +1,255 @@
+import asyncio
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+import aiohttp
+from runpod_ollama.async_runpod_repository import AsyncRunpodRepository
+from runpod_ollama.client.jobs import Job, JobResult, JobStatus
+from runpod_ollama.config import ENVIRONMENT
+from runpod_ollama.exceptions import JobFailed, PollingTimeout
+from runpod_ollama.http_pool import AsyncSessionPool
+from runpod_ollama.metrics import CallMetrics
+from runpod_ollama.polling import PollingStrategy
+from runpod_ollama.runpod_repository import FAILED_STATUSES, STREAM_POLLING
+
+JobRequest = Union[Job, Tuple[str, str, Any]]
+"""A job to `gather`: a submitted `Job` or `(endpoint_id, method, input)`."""
+
+
+class AsyncRunpodClient:
+    """Runs jobs on RunPod endpoints from an asyncio event loop.
+
+    Every endpoint is reached through one pooled keep-alive session, and
+    waiting for a job only suspends the calling coroutine, so one loop can
+    keep thousands of jobs in flight across many endpoints:
+
+        async with AsyncRunpodClient() as client:
+            results = await client.gather(
+                ("abc123", "generate", {"model": "llama3", "prompt": p}) for p in prompts
+            )
+
+    A job whose `wait` or `stream` is cancelled or times out is cancelled on
+    RunPod as well, since nobody is left to read its output.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        polling: Optional[PollingStrategy] = None,
+        mode: Optional[str] = None,
+        pool: Optional[AsyncSessionPool] = None,
+    ):
+        self.api_key = api_key or ENVIRONMENT.RUNPOD_API_TOKEN
+        self.base_url = base_url
+        self.polling = polling
+        self.mode = mode
+        self.pool = pool or AsyncSessionPool()
+        self._owns_pool = pool is None
+        self._repositories: Dict[str, AsyncRunpodRepository] = {}
+
+    async def __aenter__(self) -> "AsyncRunpodClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any):
+        await self.close()
+
+    async def close(self):
+        if self._owns_pool:
+            await self.pool.close()
+        self._repositories.clear()
+
+    def repository(self, endpoint_id: str) -> AsyncRunpodRepository:
+        repository = self._repositories.get(endpoint_id)
+        if repository is None:
+            repository = self._repositories[endpoint_id] = AsyncRunpodRepository(
+                api_key=self.api_key,
+                pod_id=endpoint_id,
+                session=self.pool.session(endpoint_id),
+                base_url=self.base_url,
+                polling=self.polling,
+            )
+        return repository
+
+    async def submit(
+        self, endpoint_id: str, method: str, input: Any, mode: Optional[str] = None
+    ) -> Job:
+        """Creates a job without waiting for it.
+
+        With `mode="runsync"` the job may already be finished, in which case
+        `wait` returns its result without another request.
+        """
+        metrics = CallMetrics(endpoint_id, method, input)
+        try:
+            out = await self.repository(endpoint_id).submit(
+                method, input, mode=mode or self.mode
+            )
+        except aiohttp.ClientError:
+            metrics.failed("http")
+            raise
+        metrics.submitted()
+        return Job(endpoint_id=endpoint_id, id=out["id"], method=method, last_status=out, metrics=metrics)
+
+    async def status(self, job: Job) -> JobStatus:
+        """Fetches the job's status once and remembers it on `job`."""
+        job.last_status = await self.repository(job.endpoint_id).status(job.id)
+        if job.metrics is not None:
+            job.metrics.polled()
+        return job.status
+
+    async def wait(
+        self,
+        job: Job,
+        timeout: Optional[float] = None,
+        polling: Optional[PollingStrategy] = None,
+    ) -> JobResult:
+        """Polls the job until it finishes and returns its result.
+
+        The output is read from the final `/status` response. `polling`
+        overrides the client's strategy for this job. Raises `PollingTimeout`
+        after `timeout` seconds or when the polling strategy gives up, after
+        cancelling the job.
+        """
+        try:
+            return await asyncio.wait_for(self._poll(job, polling), timeout)
+        except asyncio.TimeoutError:
+            if job.metrics is not None:
+                job.metrics.failed("timeout")
+            await self.cancel(job)
+            raise PollingTimeout(f"Job {job.id} not finished within {timeout}s", job.id)
+        except PollingTimeout:
+            if job.metrics is not None:
+                job.metrics.failed("timeout")
+            await self.cancel(job)
+            raise
+        except asyncio.CancelledError:
+            await self.cancel(job)
+            raise
+
+    async def _poll(self, job: Job, polling: Optional[PollingStrategy]) -> JobResult:
+        repository = self.repository(job.endpoint_id)
+        poller = (polling or repository.polling).start(job.method)
+        while not job.status.done:
+            await asyncio.sleep(poller.next_delay(job.last_status))
+            try:
+                await self.status(job)
+            except aiohttp.ClientError:
+                if job.metrics is not None:
+                    job.metrics.failed("http")
+                raise
+        out = job.last_status
+        if job.status != JobStatus.COMPLETED:
+            if job.metrics is not None:
+                job.metrics.failed("worker")
+            return JobResult.from_status(job, out)
+        poller.finish(out)
+        output = repository._job_output(out)
+        if job.metrics is not None:
+            job.metrics.completed(out)
+            output = job.metrics.worker_output(output)
+        return JobResult.from_status(job, out, output)
+
+    async def run(
+        self,
+        endpoint_id: str,
+        method: str,
+        input: Any,
+        timeout: Optional[float] = None,
+        mode: Optional[str] = None,
+    ) -> JobResult:
+        """Submits a job and waits for its result."""
+        job = await self.submit(endpoint_id, method, input, mode=mode)
+        return await self.wait(job, timeout=timeout)
+
+    async def stream(
+        self, endpoint_id: str, method: str, input: Any
+    ) -> AsyncIterator[Any]:
+        """Submits a job and yields its chunks as the worker produces them.
+
+        `input` should ask Ollama to stream. Raises `JobFailed` if the job
+        ends without completing; closing the iterator early cancels the job.
+        """
+        job = await self.submit(endpoint_id, method, input, mode="run")
+        repository = self.repository(job.endpoint_id)
+        metrics = job.metrics
+        assert metrics is not None
+        poller = STREAM_POLLING.start(method)
+        try:
+            while not job.status.done:
+                await asyncio.sleep(poller.next_delay(job.last_status))
+                metrics.polled()
+                job.last_status = await repository.stream(job.id)
+                chunks = job.last_status.get("stream") or []
+                for chunk in chunks:
+                    yield metrics.worker_output(chunk["output"])
+                if chunks:
+                    poller = STREAM_POLLING.start(method)
+        except aiohttp.ClientError:
+            metrics.failed("http")
+            raise
+        finally:
+            if not job.status.done:
+                await self.cancel(job)
+        if job.status.value in FAILED_STATUSES:
+            metrics.failed("worker")
+            raise JobFailed(
+                f"Job {job.id} on {endpoint_id} ended {job.status.value}: "
+                f"{job.last_status.get('error')}",
+                result=JobResult.from_status(job, job.last_status),
+            )
+        metrics.completed()
+
+    async def cancel(self, job: Job) -> bool:
+        """Asks RunPod to cancel the job, returns whether the request went through."""
+        try:
+            job.last_status = await self.repository(job.endpoint_id).cancel(job.id)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+        return True
+
+    async def gather(
+        self,
+        requests: Iterable[JobRequest],
+        timeout: Optional[float] = None,
+        concurrency: Optional[int] = None,
+        return_exceptions: bool = False,
+    ) -> List[JobResult]:
+        """Runs many jobs concurrently and returns their results in order.
+
+        At most `concurrency` jobs are in flight at once when it is given.
+        A failed job is a result that is not `ok`; an exception (HTTP error,
+        timeout) cancels the other jobs and is raised, unless
+        `return_exceptions` puts it in the list instead.
+        """
+        slots = asyncio.Semaphore(concurrency) if concurrency else None
+
+        async def one(request: JobRequest) -> JobResult:
+            if slots is None:
+                return await self._gathered(request, timeout)
+            async with slots:
+                return await self._gathered(request, timeout)
+
+        tasks: Sequence["asyncio.Future[JobResult]"] = [
+            asyncio.ensure_future(one(request)) for request in requests
+        ]
+        try:
+            return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def _gathered(self, request: JobRequest, timeout: Optional[float]) -> JobResult:
+        if isinstance(request, Job):
+            return await self.wait(request, timeout=timeout)
+        endpoint_id, method, input = request
+        return await self.run(endpoint_id, method, input, timeout=timeout)
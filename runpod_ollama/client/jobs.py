@@ -0,0 +1,85 @@
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Mapping, Optional
+from runpod_ollama.exceptions import JobFailed
+from runpod_ollama.metrics import CallMetrics
+from runpod_ollama.runpod_repository import PENDING_STATUSES
+
+
+class JobStatus(str, Enum):
+    IN_QUEUE = "IN_QUEUE"
+    IN_PROGRESS = "IN_PROGRESS"
+    COMPLETED = "COMPLETED"
+    FAILED = "FAILED"
+    CANCELLED = "CANCELLED"
+    TIMED_OUT = "TIMED_OUT"
+
+    @property
+    def done(self) -> bool:
+        return self.value not in PENDING_STATUSES
+
+
+@dataclass
+class Job:
+    """A job submitted to an endpoint, as returned by `submit`."""
+
+    endpoint_id: str
+    id: str
+    method: str
+    last_status: Mapping[str, Any] = field(default_factory=dict, repr=False)
+    """The last status RunPod returned, so `wait` never fetches it twice."""
+    metrics: Optional[CallMetrics] = field(default=None, repr=False, compare=False)
+
+    @property
+    def status(self) -> JobStatus:
+        return JobStatus(self.last_status.get("status", JobStatus.IN_QUEUE))
+
+
+@dataclass(frozen=True)
+class JobResult:
+    """The outcome of a finished job.
+
+    `output` has the worker's metadata stripped; `response` is the final
+    status exactly as RunPod returned it.
+    """
+
+    job: Job
+    status: JobStatus
+    output: Any = None
+    error: Optional[str] = None
+    delay_ms: Optional[int] = None
+    execution_ms: Optional[int] = None
+    cold_start: bool = False
+    response: Mapping[str, Any] = field(default_factory=dict, repr=False)
+
+    @property
+    def ok(self) -> bool:
+        return self.status == JobStatus.COMPLETED and self.error is None
+
+    def raise_for_status(self) -> "JobResult":
+        if not self.ok:
+            raise JobFailed(
+                f"Job {self.job.id} on {self.job.endpoint_id} ended {self.status.value}: "
+                f"{self.error}",
+                result=self,
+            )
+        return self
+
+    @classmethod
+    def from_status(cls, job: Job, out: Mapping[str, Any], output: Any = None) -> "JobResult":
+        """Builds the result from the final status and the job's stripped output."""
+        status = JobStatus(out["status"])
+        error = out.get("error")
+        # The worker answers an Ollama error as a completed job.
+        if isinstance(output, dict) and output.get("status") == "failed":
+            status, error, output = JobStatus.FAILED, output.get("error"), None
+        return cls(
+            job=job,
+            status=status,
+            output=output,
+            error=None if error is None else str(error),
+            delay_ms=out.get("delayTime"),
+            execution_ms=out.get("executionTime"),
+            cold_start=bool(job.metrics and job.metrics.cold_start),
+            response=out,
+        )
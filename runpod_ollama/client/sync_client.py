@@ -0,0 +1,116 @@
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Awaitable, Iterable, Iterator, List, Optional, TypeVar
+from runpod_ollama.client.async_client import AsyncRunpodClient, JobRequest
+from runpod_ollama.client.jobs import Job, JobResult, JobStatus
+from runpod_ollama.polling import PollingStrategy
+
+T = TypeVar("T")
+
+
+async def _next(iterator: AsyncIterator[T]) -> T:
+    return await iterator.__anext__()
+
+
+class RunpodClient:
+    """The blocking counterpart of `AsyncRunpodClient`.
+
+    Calls are run by an `AsyncRunpodClient` on a private event loop thread,
+    so both clients share the same transport and a blocking caller can still
+    wait for many jobs at once with `gather`, without a thread per job.
+    Interrupting a blocking call (e.g. with Ctrl-C) cancels its job.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        polling: Optional[PollingStrategy] = None,
+        mode: Optional[str] = None,
+    ):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="runpod-client", daemon=True
+        )
+        self._thread.start()
+        self._client = AsyncRunpodClient(
+            api_key=api_key, base_url=base_url, polling=polling, mode=mode
+        )
+
+    def __enter__(self) -> "RunpodClient":
+        return self
+
+    def __exit__(self, *exc_info: Any):
+        self.close()
+
+    def close(self):
+        if not self._loop.is_running():
+            return
+        self._call(self._client.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def _call(self, coroutine: Awaitable[T]) -> T:
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._loop)  # type: ignore[arg-type]
+        try:
+            return future.result()
+        except BaseException:
+            # Cancels the coroutine, which cancels its job on RunPod.
+            future.cancel()
+            raise
+
+    def submit(self, endpoint_id: str, method: str, input: Any, mode: Optional[str] = None) -> Job:
+        return self._call(self._client.submit(endpoint_id, method, input, mode=mode))
+
+    def status(self, job: Job) -> JobStatus:
+        return self._call(self._client.status(job))
+
+    def wait(
+        self,
+        job: Job,
+        timeout: Optional[float] = None,
+        polling: Optional[PollingStrategy] = None,
+    ) -> JobResult:
+        return self._call(self._client.wait(job, timeout=timeout, polling=polling))
+
+    def run(
+        self,
+        endpoint_id: str,
+        method: str,
+        input: Any,
+        timeout: Optional[float] = None,
+        mode: Optional[str] = None,
+    ) -> JobResult:
+        return self._call(self._client.run(endpoint_id, method, input, timeout=timeout, mode=mode))
+
+    def stream(self, endpoint_id: str, method: str, input: Any) -> Iterator[Any]:
+        chunks = self._client.stream(endpoint_id, method, input)
+        try:
+            while True:
+                try:
+                    yield self._call(_next(chunks))
+                except StopAsyncIteration:
+                    return
+        finally:
+            self._call(chunks.aclose())
+
+    def cancel(self, job: Job) -> bool:
+        return self._call(self._client.cancel(job))
+
+    def gather(
+        self,
+        requests: Iterable[JobRequest],
+        timeout: Optional[float] = None,
+        concurrency: Optional[int] = None,
+        return_exceptions: bool = False,
+    ) -> List[JobResult]:
+        """Runs many jobs concurrently on the client's loop, see `AsyncRunpodClient.gather`."""
+        return self._call(
+            self._client.gather(
+                list(requests),
+                timeout=timeout,
+                concurrency=concurrency,
+                return_exceptions=return_exceptions,
+            )
+        )
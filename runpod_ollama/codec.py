@@ -0,0 +1,41 @@
+"""JSON encoding of the documents the proxies read from RunPod and send to clients.
+
+Job outputs are parsed once from RunPod's `/status` answer and written once
+more for the client, and long generations or embedding batches make both
+large. orjson does either several times faster than the standard library and
+writes NumPy arrays, the embeddings of `payloads.unpack_embeddings`, straight
+from their buffer. Without orjson the standard library is used, arrays
+through `tolist`.
+"""
+
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    # NumPy arrays and scalars, which orjson only writes when they are C-contiguous.
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def loads(data: Union[bytes, bytearray, str]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(value, default=_default, separators=(",", ":")).encode()
+
+
+def dumps_str(value: Any) -> str:
+    """`dumps` for the APIs that want a str, like aiohttp's `json_response`."""
+    return dumps(value).decode()
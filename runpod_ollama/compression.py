@@ -0,0 +1,91 @@
+"""Compression of the proxies' JSON responses.
+
+Embeddings and long generations make responses of hundreds of kilobytes
+that compress several times over. A response of at least `min_bytes` is sent
+with the best encoding the client's `Accept-Encoding` allows: zstd when the
+`zstandard` package is installed, else gzip. Streamed responses are sent as
+they are, compressing them would hold chunks back.
+"""
+
+import gzip
+import threading
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+from runpod_ollama import ENVIRONMENT
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_LEVEL = 5
+
+ZSTD_LEVEL = 3
+
+
+def supported_encodings() -> List[str]:
+    """The encodings the proxy can send, the preferred one first."""
+    return (["zstd"] if zstandard is not None else []) + ["gzip"]
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """The encoding to answer a request with `accept_encoding` in, None for none."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                continue
+        accepted[name.strip().lower()] = quality
+    for encoding in supported_encodings():
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    # No file name or modification time, the same response compresses the same.
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+@dataclass
+class CompressionStats:
+    responses: int = 0
+    bytes_in: int = 0
+    bytes_out: int = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class Compressor:
+    def __init__(self, min_bytes: int):
+        self.min_bytes = min_bytes
+        self.stats = CompressionStats()
+        self._lock = threading.Lock()
+
+    def encode(self, body: bytes, accept_encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+        """`body` compressed for a client that sent `accept_encoding`, with its encoding."""
+        if len(body) < self.min_bytes:
+            return body, None
+        encoding = negotiate(accept_encoding)
+        if encoding is None:
+            return body, None
+        compressed = compress(body, encoding)
+        with self._lock:
+            self.stats.responses += 1
+            self.stats.bytes_in += len(body)
+            self.stats.bytes_out += len(compressed)
+        return compressed, encoding
+
+
+def create_compressor() -> Optional[Compressor]:
+    """The compressor configured by `PROXY_COMPRESSION`, or None when it is off."""
+    if ENVIRONMENT.PROXY_COMPRESSION != "on":
+        return None
+    return Compressor(min_bytes=int(ENVIRONMENT.PROXY_COMPRESSION_MIN_BYTES))
@@ -17,5 +17,92 @@ def get_env_or_throw(env_name: str, default_value: str = None) -> str:
 @dataclass
 class ENVIRONMENT:
     RUNPOD_API_TOKEN = get_env_or_throw("RUNPOD_API_TOKEN", default_value="test_mode_token")
+    # The serverless API jobs are sent to, under the name the RunPod SDK reads it from;
+    # the SDK's RUNPOD_API_BASE_URL is the control plane.
+    RUNPOD_ENDPOINT_BASE_URL = get_env_or_throw(
+        "RUNPOD_ENDPOINT_BASE_URL", default_value="https://api.runpod.ai/v2"
+    )
+    # The control plane whose `/graphql` lists templates and endpoints, read from the
+    # RunPod SDK's variable so both talk to the same one. Listings are cached for
+    # METADATA_CACHE_TTL seconds; "on" lets the proxies take endpoint or model names,
+    # see metadata.py.
+    RUNPOD_API_BASE_URL = get_env_or_throw(
+        "RUNPOD_API_BASE_URL", default_value="https://api.runpod.io"
+    )
+    METADATA_CACHE_PATH = get_env_or_throw(
+        "METADATA_CACHE_PATH", default_value="~/.cache/runpod_ollama/metadata.json"
+    )
+    METADATA_CACHE_TTL = get_env_or_throw("METADATA_CACHE_TTL", default_value="300")
+    PROXY_RESOLVE_NAMES = get_env_or_throw("PROXY_RESOLVE_NAMES", default_value="on")
+    # Connections kept per pool, 0 per-host limit means only the pool size applies.
+    RUNPOD_HTTP_POOL_SIZE = get_env_or_throw("RUNPOD_HTTP_POOL_SIZE", default_value="100")
+    RUNPOD_HTTP_PER_HOST_LIMIT = get_env_or_throw(
+        "RUNPOD_HTTP_PER_HOST_LIMIT", default_value="0"
+    )
+    RUNPOD_HTTP_KEEPALIVE = get_env_or_throw("RUNPOD_HTTP_KEEPALIVE", default_value="30")
+    # Seconds a single HTTP request to RunPod may take, and how often one that failed
+    # on the way is tried in total, see retries.py.
+    RUNPOD_HTTP_TIMEOUT = get_env_or_throw("RUNPOD_HTTP_TIMEOUT", default_value="30")
+    RUNPOD_RETRY_ATTEMPTS = get_env_or_throw("RUNPOD_RETRY_ATTEMPTS", default_value="3")
+    RUNPOD_RETRY_BACKOFF = get_env_or_throw("RUNPOD_RETRY_BACKOFF", default_value="0.2")
+    # Seconds the proxies give a call before cancelling its job, 0 for no deadline;
+    # `X-Request-Timeout` overrides it per request.
+    PROXY_REQUEST_TIMEOUT = get_env_or_throw("PROXY_REQUEST_TIMEOUT", default_value="0")
+    # "run" submits and polls, "runsync" first waits up to RUNPOD_RUNSYNC_WAIT_MS
+    # for the result on the submitting request and only then falls back to polling.
+    RUNPOD_CALL_MODE = get_env_or_throw("RUNPOD_CALL_MODE", default_value="run")
+    RUNPOD_RUNSYNC_WAIT_MS = get_env_or_throw(
+        "RUNPOD_RUNSYNC_WAIT_MS", default_value="10000"
+    )
+    # Embedding requests arriving within EMBED_BATCH_WAIT_MS of each other are
+    # sent as one RunPod job of up to EMBED_BATCH_MAX_SIZE requests, 0 disables it.
+    EMBED_BATCH_WAIT_MS = get_env_or_throw("EMBED_BATCH_WAIT_MS", default_value="0")
+    EMBED_BATCH_MAX_SIZE = get_env_or_throw("EMBED_BATCH_MAX_SIZE", default_value="32")
+    # "memory" or "sqlite" caches responses to deterministic requests, see response_cache.py.
+    RESPONSE_CACHE = get_env_or_throw("RESPONSE_CACHE", default_value="off")
+    RESPONSE_CACHE_MAX_BYTES = get_env_or_throw(
+        "RESPONSE_CACHE_MAX_BYTES", default_value=str(256 * 1024 * 1024)
+    )
+    RESPONSE_CACHE_TTL = get_env_or_throw("RESPONSE_CACHE_TTL", default_value="86400")
+    RESPONSE_CACHE_PATH = get_env_or_throw(
+        "RESPONSE_CACHE_PATH", default_value="~/.cache/runpod_ollama/responses.sqlite3"
+    )
+    # "on" lets identical requests in flight at the same time share one RunPod job.
+    COALESCE_REQUESTS = get_env_or_throw("COALESCE_REQUESTS", default_value="on")
+    # JSON object (or path to a JSON file) mapping aliases to endpoint ids, see router.py.
+    RUNPOD_ROUTES = get_env_or_throw("RUNPOD_ROUTES", default_value="")
+    RUNPOD_ROUTER_HEALTH_TTL = get_env_or_throw("RUNPOD_ROUTER_HEALTH_TTL", default_value="2")
+    RUNPOD_ROUTER_MAX_FAILURES = get_env_or_throw("RUNPOD_ROUTER_MAX_FAILURES", default_value="3")
+    RUNPOD_ROUTER_EJECTION_SECONDS = get_env_or_throw(
+        "RUNPOD_ROUTER_EJECTION_SECONDS", default_value="30"
+    )
+    # "on" keeps the conversations named by `X-Session-Id` on one endpoint of a route and
+    # gives `generate` turns the last `context`, see sessions.py.
+    PROXY_SESSIONS = get_env_or_throw("PROXY_SESSIONS", default_value="on")
+    PROXY_SESSION_MAX = get_env_or_throw("PROXY_SESSION_MAX", default_value="10000")
+    PROXY_SESSION_TTL = get_env_or_throw("PROXY_SESSION_TTL", default_value="1800")
+    # "on" compresses responses of at least PROXY_COMPRESSION_MIN_BYTES for clients that
+    # accept it, see compression.py.
+    PROXY_COMPRESSION = get_env_or_throw("PROXY_COMPRESSION", default_value="on")
+    PROXY_COMPRESSION_MIN_BYTES = get_env_or_throw(
+        "PROXY_COMPRESSION_MIN_BYTES", default_value="1024"
+    )
+    # How workers send `embed` vectors, "float32", "float16" (lossy) or "off" for JSON
+    # numbers; packed vectors need NumPy on the proxy, see payloads.py.
+    PROXY_EMBEDDING_DTYPE = get_env_or_throw("PROXY_EMBEDDING_DTYPE", default_value="float32")
+    # Requests per pod sent to RunPod at once, the rest wait in the proxy; 0 disables
+    # admission control unless ADMISSION_POD_LIMITS is set, see admission.py.
+    ADMISSION_MAX_CONCURRENCY = get_env_or_throw("ADMISSION_MAX_CONCURRENCY", default_value="0")
+    ADMISSION_MAX_QUEUE = get_env_or_throw("ADMISSION_MAX_QUEUE", default_value="256")
+    # JSON objects (or paths to JSON files) of per pod limits and per tenant weights.
+    ADMISSION_POD_LIMITS = get_env_or_throw("ADMISSION_POD_LIMITS", default_value="")
+    ADMISSION_TENANT_WEIGHTS = get_env_or_throw("ADMISSION_TENANT_WEIGHTS", default_value="")
+    # Comma separated endpoint ids or route aliases the proxies keep warm, see warm_pool.py.
+    KEEP_WARM_ENDPOINTS = get_env_or_throw("KEEP_WARM_ENDPOINTS", default_value="")
+    KEEP_WARM_MIN_WORKERS = get_env_or_throw("KEEP_WARM_MIN_WORKERS", default_value="1")
+    KEEP_WARM_MAX_WORKERS = get_env_or_throw("KEEP_WARM_MAX_WORKERS", default_value="3")
+    # Windows like "08:00-18:00=3,18:00-22:00=1" raising the minimum, local time.
+    KEEP_WARM_SCHEDULE = get_env_or_throw("KEEP_WARM_SCHEDULE", default_value="")
+    KEEP_WARM_INTERVAL = get_env_or_throw("KEEP_WARM_INTERVAL", default_value="30")
     HF_TOKEN = get_env_or_throw("HF_TOKEN", default_value=None)
     # OPEN_AI_API_KEY = get_env_or_throw("OPEN_AI_API_KEY")
@@ -0,0 +1,37 @@
+from typing import Any
+
+
+class RunpodError(Exception):
+    """Base class for errors raised while running a job on RunPod."""
+
+
+class PollingTimeout(RunpodError):
+    """The job did not finish within the polling deadline or poll budget."""
+
+    def __init__(self, message: str, job_id: str = ""):
+        super().__init__(message)
+        self.job_id = job_id
+
+
+class DeadlineExceeded(PollingTimeout):
+    """The call did not finish within the deadline its caller gave it."""
+
+
+class JobFailed(RunpodError):
+    """The job finished without an output, or the worker reported an error."""
+
+    def __init__(self, message: str, result: Any = None):
+        super().__init__(message)
+        self.result = result
+
+
+class MetadataError(RunpodError):
+    """RunPod's GraphQL API did not list the account's templates and endpoints."""
+
+
+class QueueFull(Exception):
+    """The proxy's admission queue for a pod is full, retry after `retry_after` seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
@@ -0,0 +1,120 @@
+"""Process-wide pooled HTTP sessions for the RunPod API.
+
+Every pod gets one keep-alive session, created on first use and shared by
+everything in the process that talks to it (proxy, client helpers, CLI), so
+`/run` and the `/status` polls that follow reuse the same TCP+TLS
+connections instead of handshaking on every call.
+"""
+
+import threading
+from typing import Dict, Optional
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from runpod_ollama.config import ENVIRONMENT
+
+
+class SessionPool:
+    """Keep-alive `requests` sessions keyed by pod id."""
+
+    def __init__(
+        self,
+        pool_size: Optional[int] = None,
+        per_host_limit: Optional[int] = None,
+    ):
+        self.pool_size = pool_size or int(ENVIRONMENT.RUNPOD_HTTP_POOL_SIZE)
+        self.per_host_limit = (
+            per_host_limit
+            if per_host_limit is not None
+            else int(ENVIRONMENT.RUNPOD_HTTP_PER_HOST_LIMIT)
+        )
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    def session(self, pod_id: str) -> requests.Session:
+        with self._lock:
+            session = self._sessions.get(pod_id)
+            if session is None:
+                session = self._sessions[pod_id] = self._create_session()
+            return session
+
+    def _create_session(self) -> requests.Session:
+        # A per-host limit makes callers wait for a free connection instead
+        # of opening a throwaway one that is discarded once the pool is full.
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.per_host_limit or self.pool_size,
+            pool_block=self.per_host_limit > 0,
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+class AsyncSessionPool:
+    """The asyncio counterpart of `SessionPool`.
+
+    All sessions share one connector, so the pool size and per-host limit
+    apply to the whole process. It must be used from a single event loop.
+    """
+
+    def __init__(
+        self,
+        pool_size: Optional[int] = None,
+        per_host_limit: Optional[int] = None,
+        keepalive_timeout: Optional[float] = None,
+    ):
+        self.pool_size = pool_size or int(ENVIRONMENT.RUNPOD_HTTP_POOL_SIZE)
+        self.per_host_limit = (
+            per_host_limit
+            if per_host_limit is not None
+            else int(ENVIRONMENT.RUNPOD_HTTP_PER_HOST_LIMIT)
+        )
+        self.keepalive_timeout = keepalive_timeout or float(
+            ENVIRONMENT.RUNPOD_HTTP_KEEPALIVE
+        )
+        self._connector: Optional[aiohttp.TCPConnector] = None
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+
+    def session(self, pod_id: str) -> aiohttp.ClientSession:
+        session = self._sessions.get(pod_id)
+        if session is None:
+            if self._connector is None:
+                self._connector = aiohttp.TCPConnector(
+                    limit=self.pool_size,
+                    limit_per_host=self.per_host_limit,
+                    keepalive_timeout=self.keepalive_timeout,
+                )
+            session = self._sessions[pod_id] = aiohttp.ClientSession(
+                connector=self._connector,
+                connector_owner=False,
+            )
+        return session
+
+    async def close(self):
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions.clear()
+        if self._connector is not None:
+            await self._connector.close()
+            self._connector = None
+
+
+_session_pool: Optional[SessionPool] = None
+_session_pool_lock = threading.Lock()
+
+
+def get_session_pool() -> SessionPool:
+    """Returns the process-wide `SessionPool`."""
+    global _session_pool
+    with _session_pool_lock:
+        if _session_pool is None:
+            _session_pool = SessionPool()
+        return _session_pool
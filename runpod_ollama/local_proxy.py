@@ -1,28 +1,447 @@
 """A local proxy for the Runpod Ollama service.
 
 Runs a local proxy to forward requests to the Runpod Ollama service. 
-The API mimicks Ollama's API, but adds a pod_id parameter to the route.
+The API mimicks Ollama's API, but adds a pod_id parameter to the route,
+which may also be the name of the endpoint or of its model.
 """
 
-from typing import Optional
-from flask import Flask, request
-from runpod_ollama import ENVIRONMENT
+from contextlib import ExitStack, closing, contextmanager
+from functools import partial
+import asyncio
+import threading
+from typing import Dict, Iterator, List, Optional
+import requests
+from flask import Flask, Response, abort, request, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from runpod_ollama import ENVIRONMENT, codec
+from runpod_ollama.admission import Admission, create_fair_queue, retry_after_header
+from runpod_ollama.batching import (
+    BATCH_EMBED_METHOD,
+    EmbeddingBatcher,
+    embedding_endpoint,
+)
+from runpod_ollama.compression import create_compressor
+from runpod_ollama.exceptions import DeadlineExceeded, PollingTimeout, QueueFull, RunpodError
+from runpod_ollama.metadata import create_proxy_resolver
+from runpod_ollama.metrics import METRICS_CONTENT_TYPE, REGISTRY
+from runpod_ollama.openai_compat import OpenAITranslation, openai_error
+from runpod_ollama.payloads import output_format
+from runpod_ollama.proxy_options import ProxyOptions
+from runpod_ollama.response_cache import (
+    cache_key,
+    create_response_cache,
+    is_cacheable,
+    is_error_response,
+)
+from runpod_ollama.retries import Deadline
+from runpod_ollama.router import create_router
 from runpod_ollama.runpod_repository import RunpodRepository
+from runpod_ollama.sessions import create_sessions, session_digest
+from runpod_ollama.single_flight import SingleFlight
+from runpod_ollama.streaming import (
+    encode_chunk,
+    stream_content_type,
+    stream_end,
+    wants_stream,
+)
+from runpod_ollama.warm_pool import create_keepers, keep_warm
+
+
+class CodecJSONProvider(DefaultJSONProvider):
+    """Reads request bodies and writes responses with `codec`, orjson when installed."""
+
+    def dumps(self, obj, **kwargs) -> str:
+        return codec.dumps_str(obj)
+
+    def loads(self, s, **kwargs):
+        return codec.loads(s)
 
 
 app = Flask(__name__)
+app.json = CodecJSONProvider(app)
+
+# Errors of calls RunPod could not complete, answered with a 502 or a 504.
+UPSTREAM_ERRORS = (RunpodError, requests.RequestException)
+
+router = create_router()
+
+keepers = create_keepers(router)
+
+fair_queue = create_fair_queue()
+
+admission = Admission(fair_queue) if fair_queue is not None else None
+
+metadata_cache = create_proxy_resolver()
+
+sessions = create_sessions()
+
+compressor = create_compressor()
+
+
+def _repository(pod_id: str) -> RunpodRepository:
+    return RunpodRepository(
+        api_key=ENVIRONMENT.RUNPOD_API_TOKEN,
+        pod_id=pod_id,
+    )
+
+
+def _refresh_health(endpoint_ids: List[str]):
+    """Fetches the health of claimed endpoints, releasing every claim however it ends."""
+    assert router is not None
+    pending = list(endpoint_ids)
+    try:
+        while pending:
+            try:
+                out = _repository(pending[0]).health()
+            except Exception:
+                # Undecodable answers too, not only those that failed on the way.
+                router.health_failed(pending[0])
+            else:
+                router.update_health(pending[0], out)
+            pending.pop(0)
+    finally:
+        for endpoint_id in pending:
+            router.health_failed(endpoint_id)
+
+
+def _resolve(pod_id: str) -> str:
+    """The endpoint id of an endpoint or model name, `RUNPOD_ROUTES` aliases are kept."""
+    if metadata_cache is None or (router is not None and router.pool(pod_id) is not None):
+        return pod_id
+    return metadata_cache.resolve(pod_id)
+
+
+def _endpoint_fault(error: Exception) -> bool:
+    """Whether `error` comes from RunPod rather than from the request or its caller."""
+    if isinstance(error, requests.HTTPError):
+        return error.response is None or error.response.status_code >= 500
+    if isinstance(error, PollingTimeout):
+        return not isinstance(error, DeadlineExceeded)
+    return isinstance(error, requests.RequestException)
+
+
+@contextmanager
+def _routed(pod_id: str, session: Optional[str] = None) -> Iterator[RunpodRepository]:
+    """A repository for the endpoint a call to `pod_id` should be sent to.
+
+    Aliases from `RUNPOD_ROUTES` are routed to one of their endpoints, the
+    one of the previous turn of `session` when it is healthy, and the
+    outcome of the call is reported back to the router.
+    """
+    if router is None or router.pool(pod_id) is None:
+        runpod_repository = _repository(pod_id)
+        yield runpod_repository
+        _record_traffic(pod_id, runpod_repository)
+        return
+    _refresh_health(router.claim_stale(pod_id))
+    prefer = sessions.endpoint(session) if sessions is not None else None
+    endpoint_id = router.pick(pod_id, prefer=prefer)
+    runpod_repository = _repository(endpoint_id)
+    ok: Optional[bool] = None
+    try:
+        yield runpod_repository
+        ok = True
+        _record_traffic(endpoint_id, runpod_repository)
+    except Exception as e:
+        ok = False if _endpoint_fault(e) else None
+        raise
+    finally:
+        router.done(endpoint_id, ok, runpod_repository.execution_time())
+
+
+@contextmanager
+def _admitted(pod_id: str, options: ProxyOptions, deadline: Deadline) -> Iterator[None]:
+    """Waits until the request may be sent upstream, see `admission`."""
+    if admission is None:
+        yield
+        return
+    with admission.admit(pod_id, options.tenant, options.priority, deadline):
+        yield
+
+
+def _remember(
+    session: Optional[str],
+    data,
+    response,
+    runpod_repository: Optional[RunpodRepository] = None,
+    endpoint_id: Optional[str] = None,
+):
+    """Records the turn of a session, where it ran and what the worker kept of it.
+
+    Turns answered from the cache or by the job of an identical request come
+    without a repository, and without a report of the worker.
+    """
+    if session is None:
+        return
+    assert sessions is not None
+    report = None
+    if runpod_repository is not None:
+        endpoint_id = runpod_repository.pod_id
+        last_call = runpod_repository.last_call
+        report = last_call.session if last_call is not None else None
+    sessions.record(session, endpoint_id, data, response, report)
+
+
+def _record_traffic(endpoint_id: str, runpod_repository: RunpodRepository):
+    keeper = keepers.get(endpoint_id)
+    execution_time = runpod_repository.execution_time()
+    if keeper is not None and execution_time is not None:
+        keeper.traffic.record(execution_time)
+
+
+def _submit_embedding_batch(
+    pod_id: str, batch_input, mode: Optional[str], timeout: Optional[float]
+):
+    with _routed(pod_id) as runpod_repository:
+        return runpod_repository.call_endpoint(
+            BATCH_EMBED_METHOD,
+            batch_input,
+            mode=mode,
+            timeout=timeout,
+            output=output_format(BATCH_EMBED_METHOD, batch_input),
+        )
+
+
+embedding_batcher = EmbeddingBatcher(
+    submit=_submit_embedding_batch,
+    max_batch_size=int(ENVIRONMENT.EMBED_BATCH_MAX_SIZE),
+    max_wait=int(ENVIRONMENT.EMBED_BATCH_WAIT_MS) / 1000,
+)
+
+response_cache = create_response_cache()
+
+single_flight = SingleFlight() if ENVIRONMENT.COALESCE_REQUESTS == "on" else None
+
+if response_cache is not None:
+    REGISTRY.register_collector(
+        "proxy_response_cache", "Response cache counter.", response_cache.stats.to_dict
+    )
+if single_flight is not None:
+    REGISTRY.register_collector(
+        "proxy_coalescing", "Request coalescing counter.", single_flight.stats.to_dict
+    )
+if compressor is not None:
+    REGISTRY.register_collector(
+        "proxy_compression", "Response compression counter.", compressor.stats.to_dict
+    )
+
+
+@app.after_request
+def compress_response(response: Response) -> Response:
+    """Compresses whole responses for clients that accept it, see compression.py."""
+    if compressor is None or response.is_streamed or "Content-Encoding" in response.headers:
+        return response
+    response.vary.add("Accept-Encoding")
+    body, encoding = compressor.encode(response.get_data(), request.headers.get("Accept-Encoding"))
+    if encoding is not None:
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+    return response
 
 
 @app.route("/<pod_id>/<path:endpoint>", methods=["POST"])
 def endpoint(pod_id: str, endpoint: str):
     """Forwards a request to the Runpod Ollama service."""
     data = request.json
-    runpod_repository = RunpodRepository(
-        api_key=ENVIRONMENT.RUNPOD_API_TOKEN,
-        pod_id=pod_id,
+    pod_id = _resolve(pod_id)
+    try:
+        options = ProxyOptions.from_headers(request.headers)
+    except ValueError as e:
+        abort(400, str(e))
+    try:
+        translation = OpenAITranslation.from_request(endpoint, data)
+    except ValueError as e:
+        return openai_error(str(e), "invalid_request_error"), 400
+    if translation is not None:
+        endpoint, data = translation.method, translation.body
+    session = options.session if sessions is not None else None
+    if session is not None:
+        data = sessions.prepare(session, endpoint, data)
+    if wants_stream(data):
+        try:
+            return _stream(pod_id, endpoint, data, options, translation, session)
+        except QueueFull as e:
+            return _rejected(e, translation)
+        except DeadlineExceeded as e:
+            return _failed(e, translation)
+
+    output = output_format(endpoint, data, options.keep, session)
+    key = None
+    if response_cache is not None and not options.no_store and is_cacheable(endpoint, data):
+        key = cache_key(pod_id, endpoint, data, output)
+        cached = None if options.no_cache else response_cache.get(key)
+        if cached is not None:
+            _remember(session, data, cached)
+            return _json_response(cached, translation, {"X-Cache": "HIT"})
+
+    # What is left of it bounds a call started again after another caller's deadline.
+    deadline = Deadline(options.timeout)
+    recorded = False
+
+    def upstream():
+        """The response with the endpoint that answered it, if known."""
+        nonlocal recorded
+        embedding = embedding_endpoint(endpoint)
+        with _admitted(pod_id, options, deadline):
+            if embedding and embedding_batcher.max_wait > 0:
+                response = embedding_batcher.call(
+                    pod_id, embedding, data, mode=options.mode, timeout=deadline.remaining()
+                )
+                return response, None
+            with _routed(pod_id, session) as runpod_repository:
+                response = runpod_repository.call_endpoint(
+                    endpoint,
+                    data,
+                    mode=options.mode,
+                    timeout=deadline.remaining(),
+                    session_id=session_digest(session),
+                    output=output,
+                )
+                _remember(session, data, response, runpod_repository)
+                recorded = True
+                return response, runpod_repository.pod_id
+
+    try:
+        if single_flight is not None and not options.no_store:
+            response, endpoint_id = single_flight.do(
+                key or cache_key(pod_id, endpoint, data, output), upstream, timeout=options.timeout
+            )
+        else:
+            response, endpoint_id = upstream()
+    except QueueFull as e:
+        return _rejected(e, translation)
+    except UPSTREAM_ERRORS as e:
+        return _failed(e, translation)
+    if not recorded:
+        _remember(session, data, response, endpoint_id=endpoint_id)
+
+    if key is not None and not is_error_response(response):
+        response_cache.set(key, response)
+        return _json_response(response, translation, {"X-Cache": "MISS"})
+    return _json_response(response, translation)
+
+
+def _json_response(
+    response, translation: Optional[OpenAITranslation], headers: Optional[Dict[str, str]] = None
+):
+    if translation is None:
+        return (response, headers) if headers else response
+    body, status = translation.response(response)
+    return body, status, headers or {}
+
+
+def _rejected(error: QueueFull, translation: Optional[OpenAITranslation]):
+    body = (
+        openai_error(str(error), "rate_limit_error")
+        if translation is not None
+        else {"error": str(error)}
     )
-    response = runpod_repository.call_endpoint(endpoint, data)
+    return body, 429, {"Retry-After": retry_after_header(error)}
+
 
+def _failed(error: Exception, translation: Optional[OpenAITranslation]):
+    message = str(error) or type(error).__name__
+    body = openai_error(message) if translation is not None else {"error": message}
+    return body, 504 if isinstance(error, (PollingTimeout, requests.Timeout)) else 502
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus metrics of the RunPod calls made by the proxy."""
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+@app.route("/_proxy/cache", methods=["GET"])
+def cache_stats():
+    """Hit, miss and eviction counters of the response cache."""
+    if response_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **response_cache.stats.to_dict()}
+
+
+@app.route("/_proxy/coalescing", methods=["GET"])
+def coalescing_stats():
+    """How many requests were sent upstream and how many shared their result."""
+    if single_flight is None:
+        return {"enabled": False}
+    return {"enabled": True, **single_flight.stats.to_dict()}
+
+
+@app.route("/_proxy/admission", methods=["GET"])
+def admission_stats():
+    """Limit, running and queued requests of every pod, with admissions and rejections."""
+    if admission is None:
+        return {"enabled": False}
+    return {"enabled": True, "pods": admission.queue.stats()}
+
+
+@app.route("/_proxy/metadata", methods=["GET"])
+def metadata_stats():
+    """The endpoint names the proxy resolves and how old their listing is."""
+    if metadata_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **metadata_cache.stats()}
+
+
+@app.route("/_proxy/sessions", methods=["GET"])
+def session_stats():
+    """Sessions kept, turns pinned to their endpoint and prompt tokens the workers reused."""
+    if sessions is None:
+        return {"enabled": False}
+    return {"enabled": True, **sessions.to_dict()}
+
+
+@app.route("/_proxy/keep-warm", methods=["GET"])
+def keep_warm_stats():
+    """Target and warm-up jobs of every endpoint kept warm, with their cold starts."""
+    return {
+        endpoint_id: {"target": keeper.target(), **keeper.stats.to_dict()}
+        for endpoint_id, keeper in keepers.items()
+    }
+
+
+def _stream(
+    pod_id: str,
+    endpoint: str,
+    data,
+    options: ProxyOptions,
+    translation: Optional[OpenAITranslation] = None,
+    session: Optional[str] = None,
+) -> Response:
+    # The wire format is the one of the endpoint the client called.
+    wire = translation.endpoint if translation is not None else endpoint
+    deadline = Deadline(options.timeout)
+    # Admitted before the response starts, so a full queue can still get a 429.
+    admitted = ExitStack()
+    admitted.enter_context(_admitted(pod_id, options, deadline))
+
+    encode = translation.encode if translation is not None else partial(encode_chunk, endpoint)
+
+    def chunks():
+        try:
+            with _routed(pod_id, session) as runpod_repository, closing(
+                runpod_repository.stream_endpoint(
+                    endpoint,
+                    data,
+                    timeout=deadline.remaining(),
+                    session_id=session_digest(session),
+                    output=output_format(endpoint, data, options.keep, session),
+                )
+            ) as stream:
+                # Closing the stream when the client went away cancels the job.
+                for chunk in stream:
+                    if isinstance(chunk, dict) and chunk.get("done"):
+                        _remember(session, data, chunk, runpod_repository)
+                    yield encode(chunk)
+        except UPSTREAM_ERRORS as e:
+            yield encode({"error": str(e) or type(e).__name__})
+        yield stream_end(wire)
+
+    response = Response(
+        stream_with_context(chunks()),
+        content_type=stream_content_type(wire),
+    )
+    response.call_on_close(admitted.close)
     return response
 
 
@@ -30,4 +449,11 @@ def run_local_proxy(
     port: int = 5000,
     debug: Optional[bool] = None,
 ):
+    if metadata_cache is not None:
+        metadata_cache.prefetch()
+    if keepers:
+        # The keepers run on an event loop of their own, next to Flask's threads.
+        threading.Thread(
+            target=asyncio.run, args=(keep_warm(list(keepers.values())),), daemon=True
+        ).start()
     app.run(debug=debug, port=port)
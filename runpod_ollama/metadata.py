@@ -0,0 +1,299 @@
+"""A local cache of the account's templates and endpoints.
+
+Listing them takes a GraphQL call to RunPod's control plane, which the CLI
+used to make on every run. `MetadataCache` keeps the last listing in a JSON
+file (`METADATA_CACHE_PATH`) and only asks RunPod again once it is older
+than `METADATA_CACHE_TTL` seconds; long running processes like the proxies
+keep serving the old listing while a fresh one is fetched in the background.
+
+Templates and endpoints are indexed by id and by name. The CLI names both
+after the model they serve, so `resolve("llama3")` gives the endpoint id of
+the model and the proxies accept `/<model>/<endpoint>` routes. Endpoints
+created with FlashBoot are renamed `<name> -fb` by RunPod, the suffix is
+ignored by the index.
+
+The file belongs to the API key it was fetched with (a hash of it is stored),
+another key fetches its own listing.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+from runpod_ollama.config import ENVIRONMENT
+from runpod_ollama.exceptions import MetadataError
+
+Clock = Callable[[], float]
+
+GRAPHQL_QUERY = """
+query Metadata {
+  myself {
+    endpoints { id name templateId gpuIds workersMin workersMax idleTimeout }
+    podTemplates { id name imageName isServerless containerDiskInGb }
+  }
+}
+"""
+
+SAVE_ENDPOINT_MUTATION = """
+mutation SaveEndpoint($input: EndpointInput!) {
+  saveEndpoint(input: $input) { id name templateId gpuIds workersMin workersMax idleTimeout }
+}
+"""
+
+# Appended by RunPod to the names of endpoints created with FlashBoot, with or without a space.
+FLASHBOOT_SUFFIX = "-fb"
+
+# Seconds before a background refresh that failed is tried again.
+RETRY_INTERVAL = 30.0
+
+logger = logging.getLogger(__name__)
+
+
+def display_name(item: Dict[str, Any]) -> str:
+    """The name of a template or endpoint as it was created, without RunPod's suffix."""
+    name = item.get("name") or ""
+    return name[: -len(FLASHBOOT_SUFFIX)].rstrip() if name.endswith(FLASHBOOT_SUFFIX) else name
+
+
+def _index(items: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Items by name, then by id, so that an id always wins over a name."""
+    index: Dict[str, Dict[str, Any]] = {}
+    for item in reversed(items):
+        index[display_name(item)] = item
+    index.update((item["id"], item) for item in items)
+    index.pop("", None)
+    return index
+
+
+@dataclass
+class Metadata:
+    endpoints: List[Dict[str, Any]] = field(default_factory=list)
+    templates: List[Dict[str, Any]] = field(default_factory=list)
+    fetched_at: float = 0.0
+    """Unix time of the listing."""
+
+    account: str = ""
+    """Hash of the API key it was fetched with."""
+
+    def __post_init__(self):
+        self._endpoints = _index(self.endpoints)
+        self._templates = _index(self.templates)
+
+    def endpoint(self, name_or_id: str) -> Optional[Dict[str, Any]]:
+        return self._endpoints.get(name_or_id)
+
+    def template(self, name_or_id: str) -> Optional[Dict[str, Any]]:
+        return self._templates.get(name_or_id)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "endpoints": self.endpoints,
+            "templates": self.templates,
+            "fetched_at": self.fetched_at,
+            "account": self.account,
+        }
+
+    @classmethod
+    def load(cls, path: str) -> Optional["Metadata"]:
+        try:
+            with open(path) as f:
+                return cls(**json.load(f))
+        except (FileNotFoundError, ValueError, TypeError):
+            return None
+
+    def save(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Unique, so that concurrent CLI runs do not write the same file.
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp, path)
+
+
+def account_hash(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+def _graphql(
+    api_key: str,
+    query: str,
+    variables: Optional[Dict[str, Any]] = None,
+    url: Optional[str] = None,
+    timeout: Optional[float] = None,
+) -> Dict[str, Any]:
+    """The `data` of a GraphQL call to RunPod's control plane."""
+    # Only needed when the cache is stale, commands reading it start faster without.
+    import requests
+
+    response = requests.post(
+        url or f"{ENVIRONMENT.RUNPOD_API_BASE_URL.rstrip('/')}/graphql",
+        json={"query": query, "variables": variables or {}},
+        headers={"Authorization": f"Bearer {api_key}"},
+        timeout=timeout or float(ENVIRONMENT.RUNPOD_HTTP_TIMEOUT),
+    )
+    if response.status_code in (401, 403):
+        raise MetadataError("RunPod refused the API key")
+    response.raise_for_status()
+    body = response.json()
+    if body.get("errors"):
+        raise MetadataError(body["errors"][0].get("message", "GraphQL query failed"))
+    return body["data"]
+
+
+def fetch_metadata(
+    api_key: str, url: Optional[str] = None, timeout: Optional[float] = None
+) -> Metadata:
+    """Lists the templates and endpoints of the account with one GraphQL query."""
+    myself = _graphql(api_key, GRAPHQL_QUERY, url=url, timeout=timeout)["myself"]
+    return Metadata(
+        endpoints=myself.get("endpoints") or [],
+        templates=myself.get("podTemplates") or [],
+        fetched_at=time.time(),
+        account=account_hash(api_key),
+    )
+
+
+def update_endpoint(
+    api_key: str,
+    endpoint: Dict[str, Any],
+    flashboot: bool = True,
+    url: Optional[str] = None,
+    **changes: Any,
+) -> Dict[str, Any]:
+    """Saves an endpoint of the listing with `changes`, e.g. `workersMax=3`.
+
+    `saveEndpoint` replaces the whole endpoint, the fields not changed are
+    sent as they were listed.
+    """
+    fields = {
+        key: endpoint[key]
+        for key in ("id", "templateId", "gpuIds", "workersMin", "workersMax", "idleTimeout")
+        if endpoint.get(key) is not None
+    }
+    fields.update(changes)
+    fields["name"] = display_name(endpoint) + (FLASHBOOT_SUFFIX if flashboot else "")
+    data = _graphql(api_key, SAVE_ENDPOINT_MUTATION, {"input": fields}, url=url)
+    return data["saveEndpoint"]
+
+
+class MetadataCache:
+    """The templates and endpoints of one account, from the cache file while it is fresh."""
+
+    def __init__(
+        self,
+        api_key: str,
+        path: Optional[str] = None,
+        ttl: Optional[float] = None,
+        fetch: Optional[Callable[[], Metadata]] = None,
+        clock: Clock = time.time,
+    ):
+        self.account = account_hash(api_key)
+        self.path = os.path.expanduser(path or ENVIRONMENT.METADATA_CACHE_PATH)
+        self.ttl = ttl if ttl is not None else float(ENVIRONMENT.METADATA_CACHE_TTL)
+        self.fetch = fetch or (lambda: fetch_metadata(api_key))
+        self.clock = clock
+        self._metadata: Optional[Metadata] = None
+        self._loaded = False
+        self._refreshing = False
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, refresh: bool = False) -> Metadata:
+        """The listing, fetched from RunPod when stale, missing or `refresh` is set."""
+        metadata = None if refresh else self.cached()
+        if metadata is None or self.is_stale(metadata):
+            metadata = self.refresh()
+        return metadata
+
+    def cached(self) -> Optional[Metadata]:
+        """The last listing of this account, however old, without asking RunPod."""
+        with self._lock:
+            if not self._loaded:
+                metadata = Metadata.load(self.path)
+                if metadata is not None and metadata.account == self.account:
+                    self._metadata = metadata
+                self._loaded = True
+            return self._metadata
+
+    def is_stale(self, metadata: Metadata) -> bool:
+        return self.clock() - metadata.fetched_at >= self.ttl
+
+    def refresh(self) -> Metadata:
+        metadata = self.fetch()
+        with self._lock:
+            self._metadata, self._loaded = metadata, True
+        metadata.save(self.path)
+        return metadata
+
+    def invalidate(self):
+        """Forgets the listing, e.g. after creating a template or an endpoint."""
+        with self._lock:
+            self._metadata, self._loaded = None, True
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def refresh_in_background(self) -> bool:
+        """Starts a refresh on a daemon thread unless one is running or just failed."""
+        with self._lock:
+            if self._refreshing or self.clock() < self._retry_at:
+                return False
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, daemon=True).start()
+        return True
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning(f"Refreshing the RunPod templates and endpoints failed: {e}")
+            with self._lock:
+                self._retry_at = self.clock() + min(RETRY_INTERVAL, self.ttl)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def stats(self) -> Dict[str, Any]:
+        metadata = self.cached()
+        if metadata is None:
+            return {"fetched": False, "endpoints": {}}
+        return {
+            "fetched": True,
+            "age": round(self.clock() - metadata.fetched_at, 1),
+            "endpoints": {display_name(e): e["id"] for e in metadata.endpoints},
+        }
+
+    def prefetch(self):
+        """Refreshes a stale or missing listing in the background, e.g. when a proxy starts."""
+        metadata = self.cached()
+        if metadata is None or self.is_stale(metadata):
+            self.refresh_in_background()
+
+    def resolve(self, name_or_id: str) -> str:
+        """The id of the endpoint named `name_or_id`, else `name_or_id` itself.
+
+        Never waits for RunPod: a stale or missing listing is refreshed in
+        the background and used as it is meanwhile.
+        """
+        self.prefetch()
+        metadata = self.cached()
+        endpoint = metadata.endpoint(name_or_id) if metadata is not None else None
+        return endpoint["id"] if endpoint is not None else name_or_id
+
+
+def create_metadata_cache() -> MetadataCache:
+    return MetadataCache(ENVIRONMENT.RUNPOD_API_TOKEN)
+
+
+def create_proxy_resolver() -> Optional[MetadataCache]:
+    """The cache the proxies resolve names with, None if `PROXY_RESOLVE_NAMES` is off."""
+    if ENVIRONMENT.PROXY_RESOLVE_NAMES != "on":
+        return None
+    return create_metadata_cache()
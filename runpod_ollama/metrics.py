@@ -0,0 +1,416 @@
+"""Prometheus-style metrics of the RunPod calls made by this process.
+
+Every call is broken down into its phases: submitting the job, waiting in
+RunPod's queue (`delayTime`, including cold starts), executing on the worker
+(`executionTime`) and the time between the job finishing and a poll noticing
+it. The worker reports Ollama's own timings with the output, under
+`WORKER_METADATA_KEY`, and they are recorded here as well. `REGISTRY.render()`
+returns everything in the Prometheus text format, which the local proxies
+serve on `/metrics`.
+"""
+
+import math
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+# The worker puts its own measurements under this key of the job output,
+# keep it in sync with `server/runpod_wrapper.py`.
+WORKER_METADATA_KEY = "runpod_ollama"
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600,
+)
+TOKENS_PER_SECOND_BUCKETS = (1, 2.5, 5, 10, 20, 40, 80, 160, 320, 640, 1280)
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Mapping[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in values
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Iterable[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Per label set: count of every bucket (not cumulative), sum.
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * len(self.buckets), [0.0]))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            total[0] += value
+
+    def count(self, **labels: str) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((k, (list(c), t[0])) for k, (c, t) in self._values.items())
+        lines = []
+        names = self.labelnames + ("le",)
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(names, key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+Collector = Callable[[], Mapping[str, float]]
+M = TypeVar("M", bound=Metric)
+
+
+class Registry:
+    """The metrics of a process, rendered in the Prometheus text format.
+
+    Besides metrics, it renders collectors: functions returning the current
+    values of counters kept elsewhere (e.g. the response cache's), which are
+    exposed as gauges named `<prefix>_<key>`.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: Dict[str, Tuple[str, Collector]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: M) -> M:
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def register_collector(self, prefix: str, documentation: str, collect: Collector):
+        with self._lock:
+            self._collectors[prefix] = (documentation, collect)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.items())
+        blocks = [metric.render() for metric in metrics]
+        for prefix, (documentation, collect) in collectors:
+            for key, value in collect().items():
+                name = f"{prefix}_{key}"
+                blocks.append(
+                    f"# HELP {name} {documentation}\n# TYPE {name} gauge\n"
+                    f"{name} {_format_value(value)}"
+                )
+        return "\n".join(blocks) + "\n"
+
+
+REGISTRY = Registry()
+
+CALL_LABELS = ("pod_id", "endpoint", "model")
+
+SUBMIT_SECONDS = REGISTRY.register(Histogram(
+    "runpod_submit_seconds", "Time to submit a job to RunPod.", CALL_LABELS,
+))
+QUEUE_SECONDS = REGISTRY.register(Histogram(
+    "runpod_queue_seconds", "Time jobs waited in RunPod's queue (delayTime).", CALL_LABELS,
+))
+EXECUTION_SECONDS = REGISTRY.register(Histogram(
+    "runpod_execution_seconds", "Time jobs ran on a worker (executionTime).", CALL_LABELS,
+))
+POLL_OVERSHOOT_SECONDS = REGISTRY.register(Histogram(
+    "runpod_poll_overshoot_seconds",
+    "Approximate time between a job finishing and a status poll noticing it.",
+    CALL_LABELS,
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "runpod_request_seconds", "End to end time of RunPod calls.", CALL_LABELS,
+))
+STATUS_POLLS = REGISTRY.register(Counter(
+    "runpod_status_polls_total", "Status and stream polls sent to RunPod.", CALL_LABELS,
+))
+RETRIES = REGISTRY.register(Counter(
+    "runpod_retries_total", "RunPod requests that were sent again.", CALL_LABELS,
+))
+ERRORS = REGISTRY.register(Counter(
+    "runpod_errors_total",
+    "Failed RunPod calls, by kind: http, timeout or worker.",
+    CALL_LABELS + ("kind",),
+))
+COLD_STARTS = REGISTRY.register(Counter(
+    "runpod_cold_starts_total",
+    "Jobs that were the first one of a newly started worker.",
+    CALL_LABELS,
+))
+COLD_START_SECONDS = REGISTRY.register(Histogram(
+    "runpod_cold_start_seconds",
+    "Queue time (delayTime) of jobs that waited for a worker to start.",
+    CALL_LABELS,
+))
+WORKER_BOOT_SECONDS = REGISTRY.register(Histogram(
+    "runpod_worker_boot_seconds",
+    "Boot phases of newly started workers: ollama_start, pull, load and total.",
+    CALL_LABELS + ("phase",),
+))
+OLLAMA_LOAD_SECONDS = REGISTRY.register(Histogram(
+    "ollama_load_seconds", "Time Ollama spent loading the model.", CALL_LABELS,
+))
+OLLAMA_PROMPT_EVAL_SECONDS = REGISTRY.register(Histogram(
+    "ollama_prompt_eval_seconds", "Time Ollama spent evaluating the prompt.", CALL_LABELS,
+))
+OLLAMA_EVAL_SECONDS = REGISTRY.register(Histogram(
+    "ollama_eval_seconds", "Time Ollama spent generating tokens.", CALL_LABELS,
+))
+OLLAMA_TOKENS_PER_SECOND = REGISTRY.register(Histogram(
+    "ollama_eval_tokens_per_second",
+    "Generation speed reported by Ollama.",
+    CALL_LABELS,
+    buckets=TOKENS_PER_SECOND_BUCKETS,
+))
+OLLAMA_PROMPT_EVAL_TOKENS = REGISTRY.register(Counter(
+    "ollama_prompt_eval_tokens_total", "Prompt tokens Ollama evaluated.", CALL_LABELS,
+))
+SESSION_TURNS = REGISTRY.register(Counter(
+    "worker_session_turns_total",
+    "Turns of conversations, by whether the worker remembered the previous one (hit).",
+    CALL_LABELS + ("hit",),
+))
+SESSION_REUSED_TOKENS = REGISTRY.register(Counter(
+    "ollama_prompt_tokens_reused_total",
+    "Prompt tokens of earlier turns the worker did not have to evaluate again.",
+    CALL_LABELS,
+))
+MODEL_JOBS = REGISTRY.register(Counter(
+    "worker_model_jobs_total",
+    "Jobs of multi-model workers, by whether their model was already loaded (hit).",
+    CALL_LABELS + ("hit",),
+))
+MODEL_EVICTIONS = REGISTRY.register(Counter(
+    "worker_model_evictions_total",
+    "Models multi-model workers unloaded to make room for the one of a job.",
+    CALL_LABELS,
+))
+MODEL_UNLOAD_SECONDS = REGISTRY.register(Histogram(
+    "worker_model_unload_seconds",
+    "Time multi-model workers spent unloading models before running a job.",
+    CALL_LABELS,
+))
+
+
+ADMISSION_LABELS = ("pod_id", "priority")
+
+ADMISSION_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "proxy_admission_queue_depth", "Requests waiting to be admitted.", ADMISSION_LABELS,
+))
+ADMISSION_RUNNING = REGISTRY.register(Gauge(
+    "proxy_admission_running", "Admitted requests still running.", ("pod_id",),
+))
+ADMISSION_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "proxy_admission_wait_seconds", "Time a request waited to be admitted.", ADMISSION_LABELS,
+))
+ADMISSION_REJECTED = REGISTRY.register(Counter(
+    "proxy_admission_rejected_total", "Requests rejected because the queue was full.",
+    ADMISSION_LABELS,
+))
+
+
+def endpoint_label(endpoint: str) -> str:
+    name = endpoint.strip("/")
+    return name[len("api/"):] if name.startswith("api/") else name
+
+
+class CallMetrics:
+    """Records the phases of a single RunPod call.
+
+    Created when the call starts; the repository reports when the job was
+    submitted, every poll, and the final status or the error.
+    """
+
+    def __init__(
+        self,
+        pod_id: str,
+        endpoint: str,
+        input: Any,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        model = input.get("model") if isinstance(input, Mapping) else None
+        self.labels = {
+            "pod_id": pod_id,
+            "endpoint": endpoint_label(endpoint),
+            "model": str(model or ""),
+        }
+        self.clock = clock
+        self.started_at = clock()
+        self.submitted_at: Optional[float] = None
+        self.queue_seconds: Optional[float] = None
+        self.cold_start = False
+        """Whether the job was the first one of a freshly started worker."""
+
+        self.session: Optional[Mapping[str, Any]] = None
+        """What the worker remembered of the conversation, see `sessions.py`."""
+
+    def submitted(self):
+        self.submitted_at = self.clock()
+        SUBMIT_SECONDS.observe(self.submitted_at - self.started_at, **self.labels)
+
+    def polled(self):
+        STATUS_POLLS.inc(**self.labels)
+
+    def retried(self):
+        RETRIES.inc(**self.labels)
+
+    def failed(self, kind: str):
+        ERRORS.inc(kind=kind, **self.labels)
+
+    def completed(self, out: Optional[Mapping[str, Any]] = None):
+        """Records a finished call, `out` is the final status if there is one."""
+        now = self.clock()
+        REQUEST_SECONDS.observe(now - self.started_at, **self.labels)
+        if not out or "executionTime" not in out:
+            return
+        queue = self.queue_seconds = out.get("delayTime", 0) / 1000
+        execution = out["executionTime"] / 1000
+        QUEUE_SECONDS.observe(queue, **self.labels)
+        EXECUTION_SECONDS.observe(execution, **self.labels)
+        # RunPod's clock starts when the submit request arrives, half-way
+        # through our submit call at best.
+        submit = (self.submitted_at or self.started_at) - self.started_at
+        overshoot = now - self.started_at - submit / 2 - queue - execution
+        POLL_OVERSHOOT_SECONDS.observe(max(overshoot, 0.0), **self.labels)
+
+    def worker_output(self, output: Any) -> Any:
+        """Records and strips the worker's metadata from an output or chunk."""
+        if not isinstance(output, dict):
+            return output
+        if output.get("status") == "failed" and "error" in output:
+            self.failed("worker")
+        if WORKER_METADATA_KEY not in output:
+            return output
+        output = dict(output)
+        metadata = output.pop(WORKER_METADATA_KEY) or {}
+        ollama = metadata.get("ollama") or {}
+        for key, histogram in (
+            ("load_seconds", OLLAMA_LOAD_SECONDS),
+            ("prompt_eval_seconds", OLLAMA_PROMPT_EVAL_SECONDS),
+            ("eval_seconds", OLLAMA_EVAL_SECONDS),
+            ("tokens_per_second", OLLAMA_TOKENS_PER_SECOND),
+        ):
+            if ollama.get(key) is not None:
+                histogram.observe(ollama[key], **self.labels)
+        if ollama.get("prompt_eval_count"):
+            OLLAMA_PROMPT_EVAL_TOKENS.inc(ollama["prompt_eval_count"], **self.labels)
+        session = metadata.get("session")
+        if session:
+            self.session = session
+            SESSION_TURNS.inc(hit="true" if session["hit"] else "false", **self.labels)
+            SESSION_REUSED_TOKENS.inc(session.get("reused_tokens", 0), **self.labels)
+        model = metadata.get("model")
+        if model:
+            MODEL_JOBS.inc(hit="true" if model["hit"] else "false", **self.labels)
+            if model.get("evicted"):
+                MODEL_EVICTIONS.inc(len(model["evicted"]), **self.labels)
+                MODEL_UNLOAD_SECONDS.observe(model["unload_seconds"], **self.labels)
+        worker = metadata.get("worker") or {}
+        if worker.get("first_job"):
+            self.cold_start = True
+            COLD_STARTS.inc(**self.labels)
+            if self.queue_seconds is not None:
+                COLD_START_SECONDS.observe(self.queue_seconds, **self.labels)
+        for key, value in (worker.get("boot") or {}).items():
+            if key.endswith("_seconds"):
+                WORKER_BOOT_SECONDS.observe(value, phase=key[: -len("_seconds")], **self.labels)
+        return output
@@ -0,0 +1,350 @@
+"""Translation between OpenAI's API and Ollama's native one.
+
+The proxies answer `v1/chat/completions`, `v1/completions` and
+`v1/embeddings` by sending the equivalent native request (`chat`, `generate`,
+`embed`) to the worker and translating its response back, streamed chunks
+included. The worker only ever sees native requests, so OpenAI clients do not
+depend on the compatibility layer of the Ollama version it runs, and share
+the response cache, request coalescing and embedding batching with native
+clients.
+"""
+
+import base64
+import json
+import struct
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+from runpod_ollama.streaming import encode_chunk
+
+OPENAI_ENDPOINTS = {
+    "v1/chat/completions": "chat",
+    "v1/completions": "generate",
+    "v1/embeddings": "embed",
+}
+
+# Request fields that become native `options`, with their native name.
+SAMPLING_OPTIONS = {
+    "temperature": "temperature",
+    "top_p": "top_p",
+    "seed": "seed",
+    "frequency_penalty": "frequency_penalty",
+    "presence_penalty": "presence_penalty",
+    "max_tokens": "num_predict",
+    "max_completion_tokens": "num_predict",
+    "stop": "stop",
+}
+
+SYSTEM_FINGERPRINT = "fp_ollama"
+
+
+def openai_error(message: str, type: str = "api_error") -> Dict[str, Any]:
+    """An error body in the shape OpenAI clients parse."""
+    return {"error": {"message": message, "type": type, "param": None, "code": None}}
+
+
+def _options(data: Mapping[str, Any]) -> Dict[str, Any]:
+    options: Dict[str, Any] = {}
+    for name, native in SAMPLING_OPTIONS.items():
+        if data.get(name) is not None:
+            options[native] = data[name]
+    if isinstance(options.get("stop"), str):
+        options["stop"] = [options["stop"]]
+    return options
+
+
+def _format(data: Mapping[str, Any]) -> Any:
+    response_format = data.get("response_format") or {}
+    if not isinstance(response_format, Mapping):
+        raise ValueError("`response_format` must be an object")
+    if response_format.get("type") == "json_object":
+        return "json"
+    if response_format.get("type") == "json_schema":
+        return (response_format.get("json_schema") or {}).get("schema")
+    return None
+
+
+def _message(message: Mapping[str, Any]) -> Dict[str, Any]:
+    """A native chat message from an OpenAI one."""
+    if not isinstance(message, Mapping) or not isinstance(message.get("role"), str):
+        raise ValueError("Each message must be an object with a string `role`")
+    native: Dict[str, Any] = {"role": message["role"]}
+    content = message.get("content")
+    if isinstance(content, list):
+        texts, images = [], []
+        for part in content:
+            if not isinstance(part, Mapping):
+                raise ValueError("Content parts must be objects with a `type`")
+            if part.get("type") == "text":
+                texts.append(part.get("text", ""))
+            elif part.get("type") == "image_url":
+                url = part.get("image_url")
+                url = url.get("url", "") if isinstance(url, Mapping) else url
+                if not isinstance(url, str) or not url.startswith("data:"):
+                    raise ValueError("Only base64 data URLs are supported for images")
+                images.append(url.split(",", 1)[-1])
+            else:
+                raise ValueError(f"Unsupported content part type {part.get('type')!r}")
+        native["content"] = "\n".join(texts)
+        if images:
+            native["images"] = images
+    else:
+        native["content"] = content or ""
+    if message.get("tool_calls"):
+        try:
+            native["tool_calls"] = [
+                {
+                    "function": {
+                        "name": call["function"]["name"],
+                        "arguments": json.loads(call["function"].get("arguments") or "{}"),
+                    }
+                }
+                for call in message["tool_calls"]
+            ]
+        except (KeyError, TypeError, AttributeError):
+            raise ValueError("Tool calls must have a `function` with a `name`") from None
+    return native
+
+
+def _tool_calls(message: Mapping[str, Any]) -> List[Dict[str, Any]]:
+    """OpenAI tool calls from a native chat message, arguments as JSON text."""
+    return [
+        {
+            "id": f"call_{uuid.uuid4().hex[:24]}",
+            "type": "function",
+            "function": {
+                "name": call["function"]["name"],
+                "arguments": json.dumps(call["function"].get("arguments") or {}),
+            },
+        }
+        for call in message.get("tool_calls") or []
+    ]
+
+
+def _finish_reason(out: Mapping[str, Any], tool_calls: bool = False) -> str:
+    if tool_calls:
+        return "tool_calls"
+    return "length" if out.get("done_reason") == "length" else "stop"
+
+
+def _usage(out: Mapping[str, Any], completion: bool = True) -> Dict[str, int]:
+    prompt_tokens = out.get("prompt_eval_count") or 0
+    if not completion:
+        return {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens}
+    completion_tokens = out.get("eval_count") or 0
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def _embedding(values: List[float], encoding_format: str) -> Any:
+    if encoding_format == "base64":
+        if hasattr(values, "astype"):
+            # A NumPy vector unpacked from the worker's buffer, see payloads.py.
+            return base64.b64encode(values.astype("<f4", copy=False).tobytes()).decode()
+        return base64.b64encode(struct.pack(f"<{len(values)}f", *values)).decode()
+    return values
+
+
+def _error_message(output: Any) -> Optional[str]:
+    """The error of a worker or Ollama error response, None for a response."""
+    if isinstance(output, Mapping) and "error" in output:
+        return str(output["error"])
+    return None
+
+
+def _error_status(output: Mapping[str, Any]) -> Tuple[int, str]:
+    """The HTTP status and OpenAI error type of a worker or Ollama error.
+
+    Errors the request caused, which the worker reports with Ollama's 4xx
+    `status_code`, must not be answered with a 5xx that SDKs retry.
+    """
+    status_code = output.get("status_code")
+    if status_code == 404:
+        return 404, "invalid_request_error"
+    if isinstance(status_code, int) and 400 <= status_code < 500:
+        return 400, "invalid_request_error"
+    return 500, "api_error"
+
+
+@dataclass
+class OpenAITranslation:
+    """One OpenAI request, its native equivalent and the state of its stream."""
+
+    endpoint: str
+    """The OpenAI endpoint, e.g. `v1/chat/completions`."""
+    method: str
+    """The native endpoint the request is sent to."""
+    body: Dict[str, Any]
+    """The native request body."""
+    model: str
+    stream: bool = False
+    include_usage: bool = False
+    encoding_format: str = "float"
+    id: str = ""
+    created: int = field(default_factory=lambda: int(time.time()))
+
+    @classmethod
+    def from_request(cls, endpoint: str, data: Any) -> Optional["OpenAITranslation"]:
+        """Returns None for endpoints that are not translated.
+
+        Raises ValueError for requests that cannot be expressed natively.
+        """
+        method = OPENAI_ENDPOINTS.get(endpoint.strip("/"))
+        if method is None:
+            return None
+        if not isinstance(data, Mapping) or not data.get("model"):
+            raise ValueError("The request body must be an object with a `model`")
+        stream = data.get("stream") is True
+        body: Dict[str, Any] = {"model": data["model"]}
+        if method == "embed":
+            inputs = data.get("input")
+            texts = [inputs] if isinstance(inputs, str) else inputs
+            if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                raise ValueError("`input` must be a string or a list of strings")
+            body["input"] = inputs
+            if data.get("dimensions") is not None:
+                body["dimensions"] = data["dimensions"]
+            stream = False
+        else:
+            n = data.get("n")
+            if n is not None and (not isinstance(n, int) or isinstance(n, bool)):
+                raise ValueError("`n` must be an integer")
+            if (n or 1) > 1:
+                raise ValueError("`n` greater than 1 is not supported")
+            if method == "chat":
+                messages = data.get("messages")
+                if not isinstance(messages, list) or not messages:
+                    raise ValueError("`messages` must be a non-empty list")
+                body["messages"] = [_message(m) for m in messages]
+                if data.get("tools"):
+                    body["tools"] = data["tools"]
+            else:
+                prompt = data.get("prompt")
+                if isinstance(prompt, list) and len(prompt) == 1:
+                    prompt = prompt[0]
+                if not isinstance(prompt, str):
+                    raise ValueError("`prompt` must be a string")
+                body["prompt"] = prompt
+                if data.get("suffix"):
+                    body["suffix"] = data["suffix"]
+            body["stream"] = stream
+            options = _options(data)
+            if options:
+                body["options"] = options
+            response_format = _format(data)
+            if response_format is not None:
+                body["format"] = response_format
+        prefix = {"chat": "chatcmpl", "generate": "cmpl", "embed": "embd"}[method]
+        return cls(
+            endpoint=endpoint.strip("/"),
+            method=method,
+            body=body,
+            model=data["model"],
+            stream=stream,
+            include_usage=bool((data.get("stream_options") or {}).get("include_usage")),
+            encoding_format=data.get("encoding_format") or "float",
+            id=f"{prefix}-{uuid.uuid4().hex[:24]}",
+        )
+
+    def response(self, output: Any) -> Tuple[Dict[str, Any], int]:
+        """The OpenAI response and HTTP status for the worker's output."""
+        error = _error_message(output)
+        if error is not None:
+            status, type = _error_status(output)
+            return openai_error(error, type), status
+        if not isinstance(output, Mapping):
+            return openai_error(f"Unexpected output from the worker: {output!r}"), 502
+        if self.method == "embed":
+            return {
+                "object": "list",
+                "data": [
+                    {
+                        "object": "embedding",
+                        "embedding": _embedding(values, self.encoding_format),
+                        "index": i,
+                    }
+                    for i, values in enumerate(output.get("embeddings") or [])
+                ],
+                "model": self.model,
+                "usage": _usage(output, completion=False),
+            }, 200
+        if self.method == "chat":
+            message = output.get("message") or {}
+            tool_calls = _tool_calls(message)
+            choice: Dict[str, Any] = {
+                "index": 0,
+                "message": {"role": "assistant", "content": message.get("content", "")},
+                "finish_reason": _finish_reason(output, bool(tool_calls)),
+            }
+            if tool_calls:
+                choice["message"]["tool_calls"] = tool_calls
+            return self._completion("chat.completion", choice, output), 200
+        choice = {
+            "text": output.get("response", ""),
+            "index": 0,
+            "logprobs": None,
+            "finish_reason": _finish_reason(output),
+        }
+        return self._completion("text_completion", choice, output), 200
+
+    def _completion(
+        self, object: str, choice: Dict[str, Any], output: Mapping[str, Any]
+    ) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "object": object,
+            "created": self.created,
+            "model": self.model,
+            "system_fingerprint": SYSTEM_FINGERPRINT,
+            "choices": [choice],
+            "usage": _usage(output),
+        }
+
+    def chunks(self, chunk: Any) -> List[Dict[str, Any]]:
+        """The OpenAI stream events for one native chunk."""
+        error = _error_message(chunk)
+        if error is not None or not isinstance(chunk, Mapping):
+            return [openai_error(error or f"Unexpected chunk from the worker: {chunk!r}")]
+        done = bool(chunk.get("done"))
+        if self.method == "chat":
+            message = chunk.get("message") or {}
+            delta: Dict[str, Any] = {"role": "assistant", "content": message.get("content", "")}
+            tool_calls = _tool_calls(message)
+            if tool_calls:
+                delta["tool_calls"] = [dict(call, index=i) for i, call in enumerate(tool_calls)]
+            choice: Dict[str, Any] = {
+                "index": 0,
+                "delta": delta,
+                "finish_reason": _finish_reason(chunk, bool(tool_calls)) if done else None,
+            }
+            object = "chat.completion.chunk"
+        else:
+            choice = {
+                "text": chunk.get("response", ""),
+                "index": 0,
+                "logprobs": None,
+                "finish_reason": _finish_reason(chunk) if done else None,
+            }
+            object = "text_completion"
+        events = [self._chunk(object, [choice])]
+        if done and self.include_usage:
+            events.append(dict(self._chunk(object, []), usage=_usage(chunk)))
+        return events
+
+    def _chunk(self, object: str, choices: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "object": object,
+            "created": self.created,
+            "model": self.model,
+            "system_fingerprint": SYSTEM_FINGERPRINT,
+            "choices": choices,
+        }
+
+    def encode(self, chunk: Any) -> bytes:
+        """The server-sent events for one native chunk."""
+        return b"".join(encode_chunk(self.endpoint, event) for event in self.chunks(chunk))
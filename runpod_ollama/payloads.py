@@ -0,0 +1,98 @@
+"""What workers leave out of job outputs, and embeddings sent as packed buffers.
+
+RunPod hands job outputs back through `/status` as JSON, where a vector of
+1024 floats takes about 20 kB. When the proxy asks for it, the worker sends
+the vectors of an `embed` response as one base64 buffer of little-endian
+float32 (or float16) values instead:
+
+    "embeddings": {"dtype": "float32", "shape": [2, 1024], "base64": "..."}
+
+which `unpack_embeddings` turns back into one NumPy array per vector, views of
+the decoded buffer rather than copies. Ollama computes `embed` vectors in
+float32, so float32 buffers lose nothing.
+
+Workers started with `WORKER_SLIM_OUTPUT=on` also leave out the bulky fields
+callers rarely read, Ollama's `context` and its raw durations, unless the job
+asks to `keep` them; `X-Keep-Fields: context,timings` does for proxy clients.
+"""
+
+import base64
+import importlib.util
+from dataclasses import dataclass
+from typing import Any, Dict, Mapping, Optional, Tuple
+from runpod_ollama import ENVIRONMENT
+from runpod_ollama.batching import BATCH_EMBED_METHOD
+
+# Keep in sync with `server/runpod_wrapper.py`.
+PACKED_DTYPES = {"float32": "<f4", "float16": "<f2"}
+
+KEEP_FIELDS = ("context", "timings")
+
+
+@dataclass(frozen=True)
+class OutputFormat:
+    """How a job's output should be shaped by the worker."""
+
+    keep: Tuple[str, ...] = ()
+    """Bulky fields to send even from a slim worker, see `KEEP_FIELDS`."""
+
+    embeddings: Optional[str] = None
+    """The dtype to pack `embed` vectors in, one of `PACKED_DTYPES`; None for JSON numbers."""
+
+    def job_input(self) -> Dict[str, Any]:
+        """The fields of the job input that ask for this format."""
+        job_input: Dict[str, Any] = {}
+        if self.keep:
+            job_input["keep"] = list(self.keep)
+        if self.embeddings is not None:
+            job_input["embeddings"] = self.embeddings
+        return job_input
+
+
+def embedding_dtype() -> Optional[str]:
+    """The dtype of `PROXY_EMBEDDING_DTYPE`, None when it is off or NumPy is missing."""
+    dtype = ENVIRONMENT.PROXY_EMBEDDING_DTYPE
+    if not dtype or dtype == "off":
+        return None
+    if dtype not in PACKED_DTYPES:
+        raise ValueError(
+            f"PROXY_EMBEDDING_DTYPE must be off or one of {', '.join(PACKED_DTYPES)}, "
+            f"got {dtype!r}"
+        )
+    return dtype if importlib.util.find_spec("numpy") is not None else None
+
+
+def output_format(
+    endpoint: str, data: Any, keep: Tuple[str, ...] = (), session: Optional[str] = None
+) -> Optional[OutputFormat]:
+    """The output format of a call to `endpoint`, None for the worker's default.
+
+    A `generate` turn of a session keeps its `context`, the next turn needs it.
+    """
+    if session is not None and endpoint == "generate" and "context" not in keep:
+        keep = keep + ("context",)
+    embeddings = embedding_dtype() if endpoint in ("embed", BATCH_EMBED_METHOD) else None
+    if not keep and embeddings is None:
+        return None
+    return OutputFormat(keep=keep, embeddings=embeddings)
+
+
+def _unpack(packed: Mapping[str, Any]) -> Any:
+    import numpy
+
+    buffer = base64.b64decode(packed["base64"])
+    # float16 vectors become float32 ones: the cast is the only copy.
+    matrix = numpy.frombuffer(buffer, dtype=PACKED_DTYPES[packed["dtype"]])
+    if packed["dtype"] != "float32":
+        matrix = matrix.astype(numpy.float32)
+    return list(matrix.reshape(packed["shape"]))
+
+
+def unpack_embeddings(output: Any) -> Any:
+    """`output` with the packed `embeddings` of its responses decoded, in place."""
+    if not isinstance(output, dict):
+        return output
+    for response in output.get("responses") or [output]:
+        if isinstance(response, dict) and isinstance(response.get("embeddings"), Mapping):
+            response["embeddings"] = _unpack(response["embeddings"])
+    return output
@@ -0,0 +1,466 @@
+"""Picks the GPU type and the scaling settings of a serverless endpoint.
+
+Every candidate endpoint, a GPU pool with `workersMin`, `workersMax`,
+`idleTimeout` and FlashBoot, is run through a discrete-event simulation of a
+traffic profile on a fake clock, so plans can be compared offline without
+creating anything on RunPod. The traffic is a JSONL trace, the counters of a
+proxy's `/metrics` turned into a Poisson process of the same rate, or a
+fixed rate.
+
+The model behind the simulation is deliberately simple and its constants
+are estimates, not measurements of RunPod:
+
+- Generation is bound by memory bandwidth: a worker produces about
+  `DECODE_EFFICIENCY * bandwidth / model size` tokens/s, and evaluates the
+  prompt `PREFILL_SPEEDUP` times faster. A worker runs one job at a time,
+  the worker's default `WORKER_CONCURRENCY`.
+- RunPod starts a worker for every queued request no starting worker will
+  take, up to `workersMax`. A cold start pulls and loads the model
+  (`ColdStart`); with FlashBoot, a worker started within
+  `flashboot_window` seconds of one stopping is restored instead.
+- `workersMin` workers are always running, billed at the active price.
+  Other workers are billed from their start until `idleTimeout` seconds
+  after their last job.
+
+Prices are the flex prices per second of RunPod's serverless GPU pools at
+the time of writing, `GPU_TYPES` can be replaced for other ones.
+"""
+
+import heapq
+import json
+import random
+from collections import deque
+from dataclasses import asdict, dataclass, replace
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+# Fraction of the memory bandwidth turned into generated tokens.
+DECODE_EFFICIENCY = 0.6
+
+# Prompt tokens are evaluated this many times faster than tokens are generated.
+PREFILL_SPEEDUP = 20.0
+
+# Weights take this much more memory once loaded, the KV cache included.
+VRAM_OVERHEAD = 1.2
+
+# Price of an always-on (`workersMin`) worker relative to a flex one.
+ACTIVE_PRICE_FACTOR = 0.7
+
+IDLE_TIMEOUTS = (5, 30, 60, 300)
+MAX_MIN_WORKERS = 2
+
+
+@dataclass(frozen=True)
+class GpuType:
+    id: str
+    """The pool id RunPod's `gpuIds` expects."""
+
+    description: str
+    vram_gb: float
+    bandwidth_gb_s: float
+    """Memory bandwidth of the slowest usual GPU of the pool."""
+
+    price_per_second: float
+    """Flex price in USD."""
+
+    def tokens_per_second(self, model_size_gb: float) -> float:
+        return DECODE_EFFICIENCY * self.bandwidth_gb_s / model_size_gb
+
+    def fits(self, model_size_gb: float) -> bool:
+        return model_size_gb * VRAM_OVERHEAD <= self.vram_gb
+
+
+GPU_TYPES = [
+    GpuType("AMPERE_16", "RTX A4000, A4500, RTX 4000 Ada", 16, 448, 0.00016),
+    GpuType("AMPERE_24", "RTX A5000, L4, RTX 3090", 24, 600, 0.00019),
+    GpuType("ADA_24", "RTX 4090", 24, 1008, 0.00031),
+    GpuType("AMPERE_48", "RTX A6000, A40", 48, 696, 0.00034),
+    GpuType("ADA_48_PRO", "L40, L40S, RTX 6000 Ada", 48, 864, 0.00053),
+    GpuType("AMPERE_80", "A100 80GB", 80, 1935, 0.00076),
+    GpuType("ADA_80_PRO", "H100 80GB", 80, 2000, 0.00116),
+]
+
+# The pool the CLI creates endpoints on without a plan.
+DEFAULT_GPU_ID = "AMPERE_16"
+
+
+@dataclass
+class ColdStart:
+    container_seconds: float = 10.0
+    """Scheduling the worker and starting its container and Ollama."""
+
+    pull_gb_per_second: float = 0.25
+    """0 when the model is baked into the image or on a network volume."""
+
+    load_gb_per_second: float = 2.0
+    flashboot_seconds: float = 2.0
+    flashboot_window: float = 600.0
+    measured_seconds: Optional[float] = None
+    """A cold start as the proxy's metrics saw it, replaces the estimate."""
+
+    def seconds(self, model_size_gb: float, flashboot: bool) -> float:
+        load = model_size_gb / self.load_gb_per_second
+        if flashboot:
+            return self.flashboot_seconds + load
+        if self.measured_seconds is not None:
+            return self.measured_seconds
+        pull = model_size_gb / self.pull_gb_per_second if self.pull_gb_per_second else 0.0
+        return self.container_seconds + pull + load
+
+
+@dataclass
+class Request:
+    at: float
+    """Seconds since the start of the traffic."""
+
+    prompt_tokens: int = 0
+    output_tokens: int = 256
+
+
+@dataclass
+class EndpointPlan:
+    gpu_id: str
+    workers_min: int
+    workers_max: int
+    idle_timeout: int
+    flashboot: bool = True
+
+
+@dataclass
+class PlanResult:
+    plan: EndpointPlan
+    requests: int
+    cost: float
+    """USD spent on the traffic."""
+
+    cost_per_hour: float
+    cost_per_million_tokens: float
+    wait_p50: float
+    wait_p95: float
+    """Seconds requests waited for a worker, cold starts included."""
+
+    latency_p95: float
+    tokens_per_second: float
+    """Generation speed of one request."""
+
+    cold_starts: int
+    meets_target: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(p * len(ordered)), len(ordered) - 1)]
+
+
+def load_trace(lines: Iterable[str], output_tokens: int = 256) -> List[Request]:
+    """Requests of a JSONL trace, one `{"timestamp": ...}` per line.
+
+    `timestamp` is in seconds, e.g. unix time. `prompt_eval_count` and
+    `eval_count`, the token counts Ollama reports, default to 0 and to
+    `output_tokens`.
+    """
+    requests = []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            requests.append(
+                Request(
+                    at=float(record["timestamp"]),
+                    prompt_tokens=int(record.get("prompt_eval_count") or 0),
+                    output_tokens=int(record.get("eval_count") or output_tokens),
+                )
+            )
+        except (ValueError, KeyError, TypeError):
+            raise ValueError(f"Line {number} of the trace is not a request with a timestamp")
+    if not requests:
+        raise ValueError("The trace has no requests")
+    start = min(r.at for r in requests)
+    return sorted((replace(r, at=r.at - start) for r in requests), key=lambda r: r.at)
+
+
+def poisson_traffic(
+    rate: float,
+    duration: float,
+    output_tokens: int = 256,
+    prompt_tokens: int = 0,
+    seed: int = 0,
+) -> List[Request]:
+    """`rate` requests per second arriving at random over `duration` seconds."""
+    rng = random.Random(seed)
+    requests = []
+    at = rng.expovariate(rate) if rate > 0 else duration
+    while at < duration:
+        requests.append(Request(at, prompt_tokens, output_tokens))
+        at += rng.expovariate(rate)
+    return requests
+
+
+def metric_sums(text: str, pod_id: Optional[str] = None) -> Dict[str, float]:
+    """Samples of a Prometheus text exposition, summed over their labels."""
+    sums: Dict[str, float] = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        name_and_labels, _, value = line.rpartition(" ")
+        name, _, labels = name_and_labels.partition("{")
+        if pod_id is not None and labels and f'pod_id="{pod_id}"' not in labels:
+            continue
+        if 'phase="' in labels and 'phase="total"' not in labels:
+            continue
+        try:
+            sums[name] = sums.get(name, 0.0) + float(value)
+        except ValueError:
+            continue
+    return sums
+
+
+@dataclass
+class MetricsProfile:
+    """The traffic a proxy's counters describe, averaged over `window` seconds."""
+
+    rate: float
+    prompt_tokens: int
+    output_tokens: int
+    cold_start_seconds: Optional[float] = None
+
+    @classmethod
+    def from_metrics(
+        cls, text: str, window: float, pod_id: Optional[str] = None
+    ) -> "MetricsProfile":
+        sums = metric_sums(text, pod_id)
+        requests = sums.get("runpod_request_seconds_count", 0.0)
+        if not requests:
+            raise ValueError("The metrics have no completed RunPod call")
+
+        def mean(name: str) -> float:
+            count = sums.get(f"{name}_count", 0.0)
+            return sums.get(f"{name}_sum", 0.0) / count if count else 0.0
+
+        tokens_per_second = mean("ollama_eval_tokens_per_second")
+        eval_seconds = mean("ollama_eval_seconds")
+        prompt_seconds = mean("ollama_prompt_eval_seconds")
+        cold_start = mean("runpod_cold_start_seconds")
+        return cls(
+            rate=requests / window,
+            output_tokens=round(eval_seconds * tokens_per_second) or 256,
+            prompt_tokens=round(prompt_seconds * tokens_per_second * PREFILL_SPEEDUP),
+            cold_start_seconds=cold_start or None,
+        )
+
+    def traffic(self, duration: float, seed: int = 0) -> List[Request]:
+        return poisson_traffic(
+            self.rate, duration, self.output_tokens, self.prompt_tokens, seed=seed
+        )
+
+
+@dataclass
+class _Worker:
+    started_at: float
+    always_on: bool
+    ready_at: float = 0.0
+    busy: bool = False
+    idle_since: float = 0.0
+    stopped_at: Optional[float] = None
+    idle_check: bool = False
+
+
+def simulate(
+    plan: EndpointPlan,
+    traffic: List[Request],
+    model_size_gb: float,
+    cold_start: Optional[ColdStart] = None,
+    gpu_types: Optional[List[GpuType]] = None,
+) -> PlanResult:
+    """Replays `traffic` on an endpoint set up like `plan`."""
+    gpu = {g.id: g for g in gpu_types or GPU_TYPES}[plan.gpu_id]
+    cold_start = cold_start or ColdStart()
+    decode = gpu.tokens_per_second(model_size_gb)
+    # Running workers, in the order they started; stopped ones move to `stopped`.
+    workers = [_Worker(0.0, True) for _ in range(plan.workers_min)]
+    stopped: List[_Worker] = []
+    starting = 0
+    last_stop: Optional[float] = None
+    cold_starts = 0
+    waiting: Deque[Request] = deque()
+    waits: List[float] = []
+    latencies: List[float] = []
+    # (time, sequence, kind, worker)
+    events: List[Tuple[float, int, str, _Worker]] = []
+    sequence = 0
+
+    def push(at: float, kind: str, worker: _Worker):
+        nonlocal sequence
+        sequence += 1
+        heapq.heappush(events, (at, sequence, kind, worker))
+
+    def dispatch(now: float):
+        for worker in workers:
+            if not waiting:
+                return
+            if not worker.busy and worker.ready_at <= now:
+                request = waiting.popleft()
+                service = request.prompt_tokens / (decode * PREFILL_SPEEDUP)
+                service += request.output_tokens / decode
+                worker.busy = True
+                waits.append(now - request.at)
+                latencies.append(now - request.at + service)
+                push(now + service, "done", worker)
+
+    def scale(now: float):
+        nonlocal starting, cold_starts
+        while len(waiting) > starting and len(workers) < plan.workers_max:
+            flashboot = (
+                plan.flashboot
+                and last_stop is not None
+                and now - last_stop <= cold_start.flashboot_window
+            )
+            boot = cold_start.seconds(model_size_gb, flashboot)
+            worker = _Worker(now, False, ready_at=now + boot, busy=True)
+            workers.append(worker)
+            starting += 1
+            cold_starts += 1
+            push(now + boot, "ready", worker)
+
+    def idle(now: float, worker: _Worker):
+        worker.busy = False
+        worker.idle_since = now
+        # One idle check per worker at a time, pushed back while it keeps working.
+        if not worker.always_on and not worker.idle_check:
+            worker.idle_check = True
+            push(now + plan.idle_timeout, "idle", worker)
+
+    arrivals = iter(traffic)
+    arrival = next(arrivals, None)
+    while events or arrival is not None:
+        # Arrivals are already sorted, only the other events go through the heap.
+        if arrival is not None and (not events or arrival.at <= events[0][0]):
+            now = arrival.at
+            waiting.append(arrival)
+            arrival = next(arrivals, None)
+        else:
+            now, _, kind, worker = heapq.heappop(events)
+            if kind == "ready":
+                starting -= 1
+                idle(now, worker)
+            elif kind == "done":
+                idle(now, worker)
+            elif kind == "idle":
+                worker.idle_check = False
+                if worker.busy:
+                    continue
+                if now < worker.idle_since + plan.idle_timeout:
+                    idle(worker.idle_since, worker)
+                    continue
+                worker.stopped_at = last_stop = now
+                workers.remove(worker)
+                stopped.append(worker)
+        dispatch(now)
+        scale(now)
+
+    workers += stopped
+    horizon = max([w.stopped_at or 0.0 for w in workers] + [r.at for r in traffic] + [1.0])
+    cost = 0.0
+    for worker in workers:
+        if worker.always_on:
+            cost += horizon * gpu.price_per_second * ACTIVE_PRICE_FACTOR
+        else:
+            cost += ((worker.stopped_at or horizon) - worker.started_at) * gpu.price_per_second
+    tokens = sum(r.output_tokens for r in traffic)
+    return PlanResult(
+        plan=plan,
+        requests=len(traffic),
+        cost=cost,
+        cost_per_hour=cost / horizon * 3600,
+        cost_per_million_tokens=cost / tokens * 1e6 if tokens else 0.0,
+        wait_p50=_percentile(waits, 0.5),
+        wait_p95=_percentile(waits, 0.95),
+        latency_p95=_percentile(latencies, 0.95),
+        tokens_per_second=decode,
+        cold_starts=cold_starts,
+    )
+
+
+def candidate_gpus(
+    model_size_gb: float,
+    target_tokens_per_second: float,
+    gpu_types: Optional[List[GpuType]] = None,
+) -> List[GpuType]:
+    """The GPU pools the model fits on and generates fast enough on."""
+    return [
+        gpu
+        for gpu in gpu_types or GPU_TYPES
+        if gpu.fits(model_size_gb)
+        and gpu.tokens_per_second(model_size_gb) >= target_tokens_per_second
+    ]
+
+
+def candidate_plans(gpus: List[GpuType], max_workers: int) -> List[EndpointPlan]:
+    # The idle timeout does not matter to endpoints without flex workers.
+    worker_counts = {n for n in (1, 2, 3, 4, 6, 8, 12, 16) if n < max_workers}
+    return [
+        EndpointPlan(gpu.id, workers_min, workers_max, idle_timeout, flashboot=True)
+        for gpu in gpus
+        for workers_max in sorted(worker_counts | {max_workers})
+        for workers_min in range(min(MAX_MIN_WORKERS, workers_max) + 1)
+        for idle_timeout in IDLE_TIMEOUTS
+        if workers_min < workers_max or idle_timeout == IDLE_TIMEOUTS[0]
+    ]
+
+
+def plan_endpoint(
+    traffic: List[Request],
+    model_size_gb: float,
+    target_tokens_per_second: float,
+    max_wait: float,
+    max_workers: int = 8,
+    cold_start: Optional[ColdStart] = None,
+    gpu_types: Optional[List[GpuType]] = None,
+) -> List[PlanResult]:
+    """Every candidate plan, best first.
+
+    Plans whose p95 wait is within `max_wait` seconds come first, cheapest
+    first, then the others by their p95 wait. An empty list means no GPU
+    pool can hold the model or reach `target_tokens_per_second`.
+    """
+    gpus = candidate_gpus(model_size_gb, target_tokens_per_second, gpu_types)
+    results = []
+    for plan in candidate_plans(gpus, max_workers):
+        result = simulate(plan, traffic, model_size_gb, cold_start, gpu_types)
+        result.meets_target = result.wait_p95 <= max_wait
+        results.append(result)
+    return sorted(
+        results,
+        key=lambda r: (
+            not r.meets_target,
+            r.cost if r.meets_target else r.wait_p95,
+            r.latency_p95,
+            # Between plans that behave the same, the smaller settings.
+            r.plan.workers_max,
+            r.plan.idle_timeout,
+        ),
+    )
+
+
+def without_flashboot(
+    result: PlanResult,
+    traffic: List[Request],
+    model_size_gb: float,
+    cold_start: Optional[ColdStart] = None,
+    gpu_types: Optional[List[GpuType]] = None,
+) -> PlanResult:
+    """`result`'s plan simulated again with FlashBoot off, to show what it saves."""
+    plan = replace(result.plan, flashboot=False)
+    return simulate(plan, traffic, model_size_gb, cold_start, gpu_types)
+
+
+def requests_per_second(traffic: List[Request]) -> float:
+    if len(traffic) < 2:
+        return 0.0
+    return len(traffic) / max(traffic[-1].at - traffic[0].at, 1e-9)
+
@@ -0,0 +1,214 @@
+"""Strategies for polling `/status/{id}` while a RunPod job runs.
+
+A `PollingStrategy` is shared by every job sent to a pod and may learn from
+finished jobs. Each job gets its own `Poller`, which asks the strategy how
+long to sleep before the next poll and enforces the deadline and poll budget.
+"""
+
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Mapping, Optional
+from runpod_ollama.exceptions import PollingTimeout
+
+Clock = Callable[[], float]
+
+
+class PollingStrategy:
+    """Decides how long to wait before each status poll.
+
+    `deadline` is in seconds from submission and `max_polls` caps the number
+    of `/status` calls; exceeding either raises `PollingTimeout`.
+    """
+
+    def __init__(
+        self,
+        deadline: Optional[float] = None,
+        max_polls: Optional[int] = None,
+    ):
+        self.deadline = deadline
+        self.max_polls = max_polls
+
+    def delay(self, key: str, poll: int, elapsed: float, out: Mapping[str, Any]) -> float:
+        """Seconds to sleep before poll number `poll` (starting at 1).
+
+        `elapsed` is the time since submission and `out` is the last status
+        RunPod returned for the job.
+        """
+        raise NotImplementedError
+
+    def observe(self, key: str, out: Mapping[str, Any]):
+        """Called with the final status of every job polled to completion."""
+
+    def start(self, key: str = "", clock: Clock = time.monotonic) -> "Poller":
+        return Poller(self, key=key, clock=clock)
+
+
+class Poller:
+    """Polling state of a single job."""
+
+    def __init__(self, strategy: PollingStrategy, key: str = "", clock: Clock = time.monotonic):
+        self.strategy = strategy
+        self.key = key
+        self.clock = clock
+        self.started_at = clock()
+        self.polls = 0
+
+    def elapsed(self) -> float:
+        return self.clock() - self.started_at
+
+    def next_delay(self, out: Mapping[str, Any]) -> float:
+        """Returns the sleep before the next poll, or raises `PollingTimeout`."""
+        strategy = self.strategy
+        job_id = out.get("id", "")
+        if strategy.max_polls is not None and self.polls >= strategy.max_polls:
+            raise PollingTimeout(
+                f"Job {job_id} not finished after {self.polls} status polls", job_id
+            )
+        self.polls += 1
+        elapsed = self.elapsed()
+        delay = strategy.delay(self.key, self.polls, elapsed, out)
+        if strategy.deadline is not None:
+            remaining = strategy.deadline - elapsed
+            if remaining <= 0:
+                raise PollingTimeout(
+                    f"Job {job_id} not finished within {strategy.deadline}s", job_id
+                )
+            delay = min(delay, remaining)
+        return max(delay, 0.0)
+
+    def finish(self, out: Mapping[str, Any]):
+        self.strategy.observe(self.key, out)
+
+
+class FixedInterval(PollingStrategy):
+    """Polls every `interval` seconds."""
+
+    def __init__(self, interval: float = 2, **kwargs):
+        super().__init__(**kwargs)
+        self.interval = interval
+
+    def delay(self, key: str, poll: int, elapsed: float, out: Mapping[str, Any]) -> float:
+        return self.interval
+
+
+class ExponentialBackoff(PollingStrategy):
+    """Starts with fast polls and backs off towards `max_interval`.
+
+    Every delay is randomized by +/- `jitter` (a fraction) so that jobs
+    submitted together do not poll in lockstep.
+    """
+
+    def __init__(
+        self,
+        initial_interval: float = 0.05,
+        multiplier: float = 1.6,
+        max_interval: float = 2.0,
+        jitter: float = 0.2,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.initial_interval = initial_interval
+        self.multiplier = multiplier
+        self.max_interval = max_interval
+        self.jitter = jitter
+
+    def _backoff(self, step: int) -> float:
+        return min(self.max_interval, self.initial_interval * self.multiplier ** (step - 1))
+
+    def _jittered(self, delay: float) -> float:
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def delay(self, key: str, poll: int, elapsed: float, out: Mapping[str, Any]) -> float:
+        return self._jittered(self._backoff(poll))
+
+
+class AdaptivePolling(ExponentialBackoff):
+    """Polling driven by how long the job has been queued or running.
+
+    The wait between polls grows with the age of the current phase (by
+    `growth`), so the latency a poll adds stays a bounded fraction of the
+    job's own duration: short jobs are polled several times a second, long
+    generations and cold starts only every few seconds, up to `max_interval`.
+    RunPod's `delayTime` tells when execution started, which restarts the
+    curve after a long queue or cold start instead of leaving it stuck at
+    `max_interval`. The `delayTime` and `executionTime` of finished jobs
+    with the same key feed running estimates of their `quantile`-th values;
+    no poll is sent before a job could plausibly have finished according to
+    them.
+    """
+
+    def __init__(
+        self,
+        growth: float = 0.3,
+        quantile: float = 0.1,
+        learning_rate: float = 0.05,
+        **kwargs,
+    ):
+        kwargs.setdefault("max_interval", 10.0)
+        super().__init__(**kwargs)
+        self.growth = growth
+        self.quantile = quantile
+        self.learning_rate = learning_rate
+        self._queue_times: Dict[str, float] = {}
+        self._execution_times: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def expected_queue_time(self, key: str) -> Optional[float]:
+        return self._queue_times.get(key)
+
+    def expected_execution_time(self, key: str) -> Optional[float]:
+        return self._execution_times.get(key)
+
+    def delay(self, key: str, poll: int, elapsed: float, out: Mapping[str, Any]) -> float:
+        status = out.get("status")
+        age = elapsed
+        shortest = None
+        if status == "IN_PROGRESS" and "delayTime" in out:
+            age = max(0.0, elapsed - out["delayTime"] / 1000)
+            shortest = self.expected_execution_time(key)
+        elif status == "IN_QUEUE" and key in self._execution_times:
+            shortest = self._queue_times.get(key, 0.0) + self._execution_times[key]
+        if shortest is not None and age < shortest:
+            # One-sided jitter, landing early would only waste a poll.
+            wait = (shortest - age) * random.uniform(1, 1 + self.jitter)
+            return min(wait, self.max_interval)
+        delay = min(self.max_interval, max(self.initial_interval, age * self.growth))
+        return self._jittered(delay)
+
+    def observe(self, key: str, out: Mapping[str, Any]):
+        if out.get("status") != "COMPLETED" or "executionTime" not in out:
+            return
+        with self._lock:
+            self._track(self._execution_times, key, out["executionTime"] / 1000)
+            self._track(self._queue_times, key, out.get("delayTime", 0) / 1000)
+
+    def _track(self, estimates: Dict[str, float], key: str, seconds: float):
+        estimate = estimates.get(key)
+        if estimate is None:
+            estimates[key] = seconds
+            return
+        # Stochastic quantile tracking: steps are proportional to the
+        # estimate so that it adapts equally fast to 50ms and 50s jobs.
+        step = self.learning_rate * max(estimate, self.initial_interval)
+        if seconds < estimate:
+            estimate -= step * (1 - self.quantile)
+        else:
+            estimate += step * self.quantile
+        estimates[key] = max(estimate, 0.0)
+
+
+_strategies: Dict[str, PollingStrategy] = {}
+_strategies_lock = threading.Lock()
+
+
+def get_polling_strategy(pod_id: str) -> PollingStrategy:
+    """Returns the process-wide default strategy of a pod.
+
+    Sharing it lets every repository for the pod learn from the same jobs.
+    """
+    with _strategies_lock:
+        strategy = _strategies.get(pod_id)
+        if strategy is None:
+            strategy = _strategies[pod_id] = AdaptivePolling()
+        return strategy
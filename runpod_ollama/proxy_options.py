@@ -0,0 +1,89 @@
+"""Per-request options of the local proxies, read from request headers."""
+
+import hashlib
+from dataclasses import dataclass
+from typing import Mapping, Optional, Tuple
+from runpod_ollama import ENVIRONMENT
+from runpod_ollama.admission import DEFAULT_PRIORITY, DEFAULT_TENANT, PRIORITIES
+from runpod_ollama.payloads import KEEP_FIELDS
+from runpod_ollama.runpod_repository import CALL_MODES
+
+MODE_HEADER = "X-Runpod-Mode"
+CACHE_CONTROL_HEADER = "Cache-Control"
+PRIORITY_HEADER = "X-Priority"
+TENANT_HEADER = "X-Tenant"
+AUTHORIZATION_HEADER = "Authorization"
+TIMEOUT_HEADER = "X-Request-Timeout"
+SESSION_HEADER = "X-Session-Id"
+KEEP_HEADER = "X-Keep-Fields"
+
+
+@dataclass
+class ProxyOptions:
+    mode: Optional[str] = None
+    """How the job is submitted, one of `CALL_MODES`; None uses the default."""
+
+    no_cache: bool = False
+    """`Cache-Control: no-cache`, skip cached responses but store the new one."""
+
+    no_store: bool = False
+    """`Cache-Control: no-store`, leave the response cache out entirely."""
+
+    priority: str = DEFAULT_PRIORITY
+    """`X-Priority`, one of `PRIORITIES`, see admission.py."""
+
+    tenant: str = DEFAULT_TENANT
+    """`X-Tenant`, else a digest of the caller's API key."""
+
+    timeout: Optional[float] = None
+    """`X-Request-Timeout`, seconds before the job is cancelled; None waits forever."""
+
+    session: Optional[str] = None
+    """`X-Session-Id`, the conversation the request continues, see sessions.py."""
+
+    keep: Tuple[str, ...] = ()
+    """`X-Keep-Fields`, bulky fields a slim worker should still send, see payloads.py."""
+
+    @classmethod
+    def from_headers(cls, headers: Mapping[str, str]) -> "ProxyOptions":
+        """Raises ValueError for header values the proxy does not understand."""
+        mode = headers.get(MODE_HEADER) or None
+        if mode is not None and mode not in CALL_MODES:
+            raise ValueError(
+                f"{MODE_HEADER} must be one of {', '.join(CALL_MODES)}, got {mode!r}"
+            )
+        priority = headers.get(PRIORITY_HEADER) or DEFAULT_PRIORITY
+        if priority not in PRIORITIES:
+            raise ValueError(
+                f"{PRIORITY_HEADER} must be one of {', '.join(PRIORITIES)}, got {priority!r}"
+            )
+        timeout = headers.get(TIMEOUT_HEADER) or ENVIRONMENT.PROXY_REQUEST_TIMEOUT
+        try:
+            seconds = float(timeout)
+        except ValueError:
+            raise ValueError(f"{TIMEOUT_HEADER} must be a number of seconds, got {timeout!r}")
+        tenant = headers.get(TENANT_HEADER)
+        if not tenant and headers.get(AUTHORIZATION_HEADER):
+            # Keys must not end up in stats or logs.
+            digest = hashlib.sha256(headers[AUTHORIZATION_HEADER].encode()).hexdigest()
+            tenant = f"key-{digest[:12]}"
+        keep = tuple(f.strip() for f in (headers.get(KEEP_HEADER) or "").split(",") if f.strip())
+        unknown = [field for field in keep if field not in KEEP_FIELDS]
+        if unknown:
+            raise ValueError(
+                f"{KEEP_HEADER} may only name {', '.join(KEEP_FIELDS)}, got {', '.join(unknown)}"
+            )
+        directives = {
+            d.strip().split("=", 1)[0].lower()
+            for d in (headers.get(CACHE_CONTROL_HEADER) or "").split(",")
+        }
+        return cls(
+            mode=mode,
+            no_cache="no-cache" in directives,
+            no_store="no-store" in directives,
+            priority=priority,
+            tenant=tenant or DEFAULT_TENANT,
+            timeout=seconds if seconds > 0 else None,
+            session=headers.get(SESSION_HEADER) or None,
+            keep=keep,
+        )
@@ -0,0 +1,233 @@
+"""A cache of proxy responses for deterministic requests.
+
+Requests with `temperature: 0` or a fixed `seed`, and embedding requests,
+always produce the same answer, so repeating them does not need another GPU
+job. Responses are keyed on the pod, the endpoint, the normalized JSON body
+and the output format the worker is asked for, and kept either in memory or
+in a sqlite file that survives restarts. Both backends expire entries after
+`ttl` seconds and evict the least recently used ones once `max_bytes` of
+responses are stored.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+from runpod_ollama import ENVIRONMENT, codec
+from runpod_ollama.batching import embedding_endpoint
+from runpod_ollama.payloads import OutputFormat
+from runpod_ollama.streaming import wants_stream
+
+CACHE_BACKENDS = ("memory", "sqlite")
+
+Clock = Callable[[], float]
+
+
+def _sampling_options(endpoint: str, body: Mapping[str, Any]) -> Mapping[str, Any]:
+    # Native endpoints nest sampling options, the OpenAI compatible ones don't.
+    if endpoint.startswith("v1/"):
+        return body
+    options = body.get("options")
+    return options if isinstance(options, Mapping) else {}
+
+
+def is_cacheable(endpoint: str, body: Any) -> bool:
+    """Whether the response to a request is the same every time it is sent."""
+    if not isinstance(body, Mapping) or wants_stream(body):
+        return False
+    if embedding_endpoint(endpoint) or endpoint.strip("/") == "v1/embeddings":
+        return True
+    options = _sampling_options(endpoint, body)
+    return options.get("temperature") == 0 or options.get("seed") is not None
+
+
+def cache_key(
+    pod_id: str, endpoint: str, body: Any, output: Optional[OutputFormat] = None
+) -> str:
+    """The key of a request, whose response also depends on the `output` it asks for."""
+    shape = output.job_input() if output is not None else {}
+    normalized = json.dumps(
+        [pod_id, endpoint.strip("/"), body, shape], sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def is_error_response(response: Any) -> bool:
+    """Worker errors are answered like responses but must not be cached."""
+    return isinstance(response, Mapping) and "error" in response
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    entries: int = 0
+    bytes: int = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class ResponseCache:
+    """Stores JSON responses by key, see `cache_key`."""
+
+    def __init__(self, max_bytes: int, ttl: float, clock: Clock = time.time):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            value = self._get(key, self.clock())
+            if value is None:
+                self.stats.misses += 1
+                return None
+            self.stats.hits += 1
+        return codec.loads(value)
+
+    def set(self, key: str, response: Any):
+        value = codec.dumps(response)
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            self._set(key, value, self.clock() + self.ttl)
+
+    def _get(self, key: str, now: float) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def _set(self, key: str, value: bytes, expires_at: float):
+        raise NotImplementedError
+
+
+class MemoryResponseCache(ResponseCache):
+    """An in-process LRU cache holding up to `max_bytes` of responses."""
+
+    def __init__(self, max_bytes: int, ttl: float, clock: Clock = time.time):
+        super().__init__(max_bytes, ttl, clock)
+        self._entries: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+
+    def _get(self, key: str, now: float) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= now:
+            self._remove(key)
+            self.stats.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set(self, key: str, value: bytes, expires_at: float):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, expires_at)
+        self.stats.entries += 1
+        self.stats.bytes += len(value)
+        while self.stats.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.stats.evictions += 1
+
+    def _remove(self, key: str):
+        value, _ = self._entries.pop(key)
+        self.stats.entries -= 1
+        self.stats.bytes -= len(value)
+
+
+class SqliteResponseCache(ResponseCache):
+    """An LRU cache kept in a sqlite file, so it survives proxy restarts."""
+
+    def __init__(self, path: str, max_bytes: int, ttl: float, clock: Clock = time.time):
+        super().__init__(max_bytes, ttl, clock)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL,"
+            " expires_at REAL NOT NULL, used_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+        self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (self.clock(),))
+        self._resync()
+
+    def _resync(self):
+        """Counts what the file holds, which other processes sharing it may change."""
+        entries, size = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM responses"
+        ).fetchone()
+        self.stats.entries, self.stats.bytes = entries, size
+
+    def _get(self, key: str, now: float) -> Optional[bytes]:
+        row = self._db.execute(
+            "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at <= now:
+            self._delete(key, len(value))
+            self.stats.expirations += 1
+            return None
+        self._db.execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+        return value
+
+    def _set(self, key: str, value: bytes, expires_at: float):
+        row = self._db.execute(
+            "SELECT LENGTH(value) FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None:
+            self._delete(key, row[0])
+        self._db.execute(
+            "INSERT INTO responses (key, value, expires_at, used_at) VALUES (?, ?, ?, ?)",
+            (key, value, expires_at, self.clock()),
+        )
+        self.stats.entries += 1
+        self.stats.bytes += len(value)
+        while self.stats.bytes > self.max_bytes:
+            oldest = self._db.execute(
+                "SELECT key, LENGTH(value) FROM responses ORDER BY used_at LIMIT 1"
+            ).fetchone()
+            if oldest is None:
+                # Emptied underneath us, the counts were off.
+                self._resync()
+                break
+            self._delete(*oldest)
+            self.stats.evictions += 1
+
+    def _delete(self, key: str, size: int):
+        self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+        self.stats.entries -= 1
+        self.stats.bytes -= size
+
+    def close(self):
+        self._db.close()
+
+
+def create_response_cache() -> Optional[ResponseCache]:
+    """The cache configured by `RESPONSE_CACHE`, or None when it is off."""
+    backend = ENVIRONMENT.RESPONSE_CACHE
+    if not backend or backend == "off":
+        return None
+    max_bytes = int(ENVIRONMENT.RESPONSE_CACHE_MAX_BYTES)
+    ttl = float(ENVIRONMENT.RESPONSE_CACHE_TTL)
+    if backend == "memory":
+        return MemoryResponseCache(max_bytes=max_bytes, ttl=ttl)
+    if backend == "sqlite":
+        return SqliteResponseCache(
+            os.path.expanduser(ENVIRONMENT.RESPONSE_CACHE_PATH), max_bytes=max_bytes, ttl=ttl
+        )
+    raise ValueError(
+        f"RESPONSE_CACHE must be off or one of {', '.join(CACHE_BACKENDS)}, got {backend!r}"
+    )
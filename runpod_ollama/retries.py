@@ -0,0 +1,107 @@
+"""Retries of RunPod API requests and deadlines of RunPod calls.
+
+A request that failed on the way (connection refused or reset, a timeout,
+a 429 or 5xx answer) is sent again after an exponential backoff with full
+jitter, at most `RUNPOD_RETRY_ATTEMPTS` times in total. Only requests that
+are safe to repeat are retried whatever happened:
+
+- `/status` and `/cancel` do not change anything the second time.
+- `/run`, `/runsync` and `/stream` are not idempotent: a lost answer to a
+  submission may have created a job, and one to a stream poll carried
+  chunks that will not be sent again. They are only retried when RunPod
+  cannot have processed them, i.e. the connection was never established or
+  the answer says the request was refused (`RESUBMIT_STATUSES`).
+
+A `Deadline` bounds a whole call, submission, retries and polling included.
+"""
+
+import math
+import random
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+from runpod_ollama.config import ENVIRONMENT
+from runpod_ollama.exceptions import DeadlineExceeded
+
+Clock = Callable[[], float]
+
+# Answers worth sending the request again for.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Answers of requests RunPod refused before doing anything.
+RESUBMIT_STATUSES = (429, 503)
+
+
+@dataclass
+class RetryPolicy:
+    attempts: int = 3
+    """Tries of a request in total, the first one included."""
+
+    backoff: float = 0.2
+    """Upper bound of the first delay, doubled on every retry."""
+
+    max_backoff: float = 5.0
+
+    def retries(self, attempt: int, safe: bool) -> bool:
+        """Whether a request that failed on try `attempt` (from 1) is sent again.
+
+        `safe` says whether the request can be repeated, see the module doc.
+        """
+        return safe and attempt < self.attempts
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to wait before try `attempt + 1`, at least the server's `Retry-After`."""
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_backoff))
+        return delay
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """The seconds of a `Retry-After` header, None for dates or garbage."""
+    try:
+        seconds = float(value) if value else None
+    except ValueError:
+        return None
+    return seconds if seconds is not None and math.isfinite(seconds) else None
+
+
+class Deadline:
+    """The time left for one call, none when `seconds` is None."""
+
+    def __init__(self, seconds: Optional[float] = None, clock: Clock = time.monotonic):
+        self.seconds = seconds
+        self.clock = clock
+        self.expires_at = None if seconds is None else clock() + seconds
+
+    def remaining(self) -> Optional[float]:
+        if self.expires_at is None:
+            return None
+        return self.expires_at - self.clock()
+
+    def check(self, job_id: str = ""):
+        """Raises DeadlineExceeded once the deadline has passed."""
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            job = f"Job {job_id}" if job_id else "The call"
+            raise DeadlineExceeded(f"{job} not finished within {self.seconds}s", job_id)
+
+    def cap(self, delay: float, job_id: str = "") -> float:
+        """`delay`, shortened so that a sleep ends by the deadline."""
+        self.check(job_id)
+        remaining = self.remaining()
+        return delay if remaining is None else min(delay, remaining)
+
+    def timeout(self, timeout: float) -> float:
+        """The timeout of one HTTP request, `timeout` or what is left if less."""
+        self.check()
+        remaining = self.remaining()
+        return timeout if remaining is None else min(timeout, remaining)
+
+
+def create_retry_policy() -> RetryPolicy:
+    """The policy configured by `RUNPOD_RETRY_ATTEMPTS` and `RUNPOD_RETRY_BACKOFF`."""
+    return RetryPolicy(
+        attempts=max(int(ENVIRONMENT.RUNPOD_RETRY_ATTEMPTS), 1),
+        backoff=float(ENVIRONMENT.RUNPOD_RETRY_BACKOFF),
+    )
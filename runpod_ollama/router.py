@@ -0,0 +1,225 @@
+"""Routing of model aliases to a pool of RunPod endpoints.
+
+`RUNPOD_ROUTES` maps a logical name to several endpoint ids, e.g. the same
+model deployed in different regions or on different GPUs:
+
+    RUNPOD_ROUTES='{"llama3": ["abc123", "def456"]}'
+
+A request to `/<name>/<endpoint>` then goes to the endpoint of the pool that
+should answer first: its queued and running jobs, as reported by RunPod's
+`/health` and corrected by the jobs this proxy has sent or finished since,
+are weighed against its workers and the execution time of its recent jobs,
+so a slow endpoint with an idle worker does not win over a fast one that is
+about to free up. Endpoints whose calls keep failing are ejected for a
+while. Paths using an endpoint id directly are forwarded as before.
+
+The `Router` only keeps the state; fetching `/health` is left to the
+proxies, which know whether they run on threads or on an event loop.
+"""
+
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Mapping, Optional
+from runpod_ollama import ENVIRONMENT
+
+Clock = Callable[[], float]
+
+
+def load_routes(value: str) -> Dict[str, List[str]]:
+    """Parses `RUNPOD_ROUTES`, a JSON object or the path to a JSON file."""
+    if not value.strip():
+        return {}
+    if value.lstrip().startswith("{"):
+        routes = json.loads(value)
+    else:
+        with open(value) as f:
+            routes = json.load(f)
+    return {alias: list(endpoint_ids) for alias, endpoint_ids in routes.items()}
+
+
+@dataclass
+class EndpointHealth:
+    in_queue: int = 0
+    in_progress: int = 0
+    idle_workers: int = 0
+    running_workers: int = 0
+
+    @classmethod
+    def from_response(cls, out: Mapping[str, Any]) -> "EndpointHealth":
+        jobs = out.get("jobs") or {}
+        workers = out.get("workers") or {}
+        return cls(
+            in_queue=jobs.get("inQueue", 0),
+            in_progress=jobs.get("inProgress", 0),
+            idle_workers=workers.get("idle", 0),
+            running_workers=workers.get("running", 0),
+        )
+
+
+@dataclass
+class EndpointState:
+    endpoint_id: str
+    health: Optional[EndpointHealth] = None
+    health_at: Optional[float] = None
+    refreshing: bool = False
+    in_flight: int = 0
+    """Calls this proxy has sent to the endpoint and not finished yet."""
+
+    in_flight_at_health: int = 0
+    failures: int = 0
+    """Consecutive failed calls or health checks."""
+
+    ejected_until: float = 0.0
+    execution_time: Optional[float] = None
+    """Moving average of the `executionTime` of recent jobs, in seconds."""
+
+    def expected_latency(self, default_execution_time: float) -> float:
+        """Estimated time until a job sent now would be finished."""
+        execution_time = self.execution_time or default_execution_time
+        jobs = self.in_flight - self.in_flight_at_health
+        workers = 1
+        if self.health is not None:
+            jobs += self.health.in_queue + self.health.in_progress
+            workers = max(self.health.idle_workers + self.health.running_workers, 1)
+        waiting = max(jobs + 1 - workers, 0)
+        return execution_time * (1 + waiting / workers)
+
+
+class Router:
+    """Picks an endpoint of a pool for every routed call."""
+
+    def __init__(
+        self,
+        routes: Mapping[str, List[str]],
+        health_ttl: float = 2.0,
+        max_failures: int = 3,
+        ejection_time: float = 30.0,
+        smoothing: float = 0.2,
+        clock: Clock = time.monotonic,
+    ):
+        self.routes = {alias: list(ids) for alias, ids in routes.items()}
+        self.health_ttl = health_ttl
+        self.max_failures = max_failures
+        self.ejection_time = ejection_time
+        self.smoothing = smoothing
+        self.clock = clock
+        self.endpoints: Dict[str, EndpointState] = {
+            endpoint_id: EndpointState(endpoint_id)
+            for ids in self.routes.values()
+            for endpoint_id in ids
+        }
+        self._lock = threading.Lock()
+
+    def pool(self, pod_id: str) -> Optional[List[str]]:
+        """The endpoint ids behind `pod_id`, or None if it is not an alias."""
+        return self.routes.get(pod_id)
+
+    def claim_stale(self, alias: str) -> List[str]:
+        """Endpoints of the pool whose health should be fetched now.
+
+        Claimed endpoints are not returned again until `update_health` or
+        `health_failed` is called for them, so concurrent requests do not
+        fetch the same health twice.
+        """
+        now = self.clock()
+        stale = []
+        with self._lock:
+            for endpoint_id in self.routes[alias]:
+                state = self.endpoints[endpoint_id]
+                fresh = state.health_at is not None and now - state.health_at < self.health_ttl
+                if not fresh and not state.refreshing and state.ejected_until <= now:
+                    state.refreshing = True
+                    stale.append(endpoint_id)
+        return stale
+
+    def update_health(self, endpoint_id: str, out: Mapping[str, Any]):
+        with self._lock:
+            state = self.endpoints[endpoint_id]
+            state.health = EndpointHealth.from_response(out)
+            state.health_at = self.clock()
+            state.in_flight_at_health = state.in_flight
+            state.refreshing = False
+
+    def health_failed(self, endpoint_id: str):
+        with self._lock:
+            state = self.endpoints[endpoint_id]
+            state.health_at = self.clock()
+            state.refreshing = False
+            self._failed(state)
+
+    def pick(self, alias: str, prefer: Optional[str] = None) -> str:
+        """The endpoint to send the next call to, counted as in flight.
+
+        `prefer` is picked whenever it is in the pool and healthy, e.g. the
+        endpoint that served the previous turns of a conversation. Every
+        `pick` must be followed by a `done` for the same endpoint.
+        """
+        now = self.clock()
+        with self._lock:
+            states = [self.endpoints[i] for i in self.routes[alias]]
+            # Endpoints that just failed are only used when nothing else is left.
+            available = (
+                [s for s in states if s.ejected_until <= now and s.failures == 0]
+                or [s for s in states if s.ejected_until <= now]
+                or states
+            )
+            preferred = [s for s in available if s.endpoint_id == prefer and s.failures == 0]
+            if preferred:
+                preferred[0].in_flight += 1
+                return preferred[0].endpoint_id
+            known = [s.execution_time for s in states if s.execution_time]
+            default = sum(known) / len(known) if known else 1.0
+            latencies = [s.expected_latency(default) for s in available]
+            best = min(latencies)
+            state = random.choice(
+                [s for s, latency in zip(available, latencies) if latency == best]
+            )
+            state.in_flight += 1
+            return state.endpoint_id
+
+    def done(
+        self, endpoint_id: str, ok: Optional[bool], execution_time: Optional[float] = None
+    ):
+        """Reports how a call picked for `endpoint_id` ended.
+
+        `ok` is None for calls that say nothing about the endpoint, e.g. ones
+        the client gave up on or the worker refused, which only free the slot.
+        """
+        with self._lock:
+            state = self.endpoints[endpoint_id]
+            state.in_flight -= 1
+            if ok is None:
+                return
+            if not ok:
+                self._failed(state)
+                return
+            state.failures = 0
+            if execution_time is not None:
+                if state.execution_time is None:
+                    state.execution_time = execution_time
+                else:
+                    state.execution_time += self.smoothing * (
+                        execution_time - state.execution_time
+                    )
+
+    def _failed(self, state: EndpointState):
+        state.failures += 1
+        if state.failures >= self.max_failures:
+            state.ejected_until = self.clock() + self.ejection_time
+            state.failures = 0
+
+
+def create_router() -> Optional[Router]:
+    """The router configured by `RUNPOD_ROUTES`, or None without routes."""
+    routes = load_routes(ENVIRONMENT.RUNPOD_ROUTES)
+    if not routes:
+        return None
+    return Router(
+        routes,
+        health_ttl=float(ENVIRONMENT.RUNPOD_ROUTER_HEALTH_TTL),
+        max_failures=int(ENVIRONMENT.RUNPOD_ROUTER_MAX_FAILURES),
+        ejection_time=float(ENVIRONMENT.RUNPOD_ROUTER_EJECTION_SECONDS),
+    )
@@ -1,64 +1,457 @@
+import threading
 import time
-from typing import Mapping, Optional, Any
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Mapping, Optional, Any
 import requests
+import urllib3
+from runpod_ollama import codec
+from runpod_ollama.config import ENVIRONMENT
+from runpod_ollama.exceptions import JobFailed, PollingTimeout, RunpodError
+from runpod_ollama.http_pool import get_session_pool
+from runpod_ollama.metrics import CallMetrics
+from runpod_ollama.payloads import OutputFormat, unpack_embeddings
+from runpod_ollama.polling import (
+    ExponentialBackoff,
+    FixedInterval,
+    PollingStrategy,
+    get_polling_strategy,
+)
+from runpod_ollama.retries import (
+    RESUBMIT_STATUSES,
+    RETRY_STATUSES,
+    Deadline,
+    RetryPolicy,
+    create_retry_policy,
+    parse_retry_after,
+)
 
 
-class RunpodRepository:
-    def __init__(self, api_key: str, pod_id: str):
+CALL_MODES = ("run", "runsync")
+
+# Statuses of a job that has not finished yet.
+PENDING_STATUSES = ("IN_QUEUE", "IN_PROGRESS")
+
+# Statuses of a job that finished without an output.
+FAILED_STATUSES = ("FAILED", "CANCELLED", "TIMED_OUT")
+
+# `/stream` is polled quickly while chunks keep coming and backs off when
+# the job is queued or between bursts.
+STREAM_POLLING = ExponentialBackoff(initial_interval=0.05, max_interval=1.0)
+
+
+@dataclass
+class RunningJob:
+    """The job of one `call_endpoint` or `stream_endpoint` call."""
+
+    id: Optional[str] = None
+    out: Mapping[str, Any] = field(default_factory=dict)
+    """The last status RunPod returned for it."""
+
+    @property
+    def pending(self) -> bool:
+        """Whether the job was submitted and may still be queued or running."""
+        return self.id is not None and self.out.get("status") in PENDING_STATUSES
+
+
+class BaseRunpodRepository:
+    """Request building shared by the sync and async repositories.
+
+    A repository may be shared by concurrent calls: the ids of the jobs they
+    wait for are kept in `active_jobs`, and `cancel_requests` cancels them all.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        pod_id: str,
+        base_url: Optional[str] = None,
+        polling: Optional[PollingStrategy] = None,
+        runsync_wait_ms: Optional[int] = None,
+        retry: Optional[RetryPolicy] = None,
+        http_timeout: Optional[float] = None,
+    ):
         self.api_key = api_key
         self.pod_id = pod_id
-        self.active_request_id: Optional[str] = None
+        self.base_url = base_url or ENVIRONMENT.RUNPOD_ENDPOINT_BASE_URL
+        self.polling = polling or get_polling_strategy(pod_id)
+        self.runsync_wait_ms = runsync_wait_ms or int(ENVIRONMENT.RUNPOD_RUNSYNC_WAIT_MS)
+        self.retry = retry or create_retry_policy()
+        self.http_timeout = http_timeout or float(ENVIRONMENT.RUNPOD_HTTP_TIMEOUT)
+        self.active_jobs: Dict[str, None] = {}
+        """Ids of the jobs calls are waiting for, oldest first."""
+        self._active_jobs_lock = threading.Lock()
+        self.last_status: Optional[Mapping[str, Any]] = None
+        """The final status of the last job `call_endpoint` waited for."""
+        self.last_call: Optional[CallMetrics] = None
 
-    def call_endpoint(
+    @property
+    def active_request_id(self) -> Optional[str]:
+        """The job of the most recent call still running, if any."""
+        with self._active_jobs_lock:
+            return next(reversed(list(self.active_jobs)), None)
+
+    def _track(self, job: RunningJob, out: Mapping[str, Any]):
+        job.id, job.out = out["id"], out
+        with self._active_jobs_lock:
+            self.active_jobs[out["id"]] = None
+
+    def _untrack(self, job: RunningJob):
+        with self._active_jobs_lock:
+            self.active_jobs.pop(job.id or "", None)
+
+    def _active_job_ids(self) -> List[str]:
+        with self._active_jobs_lock:
+            return list(self.active_jobs)
+
+    def _job_failed(self, out: Mapping[str, Any]) -> JobFailed:
+        """The error of a job that ended in one of `FAILED_STATUSES`."""
+        message = f"Job {out.get('id')} on {self.pod_id} ended {out['status']}"
+        if out.get("error"):
+            message += f": {out['error']}"
+        return JobFailed(message, result=out)
+
+    def _polling(self, sleep_interval: Optional[float]) -> PollingStrategy:
+        if sleep_interval is not None:
+            return FixedInterval(sleep_interval)
+        return self.polling
+
+    def _submit_url(self, mode: Optional[str]) -> str:
+        """The url that creates the job for `mode`, see `CALL_MODES`.
+
+        `/runsync` answers with the output when the job finishes within the
+        wait window, and with the same queued/in-progress status as `/run`
+        otherwise, so both are followed by the same polling loop.
+        """
+        mode = mode or ENVIRONMENT.RUNPOD_CALL_MODE
+        if mode == "run":
+            return f"{self._request_base_url()}/run"
+        if mode == "runsync":
+            return f"{self._request_base_url()}/runsync?wait={self.runsync_wait_ms}"
+        raise ValueError(f"Unknown call mode {mode!r}, expected one of {CALL_MODES}")
+
+    def _submit_timeout(self, mode: Optional[str]) -> float:
+        """The HTTP timeout of a submission, which `/runsync` holds up to its wait window."""
+        if (mode or ENVIRONMENT.RUNPOD_CALL_MODE) == "runsync":
+            return self.http_timeout + self.runsync_wait_ms / 1000
+        return self.http_timeout
+
+    def _job_output(self, out: Mapping[str, Any]) -> Any:
+        """The output of a completed job.
+
+        The worker's handler is a generator whose yields RunPod aggregates
+        into a list; a non-streamed response is the only item of that list.
+        """
+        output = out.get("output")
+        if isinstance(output, list) and len(output) == 1:
+            return output[0]
+        return output
+
+    def execution_time(self) -> Optional[float]:
+        """Seconds the last job ran on a worker, if RunPod reported it."""
+        if self.last_status is None or "executionTime" not in self.last_status:
+            return None
+        return self.last_status["executionTime"] / 1000
+
+    def _job_input(
         self,
         endpoint: str,
         input: Any,
-        sleep_interval: int = 2,
+        session_id: Optional[str] = None,
+        output: Optional[OutputFormat] = None,
     ) -> Mapping[str, Any]:
-        headers = self._request_headers()
-        input = {
+        job_input: Dict[str, Any] = {
             "method_name": endpoint,
             "input": input,
         }
+        if session_id is not None:
+            # Lets the worker find what it kept of the conversation, see sessions.py.
+            job_input["session"] = session_id
+        if output is not None:
+            job_input.update(output.job_input())
+        return {"input": job_input}
 
-        # TODO: Handle network errors
-        response = requests.post(
-            f"{self._request_base_url()}/run",
-            headers=headers,
-            json={"input": input},
+    def _request_base_url(self) -> str:
+        return f"{self.base_url.rstrip('/')}/{self.pod_id}"
+
+    def _request_headers(self) -> Mapping[str, str]:
+        return {
+            "accept": "application/json",
+            "content-type": "application/json",
+            "authorization": self.api_key,
+        }
+
+
+class RunpodRepository(BaseRunpodRepository):
+    def __init__(
+        self,
+        api_key: str,
+        pod_id: str,
+        base_url: Optional[str] = None,
+        session: Optional[requests.Session] = None,
+        polling: Optional[PollingStrategy] = None,
+        runsync_wait_ms: Optional[int] = None,
+        retry: Optional[RetryPolicy] = None,
+        http_timeout: Optional[float] = None,
+    ):
+        super().__init__(
+            api_key=api_key,
+            pod_id=pod_id,
+            base_url=base_url,
+            polling=polling,
+            runsync_wait_ms=runsync_wait_ms,
+            retry=retry,
+            http_timeout=http_timeout,
         )
-        response.raise_for_status()
-        out = response.json()
-        self.active_request_id = out["id"]
+        self.session = session or get_session_pool().session(pod_id)
 
-        while out["status"] != "COMPLETED":
-            out = requests.get(
-                f"{self._request_base_url()}/status/{self.active_request_id}",
-                headers=headers,
-            ).json()
-            time.sleep(sleep_interval)
+    def call_endpoint(
+        self,
+        endpoint: str,
+        input: Any,
+        sleep_interval: Optional[float] = None,
+        mode: Optional[str] = None,
+        timeout: Optional[float] = None,
+        session_id: Optional[str] = None,
+        output: Optional[OutputFormat] = None,
+    ) -> Mapping[str, Any]:
+        """Runs `endpoint` on the worker and waits for its output.
 
-        return out["output"]
+        `mode` is one of `CALL_MODES` and defaults to
+        `ENVIRONMENT.RUNPOD_CALL_MODE`. Status polls are spaced by the
+        repository's polling strategy, or every `sleep_interval` seconds when
+        it is given. Raises `JobFailed` when the job ends without an output
+        and `DeadlineExceeded` after `timeout` seconds, after cancelling it.
+        `session_id` names the conversation the call continues, see sessions.py,
+        and `output` what the worker leaves out or packs, see payloads.py.
+        """
+        poller = self._polling(sleep_interval).start(endpoint)
+        metrics = self.last_call = CallMetrics(self.pod_id, endpoint, input)
+        deadline = Deadline(timeout)
 
-    def pull_model(self, model_name: str):
-        return self.call_endpoint("pull", {"name": model_name})
+        with self._running(metrics) as job:
+            out = self.submit(
+                endpoint,
+                input,
+                mode=mode,
+                metrics=metrics,
+                deadline=deadline,
+                session_id=session_id,
+                output=output,
+            )
+            metrics.submitted()
+            self._track(job, out)
+
+            while out["status"] != "COMPLETED":
+                if out["status"] in FAILED_STATUSES:
+                    raise self._job_failed(out)
+                time.sleep(deadline.cap(poller.next_delay(out), job.id))
+                metrics.polled()
+                out = job.out = self.status(job.id, metrics=metrics, deadline=deadline)
+        poller.finish(out)
+        metrics.completed(out)
+        self.last_status = out
+
+        return unpack_embeddings(metrics.worker_output(self._job_output(out)))
 
-    def cancel_requests(self):
-        if not self.active_request_id:
-            return
-        headers = self._request_headers()
+    def stream_endpoint(
+        self,
+        endpoint: str,
+        input: Any,
+        timeout: Optional[float] = None,
+        session_id: Optional[str] = None,
+        output: Optional[OutputFormat] = None,
+    ) -> Iterator[Any]:
+        """Runs `endpoint` on the worker and yields its chunks as they arrive.
 
-        return requests.post(
-            f"{self._request_base_url()}/cancel/{self.active_request_id}",
-            headers=headers,
+        `input` should ask Ollama to stream; the chunks are read from
+        RunPod's `/stream` while the job runs. Closing the iterator early
+        cancels the job.
+        """
+        metrics = self.last_call = CallMetrics(self.pod_id, endpoint, input)
+        deadline = Deadline(timeout)
+        with self._running(metrics) as job:
+            out = self.submit(
+                endpoint,
+                input,
+                mode="run",
+                metrics=metrics,
+                deadline=deadline,
+                session_id=session_id,
+                output=output,
+            )
+            metrics.submitted()
+            self._track(job, out)
+
+            poller = STREAM_POLLING.start(endpoint)
+            while out["status"] in PENDING_STATUSES:
+                time.sleep(deadline.cap(poller.next_delay(out), job.id))
+                metrics.polled()
+                out = job.out = self.stream(job.id, metrics=metrics, deadline=deadline)
+                chunks = out.get("stream") or []
+                for chunk in chunks:
+                    yield metrics.worker_output(chunk["output"])
+                if chunks:
+                    poller = STREAM_POLLING.start(endpoint)
+            if out["status"] in FAILED_STATUSES:
+                raise self._job_failed(out)
+        metrics.completed()
+
+    @contextmanager
+    def _running(self, metrics: CallMetrics) -> Iterator[RunningJob]:
+        """Tracks the job of a call, records how the call failed, and
+        cancels the job when the call gives up on it."""
+        job = RunningJob()
+        try:
+            yield job
+        except JobFailed:
+            metrics.failed("worker")
+            raise
+        except BaseException as e:
+            if isinstance(e, PollingTimeout):
+                metrics.failed("timeout")
+            elif isinstance(e, requests.RequestException):
+                metrics.failed("http")
+            if job.pending:
+                self._abandon(job.id)
+            raise
+        finally:
+            self._untrack(job)
+
+    def _abandon(self, job_id: str):
+        """Cancels a job nobody waits for anymore, as far as RunPod can be reached."""
+        try:
+            self.cancel(job_id, deadline=Deadline(self.http_timeout))
+        except (requests.RequestException, RunpodError):
+            pass
+
+    def _request(
+        self,
+        method: str,
+        url: str,
+        idempotent: bool,
+        metrics: Optional[CallMetrics] = None,
+        deadline: Optional[Deadline] = None,
+        json: Any = None,
+        check: bool = False,
+        http_timeout: Optional[float] = None,
+    ) -> Mapping[str, Any]:
+        """Sends an API request and returns its JSON answer, see retries.py.
+
+        Raises the last error once the request may not be retried anymore,
+        any error status when `check` is set.
+        """
+        deadline = deadline or Deadline()
+        attempt = 0
+        while True:
+            attempt += 1
+            retry_after = None
+            timeout = deadline.timeout(http_timeout or self.http_timeout)
+            try:
+                response = self.session.request(
+                    method,
+                    url,
+                    headers=self._request_headers(),
+                    data=codec.dumps(json) if json is not None else None,
+                    timeout=timeout,
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not self.retry.retries(attempt, idempotent or _unsent(e)):
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    if check:
+                        response.raise_for_status()
+                    return codec.loads(response.content)
+                if not self.retry.retries(
+                    attempt, idempotent or response.status_code in RESUBMIT_STATUSES
+                ):
+                    response.raise_for_status()
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if metrics is not None:
+                metrics.retried()
+            time.sleep(deadline.cap(self.retry.delay(attempt, retry_after)))
+
+    def submit(
+        self,
+        endpoint: str,
+        input: Any,
+        mode: Optional[str] = None,
+        metrics: Optional[CallMetrics] = None,
+        deadline: Optional[Deadline] = None,
+        session_id: Optional[str] = None,
+        output: Optional[OutputFormat] = None,
+    ) -> Mapping[str, Any]:
+        """Creates a job without waiting for it, returns its first status."""
+        return self._request(
+            "POST",
+            self._submit_url(mode),
+            idempotent=False,
+            metrics=metrics,
+            deadline=deadline,
+            json=self._job_input(endpoint, input, session_id, output),
+            check=True,
+            http_timeout=self._submit_timeout(mode),
         )
 
-    def _request_base_url(self) -> str:
-        return f"https://api.runpod.ai/v2/{self.pod_id}"
+    def status(
+        self,
+        job_id: str,
+        metrics: Optional[CallMetrics] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> Mapping[str, Any]:
+        return self._request(
+            "GET",
+            f"{self._request_base_url()}/status/{job_id}",
+            idempotent=True,
+            metrics=metrics,
+            deadline=deadline,
+        )
 
-    def _request_headers(self) -> Mapping[str, str]:
-        return {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "authorization": self.api_key,
-        }
+    def stream(
+        self,
+        job_id: str,
+        metrics: Optional[CallMetrics] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> Mapping[str, Any]:
+        """The job's status with the chunks streamed since the last call."""
+        return self._request(
+            "GET",
+            f"{self._request_base_url()}/stream/{job_id}",
+            idempotent=False,
+            metrics=metrics,
+            deadline=deadline,
+        )
+
+    def cancel(self, job_id: str, deadline: Optional[Deadline] = None) -> Mapping[str, Any]:
+        return self._request(
+            "POST",
+            f"{self._request_base_url()}/cancel/{job_id}",
+            idempotent=True,
+            deadline=deadline,
+        )
+
+    def health(self) -> Mapping[str, Any]:
+        """Job and worker counts of the endpoint, from RunPod's `/health`."""
+        response = self.session.get(
+            f"{self._request_base_url()}/health",
+            headers=self._request_headers(),
+            timeout=self.http_timeout,
+        )
+        response.raise_for_status()
+        return codec.loads(response.content)
+
+    def pull_model(self, model_name: str):
+        return self.call_endpoint("pull", {"name": model_name})
+
+    def cancel_requests(self) -> List[Mapping[str, Any]]:
+        """Cancels the jobs of every call in progress."""
+        return [self.cancel(job_id) for job_id in self._active_job_ids()]
+
+
+def _unsent(error: requests.RequestException) -> bool:
+    """Whether the request failed before it could reach RunPod."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, urllib3.exceptions.NewConnectionError)
@@ -0,0 +1,161 @@
+"""Conversations kept together across turns, named by the `X-Session-Id` header.
+
+Chat clients send the whole history on every turn, and Ollama only
+evaluates what follows the part of the prompt still in its KV cache. That
+cache lives on one worker, and RunPod gives a job to whichever worker of the
+endpoint is free: the proxy cannot pick a worker, only an endpoint. For the
+turns of a session, the proxies
+
+- pick the endpoint of the previous turn when `pod_id` is a `RUNPOD_ROUTES`
+  alias, as long as it is healthy;
+- give a `generate` turn without a `context` the `context` Ollama returned
+  for the previous one of the same model;
+- send a digest of the session id with the job, so the worker can find what
+  it kept of the conversation (`SessionStore` in `server/runpod_wrapper.py`).
+  The worker reports how many prompt tokens it did not evaluate again,
+  exported as `ollama_prompt_tokens_reused_total`.
+
+Sessions unused for `PROXY_SESSION_TTL` seconds are forgotten, and the least
+recently used ones beyond `PROXY_SESSION_MAX`.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Mapping, Optional
+from runpod_ollama.config import ENVIRONMENT
+
+
+def session_digest(session_id: Optional[str]) -> Optional[str]:
+    """What the worker gets instead of the session id, which may be personal."""
+    if session_id is None:
+        return None
+    return hashlib.sha256(session_id.encode()).hexdigest()[:32]
+
+
+@dataclass
+class Session:
+    endpoint_id: Optional[str] = None
+    """The endpoint the last turn ran on."""
+
+    contexts: Dict[Optional[str], List[int]] = field(default_factory=dict)
+    """Ollama's `context` of the last `generate` turn, per model."""
+
+    turns: int = 0
+    last_used: float = 0.0
+
+
+@dataclass
+class SessionStats:
+    turns: int = 0
+    pinned: int = 0
+    """Turns sent to the endpoint of the previous turn."""
+
+    contexts_given: int = 0
+    """`generate` turns given the `context` of the previous one."""
+
+    worker_hits: int = 0
+    """Turns whose worker still had the previous turn."""
+
+    reused_tokens: int = 0
+    """Prompt tokens the workers did not evaluate again."""
+
+    expired: int = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class Sessions:
+    """The sessions of one proxy, least recently used first."""
+
+    def __init__(
+        self,
+        max_sessions: int = 10000,
+        ttl: float = 1800,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.clock = clock
+        self.stats = SessionStats()
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_used <= self.ttl and len(self._sessions) <= self.max_sessions:
+                return
+            del self._sessions[session_id]
+            self.stats.expired += 1
+
+    def _get(self, session_id: str) -> Session:
+        now = self.clock()
+        self._expire(now)
+        session = self._sessions.pop(session_id, None) or Session()
+        session.last_used = now
+        self._sessions[session_id] = session
+        return session
+
+    def endpoint(self, session_id: Optional[str]) -> Optional[str]:
+        """The endpoint the previous turn of the session ran on."""
+        if session_id is None:
+            return None
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session.endpoint_id if session is not None else None
+
+    def prepare(self, session_id: str, endpoint: str, data: Any) -> Any:
+        """`data` of a new turn, with the previous `context` for a `generate` turn."""
+        with self._lock:
+            session = self._get(session_id)
+            self.stats.turns += 1
+            if endpoint.strip("/") != "generate" or not isinstance(data, dict):
+                return data
+            context = session.contexts.get(data.get("model"))
+            if context and not data.get("context"):
+                self.stats.contexts_given += 1
+                return dict(data, context=context)
+        return data
+
+    def record(
+        self,
+        session_id: str,
+        endpoint_id: Optional[str],
+        data: Any,
+        response: Any,
+        report: Optional[Mapping[str, Any]] = None,
+    ):
+        """Remembers where a turn of `data` ran and how it ended, `report` is the worker's.
+
+        `endpoint_id` is None when the proxy does not know, for a cached answer.
+        """
+        with self._lock:
+            session = self._get(session_id)
+            if endpoint_id is not None:
+                if session.endpoint_id == endpoint_id:
+                    self.stats.pinned += 1
+                session.endpoint_id = endpoint_id
+            session.turns += 1
+            if isinstance(response, dict) and response.get("context"):
+                model = data.get("model") if isinstance(data, dict) else None
+                session.contexts[model] = response["context"]
+            if report:
+                self.stats.worker_hits += bool(report.get("hit"))
+                self.stats.reused_tokens += report.get("reused_tokens", 0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"sessions": len(self._sessions), **self.stats.to_dict()}
+
+
+def create_sessions() -> Optional[Sessions]:
+    if ENVIRONMENT.PROXY_SESSIONS != "on":
+        return None
+    return Sessions(
+        max_sessions=int(ENVIRONMENT.PROXY_SESSION_MAX),
+        ttl=float(ENVIRONMENT.PROXY_SESSION_TTL),
+    )
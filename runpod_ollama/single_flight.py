@@ -0,0 +1,146 @@
+"""Coalescing of identical in-flight requests.
+
+While a request is running, identical requests for the same pod wait for it
+instead of submitting their own RunPod job and polling loop, and all of them
+get its result. Duplicates pile up mostly during cold starts, when clients
+retry requests that are still queued.
+
+Every caller waits only up to its own `timeout`. The call itself runs with the
+deadline of the caller that started it, so when that deadline passes the
+others do not get its `DeadlineExceeded`: they start the call again.
+"""
+
+import asyncio
+import threading
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+from runpod_ollama.exceptions import DeadlineExceeded
+from runpod_ollama.retries import Deadline
+
+
+@dataclass
+class SingleFlightStats:
+    upstream: int = 0
+    """Requests that were actually sent."""
+
+    coalesced: int = 0
+    """Requests answered with the result of an identical in-flight one."""
+
+    def to_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+@dataclass
+class _Call:
+    result: Any = None
+    error: Optional[Exception] = None
+    done: threading.Event = field(default_factory=threading.Event)
+
+
+class SingleFlight:
+    """Runs one call per key at a time, for callers on different threads."""
+
+    def __init__(self):
+        self.stats = SingleFlightStats()
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """The result of `fn`, or of the identical call in flight for `key`.
+
+        Raises `DeadlineExceeded` when the result is not there within `timeout`.
+        """
+        deadline = Deadline(timeout)
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if call is None:
+                    call = self._calls[key] = _Call()
+                    self.stats.upstream += 1
+                else:
+                    self.stats.coalesced += 1
+
+            if leader:
+                try:
+                    call.result = fn()
+                except Exception as e:
+                    call.error = e
+                finally:
+                    with self._lock:
+                        del self._calls[key]
+                    call.done.set()
+            elif not call.done.wait(deadline.remaining()):
+                raise DeadlineExceeded(f"The call not finished within {timeout}s")
+
+            if not leader and isinstance(call.error, DeadlineExceeded):
+                # The deadline of the caller that started it, not ours.
+                deadline.check()
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+
+class AsyncSingleFlight:
+    """The asyncio counterpart of `SingleFlight`.
+
+    The call runs in its own task, so the caller that started it can go
+    away without failing the others. Once every caller went away, the call
+    is cancelled, and with it the RunPod job.
+    """
+
+    def __init__(self):
+        self.stats = SingleFlightStats()
+        self._calls: Dict[str, "asyncio.Future[Any]"] = {}
+        self._waiters: Dict["asyncio.Future[Any]", int] = {}
+
+    async def do(
+        self, key: str, fn: Callable[[], Awaitable[Any]], timeout: Optional[float] = None
+    ) -> Any:
+        """The result of `fn`, or of the identical call in flight for `key`.
+
+        Raises `DeadlineExceeded` when the result is not there within `timeout`.
+        """
+        deadline = Deadline(timeout)
+        while True:
+            call = self._calls.get(key)
+            leader = call is None
+            if call is None:
+                call = self._calls[key] = asyncio.ensure_future(fn())
+                call.add_done_callback(lambda done: self._forget(key, done))
+                self.stats.upstream += 1
+            else:
+                self.stats.coalesced += 1
+            try:
+                return await self._wait(call, deadline)
+            except DeadlineExceeded:
+                if leader or not call.done() or call.cancelled():
+                    raise
+                # The deadline of the caller that started it, not ours.
+                deadline.check()
+
+    def _forget(self, key: str, call: "asyncio.Future[Any]"):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def _wait(self, call: "asyncio.Future[Any]", deadline: Deadline) -> Any:
+        self._waiters[call] = self._waiters.get(call, 0) + 1
+        try:
+            remaining = deadline.remaining()
+            if remaining is None:
+                return await asyncio.shield(call)
+            try:
+                return await asyncio.wait_for(asyncio.shield(call), max(remaining, 0))
+            except asyncio.TimeoutError:
+                if self._waiters[call] == 1 and not call.done():
+                    call.cancel()
+                raise DeadlineExceeded(f"The call not finished within {deadline.seconds}s")
+        except asyncio.CancelledError:
+            if self._waiters[call] == 1 and not call.done():
+                call.cancel()
+            raise
+        finally:
+            self._waiters[call] -= 1
+            if not self._waiters[call]:
+                del self._waiters[call]
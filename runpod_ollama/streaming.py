@@ -0,0 +1,39 @@
+"""Wire formats of streamed responses.
+
+Ollama's native API streams newline delimited JSON, while its OpenAI
+compatible `v1/...` endpoints stream server-sent events.
+"""
+
+from typing import Any
+from runpod_ollama import codec
+
+
+def wants_stream(data: Any) -> bool:
+    """Whether a request body asks for a streamed response.
+
+    Only an explicit `"stream": true` streams; the proxy has always answered
+    requests without the flag with a single JSON document.
+    """
+    return isinstance(data, dict) and data.get("stream") is True
+
+
+def is_openai_endpoint(endpoint: str) -> bool:
+    return endpoint.startswith("v1/")
+
+
+def stream_content_type(endpoint: str) -> str:
+    if is_openai_endpoint(endpoint):
+        return "text/event-stream"
+    return "application/x-ndjson"
+
+
+def encode_chunk(endpoint: str, chunk: Any) -> bytes:
+    if is_openai_endpoint(endpoint):
+        return b"data: " + codec.dumps(chunk) + b"\n\n"
+    return codec.dumps(chunk) + b"\n"
+
+
+def stream_end(endpoint: str) -> bytes:
+    if is_openai_endpoint(endpoint):
+        return b"data: [DONE]\n\n"
+    return b""
@@ -0,0 +1,266 @@
+"""Keeps serverless workers warm ahead of traffic.
+
+A `WarmPoolKeeper` checks an endpoint's `/health` every `interval` seconds
+and sends a cheap `_warm` job (the worker loads the model and answers without
+generating anything) for every worker of its target that is not already
+running or starting. Idle workers picking these jobs up start their idle
+timeout over, and missing ones are started by RunPod, so `interval` should be
+shorter than the endpoint's idle timeout. The target is the larger of a fixed
+minimum, an optional time-of-day schedule, and the workers the recent traffic
+kept busy times `headroom`, capped at `max_workers`.
+
+Workers report whether a job was the first one they ran, so every warm-up
+job that hit a cold worker is counted as a cold start together with the time
+it waited for the worker.
+"""
+
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Mapping, Optional, Tuple
+import aiohttp
+from runpod_ollama import ENVIRONMENT
+from runpod_ollama.async_runpod_repository import AsyncRunpodRepository
+from runpod_ollama.router import Router
+
+# The worker recognizes warm-up jobs by this method name, keep it in sync
+# with `server/runpod_wrapper.py`.
+WARM_METHOD = "_warm"
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ScheduleWindow:
+    start: int
+    """Minutes after midnight, local time."""
+
+    end: int
+    workers: int
+
+    def contains(self, minute: int) -> bool:
+        if self.start <= self.end:
+            return self.start <= minute < self.end
+        # Windows like 22:00-06:00 wrap around midnight.
+        return minute >= self.start or minute < self.end
+
+
+def _minutes(value: str) -> int:
+    hours, minutes = value.strip().split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def parse_schedule(spec: str) -> List[ScheduleWindow]:
+    """Parses windows like `08:00-18:00=3,18:00-22:00=1`."""
+    windows = []
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        try:
+            span, workers = part.split("=")
+            start, end = span.split("-")
+            windows.append(ScheduleWindow(_minutes(start), _minutes(end), int(workers)))
+        except ValueError:
+            raise ValueError(f"Invalid schedule window {part!r}, expected HH:MM-HH:MM=workers")
+    return windows
+
+
+class TrafficTracker:
+    """The execution time of the jobs sent to an endpoint over the last `window` seconds.
+
+    Their sum divided by the window is the average number of workers the
+    traffic kept busy.
+    """
+
+    def __init__(self, window: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        self.window = window
+        self.clock = clock
+        self._jobs: Deque[Tuple[float, float]] = deque()
+        self._lock = threading.Lock()
+
+    def record(self, execution_time: float):
+        with self._lock:
+            self._jobs.append((self.clock(), execution_time))
+
+    def busy_workers(self) -> float:
+        cutoff = self.clock() - self.window
+        with self._lock:
+            while self._jobs and self._jobs[0][0] < cutoff:
+                self._jobs.popleft()
+            return sum(execution_time for _, execution_time in self._jobs) / self.window
+
+
+@dataclass
+class WarmPoolStats:
+    warm_jobs: int = 0
+    failed_warm_jobs: int = 0
+    cold_starts: int = 0
+    cold_start_seconds: List[float] = field(default_factory=list)
+    """Queue time of every warm-up job that started a cold worker."""
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class KeepWarmReport:
+    """What a keeper saw and did in one check."""
+
+    endpoint_id: str
+    target: int
+    workers: Mapping[str, int]
+    warm_jobs: int
+    cold_starts: List[float]
+
+    def __str__(self) -> str:
+        workers = ", ".join(f"{k}={v}" for k, v in sorted(self.workers.items()))
+        line = (
+            f"{self.endpoint_id}: target {self.target}, workers {workers or 'none'}, "
+            f"sent {self.warm_jobs} warm-up job(s)"
+        )
+        if self.cold_starts:
+            waits = ", ".join(f"{s:.1f}s" for s in self.cold_starts)
+            line += f", {len(self.cold_starts)} cold start(s) ({waits})"
+        return line
+
+
+# Workers kept warm without our help, from `/health`'s worker counts.
+BUSY_WORKER_STATES = ("running", "initializing")
+
+
+class WarmPoolKeeper:
+    def __init__(
+        self,
+        api_key: str,
+        endpoint_id: str,
+        min_workers: int = 1,
+        max_workers: Optional[int] = None,
+        schedule: Optional[List[ScheduleWindow]] = None,
+        interval: float = 30.0,
+        headroom: float = 1.5,
+        base_url: Optional[str] = None,
+        traffic: Optional[TrafficTracker] = None,
+    ):
+        self.api_key = api_key
+        self.endpoint_id = endpoint_id
+        self.min_workers = min_workers
+        self.max_workers = max(max_workers or min_workers, min_workers)
+        self.schedule = schedule or []
+        self.interval = interval
+        self.headroom = headroom
+        self.base_url = base_url
+        self.traffic = traffic or TrafficTracker()
+        self.stats = WarmPoolStats()
+
+    def target(self, now: Optional[datetime] = None) -> int:
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        scheduled = [w.workers for w in self.schedule if w.contains(minute)]
+        floor = max(scheduled) if scheduled else self.min_workers
+        busy = math.ceil(self.traffic.busy_workers() * self.headroom)
+        return min(max(floor, busy), max(self.max_workers, floor))
+
+    def _repository(self, session: aiohttp.ClientSession) -> AsyncRunpodRepository:
+        return AsyncRunpodRepository(
+            api_key=self.api_key,
+            pod_id=self.endpoint_id,
+            session=session,
+            base_url=self.base_url,
+        )
+
+    async def _warm(self, session: aiohttp.ClientSession) -> Optional[float]:
+        """Sends one warm-up job, returns its queue time if it hit a cold worker."""
+        repository = self._repository(session)
+        try:
+            await repository.call_endpoint(WARM_METHOD, {})
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.stats.failed_warm_jobs += 1
+            logger.warning(f"Warm-up job for {self.endpoint_id} failed: {e}")
+            return None
+        self.stats.warm_jobs += 1
+        call = repository.last_call
+        if call is None or not call.cold_start:
+            return None
+        wait = call.queue_seconds or 0.0
+        self.stats.cold_starts += 1
+        self.stats.cold_start_seconds.append(wait)
+        return wait
+
+    async def check(self, session: aiohttp.ClientSession) -> KeepWarmReport:
+        """Warms the workers of the target that are not busy, once."""
+        target = self.target()
+        health = await self._repository(session).health()
+        workers: Dict[str, int] = health.get("workers") or {}
+        busy = sum(workers.get(state, 0) for state in BUSY_WORKER_STATES)
+        warm_jobs = max(target - busy, 0)
+        waits = await asyncio.gather(*(self._warm(session) for _ in range(warm_jobs)))
+        return KeepWarmReport(
+            endpoint_id=self.endpoint_id,
+            target=target,
+            workers=workers,
+            warm_jobs=warm_jobs,
+            cold_starts=[w for w in waits if w is not None],
+        )
+
+    async def run(
+        self,
+        session: aiohttp.ClientSession,
+        on_report: Callable[[KeepWarmReport], Any] = lambda report: logger.info(str(report)),
+    ):
+        """Checks the endpoint every `interval` seconds until cancelled.
+
+        A check that is still waiting for its warm-up jobs does not hold up
+        the next one.
+        """
+        pending: "set[asyncio.Task[None]]" = set()
+
+        async def check():
+            try:
+                on_report(await self.check(session))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Keeping {self.endpoint_id} warm failed: {e}")
+
+        try:
+            while True:
+                task = asyncio.ensure_future(check())
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+                await asyncio.sleep(self.interval)
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+async def keep_warm(
+    keepers: List[WarmPoolKeeper],
+    on_report: Callable[[KeepWarmReport], Any] = lambda report: logger.info(str(report)),
+):
+    """Runs `keepers` on one shared connection pool until cancelled."""
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(keeper.run(session, on_report) for keeper in keepers))
+
+
+def create_keepers(router: Optional[Router] = None) -> Dict[str, WarmPoolKeeper]:
+    """The keepers configured by `KEEP_WARM_ENDPOINTS`, by endpoint id.
+
+    Aliases of `router` stand for all the endpoints of their pool.
+    """
+    endpoint_ids: List[str] = []
+    for name in filter(None, (n.strip() for n in ENVIRONMENT.KEEP_WARM_ENDPOINTS.split(","))):
+        pool = router.pool(name) if router is not None else None
+        endpoint_ids.extend(pool or [name])
+    schedule = parse_schedule(ENVIRONMENT.KEEP_WARM_SCHEDULE)
+    return {
+        endpoint_id: WarmPoolKeeper(
+            api_key=ENVIRONMENT.RUNPOD_API_TOKEN,
+            endpoint_id=endpoint_id,
+            min_workers=int(ENVIRONMENT.KEEP_WARM_MIN_WORKERS),
+            max_workers=int(ENVIRONMENT.KEEP_WARM_MAX_WORKERS),
+            schedule=schedule,
+            interval=float(ENVIRONMENT.KEEP_WARM_INTERVAL),
+        )
+        for endpoint_id in dict.fromkeys(endpoint_ids)
+    }
@@ -0,0 +1,177 @@
+"""Boots a worker: starts Ollama, gets the model ready, then takes jobs.
+
+    python -u bootstrap.py <model>
+
+Every second spent here is a second of cold start, so instead of waiting for
+Ollama's log line and pulling the model on every start:
+- Ollama's HTTP API is probed every `PROBE_INTERVAL` seconds,
+- the pull is skipped when the model's manifest and blobs are already in
+  `OLLAMA_MODELS`, baked into the image or on a network volume,
+- the model is loaded into memory with an empty generate request and
+  `OLLAMA_KEEP_ALIVE` before the first job is taken, not by it.
+
+A worker serving several models (`bootstrap.py llama3,phi3`) pulls the ones
+missing from disk and loads the first.
+
+The duration of every phase is reported with the first job's output.
+"""
+
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from runpod_wrapper import WorkerConfig, keep_alive_value, serve
+
+logger = logging.getLogger(__name__)
+
+PROBE_INTERVAL = 0.01
+
+DEFAULT_REGISTRY = "registry.ollama.ai"
+
+
+def manifest_path(models_dir: str, model: str) -> str:
+    """Where Ollama stores the manifest of `model`, e.g. `mistral` or `user/model:tag`."""
+    name, tag = model, "latest"
+    if ":" in model.rsplit("/", 1)[-1]:
+        name, tag = model.rsplit(":", 1)
+    parts = name.split("/")
+    if len(parts) == 1:
+        parts = [DEFAULT_REGISTRY, "library"] + parts
+    elif len(parts) == 2:
+        parts = [DEFAULT_REGISTRY] + parts
+    return os.path.join(os.path.expanduser(models_dir), "manifests", *parts, tag)
+
+
+def _manifest(models_dir: str, model: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(manifest_path(models_dir, model)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def model_on_disk(models_dir: str, model: str) -> bool:
+    """Whether the manifest of `model` and every blob it lists are in `models_dir`."""
+    manifest = _manifest(models_dir, model)
+    if manifest is None:
+        return False
+    layers = manifest.get("layers", []) + [manifest.get("config") or {}]
+    blobs = os.path.join(os.path.expanduser(models_dir), "blobs")
+    return all(
+        os.path.exists(os.path.join(blobs, layer["digest"].replace(":", "-")))
+        for layer in layers
+        if layer.get("digest")
+    )
+
+
+def model_bytes(models_dir: str, model: str) -> int:
+    """The size of `model`'s blobs as its manifest lists them, 0 when it is not on disk."""
+    manifest = _manifest(models_dir, model) or {}
+    layers = manifest.get("layers", []) + [manifest.get("config") or {}]
+    return sum(layer.get("size", 0) for layer in layers)
+
+
+def _post(base_url: str, method_name: str, body: Any, timeout: Optional[float] = None) -> Any:
+    request = urllib.request.Request(
+        f"{base_url}/api/{method_name}",
+        data=json.dumps(body).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read() or b"null")
+
+
+def wait_until_ready(
+    base_url: str,
+    timeout: float,
+    process: Optional[subprocess.Popen] = None,
+    interval: float = PROBE_INTERVAL,
+):
+    """Probes Ollama's HTTP API until it answers."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(f"{base_url}/", timeout=1) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Ollama exited with code {process.returncode}")
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Ollama did not answer on {base_url} within {timeout}s")
+        time.sleep(interval)
+
+
+def boot(
+    config: WorkerConfig,
+    command: Sequence[str] = ("ollama", "serve"),
+) -> Tuple[subprocess.Popen, Dict[str, Any]]:
+    """Starts Ollama with `command` and loads the model, pulling it if needed.
+
+    Returns the Ollama process and the duration of every boot phase.
+    """
+    started = time.monotonic()
+    env = dict(os.environ)
+    # Jobs without their own `keep_alive` must not unload the preloaded model.
+    env.setdefault("OLLAMA_KEEP_ALIVE", config.keep_alive)
+    if config.multi_model:
+        # The worker evicts models itself, Ollama must not run out of slots first.
+        env.setdefault(
+            "OLLAMA_MAX_LOADED_MODELS", str(config.max_loaded_models or len(config.models))
+        )
+    process = subprocess.Popen(list(command), env=env)
+    # The disk is checked while Ollama starts.
+    models = config.models or [config.model]
+    missing = [model for model in models if not model_on_disk(config.models_dir, model)]
+
+    wait_until_ready(config.ollama_base_url, config.boot_timeout, process)
+    phases: Dict[str, Any] = {"ollama_start_seconds": time.monotonic() - started}
+
+    phase_started = time.monotonic()
+    for model in models:
+        if model not in missing:
+            logger.info(f"{model} found in {config.models_dir}, not pulling it")
+            continue
+        logger.info(f"Pulling {model}")
+        _post(config.ollama_base_url, "pull", {"name": model, "stream": False})
+    phases["pulled"] = bool(missing)
+    phases["pull_seconds"] = time.monotonic() - phase_started
+
+    phase_started = time.monotonic()
+    _post(
+        config.ollama_base_url,
+        "generate",
+        {"model": config.model, "keep_alive": keep_alive_value(config.keep_alive)},
+        timeout=config.request_timeout,
+    )
+    phases["load_seconds"] = time.monotonic() - phase_started
+    phases["total_seconds"] = time.monotonic() - started
+    logger.info(
+        "Booted in {total_seconds:.2f}s: Ollama {ollama_start_seconds:.2f}s, "
+        "pull {pull_seconds:.2f}s, load {load_seconds:.2f}s".format(**phases)
+    )
+    return process, phases
+
+
+def main(argv: List[str]):
+    config = WorkerConfig.from_environment(argv)
+    process, phases = boot(config)
+    sizes = {model: model_bytes(config.models_dir, model) for model in config.models}
+    # Stop Ollama with the worker, RunPod stops workers with SIGTERM.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        serve(config, boot=phases, model_sizes=sizes)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    main(sys.argv)
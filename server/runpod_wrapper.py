@@ -1,14 +1,67 @@
 import runpod
-from typing import Any, Literal, TypedDict
-import requests
+from contextlib import asynccontextmanager
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    AsyncIterator,
+    Deque,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    Tuple,
+    TypedDict,
+    Union,
+)
+import aiohttp
+import asyncio
+import base64
+import hashlib
+import json
+import struct
 import sys
 import os
+import time
 import logging
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Jobs with this method carry several embedding requests coalesced by the
+# local proxy, see `runpod_ollama/batching.py`.
+BATCH_EMBED_METHOD = "_batch/embed"
+
+# Loads the model without generating anything, sent by the warm pool keeper,
+# see `runpod_ollama/warm_pool.py`.
+WARM_METHOD = "_warm"
+
+# Measurements of the worker travel with the job output under this key and
+# are stripped by the local proxy, see `runpod_ollama/metrics.py`.
+WORKER_METADATA_KEY = "runpod_ollama"
+
+# Ollama's raw durations, summed up under `WORKER_METADATA_KEY` already. Slim
+# outputs leave them out unless the job asks to keep "timings".
+DURATION_FIELDS = ("total_duration", "load_duration", "prompt_eval_duration", "eval_duration")
+
+# Formats `embed` vectors may be packed in, see `runpod_ollama/payloads.py`.
+PACKED_FORMATS = {"float32": "f", "float16": "e"}
+
+
+def _loads(data: Any) -> Any:
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def _dumps(value: Any) -> str:
+    return orjson.dumps(value).decode() if orjson is not None else json.dumps(value)
+
+
 class HandlerInput(TypedDict):
     """The data for calling the Ollama service."""
 
@@ -18,56 +71,869 @@ class HandlerInput(TypedDict):
     input: Any
     """The body of the post request to the Ollama service."""
 
+    session: Optional[str]
+    """Digest of the conversation's `X-Session-Id`, set by the local proxy."""
+
+    keep: Optional[List[str]]
+    """Fields a slim worker sends anyway, "context" and "timings"."""
+
+    embeddings: Optional[str]
+    """The format `embed` vectors are sent in, one of `PACKED_FORMATS`; JSON numbers if unset."""
+
 
 class HandlerJob(TypedDict):
     input: HandlerInput
 
 
-def handler(job: HandlerJob):
-    # Get base URL from environment variable or use default
-    base_url = os.environ.get("OLLAMA_BASE_URL", "http://0.0.0.0:11434")
-    
-    # Verify API key if authentication is enabled
-    api_key = os.environ.get("RUNPOD_API_KEY")
-    if api_key and "authorization" in job.get("headers", {}):
-        auth_header = job.get("headers", {}).get("authorization", "")
-        if not auth_header.startswith("Bearer ") or auth_header[7:] != api_key:
-            logger.error("Invalid API key provided")
-            return {"error": "Unauthorized: Invalid API key", "status": "failed"}
-    
-    input = job["input"]
-    logger.info(f"Received request for method: {input['method_name']}")
-
-    # Streaming is not supported in serverless mode
-    input["input"]["stream"] = False
-    
-    # Get the model name from arguments
-    model = sys.argv[1]
-    input["input"]["model"] = model
-    
-    logger.info(f"Using model: {model}")
-    logger.info(f"Sending request to: {base_url}/api/{input['method_name']}/")
+@dataclass
+class WorkerConfig:
+    """Worker settings, resolved once when the worker starts."""
+
+    model: str
+    """The model every request is run with, the first argument of the worker.
+
+    With several `models`, the first one, run for requests that name none.
+    """
+
+    ollama_base_url: str = "http://0.0.0.0:11434"
+
+    api_key: Optional[str] = None
+    """When set, jobs carrying an authorization header must match it."""
+
+    concurrency: int = 1
+    """How many jobs the worker runs at once, match it with Ollama's parallel slots."""
+
+    request_timeout: float = 120
+
+    models_dir: str = "~/.ollama/models"
+    """Where Ollama keeps its models, a model found there is not pulled again."""
+
+    keep_alive: str = "-1"
+    """How long the model stays loaded after the worker preloads it, negative is forever."""
+
+    boot_timeout: float = 300
+    """How long Ollama may take to start answering."""
+
+    session_cache_size: int = 256
+    """Conversations whose last turn the worker remembers, 0 disables it."""
+
+    worker_id: str = ""
+    """RunPod's id of the worker, reported with every job."""
+
+    slim_output: bool = False
+    """Whether `context` and Ollama's raw durations are left out unless a job keeps them."""
+
+    models: List[str] = field(default_factory=list)
+    """The models requests may name, the first argument split on commas.
+
+    With more than one, the worker runs the `model` of every request and
+    keeps the most requested ones loaded, see `ModelResidency`.
+    """
+
+    vram_gb: float = 0
+    """VRAM the loaded models may take together, 0 leaves it to Ollama."""
+
+    max_loaded_models: int = 0
+    """How many models stay loaded at once, 0 for all of `models`."""
+
+    preload: bool = True
+    """Whether models the recent jobs asked for are loaded again before they are needed."""
+
+    @classmethod
+    def from_environment(cls, argv: List[str]) -> "WorkerConfig":
+        models = [model.strip() for model in argv[1].split(",") if model.strip()]
+        return cls(
+            model=models[0],
+            ollama_base_url=os.environ.get("OLLAMA_BASE_URL", "http://0.0.0.0:11434"),
+            api_key=os.environ.get("RUNPOD_API_KEY"),
+            concurrency=int(
+                os.environ.get(
+                    "WORKER_CONCURRENCY", os.environ.get("OLLAMA_NUM_PARALLEL", "1")
+                )
+            ),
+            request_timeout=float(os.environ.get("OLLAMA_REQUEST_TIMEOUT", "120")),
+            models_dir=os.environ.get("OLLAMA_MODELS", "~/.ollama/models"),
+            keep_alive=os.environ.get("OLLAMA_KEEP_ALIVE", "-1"),
+            boot_timeout=float(os.environ.get("OLLAMA_BOOT_TIMEOUT", "300")),
+            session_cache_size=int(os.environ.get("WORKER_SESSION_CACHE_SIZE", "256")),
+            worker_id=os.environ.get("RUNPOD_POD_ID", ""),
+            slim_output=os.environ.get("WORKER_SLIM_OUTPUT", "off") == "on",
+            models=models,
+            vram_gb=float(os.environ.get("WORKER_VRAM_GB", "0")),
+            max_loaded_models=int(
+                os.environ.get(
+                    "WORKER_MAX_LOADED_MODELS", os.environ.get("OLLAMA_MAX_LOADED_MODELS", "0")
+                )
+            ),
+            preload=os.environ.get("WORKER_PRELOAD", "on") == "on",
+        )
+
+    @property
+    def multi_model(self) -> bool:
+        return len(self.models) > 1
+
 
+def keep_alive_value(keep_alive: str) -> Union[int, str]:
+    """`keep_alive` for a request body, Ollama reads plain numbers as seconds."""
     try:
-        response = requests.post(
-            url=f"{base_url}/api/{input['method_name']}/",
-            headers={"Content-Type": "application/json"},
-            json=input["input"],
-            timeout=120  # Add timeout to prevent hanging indefinitely
+        return int(keep_alive)
+    except ValueError:
+        return keep_alive
+
+
+async def _stream_chunks(response: aiohttp.ClientResponse) -> AsyncIterator[Any]:
+    """Yields the JSON chunks of a streamed Ollama response.
+
+    Native endpoints stream NDJSON, the OpenAI compatible ones stream SSE
+    `data: ...` lines ending with `data: [DONE]`.
+    """
+    async for raw_line in response.content:
+        line = raw_line.decode("utf-8").strip()
+        if not line:
+            continue
+        if line.startswith("data:"):
+            line = line[len("data:"):].strip()
+            if line == "[DONE]":
+                return
+        yield _loads(line)
+
+
+async def ollama_error(response: aiohttp.ClientResponse) -> Dict[str, Any]:
+    """The output of a job Ollama refused, with its message and HTTP status.
+
+    `status_code` lets the proxy tell errors caused by the request, like an
+    unknown model or an invalid option, from faults of the worker.
+    """
+    try:
+        message = _loads(await response.read()).get("error")
+    except (ValueError, AttributeError):
+        message = None
+    return {
+        "error": message or f"Ollama answered {response.status} {response.reason}",
+        "status": "failed",
+        "status_code": response.status,
+    }
+
+
+def ollama_timings(response: Any) -> Optional[Dict[str, Any]]:
+    """Ollama's timings of a final response, in seconds and tokens per second."""
+    if not isinstance(response, dict) or "total_duration" not in response:
+        return None
+    timings: Dict[str, Any] = {
+        "total_seconds": response["total_duration"] / 1e9,
+        "load_seconds": response.get("load_duration", 0) / 1e9,
+        "prompt_eval_count": response.get("prompt_eval_count", 0),
+        "prompt_eval_seconds": response.get("prompt_eval_duration", 0) / 1e9,
+        "eval_count": response.get("eval_count", 0),
+        "eval_seconds": response.get("eval_duration", 0) / 1e9,
+    }
+    if timings["eval_seconds"] > 0:
+        timings["tokens_per_second"] = timings["eval_count"] / timings["eval_seconds"]
+    if timings["prompt_eval_seconds"] > 0:
+        timings["prompt_tokens_per_second"] = (
+            timings["prompt_eval_count"] / timings["prompt_eval_seconds"]
+        )
+    return timings
+
+
+def with_metadata(
+    output: Any,
+    response: Any = None,
+    worker: Optional[Dict[str, Any]] = None,
+    session: Optional[Dict[str, Any]] = None,
+    model: Optional[Dict[str, Any]] = None,
+) -> Any:
+    """Attaches Ollama's timings of `response` and the worker's facts to `output`."""
+    metadata: Dict[str, Any] = {}
+    timings = ollama_timings(response)
+    if timings is not None:
+        metadata["ollama"] = timings
+    if worker:
+        metadata["worker"] = worker
+    if session:
+        metadata["session"] = session
+    if model:
+        metadata["model"] = model
+    if metadata and isinstance(output, dict):
+        output.setdefault(WORKER_METADATA_KEY, {}).update(metadata)
+    return output
+
+
+def slimmed(output: Any, keep: List[str]) -> Any:
+    """`output` without `context` and Ollama's raw durations, but for the ones in `keep`."""
+    if isinstance(output, dict):
+        if "context" not in keep:
+            output.pop("context", None)
+        if "timings" not in keep:
+            for name in DURATION_FIELDS:
+                output.pop(name, None)
+    return output
+
+
+def pack_embeddings(response: Any, format: Optional[str]) -> Any:
+    """`response` with its `embeddings` as one base64 buffer of little-endian `format` values.
+
+    Leaves responses without an `embeddings` list alone, like legacy
+    `/api/embeddings` ones, and every response when `format` is not set.
+    """
+    if format not in PACKED_FORMATS or not isinstance(response, dict):
+        return response
+    vectors = response.get("embeddings")
+    if not isinstance(vectors, list):
+        return response
+    values = [value for vector in vectors for value in vector]
+    buffer = struct.pack(f"<{len(values)}{PACKED_FORMATS[format]}", *values)
+    response["embeddings"] = {
+        "dtype": format,
+        "shape": [len(vectors), len(vectors[0]) if vectors else 0],
+        "base64": base64.b64encode(buffer).decode(),
+    }
+    return response
+
+
+def conversation_key(model: Optional[str], messages: List[Any]) -> str:
+    """Digest of the model and the roles and contents of a chat's messages.
+
+    Clients send back the answers they got without Ollama's other fields.
+    """
+    pairs = [[m.get("role"), m.get("content")] for m in messages if isinstance(m, dict)]
+    encoded = json.dumps([model, pairs], separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+@dataclass
+class SessionTurn:
+    """What the worker remembers of the last turn of a conversation."""
+
+    tokens: int
+    """Tokens of the conversation so far, in Ollama's KV cache if the model stayed loaded."""
+
+    context: Optional[List[int]] = None
+    """Ollama's `context` of a `generate` turn."""
+
+
+class SessionStore:
+    """The last turn of the most recent conversations, least recently used out first.
+
+    A chat turn is keyed by the digest of its messages plus the answer, which
+    is what the next turn sends before its new message. Ollama keeps the KV
+    cache of the last prompt of every parallel slot and only evaluates what
+    follows the longest matching prefix, so a hit tells how many prompt
+    tokens that may have saved, unless Ollama evaluated at least as many
+    again because another prompt took the slot. `generate` turns are keyed by
+    the proxy's session digest and keep Ollama's `context`, given back to the
+    next turn that comes without one. Both keys include the model: the KV
+    cache and the tokens of one model mean nothing to another.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._turns: "OrderedDict[str, SessionTurn]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[SessionTurn]:
+        turn = self._turns.get(key)
+        if turn is not None:
+            self._turns.move_to_end(key)
+        return turn
+
+    def set(self, key: str, turn: SessionTurn):
+        if self.max_size <= 0:
+            return
+        self._turns[key] = turn
+        self._turns.move_to_end(key)
+        while len(self._turns) > self.max_size:
+            self._turns.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._turns)
+
+    def previous(
+        self, method_name: str, body: Any, session: Optional[str]
+    ) -> Optional[SessionTurn]:
+        """The turn `body` continues, with its `context` added to a `generate` body."""
+        model = body.get("model")
+        if method_name == "chat" and isinstance(body.get("messages"), list):
+            return self.get(conversation_key(model, body["messages"][:-1]))
+        if method_name != "generate" or not session:
+            return None
+        turn = self.get(f"generate:{model}:{session}")
+        if turn is not None and turn.context and not body.get("context"):
+            body["context"] = turn.context
+        return turn
+
+    def remember(
+        self,
+        method_name: str,
+        body: Any,
+        session: Optional[str],
+        result: Any,
+        previous: Optional[SessionTurn],
+        answer: str = "",
+    ) -> int:
+        """Remembers the turn `result` answered, returns the prompt tokens it reused.
+
+        `answer` is the text of a streamed chat.
+        """
+        if not isinstance(result, dict) or not result.get("done"):
+            return 0
+        evaluated = result.get("prompt_eval_count", 0)
+        reused = previous.tokens if previous is not None and evaluated < previous.tokens else 0
+        tokens = reused + evaluated + result.get("eval_count", 0)
+        if method_name == "chat" and isinstance(body.get("messages"), list):
+            message = result.get("message") or {}
+            message = {
+                "role": message.get("role", "assistant"),
+                "content": answer or message.get("content", ""),
+            }
+            key = conversation_key(body.get("model"), body["messages"] + [message])
+            self.set(key, SessionTurn(tokens))
+        elif method_name == "generate" and session:
+            context = result.get("context")
+            turn = SessionTurn(len(context or []) or tokens, context)
+            self.set(f"generate:{body.get('model')}:{session}", turn)
+        return reused
+
+
+class UnknownModel(ValueError):
+    """A job named a model the worker does not serve."""
+
+
+def same_model(a: str, b: str) -> bool:
+    """Whether two model names are the same, `llama3` is `llama3:latest`."""
+
+    def tagged(name: str) -> str:
+        return name if ":" in name.rsplit("/", 1)[-1] else f"{name}:latest"
+
+    return tagged(a) == tagged(b)
+
+
+@dataclass
+class ResidentModel:
+    """A model the worker keeps loaded in Ollama."""
+
+    size: int = 0
+    """Bytes of VRAM it takes, 0 when neither the disk nor Ollama's `/api/ps` told."""
+
+    in_flight: int = 0
+    last_used: float = 0.0
+
+
+class ModelResidency:
+    """Which of the allowed models stay loaded in Ollama.
+
+    The worker sends every request with its own `keep_alive`, so models only
+    leave memory when they are evicted here, with a `keep_alive: 0` request.
+    A model that does not fit next to the loaded ones, in `vram_bytes` or
+    `max_loaded` models, evicts the idle ones the last `window` jobs asked
+    for least, the least recently used first, or waits until enough of them
+    are idle. A size not known yet is taken as the average of the known ones.
+    A model the recent jobs asked for that is not loaded anymore is preloaded
+    when it fits without evicting one they asked for as often.
+    """
+
+    def __init__(
+        self,
+        models: List[str],
+        vram_bytes: int = 0,
+        max_loaded: int = 0,
+        sizes: Optional[Dict[str, int]] = None,
+        window: int = 32,
+        clock=time.monotonic,
+    ):
+        self.models = models
+        self.vram_bytes = vram_bytes
+        self.max_loaded = max_loaded or len(models)
+        self.sizes: Dict[str, int] = dict(sizes or {})
+        self.recent: Deque[str] = deque(maxlen=window)
+        self.resident: "OrderedDict[str, ResidentModel]" = OrderedDict()
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, requested: Optional[str]) -> str:
+        """The allowed model a request names, the first one when it names none."""
+        if not requested:
+            return self.models[0]
+        for model in self.models:
+            if same_model(model, requested):
+                return model
+        raise UnknownModel(
+            f"Model {requested} is not served by this worker, only {', '.join(self.models)}"
+        )
+
+    def demand(self, model: str) -> int:
+        """How many of the recent jobs asked for `model`."""
+        return self.recent.count(model)
+
+    def hit_rate(self) -> float:
+        return self.hits / max(self.hits + self.misses, 1)
+
+    def size(self, model: str) -> int:
+        """The memory `model` takes, the average of the known sizes when it is not known."""
+        if self.sizes.get(model):
+            return self.sizes[model]
+        known = [size for size in self.sizes.values() if size]
+        return sum(known) // len(known) if known else 0
+
+    def _victims(self, model: str, below: Optional[int] = None) -> Optional[List[str]]:
+        """The models to evict for `model` to fit, None when evicting idle ones is not enough.
+
+        With `below`, only models asked for less often than that may go. A
+        model that does not fit even alone is loaded and left to Ollama.
+        """
+        others = {name: r for name, r in self.resident.items() if name != model}
+        if not others:
+            return []
+        candidates = sorted(
+            (
+                name
+                for name, r in others.items()
+                if r.in_flight == 0 and (below is None or self.demand(name) < below)
+            ),
+            key=lambda name: (self.demand(name), others[name].last_used),
         )
-        response.encoding = "utf-8"
-        
-        # Raise an exception if the request was unsuccessful
-        response.raise_for_status()
-        
-        return response.json()
-        
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Request error: {str(e)}")
-        return {"error": str(e), "status": "failed"}
-    except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
-        return {"error": str(e), "status": "failed"}
-
-
-runpod.serverless.start({"handler": handler})
+        size = self.size(model)
+        used = sum(r.size or self.size(name) for name, r in others.items())
+        count = len(others)
+        victims: List[str] = []
+        while count >= self.max_loaded or (self.vram_bytes and used + size > self.vram_bytes):
+            if not candidates:
+                return None
+            victim = candidates.pop(0)
+            victims.append(victim)
+            used -= others[victim].size or self.size(victim)
+            count -= 1
+        return victims
+
+    def acquire(self, model: str, job: bool = True) -> Optional[Tuple[bool, List[str]]]:
+        """Marks `model` in use, returns whether it was loaded and the models to evict first.
+
+        Returns None and marks nothing when the models in use leave no room
+        for `model`, see `release`. `job` is False for a preload, which does
+        not count as a request.
+        """
+        resident = self.resident.get(model)
+        hit = resident is not None
+        victims = [] if hit else self._victims(model)
+        if victims is None:
+            return None
+        for victim in victims:
+            del self.resident[victim]
+        if resident is None:
+            resident = self.resident[model] = ResidentModel(self.sizes.get(model, 0))
+        self.resident.move_to_end(model)
+        resident.in_flight += 1
+        resident.last_used = self.clock()
+        if job:
+            self.recent.append(model)
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return hit, victims
+
+    def release(self, model: str):
+        """Marks a use of `model` done, which may leave room for the models waiting for it."""
+        resident = self.resident.get(model)
+        if resident is not None:
+            resident.in_flight -= 1
+            resident.last_used = self.clock()
+
+    def preload_candidate(self) -> Optional[Tuple[str, List[str]]]:
+        """The model worth loading before it is asked for, with the models to evict for it."""
+        waiting = [
+            (self.demand(model), model)
+            for model in self.models
+            if model not in self.resident and self.demand(model) > 0
+        ]
+        if not waiting:
+            return None
+        demand, model = max(waiting)
+        victims = self._victims(model, below=demand)
+        return (model, victims) if victims is not None else None
+
+    def update(self, running: List[Dict[str, Any]]):
+        """Takes the sizes and the loaded models from Ollama's `/api/ps`."""
+        loaded = set()
+        for entry in running:
+            name = entry.get("name") or entry.get("model") or ""
+            for model in self.models:
+                if same_model(model, name):
+                    loaded.add(model)
+                    self.sizes[model] = entry.get("size_vram") or entry.get("size") or 0
+                    if model in self.resident:
+                        self.resident[model].size = self.sizes[model]
+        # Ollama may have evicted models by itself, e.g. out of VRAM.
+        for model, resident in list(self.resident.items()):
+            if model not in loaded and resident.in_flight == 0:
+                del self.resident[model]
+
+
+class OllamaWorker:
+    """Forwards RunPod jobs to the local Ollama daemon.
+
+    All jobs share one keep-alive connection pool to Ollama. The pool is
+    created by the first job, inside the event loop RunPod runs the handler
+    on, and is sized for `concurrency` jobs in flight.
+    """
+
+    def __init__(
+        self,
+        config: WorkerConfig,
+        boot: Optional[Dict[str, Any]] = None,
+        model_sizes: Optional[Dict[str, int]] = None,
+    ):
+        self.config = config
+        self.boot = boot
+        """How long every phase of the worker's boot took, see `bootstrap.py`."""
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.started_at = time.monotonic()
+        self.jobs_started = 0
+        self.sessions = SessionStore(config.session_cache_size)
+        self.residency: Optional[ModelResidency] = None
+        if config.multi_model:
+            self.residency = ModelResidency(
+                config.models,
+                vram_bytes=int(config.vram_gb * 1024**3),
+                max_loaded=config.max_loaded_models,
+                sizes=model_sizes,
+            )
+            if boot is not None:
+                # `bootstrap.py` loaded the first model.
+                self.residency.acquire(config.model, job=False)
+                self.residency.release(config.model)
+        self._rebalancing: Optional["asyncio.Future[None]"] = None
+        self._room: Optional[asyncio.Condition] = None
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=max(self.config.concurrency, 1) * 2),
+                timeout=aiohttp.ClientTimeout(total=self.config.request_timeout),
+                headers={"Content-Type": "application/json"},
+                json_serialize=_dumps,
+            )
+        return self._session
+
+    def room(self) -> asyncio.Condition:
+        """Notified when a model is released, created like `session` on the handler's loop."""
+        if self._room is None:
+            self._room = asyncio.Condition()
+        return self._room
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+    def concurrency_modifier(self, current_concurrency: int) -> int:
+        return self.config.concurrency
+
+    def _authorized(self, job: Any) -> bool:
+        api_key = self.config.api_key
+        headers = job.get("headers", {})
+        if not api_key or "authorization" not in headers:
+            return True
+        auth_header = headers.get("authorization", "")
+        return auth_header.startswith("Bearer ") and auth_header[7:] == api_key
+
+    def _session_report(self, previous: Optional[SessionTurn], reused: int) -> Dict[str, Any]:
+        """What the proxy learns of the conversation, see runpod_ollama/sessions.py."""
+        report: Dict[str, Any] = {"hit": previous is not None, "reused_tokens": reused}
+        if self.config.worker_id:
+            report["worker_id"] = self.config.worker_id
+        return report
+
+    async def handler(self, job: HandlerJob) -> AsyncIterator[Any]:
+        """Forwards a job to Ollama, yielding its response chunk by chunk.
+
+        Requests with `"stream": true` yield every chunk as Ollama produces it,
+        so they can be read from RunPod's `/stream` while the job runs. Other
+        requests yield the whole response once. With `return_aggregate_stream`
+        the job output is the list of everything yielded.
+        """
+        if not self._authorized(job):
+            logger.error("Invalid API key provided")
+            yield {"error": "Unauthorized: Invalid API key", "status": "failed"}
+            return
+
+        input = job["input"]
+        logger.info(f"Received request for method: {input['method_name']}")
+
+        # The first job of a worker is the one that paid for its cold start.
+        worker = None
+        if self.jobs_started == 0:
+            worker = {
+                "first_job": True,
+                "uptime_seconds": time.monotonic() - self.started_at,
+            }
+            if self.boot is not None:
+                worker["boot"] = self.boot
+        self.jobs_started += 1
+
+        if input["method_name"] in (BATCH_EMBED_METHOD, WARM_METHOD):
+            try:
+                if input["method_name"] == WARM_METHOD:
+                    output = await self._warm()
+                else:
+                    output = await self._embed_batch(input["input"]["requests"])
+                    for response in output["responses"]:
+                        self._shape(response, input)
+                yield with_metadata(output, worker=worker)
+            except UnknownModel as e:
+                yield {"error": str(e), "status": "failed", "status_code": 404}
+            except aiohttp.ClientResponseError as e:
+                logger.error(f"Request error: {str(e)}")
+                yield {"error": str(e), "status": "failed", "status_code": e.status}
+            except aiohttp.ClientError as e:
+                logger.error(f"Request error: {str(e)}")
+                yield {"error": str(e), "status": "failed"}
+            return
+
+        method_name = input["method_name"]
+        body = input["input"]
+        stream = bool(body.get("stream", False))
+        body["stream"] = stream
+        session_id = input.get("session")
+        tracked = bool(session_id) or method_name == "chat"
+
+        try:
+            async with self._model(body) as model:
+                previous = self.sessions.previous(method_name, body, session_id)
+                async with self.session().post(
+                    f"{self.config.ollama_base_url}/api/{method_name}/",
+                    json=body,
+                ) as response:
+                    if response.status >= 400:
+                        yield await ollama_error(response)
+                        return
+
+                    if stream:
+                        answer = []
+                        async for chunk in _stream_chunks(response):
+                            answer.append((chunk.get("message") or {}).get("content", ""))
+                            if chunk.get("done"):
+                                reused = self.sessions.remember(
+                                    method_name, body, session_id, chunk, previous, "".join(answer)
+                                )
+                                session = (
+                                    self._session_report(previous, reused) if tracked else None
+                                )
+                                chunk = with_metadata(chunk, chunk, worker, session, model)
+                                yield self._shape(chunk, input)
+                            else:
+                                yield with_metadata(chunk, chunk, worker)
+                            worker = None
+                    else:
+                        result = await response.json(content_type=None, loads=_loads)
+                        reused = self.sessions.remember(
+                            method_name, body, session_id, result, previous
+                        )
+                        session = self._session_report(previous, reused) if tracked else None
+                        result = with_metadata(result, result, worker, session, model)
+                        yield self._shape(result, input)
+
+        except UnknownModel as e:
+            yield {"error": str(e), "status": "failed", "status_code": 404}
+        except aiohttp.ClientError as e:
+            logger.error(f"Request error: {str(e)}")
+            yield {"error": str(e), "status": "failed"}
+        except Exception as e:
+            logger.error(f"Unexpected error: {str(e)}")
+            yield {"error": str(e), "status": "failed"}
+
+    def _shape(self, output: Any, input: HandlerInput) -> Any:
+        """Leaves out the fields the job does not keep and packs embeddings as it asks."""
+        if self.config.slim_output:
+            output = slimmed(output, input.get("keep") or [])
+        return pack_embeddings(output, input.get("embeddings"))
+
+    @asynccontextmanager
+    async def _model(self, body: Any, job: bool = True) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """Sets the model of a request body, making room for it on a multi-model worker.
+
+        Yields what the proxy learns of the model's residency, None on a
+        single-model worker. Raises `UnknownModel` for a model not allowed.
+        """
+        if self.residency is None:
+            body["model"] = self.config.model
+            yield None
+            return
+        model = body["model"] = self.residency.resolve(body.get("model"))
+        # The worker decides when models leave memory, not Ollama's timer.
+        body["keep_alive"] = keep_alive_value(self.config.keep_alive)
+        residency = self.residency
+        report: Dict[str, Any] = {"name": model}
+        async with self.room():
+            # Like Ollama, a model that does not fit waits for the ones in use.
+            hit, victims = await self.room().wait_for(lambda: residency.acquire(model, job=job))
+            # No request may reach Ollama before the models it makes room for are gone.
+            if victims:
+                report["evicted"] = victims
+                report["unload_seconds"] = await self._unload(victims)
+        report.update(hit=hit, hit_rate=residency.hit_rate())
+        try:
+            yield report
+        finally:
+            await self._release(model)
+            self._rebalance(refresh=not hit)
+
+    async def _release(self, model: str):
+        assert self.residency is not None
+        async with self.room():
+            self.residency.release(model)
+            self.room().notify_all()
+
+    async def _unload(self, models: List[str]) -> float:
+        """Evicts `models` from Ollama's memory, returns how long that took."""
+        started = time.monotonic()
+        try:
+            await asyncio.gather(
+                *(self._post("generate", {"model": model, "keep_alive": 0}) for model in models)
+            )
+        except aiohttp.ClientError as e:
+            logger.warning(f"Could not unload {', '.join(models)}: {e}")
+        return time.monotonic() - started
+
+    def _rebalance(self, refresh: bool):
+        """Preloads the model the recent jobs ask for in the background.
+
+        With `refresh`, after a model was loaded, the sizes and the loaded
+        models are read from Ollama first.
+        """
+        assert self.residency is not None
+        if self._rebalancing is not None and not self._rebalancing.done():
+            return
+        if refresh or (self.config.preload and self.residency.preload_candidate() is not None):
+            self._rebalancing = asyncio.ensure_future(self._rebalance_now(refresh))
+
+    async def _rebalance_now(self, refresh: bool):
+        assert self.residency is not None
+        try:
+            if refresh:
+                self.residency.update((await self._get("ps")).get("models") or [])
+            candidate = self.residency.preload_candidate() if self.config.preload else None
+            if candidate is None:
+                return
+            body: Dict[str, Any] = {"model": candidate[0]}
+            # There is room for the candidate, this does not wait.
+            async with self._model(body, job=False) as report:
+                started = time.monotonic()
+                await self._post("generate", body)
+            assert report is not None
+            logger.info(
+                f"Preloaded {body['model']} in {time.monotonic() - started:.2f}s"
+                + (f", evicted {', '.join(report['evicted'])}" if report.get("evicted") else "")
+            )
+        except aiohttp.ClientError as e:
+            logger.warning(f"Could not preload a model: {e}")
+
+    async def _post(self, method_name: str, body: Any) -> Any:
+        async with self.session().post(
+            f"{self.config.ollama_base_url}/api/{method_name}/",
+            json=body,
+        ) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None, loads=_loads)
+
+    async def _get(self, method_name: str) -> Any:
+        async with self.session().get(
+            f"{self.config.ollama_base_url}/api/{method_name}"
+        ) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None, loads=_loads)
+
+    async def _warm(self) -> Any:
+        """Loads the model into memory, a generate request without a prompt."""
+        started = time.monotonic()
+        body: Dict[str, Any] = {"keep_alive": keep_alive_value(self.config.keep_alive)}
+        # Warm-ups load the first model and do not count as requests for it.
+        async with self._model(body, job=False):
+            await self._post("generate", body)
+        return {"warm": True, "load_seconds": time.monotonic() - started}
+
+    async def _embed_batch(self, requests: List[Any]) -> Any:
+        """Answers a batch of embedding requests with as few Ollama calls as possible.
+
+        The `embed` requests become a single multi-input `/api/embed` call.
+        The legacy `/api/embeddings` takes one prompt at a time (and does not
+        normalize like `/api/embed`), so those are sent concurrently instead.
+        """
+        # The proxy only batches requests for the same model, see `batch_key`.
+        first = dict(requests[0]["body"])
+        async with self._model(first) as model:
+            routing = {k: first[k] for k in ("model", "keep_alive") if k in first}
+            output, result = await self._embed_requests(requests, routing)
+        return with_metadata(output, result, model=model)
+
+    async def _embed_requests(
+        self, requests: List[Any], routing: Dict[str, Any]
+    ) -> Tuple[Dict[str, Any], Any]:
+        """The responses of a batch, and Ollama's response to its `/api/embed` call."""
+        embed = [r["body"] for r in requests if r["endpoint"] == "embed"]
+        legacy = [r["body"] for r in requests if r["endpoint"] != "embed"]
+        logger.info(f"Embedding batch of {len(embed)} embed and {len(legacy)} legacy requests")
+
+        embed_responses: List[Any] = []
+        result = None
+        if embed:
+            inputs = [b.get("input", "") for b in embed]
+            counts = [1 if isinstance(i, str) else len(i) for i in inputs]
+            body = {k: v for k, v in embed[0].items() if k != "input"}
+            body.update(routing)
+            body["input"] = [
+                text for i in inputs for text in ([i] if isinstance(i, str) else i)
+            ]
+            result = await self._post("embed", body)
+            embeddings = result["embeddings"]
+            offset = 0
+            for count in counts:
+                response = dict(result)
+                response["embeddings"] = embeddings[offset:offset + count]
+                embed_responses.append(response)
+                offset += count
+
+        legacy_responses = await asyncio.gather(
+            *(self._post("embeddings", dict(b, **routing)) for b in legacy)
+        )
+
+        embed_iter, legacy_iter = iter(embed_responses), iter(legacy_responses)
+        output = {
+            "responses": [
+                next(embed_iter) if r["endpoint"] == "embed" else next(legacy_iter)
+                for r in requests
+            ]
+        }
+        return output, result
+
+
+def serve(
+    config: WorkerConfig,
+    boot: Optional[Dict[str, Any]] = None,
+    model_sizes: Optional[Dict[str, int]] = None,
+):
+    """Takes RunPod jobs until the worker is stopped.
+
+    `model_sizes` are the bytes of the allowed models on disk, the first
+    guess of the VRAM they take.
+    """
+    logger.info(
+        f"Serving {', '.join(config.models or [config.model])} from {config.ollama_base_url}, "
+        f"{config.concurrency} concurrent job(s)"
+    )
+    worker = OllamaWorker(config, boot, model_sizes)
+    runpod.serverless.start(
+        {
+            "handler": worker.handler,
+            "concurrency_modifier": worker.concurrency_modifier,
+            "return_aggregate_stream": True,
+        }
+    )
+
+
+def main():
+    serve(WorkerConfig.from_environment(sys.argv))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,8 @@
 #!/bin/bash
 
-cleanup() {
-    echo "Cleaning up..."
-    pkill -P $$ # Kill all child processes of the current script
-    exit 0
-}
-
-# Trap exit signals and call the cleanup function
-trap cleanup SIGINT SIGTERM
-
 # Kill any existing ollama processes
 pgrep ollama | xargs kill
 
-# Start the ollama server and log its output
-ollama serve 2>&1 | tee ollama.server.log &
-OLLAMA_PID=$! # Store the process ID (PID) of the background command
-
-check_server_is_running() {
-    echo "Checking if server is running..."
-    if cat ollama.server.log | grep -q "Listening"; then
-        return 0 # Success
-    else
-        return 1 # Failure
-    fi
-}
-
-# Wait for the server to start
-while ! check_server_is_running; do
-    sleep 5
-done
-
-ollama pull $1
-python -u runpod_wrapper.py $1
+# Starts Ollama, pulls the model if it is not on disk yet and loads it, then
+# takes jobs, see bootstrap.py.
+exec python -u bootstrap.py $1